@@ -0,0 +1,123 @@
+"""traffic_rollups
+
+Revision ID: fe312231ccdc
+Revises: 53e30136e41b
+Create Date: 2024-03-08 10:12:41.218734
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# Polar Custom Imports
+from polar.kit.extensions.sqlalchemy import PostgresUUID
+
+# revision identifiers, used by Alembic.
+revision = "fe312231ccdc"
+down_revision = "53e30136e41b"
+branch_labels: tuple[str] | None = None
+depends_on: tuple[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "traffic_rollups",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("period", sa.String(), nullable=False),
+        sa.Column("start_date", sa.DATE(), nullable=False),
+        sa.Column("article_id", sa.UUID(), nullable=True),
+        sa.Column("organization_id", sa.UUID(), nullable=True),
+        sa.Column("views", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["article_id"],
+            ["articles.id"],
+            name=op.f("traffic_rollups_article_id_fkey"),
+        ),
+        sa.ForeignKeyConstraint(
+            ["organization_id"],
+            ["organizations.id"],
+            name=op.f("traffic_rollups_organization_id_fkey"),
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("traffic_rollups_pkey")),
+        sa.UniqueConstraint(
+            "period",
+            "start_date",
+            "organization_id",
+            "article_id",
+            name="traffic_rollups_unique_key",
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+    op.create_index(
+        "ix_traffic_rollups_article_id",
+        "traffic_rollups",
+        ["article_id", "period", "start_date"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_traffic_rollups_organization_id",
+        "traffic_rollups",
+        ["organization_id", "period", "start_date"],
+        unique=False,
+    )
+
+    op.create_table(
+        "traffic_referrer_rollups",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("period", sa.String(), nullable=False),
+        sa.Column("start_date", sa.DATE(), nullable=False),
+        sa.Column("article_id", sa.UUID(), nullable=False),
+        sa.Column("referrer", sa.String(), nullable=False),
+        sa.Column("views", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["article_id"],
+            ["articles.id"],
+            name=op.f("traffic_referrer_rollups_article_id_fkey"),
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("traffic_referrer_rollups_pkey")),
+        sa.UniqueConstraint(
+            "period",
+            "start_date",
+            "article_id",
+            "referrer",
+            name="traffic_referrer_rollups_unique_key",
+        ),
+    )
+    op.create_index(
+        "ix_traffic_referrer_rollups_article_id",
+        "traffic_referrer_rollups",
+        ["article_id", "period", "start_date"],
+        unique=False,
+    )
+
+    # backfill from existing traffic
+    for period in ("day", "week", "month"):
+        op.execute(
+            f"""
+INSERT INTO traffic_rollups (id, period, start_date, article_id, organization_id, views)
+SELECT gen_random_uuid(), '{period}', date_trunc('{period}', date)::date, article_id, organization_id, SUM(views)
+FROM traffic
+GROUP BY date_trunc('{period}', date)::date, article_id, organization_id;
+            """
+        )
+
+    for period in ("day", "month"):
+        op.execute(
+            f"""
+INSERT INTO traffic_referrer_rollups (id, period, start_date, article_id, referrer, views)
+SELECT gen_random_uuid(), '{period}', date_trunc('{period}', date)::date, article_id, referrer, SUM(views)
+FROM traffic
+WHERE article_id IS NOT NULL AND referrer IS NOT NULL AND referrer != ''
+GROUP BY date_trunc('{period}', date)::date, article_id, referrer;
+            """
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_traffic_referrer_rollups_article_id",
+        table_name="traffic_referrer_rollups",
+    )
+    op.drop_table("traffic_referrer_rollups")
+    op.drop_index("ix_traffic_rollups_organization_id", table_name="traffic_rollups")
+    op.drop_index("ix_traffic_rollups_article_id", table_name="traffic_rollups")
+    op.drop_table("traffic_rollups")
@@ -0,0 +1,43 @@
+"""articles.email_delivered_count
+
+Revision ID: 0b6b5a8f2d3e
+Revises: fe312231ccdc
+Create Date: 2024-03-11 09:42:17.604215
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# Polar Custom Imports
+from polar.kit.extensions.sqlalchemy import PostgresUUID
+
+# revision identifiers, used by Alembic.
+revision = "0b6b5a8f2d3e"
+down_revision = "fe312231ccdc"
+branch_labels: tuple[str] | None = None
+depends_on: tuple[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "articles",
+        sa.Column(
+            "email_delivered_count",
+            sa.Integer(),
+            nullable=False,
+            server_default=sa.text("0"),
+        ),
+    )
+
+    # Already sent articles were delivered by one job per receiver
+    op.execute(
+        """
+UPDATE articles
+SET email_delivered_count=email_sent_to_count
+WHERE email_sent_to_count IS NOT NULL;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("articles", "email_delivered_count")
@@ -0,0 +1,97 @@
+"""issues.github_next_crawl_at
+
+Revision ID: 7c1d5e9a4b20
+Revises: 0b6b5a8f2d3e
+Create Date: 2024-03-13 10:21:54.118302
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# Polar Custom Imports
+from polar.kit.extensions.sqlalchemy import PostgresUUID
+
+# revision identifiers, used by Alembic.
+revision = "7c1d5e9a4b20"
+down_revision = "0b6b5a8f2d3e"
+branch_labels: tuple[str] | None = None
+depends_on: tuple[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "issues",
+        sa.Column(
+            "github_issue_next_crawl_at", sa.TIMESTAMP(timezone=True), nullable=True
+        ),
+    )
+    op.add_column(
+        "issues",
+        sa.Column(
+            "github_issue_unchanged_count",
+            sa.Integer(),
+            nullable=False,
+            server_default=sa.text("0"),
+        ),
+    )
+    op.add_column(
+        "issues",
+        sa.Column(
+            "github_timeline_next_crawl_at",
+            sa.TIMESTAMP(timezone=True),
+            nullable=True,
+        ),
+    )
+    op.add_column(
+        "issues",
+        sa.Column(
+            "github_timeline_unchanged_count",
+            sa.Integer(),
+            nullable=False,
+            server_default=sa.text("0"),
+        ),
+    )
+
+    # Keep the schedule of the fixed 12 hours interval until the next crawl
+    op.execute(
+        """
+UPDATE issues
+SET github_issue_next_crawl_at=github_issue_fetched_at + INTERVAL '12 hours'
+WHERE github_issue_fetched_at IS NOT NULL;
+        """
+    )
+    op.execute(
+        """
+UPDATE issues
+SET github_timeline_next_crawl_at=github_timeline_fetched_at + INTERVAL '12 hours'
+WHERE github_timeline_fetched_at IS NOT NULL;
+        """
+    )
+
+    op.create_index(
+        "idx_issues_organization_id_github_issue_next_crawl_at",
+        "issues",
+        ["organization_id", "github_issue_next_crawl_at"],
+        unique=False,
+    )
+    op.create_index(
+        "idx_issues_organization_id_github_timeline_next_crawl_at",
+        "issues",
+        ["organization_id", "github_timeline_next_crawl_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "idx_issues_organization_id_github_timeline_next_crawl_at",
+        table_name="issues",
+    )
+    op.drop_index(
+        "idx_issues_organization_id_github_issue_next_crawl_at",
+        table_name="issues",
+    )
+    op.drop_column("issues", "github_timeline_unchanged_count")
+    op.drop_column("issues", "github_timeline_next_crawl_at")
+    op.drop_column("issues", "github_issue_unchanged_count")
+    op.drop_column("issues", "github_issue_next_crawl_at")
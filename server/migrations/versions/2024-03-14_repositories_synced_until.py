@@ -0,0 +1,36 @@
+"""repositories.synced_until
+
+Revision ID: 3f8a2c6d9e14
+Revises: 7c1d5e9a4b20
+Create Date: 2024-03-14 14:05:32.671940
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# Polar Custom Imports
+from polar.kit.extensions.sqlalchemy import PostgresUUID
+
+# revision identifiers, used by Alembic.
+revision = "3f8a2c6d9e14"
+down_revision = "7c1d5e9a4b20"
+branch_labels: tuple[str] | None = None
+depends_on: tuple[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "repositories",
+        sa.Column("issues_synced_until", sa.TIMESTAMP(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "repositories",
+        sa.Column(
+            "pull_requests_synced_until", sa.TIMESTAMP(timezone=True), nullable=True
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("repositories", "pull_requests_synced_until")
+    op.drop_column("repositories", "issues_synced_until")
@@ -0,0 +1,29 @@
+"""articles.email_delivered_until
+
+Revision ID: 9d4e7a1c3b58
+Revises: 3f8a2c6d9e14
+Create Date: 2024-03-15 10:12:48.302117
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# Polar Custom Imports
+from polar.kit.extensions.sqlalchemy import PostgresUUID
+
+# revision identifiers, used by Alembic.
+revision = "9d4e7a1c3b58"
+down_revision = "3f8a2c6d9e14"
+branch_labels: tuple[str] | None = None
+depends_on: tuple[str] | None = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "articles",
+        sa.Column("email_delivered_until", PostgresUUID(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("articles", "email_delivered_until")
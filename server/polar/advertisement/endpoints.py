@@ -215,7 +215,7 @@ async def track_view(
     if not ad:
         raise ResourceNotFound()
 
-    await advertisement_campaign_service.track_view(session, ad)
+    await advertisement_campaign_service.track_view(ad)
 
     return AdvertisementCampaignPublic.model_validate(ad)
 
@@ -1,20 +1,29 @@
+import itertools
 import uuid
 from collections.abc import Sequence
 
 from sqlalchemy import (
+    Integer,
     and_,
+    column,
     select,
     update,
+    values,
 )
 
 from polar.advertisement.schemas import (
     CreateAdvertisementCampaign,
     EditAdvertisementCampaign,
 )
+from polar.kit.counter_buffer import FLUSH_BATCH_SIZE, CounterBuffer
 from polar.kit.db.postgres import AsyncSession
+from polar.kit.extensions.sqlalchemy import PostgresUUID
 from polar.kit.utils import utc_now
 from polar.models.advertisement_campaign import AdvertisementCampaign
 from polar.models.subscription_benefit_grant import SubscriptionBenefitGrant
+from polar.redis import redis
+
+views_buffer = CounterBuffer(redis, "advertisement_campaign_views")
 
 
 class AdvertisementCampaignService:
@@ -65,19 +74,30 @@ class AdvertisementCampaignService:
         await session.commit()
         return campaign
 
-    async def track_view(
-        self,
-        session: AsyncSession,
-        campaign: AdvertisementCampaign,
-    ) -> None:
-        stmt = (
-            update(AdvertisementCampaign)
-            .where(AdvertisementCampaign.id == campaign.id)
-            .values({"views": AdvertisementCampaign.views + 1})
-        )
-
-        await session.execute(stmt)
-        await session.commit()
+    async def track_view(self, campaign: AdvertisementCampaign) -> None:
+        await views_buffer.incr(str(campaign.id))
+
+    async def flush_views(self, session: AsyncSession) -> None:
+        async with views_buffer.flush() as deltas:
+            if not deltas:
+                return
+
+            for batch in itertools.batched(deltas.items(), FLUSH_BATCH_SIZE):
+                deltas_values = values(
+                    column("id", PostgresUUID),
+                    column("views", Integer),
+                    name="deltas",
+                ).data([(uuid.UUID(id), views) for id, views in batch])
+                stmt = (
+                    update(AdvertisementCampaign)
+                    .where(AdvertisementCampaign.id == deltas_values.c.id)
+                    .values(
+                        {"views": AdvertisementCampaign.views + deltas_values.c.views}
+                    )
+                )
+                await session.execute(stmt)
+
+            await session.commit()
 
     async def delete(
         self,
@@ -0,0 +1,9 @@
+from polar.worker import AsyncSessionMaker, JobContext, interval
+
+from .service import advertisement_campaign_service
+
+
+@interval(second=30)
+async def advertisement_campaigns_flush_views(ctx: JobContext) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        await advertisement_campaign_service.flush_views(session)
@@ -9,15 +9,17 @@ from fastapi.openapi.utils import get_openapi
 from fastapi.routing import APIRoute
 from starlette.routing import BaseRoute
 
-from polar import receivers, worker  # noqa
+from polar import receivers, tasks, worker  # noqa
 from polar.api import router
 from polar.config import settings
+from polar.eventstream.hub import hub as eventstream_hub
 from polar.exception_handlers import (
     polar_exception_handler,
     polar_redirection_exception_handler,
 )
 from polar.exceptions import PolarError, PolarRedirectionError
 from polar.health.endpoints import router as health_router
+from polar.integrations.github.registry import registry as github_client_registry
 from polar.kit.cors.cors import CallbackCORSMiddleware
 from polar.kit.cors.custom_domain_cors import is_allowed_custom_domain
 from polar.kit.db.postgres import (
@@ -72,6 +74,8 @@ async def lifespan(app: FastAPI) -> AsyncIterator[State]:
 
         yield {"engine": engine, "sessionmaker": sessionmaker}
 
+        await eventstream_hub.close()
+        await github_client_registry.close()
         await engine.dispose()
 
         log.info("Polar API stopped")
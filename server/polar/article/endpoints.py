@@ -303,10 +303,7 @@ async def viewed(
 
     # Track view
     # TODO: very simplistic for now, might need some improvements later :-)
-    await article_service.track_view(
-        session,
-        id,
-    )
+    await article_service.track_view(id)
 
     return ArticleViewedResponse(ok=True)
 
@@ -37,6 +37,7 @@ class Article(Schema):
     notify_subscribers: bool | None = None
     notifications_sent_at: datetime.datetime | None = None
     email_sent_to_count: int | None = None
+    email_delivered_count: int | None = None
     web_view_count: int | None = None
 
     og_image_url: str | None = None
@@ -149,6 +150,9 @@ class Article(Schema):
             if include_admin_fields
             else None,
             email_sent_to_count=i.email_sent_to_count if include_admin_fields else None,
+            email_delivered_count=i.email_delivered_count
+            if include_admin_fields
+            else None,
             web_view_count=i.web_view_count if include_admin_fields else None,
             is_pinned=i.is_pinned,
             og_image_url=i.og_image_url,
@@ -1,26 +1,34 @@
 from __future__ import annotations
 
+import itertools
 from collections.abc import Sequence
 from datetime import datetime
 from operator import and_, or_
+from typing import NamedTuple
 from uuid import UUID
 
 import structlog
 from discord_webhook import AsyncDiscordWebhook, DiscordEmbed
 from slugify import slugify
 from sqlalchemy import (
+    Integer,
     Select,
+    column,
     desc,
     false,
     func,
     nullsfirst,
     select,
+    update,
+    values,
 )
 from sqlalchemy.orm import contains_eager, joinedload
 
 from polar.authz.service import Subject
 from polar.config import settings
 from polar.exceptions import BadRequest
+from polar.kit.counter_buffer import FLUSH_BATCH_SIZE, CounterBuffer
+from polar.kit.extensions.sqlalchemy import PostgresUUID
 from polar.kit.pagination import PaginationParams, paginate
 from polar.kit.utils import utc_now
 from polar.models import ArticlesSubscription
@@ -29,12 +37,15 @@ from polar.models.organization import Organization
 from polar.models.user import User
 from polar.models.user_organization import UserOrganization
 from polar.postgres import AsyncSession, sql
+from polar.redis import redis
 from polar.worker import enqueue_job
 
 from .schemas import ArticleCreate, ArticleUpdate, Visibility
 
 log = structlog.get_logger()
 
+views_buffer = CounterBuffer(redis, "article_views")
+
 
 def polar_slugify(input: str) -> str:
     return slugify(
@@ -44,6 +55,14 @@ def polar_slugify(input: str) -> str:
     )
 
 
+class ArticleReceiver(NamedTuple):
+    user_id: UUID
+    email: str
+    is_paid_subscriber: bool
+    is_organization_member: bool
+    subscriber_id: UUID | None
+
+
 class ArticleService:
     async def create(
         self,
@@ -307,18 +326,32 @@ class ArticleService:
             case "public":
                 return Article.Visibility.public
 
-    async def track_view(
-        self,
-        session: AsyncSession,
-        id: UUID,
-    ) -> None:
-        statement = (
-            sql.update(Article)
-            .where(Article.id == id)
-            .values({"web_view_count": Article.web_view_count + 1})
-        )
-        await session.execute(statement)
-        await session.commit()
+    async def track_view(self, id: UUID) -> None:
+        await views_buffer.incr(str(id))
+
+    async def flush_views(self, session: AsyncSession) -> None:
+        async with views_buffer.flush() as deltas:
+            if not deltas:
+                return
+
+            for batch in itertools.batched(deltas.items(), FLUSH_BATCH_SIZE):
+                deltas_values = values(
+                    column("id", PostgresUUID),
+                    column("views", Integer),
+                    name="deltas",
+                ).data([(UUID(id), views) for id, views in batch])
+                statement = (
+                    sql.update(Article)
+                    .where(Article.id == deltas_values.c.id)
+                    .values(
+                        {
+                            "web_view_count": Article.web_view_count
+                            + deltas_values.c.views
+                        }
+                    )
+                )
+                await session.execute(statement)
+            await session.commit()
 
     async def list_scheduled_unsent_posts(
         self, session: AsyncSession
@@ -333,16 +366,16 @@ class ArticleService:
         res = await session.execute(statement)
         return res.scalars().unique().all()
 
-    async def list_receivers(
-        self, session: AsyncSession, organization_id: UUID, paid_subscribers_only: bool
-    ) -> Sequence[tuple[UUID, bool, bool]]:
+    def _get_receivers_statement(
+        self, organization_id: UUID, paid_subscribers_only: bool
+    ) -> Select[tuple[UUID, bool, bool]]:
         user_subscription_clause = (
             ArticlesSubscription.organization_id == organization_id
         )
         if paid_subscribers_only:
             user_subscription_clause &= ArticlesSubscription.paid_subscriber.is_(True)
 
-        statement = (
+        return (
             select(
                 User.id,
                 func.coalesce(ArticlesSubscription.paid_subscriber, False),
@@ -368,9 +401,94 @@ class ArticleService:
             )
         )
 
+    async def list_receivers(
+        self, session: AsyncSession, organization_id: UUID, paid_subscribers_only: bool
+    ) -> Sequence[tuple[UUID, bool, bool]]:
+        statement = self._get_receivers_statement(
+            organization_id, paid_subscribers_only
+        )
         result = await session.execute(statement)
         return result.tuples().all()
 
+    async def count_all_receivers(
+        self, session: AsyncSession, organization_id: UUID, paid_subscribers_only: bool
+    ) -> int:
+        statement = select(func.count()).select_from(
+            self._get_receivers_statement(
+                organization_id, paid_subscribers_only
+            ).subquery()
+        )
+        result = await session.execute(statement)
+        return result.scalar_one()
+
+    async def list_receivers_batch(
+        self,
+        session: AsyncSession,
+        article: Article,
+        *,
+        after: UUID | None = None,
+        limit: int,
+    ) -> Sequence[ArticleReceiver]:
+        """
+        List the receivers of the article email, with what's needed to deliver it.
+
+        Receivers are ordered by user id: pass the last one as `after`
+        to get the next batch.
+        """
+        statement = (
+            self._get_receivers_statement(
+                article.organization_id, article.paid_subscribers_only
+            )
+            .add_columns(User.email, ArticlesSubscription.id)
+            .order_by(User.id)
+            .limit(limit)
+        )
+        if after is not None:
+            statement = statement.where(User.id > after)
+
+        result = await session.execute(statement)
+        return [
+            ArticleReceiver(
+                user_id=user_id,
+                email=email,
+                is_paid_subscriber=is_paid_subscriber,
+                is_organization_member=is_organization_member,
+                subscriber_id=subscriber_id,
+            )
+            for (
+                user_id,
+                is_paid_subscriber,
+                is_organization_member,
+                email,
+                subscriber_id,
+            ) in result.tuples().all()
+        ]
+
+    async def add_delivered(
+        self,
+        session: AsyncSession,
+        article: Article,
+        count: int,
+        *,
+        last_user_id: UUID,
+    ) -> None:
+        """
+        Record the delivery of a batch of receivers.
+
+        `last_user_id` is saved alongside the count,
+        so an interrupted delivery resumes after it.
+        """
+        statement = (
+            update(Article)
+            .where(Article.id == article.id)
+            .values(
+                email_delivered_count=Article.email_delivered_count + count,
+                email_delivered_until=last_user_id,
+            )
+        )
+        await session.execute(statement)
+        await session.commit()
+
     async def count_receivers(
         self, session: AsyncSession, organization_id: UUID, paid_subscribers_only: bool
     ) -> tuple[int, int, int]:
@@ -407,26 +525,15 @@ class ArticleService:
             raise BadRequest("article is scheduled to be published in the future")
 
         article.notifications_sent_at = utc_now()
-        await article.save(session)
-        await session.commit()
-
-        receivers = await article_service.list_receivers(
+        article.email_sent_to_count = await self.count_all_receivers(
             session, article.organization_id, article.paid_subscribers_only
         )
-
-        for receiver_user_id, _, _ in receivers:
-            await enqueue_job(
-                "articles.send_to_user",
-                article_id=article.id,
-                user_id=receiver_user_id,
-                is_test=False,
-            )
-
-        # after scheduling is complete
-        article.email_sent_to_count = len(receivers)
         await article.save(session)
         await session.commit()
 
+        # Emails are rendered and sent by batches in a single job
+        await enqueue_job("articles.send_to_subscribers", article_id=article.id)
+
     def _get_readable_articles_statement(
         self, auth_subject: Subject
     ) -> Select[tuple[Article, bool]]:
@@ -1,18 +1,21 @@
-from uuid import UUID
+from uuid import UUID, uuid4
 
 import httpx
 import structlog
+from arq import Retry
 
 from polar.auth.service import AuthService
 from polar.config import settings
-from polar.email.sender import get_email_sender
+from polar.email.sender import EmailMessage, get_email_sender
 from polar.logging import Logger
 from polar.models.article import Article
+from polar.models.user import User
 from polar.user.service import user as user_service
 from polar.worker import (
     AsyncSessionMaker,
     JobContext,
     PolarWorkerContext,
+    TaskLane,
     interval,
     task,
 )
@@ -22,7 +25,56 @@ from .service import article_service
 log: Logger = structlog.get_logger()
 
 
-@task("articles.send_to_user")
+def _get_unsubscribe_link(article: Article, subscriber_id: UUID | str) -> str:
+    return f"https://polar.sh/unsubscribe?org={article.organization.name}&id={subscriber_id}"
+
+
+def _get_sender(article: Article) -> tuple[str, dict[str, str]]:
+    """Return the name the email is sent from and its Reply-To headers."""
+    email_headers: dict[str, str] = {}
+    from_name = ""
+    if article.byline == Article.Byline.organization:
+        from_name = article.organization.pretty_name or article.organization.name
+        if article.organization.email:
+            email_headers["Reply-To"] = f"{from_name} <{article.organization.email}>"
+    else:
+        from_name = article.created_by_user.username
+        if article.created_by_user.email:
+            email_headers["Reply-To"] = f"{from_name} <{article.created_by_user.email}>"
+    return from_name, email_headers
+
+
+async def _render(
+    client: httpx.AsyncClient,
+    article: Article,
+    user: User,
+    render_data: dict[str, str],
+) -> str | None:
+    (jwt, _) = AuthService.generate_token(user)
+
+    response = await client.post(
+        f"{settings.FRONTEND_BASE_URL}/email/article/{article.id}",
+        json=render_data,
+        # Authenticating to the renderer as the user we're sending the email to
+        headers={"Cookie": f"polar_session={jwt};"},
+        # Increase the default timeout because it can be slow to render
+        timeout=60,
+    )
+
+    if not response.is_success:
+        log.error(f"failed to get rendered article: code={response.status_code}")
+        return None
+
+    return response.text
+
+
+# Merge duplicate requests, but don't send the article twice
+@task(
+    "articles.send_to_user",
+    lane=TaskLane.bulk,
+    dedupe_on=("article_id", "user_id", "is_test"),
+    dedupe_rerun=False,
+)
 async def articles_send_to_user(
     ctx: JobContext,
     article_id: UUID,
@@ -43,71 +95,144 @@ async def articles_send_to_user(
         subject = "[TEST] " if is_test else ""
         subject += article.title
 
-        (jwt, _) = AuthService.generate_token(user)
-
-        # _, magic_link_token = await magic_link_service.request(
-        #     session,
-        #     user.email,
-        #     source="article_links",
-        #     expires_at=utc_now() + timedelta(hours=24),
-        # )
-
-        email_headers: dict[str, str] = {}
+        from_name, email_headers = _get_sender(article)
 
-        render_data = {
-            # Add pre-authenticated tokens to the end of all links in the email
-            # "inject_magic_link_token": magic_link_token,
-        }
+        render_data: dict[str, str] = {}
 
         # Get subscriber ID (if exists)
         subscriber = await article_service.get_subscriber(
             session, user_id, article.organization_id
         )
         if subscriber:
-            unsubscribe_link = f"https://polar.sh/unsubscribe?org={article.organization.name}&id={subscriber.id}"
+            unsubscribe_link = _get_unsubscribe_link(article, subscriber.id)
             render_data["unsubscribe_link"] = unsubscribe_link
             email_headers["List-Unsubscribe"] = f"<{unsubscribe_link}>"
 
         async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.FRONTEND_BASE_URL}/email/article/{article.id}",
-                json=render_data,
-                # Authenticating to the renderer as the user we're sending the email to
-                headers={"Cookie": f"polar_session={jwt};"},
-                # Increase the default timeout because it can be slow to render
-                timeout=60,
-            )
-
-        if not response.is_success:
-            log.error(f"failed to get rendered article: code={response.status_code}")
+            html_content = await _render(client, article, user, render_data)
+        if html_content is None:
             return None
 
-        from_name = ""
-        if article.byline == Article.Byline.organization:
-            from_name = article.organization.pretty_name or article.organization.name
-            if article.organization.email:
-                email_headers[
-                    "Reply-To"
-                ] = f"{from_name} <{article.organization.email}>"
-        else:
-            from_name = article.created_by_user.username
-            if article.created_by_user.email:
-                email_headers[
-                    "Reply-To"
-                ] = f"{from_name} <{article.created_by_user.email}>"
-
         email_sender = get_email_sender("article")
 
         email_sender.send_to_user(
             to_email_addr=user.email,
             subject=subject,
-            html_content=response.text,
+            html_content=html_content,
             from_name=from_name,
             from_email_addr=f"{article.organization.name}@posts.polar.sh",
             email_headers=email_headers,
         )
 
 
+@task("articles.send_to_subscribers", lane=TaskLane.bulk, timeout=3600)
+async def articles_send_to_subscribers(
+    ctx: JobContext,
+    article_id: UUID,
+    polar_context: PolarWorkerContext,
+) -> None:
+    """
+    Deliver the article email to all its receivers, by batches.
+
+    The content only depends on the access level of the receiver,
+    so it's rendered once per variant. The only per-receiver part,
+    the unsubscribe link, is rendered with a placeholder which is then
+    substituted for each receiver.
+
+    The progress is saved after each batch: if the job is interrupted,
+    its retry resumes after the last receiver delivered. If a variant fails
+    to render, the job is retried from the first receiver not delivered.
+    """
+    async with AsyncSessionMaker(ctx) as session:
+        article = await article_service.get_loaded(session, article_id)
+        if not article:
+            return
+
+        from_name, sender_headers = _get_sender(article)
+        from_email_addr = f"{article.organization.name}@posts.polar.sh"
+        email_sender = get_email_sender("article")
+
+        subscriber_id_placeholder = str(uuid4())
+        # By (paid subscriber, organization member, has unsubscribe link)
+        renders: dict[tuple[bool, bool, bool], str] = {}
+
+        async with httpx.AsyncClient() as client:
+            after = article.email_delivered_until
+            while True:
+                receivers = await article_service.list_receivers_batch(
+                    session,
+                    article,
+                    after=after,
+                    limit=settings.ARTICLE_EMAIL_BATCH_SIZE,
+                )
+                if not receivers:
+                    break
+
+                messages: list[EmailMessage] = []
+                render_failed = False
+                for receiver in receivers:
+                    variant = (
+                        receiver.is_paid_subscriber,
+                        receiver.is_organization_member,
+                        receiver.subscriber_id is not None,
+                    )
+                    if variant not in renders:
+                        user = await user_service.get(session, receiver.user_id)
+                        assert user is not None
+                        render_data: dict[str, str] = {}
+                        if receiver.subscriber_id is not None:
+                            render_data["unsubscribe_link"] = _get_unsubscribe_link(
+                                article, subscriber_id_placeholder
+                            )
+                        rendered = await _render(client, article, user, render_data)
+                        # Not cached, so the retry renders it again
+                        if rendered is None:
+                            render_failed = True
+                            break
+                        renders[variant] = rendered
+
+                    html_content = renders[variant]
+
+                    email_headers = dict(sender_headers)
+                    if receiver.subscriber_id is not None:
+                        html_content = html_content.replace(
+                            subscriber_id_placeholder, str(receiver.subscriber_id)
+                        )
+                        unsubscribe_link = _get_unsubscribe_link(
+                            article, receiver.subscriber_id
+                        )
+                        email_headers["List-Unsubscribe"] = f"<{unsubscribe_link}>"
+
+                    messages.append(
+                        {
+                            "to_email_addr": receiver.email,
+                            "subject": article.title,
+                            "html_content": html_content,
+                            "from_name": from_name,
+                            "from_email_addr": from_email_addr,
+                            "email_headers": email_headers,
+                        }
+                    )
+                    after = receiver.user_id
+
+                if messages:
+                    email_sender.send_batch_to_users(messages)
+                    assert after is not None
+                    await article_service.add_delivered(
+                        session, article, len(messages), last_user_id=after
+                    )
+
+                log.info(
+                    "articles.send_to_subscribers.batch",
+                    article_id=article.id,
+                    delivered=len(messages),
+                    receivers=len(receivers),
+                )
+
+                if render_failed:
+                    raise Retry(2 ** ctx["job_try"])
+
+
 @interval(second=0)
 async def articles_send_scheduled(
     ctx: JobContext,
@@ -116,3 +241,9 @@ async def articles_send_scheduled(
         articles = await article_service.list_scheduled_unsent_posts(session)
         for article in articles:
             await article_service.send_to_subscribers(session, article)
+
+
+@interval(second=30)
+async def articles_flush_views(ctx: JobContext) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        await article_service.flush_views(session)
@@ -65,11 +65,25 @@ class Settings(BaseSettings):
     POSTGRES_HOST: str = "127.0.0.1"
     POSTGRES_PORT: int = 5432
     POSTGRES_DATABASE: str = "polar_development"
+    # Rows fetched at once when streaming results, e.g. for CSV exports
+    POSTGRES_STREAM_YIELD_PER: int = 1000
 
     # Redis
     REDIS_HOST: str = "127.0.0.1"
     REDIS_PORT: int = 6379
 
+    # Worker
+    # Lanes consumed by a worker process, with their maximum concurrent jobs.
+    # Run processes with a single lane to dedicate them to it.
+    WORKER_LANES: dict[str, int] = {"critical": 10, "default": 10, "bulk": 5}
+    # Port on which worker processes serve their Prometheus metrics, if any
+    WORKER_METRICS_PORT: int | None = None
+
+    # Event stream
+    # Maximum number of pending events per client before it's disconnected
+    EVENTSTREAM_QUEUE_SIZE: int = 100
+    EVENTSTREAM_MEMBERS_CACHE_TTL_SECONDS: int = 30
+
     # Github App
     GITHUB_APP_NAMESPACE: str = ""
     GITHUB_APP_IDENTIFIER: str = ""
@@ -78,6 +92,11 @@ class Settings(BaseSettings):
     GITHUB_CLIENT_ID: str = ""
     GITHUB_CLIENT_SECRET: str = ""
     GITHUB_POLAR_USER_ACCESS_TOKEN: str | None = None
+    GITHUB_CLIENT_IDLE_TIMEOUT_SECONDS: int = 300
+    GITHUB_CLIENT_REGISTRY_MAX_CLIENTS: int = 1000
+    GITHUB_CLIENT_MAX_CONNECTIONS: int = 100
+    # Requires the `h2` package
+    GITHUB_CLIENT_HTTP2: bool = False
 
     # Discord
     DISCORD_CLIENT_ID: str = ""
@@ -92,6 +111,9 @@ class Settings(BaseSettings):
     # Stripe webhook secrets
     STRIPE_WEBHOOK_SECRET: str = ""
     STRIPE_CONNECT_WEBHOOK_SECRET: str = ""
+    # Stripe API client
+    STRIPE_REQUEST_TIMEOUT_SECONDS: int = 30
+    STRIPE_MAX_CONCURRENT_REQUESTS: int = 16
 
     # Open Collective
     OPEN_COLLECTIVE_PERSONAL_TOKEN: str | None = None
@@ -113,6 +135,7 @@ class Settings(BaseSettings):
 
     # Application behaviours
     API_PAGINATION_MAX_LIMIT: int = 100
+    API_PAGINATION_COUNT_CACHE_TTL_SECONDS: int = 60
 
     AUTO_SUBSCRIBE_SUBSCRIPTION_TIER_ID: uuid.UUID | None = None
 
@@ -121,6 +144,7 @@ class Settings(BaseSettings):
 
     EMAIL_SENDER: EmailSender = EmailSender.logger
     RESEND_API_KEY: str = ""
+    ARTICLE_EMAIL_BATCH_SIZE: int = 100
 
     ACCOUNT_BALANCE_REVIEW_THRESHOLD: int = 10000
 
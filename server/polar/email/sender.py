@@ -1,4 +1,7 @@
+import itertools
 from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from typing import NotRequired, TypedDict
 
 import resend
 import structlog
@@ -10,6 +13,15 @@ from polar.logging import Logger
 log: Logger = structlog.get_logger()
 
 
+class EmailMessage(TypedDict):
+    to_email_addr: str
+    subject: str
+    html_content: str
+    from_name: NotRequired[str]
+    from_email_addr: NotRequired[str]
+    email_headers: NotRequired[dict[str, str]]
+
+
 class EmailSender(ABC):
     @abstractmethod
     def send_to_user(
@@ -26,6 +38,10 @@ class EmailSender(ABC):
     ) -> None:
         pass
 
+    def send_batch_to_users(self, messages: Sequence[EmailMessage]) -> None:
+        for message in messages:
+            self.send_to_user(**message)
+
 
 class LoggingEmailSender(EmailSender):
     def send_to_user(
@@ -88,6 +104,27 @@ class ResendEmailSender(EmailSender):
             email_id=email["id"],
         )
 
+    def send_batch_to_users(self, messages: Sequence[EmailMessage]) -> None:
+        # Resend accepts at most 100 emails per batch
+        for batch in itertools.batched(messages, 100):
+            resend.Batch.send(
+                [
+                    {
+                        "from": (
+                            f"{message.get('from_name', 'Polar')} "
+                            f"<{message.get('from_email_addr', 'polarsource@posts.polar.sh')}>"
+                        ),
+                        "to": [message["to_email_addr"]],
+                        "subject": message["subject"],
+                        "html": message["html_content"],
+                        "headers": message.get("email_headers", {}),
+                    }
+                    for message in batch
+                ]
+            )
+
+            log.info("resend.batch_send", count=len(batch))
+
 
 def get_email_sender(type: str = "notification") -> EmailSender:
     if settings.EMAIL_SENDER == EmailSenderType.resend:
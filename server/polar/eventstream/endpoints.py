@@ -1,10 +1,8 @@
-import asyncio
 from collections.abc import AsyncGenerator
 from typing import Any
 
 import structlog
 from fastapi import APIRouter, Depends, Request
-from redis.exceptions import ConnectionError
 from sse_starlette.sse import EventSourceResponse
 
 from polar.auth.dependencies import Auth, UserRequiredAuth
@@ -12,12 +10,12 @@ from polar.enums import Platforms
 from polar.exceptions import ResourceNotFound, Unauthorized
 from polar.organization.service import organization as organization_service
 from polar.postgres import AsyncSession, get_db_session
-from polar.redis import Redis, get_redis
 from polar.repository.service import repository as repository_service
 from polar.user_organization.service import (
     user_organization as user_organization_service,
 )
 
+from .hub import EventStreamHub, get_hub
 from .service import Receivers
 
 router = APIRouter(tags=["stream"])
@@ -26,44 +24,30 @@ log = structlog.get_logger()
 
 
 async def subscribe(
-    redis: Redis,
+    hub: EventStreamHub,
     channels: list[str],
     request: Request,
 ) -> AsyncGenerator[Any, Any]:
-    async with redis.pubsub() as pubsub:
-        await pubsub.subscribe(*channels)
-
-        while True:
+    async with hub.subscribe(channels) as subscriber:
+        while not subscriber.evicted.is_set():
             if await request.is_disconnected():
-                await pubsub.close()
                 break
 
-            try:
-                message = await pubsub.get_message(
-                    ignore_subscribe_messages=True,
-                    # Waits for up to 10s for a new message
-                    timeout=10.0,
-                )
-
-                if message is not None:
-                    log.info("redis.pubsub", message=message["data"])
-                    yield message["data"]
-            except asyncio.CancelledError as e:
-                await pubsub.close()
-                raise e
-            except ConnectionError as e:
-                await pubsub.close()
-                raise e
+            # Waits for up to 10s for a new message
+            message = await subscriber.get(timeout=10.0)
+            if message is not None:
+                log.info("redis.pubsub", message=message)
+                yield message
 
 
 @router.get("/user/stream")
 async def user_stream(
     request: Request,
     auth: UserRequiredAuth,
-    redis: Redis = Depends(get_redis),
+    hub: EventStreamHub = Depends(get_hub),
 ) -> EventSourceResponse:
     receivers = Receivers(user_id=auth.user.id)
-    return EventSourceResponse(subscribe(redis, receivers.get_channels(), request))
+    return EventSourceResponse(subscribe(hub, receivers.get_channels(), request))
 
 
 @router.get("/{platform}/{org_name}/stream")
@@ -72,7 +56,7 @@ async def user_org_stream(
     org_name: str,
     request: Request,
     auth: Auth = Depends(Auth.current_user),
-    redis: Redis = Depends(get_redis),
+    hub: EventStreamHub = Depends(get_hub),
     session: AsyncSession = Depends(get_db_session),
 ) -> EventSourceResponse:
     if not auth.user:
@@ -91,7 +75,7 @@ async def user_org_stream(
         raise Unauthorized()
 
     receivers = Receivers(user_id=auth.user.id, organization_id=org.id)
-    return EventSourceResponse(subscribe(redis, receivers.get_channels(), request))
+    return EventSourceResponse(subscribe(hub, receivers.get_channels(), request))
 
 
 @router.get("/{platform}/{org_name}/{repo_name}/stream")
@@ -101,7 +85,7 @@ async def user_org_repo_stream(
     repo_name: str,
     request: Request,
     auth: Auth = Depends(Auth.current_user),
-    redis: Redis = Depends(get_redis),
+    hub: EventStreamHub = Depends(get_hub),
     session: AsyncSession = Depends(get_db_session),
 ) -> EventSourceResponse:
     if not auth.user:
@@ -130,4 +114,4 @@ async def user_org_repo_stream(
         organization_id=org.id,
         repository_id=repo.id,
     )
-    return EventSourceResponse(subscribe(redis, receivers.get_channels(), request))
+    return EventSourceResponse(subscribe(hub, receivers.get_channels(), request))
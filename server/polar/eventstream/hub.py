@@ -0,0 +1,200 @@
+import asyncio
+from collections.abc import AsyncIterator, Iterable
+from contextlib import asynccontextmanager
+
+import structlog
+from prometheus_client import Counter, Gauge
+from redis.asyncio.client import PubSub
+from redis.exceptions import ConnectionError
+
+from polar.config import settings
+from polar.logging import Logger
+from polar.redis import Redis
+from polar.redis import redis as default_redis
+
+log: Logger = structlog.get_logger()
+
+eventstream_connected_clients = Gauge(
+    "eventstream_connected_clients", "Clients connected to the event stream"
+)
+eventstream_subscribed_channels = Gauge(
+    "eventstream_subscribed_channels", "Redis channels subscribed by the event stream"
+)
+eventstream_dropped_events = Counter(
+    "eventstream_dropped_events",
+    "Events that couldn't be delivered to a client of the event stream",
+)
+eventstream_evicted_clients = Counter(
+    "eventstream_evicted_clients",
+    "Clients disconnected from the event stream",
+    ["reason"],
+)
+
+
+class Subscriber:
+    def __init__(self, channels: Iterable[str], queue_size: int) -> None:
+        self.channels = set(channels)
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.evicted = asyncio.Event()
+
+    async def get(self, timeout: float) -> str | None:
+        """
+        Wait for the next message.
+
+        Returns `None` if no message was received before `timeout`
+        or if the subscriber has been evicted.
+        """
+        if self.queue.empty() and self.evicted.is_set():
+            return None
+
+        get_task = asyncio.ensure_future(self.queue.get())
+        evicted_task = asyncio.ensure_future(self.evicted.wait())
+        done, pending = await asyncio.wait(
+            {get_task, evicted_task},
+            timeout=timeout,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        for task in pending:
+            task.cancel()
+
+        if get_task in done:
+            return get_task.result()
+        return None
+
+
+class EventStreamHub:
+    """
+    Multiplex the event stream clients of the process on a single Redis connection.
+
+    The hub subscribes to the union of the channels of its subscribers
+    and dispatches each message to the in-memory queue of the interested ones.
+
+    A subscriber which doesn't consume its queue fast enough is evicted,
+    so the browser can reconnect instead of slowing down everyone else.
+    """
+
+    def __init__(self, redis: Redis, *, queue_size: int) -> None:
+        self.redis = redis
+        self.queue_size = queue_size
+        self._pubsub: PubSub | None = None
+        self._reader: asyncio.Task[None] | None = None
+        self._lock: asyncio.Lock | None = None
+        self._subscribers: dict[str, set[Subscriber]] = {}
+
+    @asynccontextmanager
+    async def subscribe(self, channels: Iterable[str]) -> AsyncIterator[Subscriber]:
+        subscriber = Subscriber(channels, self.queue_size)
+        await self._add_subscriber(subscriber)
+        eventstream_connected_clients.inc()
+        try:
+            yield subscriber
+        finally:
+            eventstream_connected_clients.dec()
+            await self._remove_subscriber(subscriber)
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.close()
+            self._pubsub = None
+        for subscribers in self._subscribers.values():
+            for subscriber in subscribers:
+                subscriber.evicted.set()
+        self._subscribers = {}
+        eventstream_subscribed_channels.set(0)
+
+    def dispatch(self, channel: str, data: str) -> None:
+        for subscriber in list(self._subscribers.get(channel, ())):
+            try:
+                subscriber.queue.put_nowait(data)
+            except asyncio.QueueFull:
+                eventstream_dropped_events.inc()
+                self._evict(subscriber, "slow_consumer")
+
+    async def _add_subscriber(self, subscriber: Subscriber) -> None:
+        async with self._get_lock():
+            new_channels = [
+                channel
+                for channel in subscriber.channels
+                if channel not in self._subscribers
+            ]
+            for channel in subscriber.channels:
+                self._subscribers.setdefault(channel, set()).add(subscriber)
+
+            if new_channels:
+                pubsub = self._get_pubsub()
+                await pubsub.subscribe(*new_channels)
+                eventstream_subscribed_channels.set(len(self._subscribers))
+
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+
+    async def _remove_subscriber(self, subscriber: Subscriber) -> None:
+        async with self._get_lock():
+            stale_channels: list[str] = []
+            for channel in subscriber.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[channel]
+                    stale_channels.append(channel)
+
+            if stale_channels and self._pubsub is not None:
+                await self._pubsub.unsubscribe(*stale_channels)
+                eventstream_subscribed_channels.set(len(self._subscribers))
+
+    def _evict(self, subscriber: Subscriber, reason: str) -> None:
+        if subscriber.evicted.is_set():
+            return
+        subscriber.evicted.set()
+        eventstream_evicted_clients.labels(reason=reason).inc()
+        # Stop dispatching to it right away, Redis unsubscription happens on exit
+        for channel in subscriber.channels:
+            subscribers = self._subscribers.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+
+    async def _read(self) -> None:
+        pubsub = self._get_pubsub()
+        try:
+            while True:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=10.0
+                )
+                if message is not None and message["type"] == "message":
+                    self.dispatch(message["channel"], message["data"])
+        except ConnectionError as e:
+            log.warning("eventstream.hub.connection_error", error=str(e))
+            # Let the clients reconnect, which will setup a fresh connection
+            for subscribers in list(self._subscribers.values()):
+                for subscriber in list(subscribers):
+                    self._evict(subscriber, "connection_error")
+            self._subscribers = {}
+            eventstream_subscribed_channels.set(0)
+            await pubsub.reset()
+            self._pubsub = None
+
+    def _get_pubsub(self) -> PubSub:
+        if self._pubsub is None:
+            self._pubsub = self.redis.pubsub()
+        return self._pubsub
+
+    def _get_lock(self) -> asyncio.Lock:
+        # Lazily created so it's bound to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+
+hub = EventStreamHub(default_redis, queue_size=settings.EVENTSTREAM_QUEUE_SIZE)
+
+
+def get_hub() -> EventStreamHub:
+    return hub
+
+
+__all__ = ["EventStreamHub", "Subscriber", "hub", "get_hub"]
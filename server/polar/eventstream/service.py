@@ -1,8 +1,11 @@
+import json
+from collections.abc import Iterable, Sequence
 from typing import Any
 from uuid import UUID
 
 from pydantic import BaseModel
 
+from polar.config import settings
 from polar.kit.utils import generate_uuid
 from polar.postgres import AsyncSession
 from polar.redis import redis
@@ -39,10 +42,21 @@ class Event(BaseModel):
     payload: dict[str, Any]
 
 
-async def send(event: Event, channels: list[str]) -> None:
+async def send(event: Event, channels: Iterable[str]) -> None:
+    """
+    Publish the event on all the channels in a single round-trip.
+
+    The event is serialized once and duplicate channels are only published once.
+    """
+    unique_channels = list(dict.fromkeys(channels))
+    if not unique_channels:
+        return
+
     event_json = event.model_dump_json()
-    for channel in channels:
-        await redis.publish(channel, event_json)
+    async with redis.pipeline(transaction=False) as pipe:
+        for channel in unique_channels:
+            pipe.publish(channel, event_json)
+        await pipe.execute()
 
 
 async def publish(
@@ -64,22 +78,52 @@ async def publish(
     await send(event, channels)
 
 
+def _get_members_cache_key(organization_id: UUID) -> str:
+    return f"eventstream:members:{organization_id}"
+
+
+async def _get_member_ids(
+    session: AsyncSession, organization_id: UUID
+) -> Sequence[UUID]:
+    """
+    List the members of the organization, cached for a short time
+    since the same organization is usually notified several times in a row.
+    """
+    cache_key = _get_members_cache_key(organization_id)
+    cached = await redis.get(cache_key)
+    if cached is not None:
+        return [UUID(member_id) for member_id in json.loads(cached)]
+
+    member_ids = await user_organization_service.list_user_ids_by_org(
+        session, org_id=organization_id
+    )
+    await redis.setex(
+        cache_key,
+        settings.EVENTSTREAM_MEMBERS_CACHE_TTL_SECONDS,
+        json.dumps([str(member_id) for member_id in member_ids]),
+    )
+    return member_ids
+
+
+async def invalidate_members_cache(organization_id: UUID) -> None:
+    await redis.delete(_get_members_cache_key(organization_id))
+
+
 async def publish_members(
     session: AsyncSession,
     key: str,
     payload: dict[str, Any],
     organization_id: UUID,
 ) -> None:
-    members = await user_organization_service.list_by_org(
-        session, org_id=organization_id
+    member_ids = await _get_member_ids(session, organization_id)
+    channels = [
+        channel
+        for member_id in member_ids
+        for channel in Receivers(user_id=member_id).get_channels()
+    ]
+    event = Event(
+        id=generate_uuid(),
+        key=key,
+        payload=payload,
     )
-
-    for m in members:
-        receivers = Receivers(user_id=m.user_id)
-        channels = receivers.get_channels()
-        event = Event(
-            id=generate_uuid(),
-            key=key,
-            payload=payload,
-        )
-        await send(event, channels)
+    await send(event, channels)
@@ -1,12 +1,21 @@
 import datetime
+import time
 
 from githubkit.cache.base import BaseCache
 
 from polar.redis import redis
 
+# Shared by all the clients of the process, by key: (value, expiration)
+_local_cache: dict[str, tuple[str, float]] = {}
+
 
 class RedisCache(BaseCache):
-    """Redis Backed Cache"""
+    """
+    Redis Backed Cache
+
+    Values are also kept in memory until they expire, so the JWT and
+    installation access tokens don't cost a Redis round-trip on every request.
+    """
 
     def __init__(self) -> None:
         pass
@@ -15,6 +24,13 @@ class RedisCache(BaseCache):
         raise NotImplementedError()
 
     async def aget(self, key: str) -> str | None:
+        local_value = _local_cache.get(key)
+        if local_value is not None:
+            value, expires_at = local_value
+            if expires_at > time.monotonic():
+                return value
+            del _local_cache[key]
+
         return await redis.get("githubkit:" + key)
 
     def set(self, key: str, value: str, ex: datetime.timedelta) -> None:
@@ -22,3 +38,4 @@ class RedisCache(BaseCache):
 
     async def aset(self, key: str, value: str, ex: datetime.timedelta) -> None:
         await redis.setex("githubkit:" + key, time=ex, value=value)
+        _local_cache[key] = (value, time.monotonic() + ex.total_seconds())
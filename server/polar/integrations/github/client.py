@@ -16,11 +16,11 @@ from githubkit.utils import UNSET, Unset
 from pydantic import BaseModel, Field
 
 from polar.config import settings
-from polar.integrations.github.cache import RedisCache
 from polar.models.user import OAuthAccount, OAuthPlatform, User
 from polar.postgres import AsyncSession
 from polar.user.oauth_service import oauth_account_service
 
+from .registry import registry
 from .types import AppPermissionsType
 
 log = structlog.get_logger()
@@ -138,7 +138,7 @@ async def get_refreshed_oauth_client(
 
 
 def get_client(access_token: str) -> GitHub[TokenAuthStrategy]:
-    return GitHub(access_token)
+    return registry.get_token_client(access_token)
 
 
 def get_polar_client() -> GitHub[TokenAuthStrategy]:
@@ -152,15 +152,7 @@ def get_polar_client() -> GitHub[TokenAuthStrategy]:
 
 
 def get_app_client() -> GitHub[AppAuthStrategy]:
-    return GitHub(
-        AppAuthStrategy(
-            app_id=settings.GITHUB_APP_IDENTIFIER,
-            private_key=settings.GITHUB_APP_PRIVATE_KEY,
-            client_id=settings.GITHUB_CLIENT_ID,
-            client_secret=settings.GITHUB_CLIENT_SECRET,
-            cache=RedisCache(),
-        )
-    )
+    return registry.get_app_client()
 
 
 def get_app_installation_client(
@@ -169,20 +161,7 @@ def get_app_installation_client(
     if not installation_id:
         raise Exception("unable to create github client: no installation_id provided")
 
-    # Using the RedisCache() below to cache generated JWTs
-    # This improves ETag/If-None-Match cache hits over the default in-memory cache, as
-    # they can be reused across restarts of the python process and by multiple workers.
-    return GitHub(
-        AppInstallationAuthStrategy(
-            app_id=settings.GITHUB_APP_IDENTIFIER,
-            private_key=settings.GITHUB_APP_PRIVATE_KEY,
-            installation_id=installation_id,
-            client_id=settings.GITHUB_CLIENT_ID,
-            client_secret=settings.GITHUB_CLIENT_SECRET,
-            permissions=permissions,
-            cache=RedisCache(),
-        )
-    )
+    return registry.get_installation_client(installation_id, permissions=permissions)
 
 
 __all__ = [
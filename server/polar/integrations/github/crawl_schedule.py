@@ -0,0 +1,88 @@
+import datetime
+import random
+
+from polar.kit.utils import utc_now
+from polar.models import Issue
+
+# Interval of an open issue with no particular activity
+BASE_INTERVAL = datetime.timedelta(hours=12)
+MIN_INTERVAL = datetime.timedelta(hours=1)
+MAX_INTERVAL = datetime.timedelta(days=14)
+
+# Crawls are postponed by this much when GitHub sent us fresh data anyway,
+# e.g. through a webhook.
+FRESH_DATA_INTERVAL = datetime.timedelta(hours=12)
+
+# Unchanged crawls doubling the interval, at most
+MAX_BACKOFF_STEPS = 4
+
+RECENT_ACTIVITY = datetime.timedelta(days=7)
+DORMANT_ACTIVITY = datetime.timedelta(days=365)
+
+
+def get_crawl_interval(issue: Issue, unchanged_count: int) -> datetime.timedelta:
+    """
+    How long to wait before crawling the issue again.
+
+    The crawl budget goes where data actually changes: issues with pledges,
+    a badge or a recent activity are crawled more often, closed, dormant
+    or repeatedly unchanged ones less.
+    """
+    interval = BASE_INTERVAL
+
+    if issue.pledged_amount_sum > 0:
+        interval /= 4
+    elif issue.pledge_badge_embedded_at is not None or issue.has_pledge_badge_label:
+        interval /= 2
+
+    if issue.state == Issue.State.CLOSED:
+        interval *= 4
+
+    if issue.issue_modified_at is not None:
+        inactivity = utc_now() - issue.issue_modified_at
+        if inactivity < RECENT_ACTIVITY:
+            interval /= 2
+        elif inactivity > DORMANT_ACTIVITY:
+            interval *= 2
+
+    interval *= 2 ** min(unchanged_count, MAX_BACKOFF_STEPS)
+
+    return min(max(interval, MIN_INTERVAL), MAX_INTERVAL)
+
+
+def get_next_crawl_at(issue: Issue, unchanged_count: int) -> datetime.datetime:
+    interval = get_crawl_interval(issue, unchanged_count)
+    # Spread the crawls of issues fetched together
+    jitter = interval * random.uniform(-0.1, 0.1)
+    return utc_now() + interval + jitter
+
+
+def mark_issue_crawled(issue: Issue, *, changed: bool) -> None:
+    """Record a crawl of the issue and schedule the next one."""
+    issue.github_issue_unchanged_count = (
+        0 if changed else issue.github_issue_unchanged_count + 1
+    )
+    issue.github_issue_fetched_at = utc_now()
+    issue.github_issue_next_crawl_at = get_next_crawl_at(
+        issue, issue.github_issue_unchanged_count
+    )
+
+
+def mark_timeline_crawled(issue: Issue, *, changed: bool) -> None:
+    """Record a crawl of the issue timeline and schedule the next one."""
+    issue.github_timeline_unchanged_count = (
+        0 if changed else issue.github_timeline_unchanged_count + 1
+    )
+    issue.github_timeline_fetched_at = utc_now()
+    issue.github_timeline_next_crawl_at = get_next_crawl_at(
+        issue, issue.github_timeline_unchanged_count
+    )
+
+
+__all__ = [
+    "FRESH_DATA_INTERVAL",
+    "get_crawl_interval",
+    "get_next_crawl_at",
+    "mark_issue_crawled",
+    "mark_timeline_crawled",
+]
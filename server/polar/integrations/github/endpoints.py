@@ -49,6 +49,12 @@ from .schemas import (
 )
 from .service.organization import github_organization
 from .service.user import GithubUserServiceError, github_user
+from .webhook_ingestion import (
+    COALESCE_WINDOW_SECONDS,
+    get_coalescing_key,
+    github_webhook_events,
+    webhook_ingestion,
+)
 
 log = structlog.get_logger()
 
@@ -440,12 +446,87 @@ async def enqueue(request: Request) -> WebhookResponse:
     if event_name not in IMPLEMENTED_WEBHOOKS:
         return not_implemented()
 
-    task_name = f"github.webhook.{event_name}"
-    enqueued = await enqueue_job(task_name, event_scope, event_action, json_body)
+    delivery_id = request.headers.get("X-GitHub-Delivery")
+    if delivery_id is not None and not await webhook_ingestion.claim_delivery(
+        delivery_id
+    ):
+        github_webhook_events.labels(event_name, "duplicate").inc()
+        log.info("github.webhook.duplicate", delivery_id=delivery_id)
+        return WebhookResponse(success=True, message="Duplicate delivery")
+
+    payload_key: str | None = None
+    try:
+        payload_key = await webhook_ingestion.store_payload(json_body)
+
+        coalescing_key = get_coalescing_key(event_name, json_body)
+        if coalescing_key is not None:
+            response = await enqueue_coalesced(
+                coalescing_key, event_name, event_scope, event_action, payload_key
+            )
+        else:
+            task_name = f"github.webhook.{event_name}"
+            enqueued = await enqueue_job(
+                task_name, event_scope, event_action, payload_key
+            )
+            if enqueued:
+                github_webhook_events.labels(event_name, "processed").inc()
+                log.info("github.webhook.queued", task_name=task_name)
+                response = WebhookResponse(success=True, job_id=enqueued.job_id)
+            else:
+                response = WebhookResponse(
+                    success=False, message="Failed to enqueue task"
+                )
+    except BaseException:
+        await discard_delivery(delivery_id, payload_key)
+        raise
+
+    if not response.success:
+        await discard_delivery(delivery_id, payload_key)
+
+    return response
+
+
+async def discard_delivery(delivery_id: str | None, payload_key: str | None) -> None:
+    """Forget a delivery which won't be processed, so its redelivery is."""
+    if payload_key is not None:
+        await webhook_ingestion.delete_payload(payload_key)
+    if delivery_id is not None:
+        await webhook_ingestion.release_delivery(delivery_id)
+
+
+async def enqueue_coalesced(
+    key: str,
+    event_name: str,
+    event_scope: str,
+    event_action: str | None,
+    payload_key: str,
+) -> WebhookResponse:
+    already_pending = await webhook_ingestion.push(
+        key,
+        {
+            "event_name": event_name,
+            "scope": event_scope,
+            "action": event_action,
+            "payload": payload_key,
+        },
+    )
+    if already_pending:
+        github_webhook_events.labels(event_name, "coalesced").inc()
+        log.info("github.webhook.coalesced", key=key)
+        return WebhookResponse(success=True, message="Coalesced")
+
+    try:
+        enqueued = await enqueue_job(
+            "github.webhook.coalesced", key, _defer_by=COALESCE_WINDOW_SECONDS
+        )
+    except BaseException:
+        await webhook_ingestion.discard(key)
+        raise
     if not enqueued:
+        await webhook_ingestion.discard(key)
         return WebhookResponse(success=False, message="Failed to enqueue task")
 
-    log.info("github.webhook.queued", task_name=task_name)
+    log.info("github.webhook.queued", task_name="github.webhook.coalesced", key=key)
     return WebhookResponse(success=True, job_id=enqueued.job_id)
 
 
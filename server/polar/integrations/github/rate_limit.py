@@ -0,0 +1,311 @@
+import asyncio
+import contextvars
+import enum
+import math
+import time
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager
+
+from prometheus_client import Counter
+
+from polar.exceptions import PolarError
+from polar.redis import Redis
+from polar.redis import redis as default_redis
+
+github_rate_limit_waits = Counter(
+    "github_rate_limit_waits",
+    "GitHub requests delayed or rejected to respect the rate limit budget",
+    ["priority", "outcome"],
+)
+
+# Longer waits are left to the job queue, to not hold a worker
+MAX_PACING_DELAY_SECONDS = 10
+
+# GitHub asks to wait at least a second between requests creating content,
+# e.g. invitations, or they trigger the secondary rate limits.
+WRITE_INTERVAL_SECONDS = 1.0
+
+
+class GitHubRateLimitPriority(enum.IntEnum):
+    """
+    Who a GitHub request is made for.
+
+    Lower priorities can't consume the share of the budget
+    reserved for the higher ones.
+    """
+
+    webhook = 0
+    badge = 1
+    crawl = 2
+
+    @property
+    def reserve(self) -> float:
+        """Fraction of the rate limit this priority leaves untouched."""
+        return {
+            GitHubRateLimitPriority.webhook: 0.0,
+            GitHubRateLimitPriority.badge: 0.1,
+            GitHubRateLimitPriority.crawl: 0.3,
+        }[self]
+
+    @property
+    def paced(self) -> bool:
+        """Whether requests are spread evenly until the rate limit resets."""
+        return self == GitHubRateLimitPriority.crawl
+
+
+_priority: contextvars.ContextVar[GitHubRateLimitPriority] = contextvars.ContextVar(
+    "github_rate_limit_priority", default=GitHubRateLimitPriority.webhook
+)
+
+
+def get_priority() -> GitHubRateLimitPriority:
+    return _priority.get()
+
+
+@contextmanager
+def priority(value: GitHubRateLimitPriority) -> Iterator[None]:
+    token = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimitBudgetExceeded(PolarError):
+    def __init__(self, bucket: str, retry_after: int) -> None:
+        self.bucket = bucket
+        self.retry_after = retry_after
+        message = (
+            f"The GitHub rate limit budget of {bucket} is exhausted "
+            f"for this priority, retry in {retry_after} seconds."
+        )
+        super().__init__(message)
+
+
+# KEYS[1]: bucket hash
+# ARGV: now, cost, reserve fraction, paced (0/1), maximum pacing interval
+# Returns the number of seconds to wait, 0 if the request can be made right away.
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local reserve = tonumber(ARGV[3])
+local paced = ARGV[4] == "1"
+local max_interval = tonumber(ARGV[5])
+
+local state = redis.call("HMGET", KEYS[1], "limit", "remaining", "reset", "next_at")
+local limit = tonumber(state[1])
+if limit == nil then
+    -- Nothing known yet, the response headers will tell
+    return "0"
+end
+local remaining = tonumber(state[2])
+local reset = tonumber(state[3])
+local next_at = tonumber(state[4]) or 0
+
+if reset <= now then
+    remaining = limit
+    reset = math.floor(now) + 3600
+    redis.call("HSET", KEYS[1], "remaining", remaining, "reset", reset)
+end
+
+local available = remaining - math.floor(limit * reserve)
+if available < cost then
+    return tostring(reset - now)
+end
+
+if paced then
+    if next_at > now then
+        return tostring(next_at - now)
+    end
+    -- Capped so paced requests always fit in the in-process wait:
+    -- multi-request jobs would otherwise be rejected on their second request,
+    -- and start over from scratch on every retry.
+    -- The reserve still protects the higher priorities.
+    local interval = math.min((reset - now) / available * cost, max_interval)
+    redis.call("HSET", KEYS[1], "next_at", tostring(now + interval))
+end
+
+redis.call("HINCRBY", KEYS[1], "remaining", -cost)
+return "0"
+"""
+
+
+# KEYS[1]: next write slot
+# ARGV: now, interval, maximum wait
+# Returns the number of seconds to wait for the reserved slot.
+# If it's longer than the maximum wait, the slot is not reserved.
+_RESERVE_WRITE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+
+local next_at = tonumber(redis.call("GET", KEYS[1])) or now
+if next_at < now then
+    next_at = now
+end
+
+local wait = next_at - now
+if wait > max_wait then
+    return tostring(wait)
+end
+
+redis.call("SET", KEYS[1], tostring(next_at + interval), "EX", 3600)
+return tostring(wait)
+"""
+
+
+def get_installation_bucket(installation_id: int) -> str:
+    return f"installation:{installation_id}"
+
+
+class RateLimitBudget:
+    """
+    Cluster-wide budget of GitHub requests, shared by all the workers.
+
+    There is one bucket per installation or token, and per rate-limit resource.
+    Its state is refreshed from the rate-limit headers of every response,
+    and decremented by every request in-between.
+
+    Requests are admitted by priority: lower ones keep a reserve for the higher
+    ones, and background crawls are paced evenly until the rate limit resets
+    instead of bursting.
+    """
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+
+    def _get_key(self, bucket: str, resource: str) -> str:
+        return f"github:rate_limit:{bucket}:{resource}"
+
+    async def acquire(
+        self,
+        bucket: str,
+        priority: GitHubRateLimitPriority,
+        *,
+        resource: str = "core",
+        cost: int = 1,
+    ) -> float:
+        """
+        Consume `cost` requests from the budget.
+
+        Returns the number of seconds to wait before trying again
+        if the budget doesn't allow it now, 0 if it was consumed.
+        """
+        wait = await self.redis.eval(
+            _ACQUIRE_SCRIPT,
+            1,
+            self._get_key(bucket, resource),
+            time.time(),
+            cost,
+            priority.reserve,
+            int(priority.paced),
+            MAX_PACING_DELAY_SECONDS,
+        )
+        return float(wait)
+
+    async def reserve_write(
+        self,
+        bucket: str,
+        *,
+        interval: float = WRITE_INTERVAL_SECONDS,
+        max_wait: float = MAX_PACING_DELAY_SECONDS,
+    ) -> float:
+        """
+        Reserve the next write slot of the bucket.
+
+        Writes are spaced by `interval` across all the workers.
+        Returns the number of seconds to wait for the slot:
+        if it's more than `max_wait`, no slot was reserved.
+        """
+        wait = await self.redis.eval(
+            _RESERVE_WRITE_SCRIPT,
+            1,
+            self._get_key(bucket, "write"),
+            time.time(),
+            interval,
+            max_wait,
+        )
+        return float(wait)
+
+    async def update(self, bucket: str, headers: Mapping[str, str]) -> None:
+        """Update the budget from the rate-limit headers of a GitHub response."""
+        try:
+            limit = int(headers["x-ratelimit-limit"])
+            remaining = int(headers["x-ratelimit-remaining"])
+            reset = int(headers["x-ratelimit-reset"])
+        except (KeyError, ValueError):
+            return
+
+        resource = headers.get("x-ratelimit-resource", "core")
+        key = self._get_key(bucket, resource)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(
+                key, mapping={"limit": limit, "remaining": remaining, "reset": reset}
+            )
+            pipe.expireat(key, reset + 3600)
+            await pipe.execute()
+
+    async def get_remaining(self, bucket: str, resource: str = "core") -> int | None:
+        """Requests remaining in the bucket, if known."""
+        remaining, reset = await self.redis.hmget(
+            self._get_key(bucket, resource), ["remaining", "reset"]
+        )
+        if remaining is None or reset is None or int(reset) <= time.time():
+            return None
+        return int(remaining)
+
+
+rate_limit_budget = RateLimitBudget(default_redis)
+
+
+async def wait_for_budget(bucket: str, *, resource: str = "core") -> None:
+    """
+    Wait until the budget allows a request with the current priority.
+
+    Raises `RateLimitBudgetExceeded` if it would take too long.
+    """
+    current_priority = get_priority()
+    while True:
+        wait = await rate_limit_budget.acquire(
+            bucket, current_priority, resource=resource
+        )
+        if wait <= 0:
+            return
+        if wait > MAX_PACING_DELAY_SECONDS:
+            github_rate_limit_waits.labels(
+                priority=current_priority.name, outcome="rejected"
+            ).inc()
+            raise RateLimitBudgetExceeded(bucket, math.ceil(wait))
+        github_rate_limit_waits.labels(
+            priority=current_priority.name, outcome="delayed"
+        ).inc()
+        await asyncio.sleep(wait)
+
+
+async def wait_for_write_slot(bucket: str) -> None:
+    """
+    Wait until a write request can be made without tripping
+    the secondary rate limits.
+
+    Raises `RateLimitBudgetExceeded` if it would take too long.
+    """
+    wait = await rate_limit_budget.reserve_write(bucket)
+    if wait > MAX_PACING_DELAY_SECONDS:
+        github_rate_limit_waits.labels(priority="write", outcome="rejected").inc()
+        raise RateLimitBudgetExceeded(bucket, math.ceil(wait))
+    if wait > 0:
+        github_rate_limit_waits.labels(priority="write", outcome="delayed").inc()
+        await asyncio.sleep(wait)
+
+
+__all__ = [
+    "GitHubRateLimitPriority",
+    "RateLimitBudget",
+    "RateLimitBudgetExceeded",
+    "get_installation_bucket",
+    "get_priority",
+    "priority",
+    "rate_limit_budget",
+    "wait_for_budget",
+    "wait_for_write_slot",
+]
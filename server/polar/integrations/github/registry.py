@@ -0,0 +1,307 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from collections.abc import AsyncGenerator, Hashable
+from contextlib import asynccontextmanager
+from typing import Any, TypeVar
+
+import hishel
+import httpx
+import structlog
+from githubkit import (
+    AppAuthStrategy,
+    AppInstallationAuthStrategy,
+    GitHub,
+    TokenAuthStrategy,
+)
+from githubkit.auth.base import BaseAuthStrategy
+from githubkit.utils import UNSET, Unset
+from httpx._types import URLTypes
+from prometheus_client import Counter, Gauge
+
+from polar.config import settings
+from polar.logging import Logger
+
+from .cache import RedisCache
+from .rate_limit import get_installation_bucket, rate_limit_budget, wait_for_budget
+from .types import AppPermissionsType
+
+log: Logger = structlog.get_logger()
+
+A = TypeVar("A", bound=BaseAuthStrategy)
+
+github_client_registry_clients = Gauge(
+    "github_client_registry_clients", "GitHub clients kept in the registry"
+)
+github_client_registry_connections = Gauge(
+    "github_client_registry_connections",
+    "Connections opened in the GitHub connection pool",
+)
+github_client_registry_lookups = Counter(
+    "github_client_registry_lookups",
+    "Lookups of GitHub clients in the registry",
+    ["kind", "result"],
+)
+github_client_registry_evictions = Counter(
+    "github_client_registry_evictions",
+    "GitHub clients closed by the registry",
+    ["reason"],
+)
+
+
+class _SharedTransport(httpx.AsyncBaseTransport):
+    """Let a client use the pool of the registry without closing it."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport) -> None:
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        # The pool is owned by the registry
+        pass
+
+
+class PooledGitHub(GitHub[A]):
+    """
+    GitHub client keeping a single HTTP client for its whole life,
+    on top of the connection pool of the registry.
+
+    Vanilla clients create a new HTTP client, hence new connections,
+    on every request made outside of an `async with` block.
+
+    Requests go through the cluster-wide rate limit budget of the client.
+    """
+
+    _transport: httpx.AsyncBaseTransport
+    _http_client: httpx.AsyncClient | None = None
+    last_used_at: float
+    rate_limit_bucket: str
+
+    def _create_async_client(self) -> httpx.AsyncClient:
+        transport: httpx.AsyncBaseTransport = _SharedTransport(self._transport)
+        if self.config.http_cache:
+            transport = hishel.AsyncCacheTransport(
+                transport, storage=hishel.AsyncInMemoryStorage()
+            )
+        return httpx.AsyncClient(**self._get_client_defaults(), transport=transport)
+
+    @asynccontextmanager
+    async def get_async_client(self) -> AsyncGenerator[httpx.AsyncClient, None]:
+        self.last_used_at = time.monotonic()
+        if self._http_client is None:
+            self._http_client = self._create_async_client()
+        yield self._http_client
+
+    async def _arequest(
+        self, method: str, url: URLTypes, **kwargs: Any
+    ) -> httpx.Response:
+        resource = "graphql" if str(url).endswith("/graphql") else "core"
+        await wait_for_budget(self.rate_limit_bucket, resource=resource)
+        response = await super()._arequest(method, url, **kwargs)
+        await rate_limit_budget.update(self.rate_limit_bucket, response.headers)
+        return response
+
+    async def aclose(self) -> None:
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+
+class GitHubClientRegistry:
+    """
+    Process-wide registry of long-lived GitHub clients.
+
+    One client is kept per installation or token, so keep-alive connections,
+    HTTP cache and installation access tokens are reused across tasks.
+    All of them share a single connection pool.
+
+    Clients unused for `idle_timeout` seconds are closed,
+    as well as the least recently used ones beyond `max_clients`.
+    """
+
+    def __init__(
+        self,
+        *,
+        idle_timeout: float,
+        max_clients: int,
+        max_connections: int,
+        http2: bool,
+    ) -> None:
+        self.idle_timeout = idle_timeout
+        self.max_clients = max_clients
+        self.max_connections = max_connections
+        self.http2 = http2
+        self._clients: OrderedDict[Hashable, PooledGitHub[Any]] = OrderedDict()
+        self._transport: httpx.AsyncHTTPTransport | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._last_sweep_at = time.monotonic()
+        github_client_registry_connections.set_function(self._count_connections)
+
+    def get_installation_client(
+        self,
+        installation_id: int,
+        *,
+        permissions: AppPermissionsType | Unset = UNSET,
+    ) -> GitHub[AppInstallationAuthStrategy]:
+        key = (
+            "installation",
+            installation_id,
+            None
+            if isinstance(permissions, Unset)
+            else tuple(sorted(permissions.items())),
+        )
+        client = self._get(key, "installation")
+        if client is None:
+            bucket = get_installation_bucket(installation_id)
+            # Using the RedisCache() below to cache generated JWTs
+            # and installation access tokens across processes.
+            client = self._add(
+                key,
+                bucket,
+                PooledGitHub(
+                    AppInstallationAuthStrategy(
+                        app_id=settings.GITHUB_APP_IDENTIFIER,
+                        private_key=settings.GITHUB_APP_PRIVATE_KEY,
+                        installation_id=installation_id,
+                        client_id=settings.GITHUB_CLIENT_ID,
+                        client_secret=settings.GITHUB_CLIENT_SECRET,
+                        permissions=permissions,
+                        cache=RedisCache(),
+                    )
+                ),
+            )
+        return client
+
+    def get_app_client(self) -> GitHub[AppAuthStrategy]:
+        key = ("app",)
+        client = self._get(key, "app")
+        if client is None:
+            client = self._add(
+                key,
+                "app",
+                PooledGitHub(
+                    AppAuthStrategy(
+                        app_id=settings.GITHUB_APP_IDENTIFIER,
+                        private_key=settings.GITHUB_APP_PRIVATE_KEY,
+                        client_id=settings.GITHUB_CLIENT_ID,
+                        client_secret=settings.GITHUB_CLIENT_SECRET,
+                        cache=RedisCache(),
+                    )
+                ),
+            )
+        return client
+
+    def get_token_client(self, access_token: str) -> GitHub[TokenAuthStrategy]:
+        # Don't keep the raw tokens around as keys
+        token_hash = hashlib.sha256(access_token.encode()).hexdigest()
+        key = ("token", token_hash)
+        client = self._get(key, "token")
+        if client is None:
+            client = self._add(
+                key,
+                f"token:{token_hash}",
+                PooledGitHub(TokenAuthStrategy(access_token)),
+            )
+        return client
+
+    async def close(self) -> None:
+        clients = list(self._clients.values())
+        self._clients.clear()
+        github_client_registry_clients.set(0)
+        for client in clients:
+            await client.aclose()
+        if self._transport is not None:
+            await self._transport.aclose()
+            self._transport = None
+        self._loop = None
+
+    def _get(self, key: Hashable, kind: str) -> Any:
+        self._check_loop()
+        self._sweep()
+        client = self._clients.get(key)
+        if client is None:
+            github_client_registry_lookups.labels(kind=kind, result="miss").inc()
+            return None
+        github_client_registry_lookups.labels(kind=kind, result="hit").inc()
+        self._clients.move_to_end(key)
+        return client
+
+    def _add(
+        self, key: Hashable, rate_limit_bucket: str, client: PooledGitHub[A]
+    ) -> PooledGitHub[A]:
+        client._transport = self._get_transport()
+        client.rate_limit_bucket = rate_limit_bucket
+        client.last_used_at = time.monotonic()
+        self._clients[key] = client
+        while len(self._clients) > self.max_clients:
+            _, evicted = self._clients.popitem(last=False)
+            self._close_later(evicted, "capacity")
+        github_client_registry_clients.set(len(self._clients))
+        return client
+
+    def _sweep(self) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep_at < self.idle_timeout / 2:
+            return
+        self._last_sweep_at = now
+        for key, client in list(self._clients.items()):
+            if now - client.last_used_at > self.idle_timeout:
+                del self._clients[key]
+                self._close_later(client, "idle")
+        github_client_registry_clients.set(len(self._clients))
+
+    def _close_later(self, client: PooledGitHub[Any], reason: str) -> None:
+        github_client_registry_evictions.labels(reason=reason).inc()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # Closing only releases the HTTP client, the pool stays open
+        loop.create_task(client.aclose())
+
+    def _get_transport(self) -> httpx.AsyncHTTPTransport:
+        if self._transport is None:
+            self._transport = httpx.AsyncHTTPTransport(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.idle_timeout,
+                ),
+            )
+        return self._transport
+
+    def _check_loop(self) -> None:
+        """
+        Connections are bound to the event loop they were opened on.
+
+        Start from a fresh pool if the loop changed, e.g. between tests.
+        """
+        try:
+            loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if self._loop is not loop:
+            self._clients.clear()
+            self._transport = None
+            self._loop = loop
+            github_client_registry_clients.set(0)
+
+    def _count_connections(self) -> int:
+        if self._transport is None:
+            return 0
+        return len(self._transport._pool.connections)
+
+
+registry = GitHubClientRegistry(
+    idle_timeout=settings.GITHUB_CLIENT_IDLE_TIMEOUT_SECONDS,
+    max_clients=settings.GITHUB_CLIENT_REGISTRY_MAX_CLIENTS,
+    max_connections=settings.GITHUB_CLIENT_MAX_CONNECTIONS,
+    http2=settings.GITHUB_CLIENT_HTTP2,
+)
+
+
+__all__ = ["GitHubClientRegistry", "PooledGitHub", "registry"]
@@ -3,13 +3,15 @@ from __future__ import annotations
 import asyncio
 import datetime
 from collections.abc import Awaitable, Sequence
-from typing import Any, Literal
+from typing import Any, Literal, cast
 from uuid import UUID
 
 import structlog
 from githubkit import GitHub, Paginator
-from githubkit.exception import RequestFailed
-from sqlalchemy import asc, or_
+from githubkit.exception import GraphQLFailed, PrimaryRateLimitExceeded, RequestFailed
+from githubkit.graphql import GraphQLResponse, build_graphql_request
+from githubkit.utils import UNSET
+from sqlalchemy import or_
 
 from polar.dashboard.schemas import IssueSortBy
 from polar.enums import Platforms
@@ -36,12 +38,100 @@ from polar.repository.hooks import (
 from .. import client as github
 from .. import types
 from ..badge import GithubBadge
+from ..crawl_schedule import FRESH_DATA_INTERVAL, mark_issue_crawled
 from .organization import github_organization
-from .paginated import ErrorCount, SyncedCount, github_paginated_service
+from .paginated import (
+    ErrorCount,
+    SyncCheckpoint,
+    SyncedCount,
+    github_paginated_service,
+)
 from .repository import github_repository
 
 log: Logger = structlog.get_logger()
 
+# Issues refreshed per GraphQL query, keeping it well below the node limit
+SYNC_ISSUES_BATCH_SIZE = 100
+
+_ISSUES_BATCH_QUERY_FRAGMENTS = """
+fragment ActorFields on Actor {
+  __typename
+  login
+  avatarUrl
+  url
+  ... on User {
+    databaseId
+  }
+  ... on Bot {
+    databaseId
+  }
+}
+
+fragment IssueFields on Issue {
+  databaseId
+  number
+  title
+  body
+  state
+  stateReason
+  authorAssociation
+  createdAt
+  updatedAt
+  closedAt
+  author {
+    ...ActorFields
+  }
+  comments {
+    totalCount
+  }
+  labels(first: 50) {
+    nodes {
+      id
+      name
+      color
+      description
+      isDefault
+    }
+  }
+  assignees(first: 10) {
+    nodes {
+      ...ActorFields
+    }
+  }
+  milestone {
+    number
+    title
+    state
+    dueOn
+    url
+  }
+  reactionGroups {
+    content
+    reactors {
+      totalCount
+    }
+  }
+  repository {
+    databaseId
+  }
+}
+"""
+
+
+def _get_issues_batch_query(numbers: Sequence[int]) -> str:
+    issues = "\n".join(
+        f"    issue{i}: issueOrPullRequest(number: {number}) "
+        "{ __typename ...IssueFields }"
+        for i, number in enumerate(numbers)
+    )
+    return (
+        "query ($owner: String!, $name: String!) {\n"
+        "  repository(owner: $owner, name: $name) {\n"
+        f"{issues}\n"
+        "  }\n"
+        "}\n" + _ISSUES_BATCH_QUERY_FRAGMENTS
+    )
+
 
 class GithubIssueService(IssueService):
     async def get_by_external_id(
@@ -133,9 +223,26 @@ class GithubIssueService(IssueService):
             schemas,
             constraints=[Issue.external_id],
             mutable_keys=IssueCreate.__mutable_keys__,
-            autocommit=autocommit,
+            autocommit=False,
         )
 
+        # We just got fresh data, e.g. from a webhook: no need to crawl it soon
+        fresh_until = utc_now() + FRESH_DATA_INTERVAL
+        await session.execute(
+            sql.update(Issue)
+            .where(
+                Issue.id.in_([record.id for record in records]),
+                or_(
+                    Issue.github_issue_next_crawl_at.is_(None),
+                    Issue.github_issue_next_crawl_at < fresh_until,
+                ),
+            )
+            .values(github_issue_next_crawl_at=fresh_until)
+            .execution_options(synchronize_session="fetch")
+        )
+        if autocommit:
+            await session.commit()
+
         # We're currently in a bit of a pickle here.
         #
         # We're propagating the session to the hook functions, and they are unable
@@ -320,7 +427,7 @@ class GithubIssueService(IssueService):
         except RequestFailed as e:
             if e.response.status_code == 404:
                 log.info("github.sync_issue.404.marking_as_crawled")
-                issue.github_issue_fetched_at = utc_now()
+                mark_issue_crawled(issue, changed=False)
                 await issue.save(session)
                 return
             elif e.response.status_code == 410:  # 410 Gone, i.e. deleted
@@ -333,6 +440,8 @@ class GithubIssueService(IssueService):
         # Cache hit, nothing new
         if res.status_code == 304:
             log.info("github.sync_issue.etag_cache_hit", issue_id=issue.id)
+            mark_issue_crawled(issue, changed=False)
+            await issue.save(session)
             return
 
         if res.status_code == 200:
@@ -375,26 +484,157 @@ class GithubIssueService(IssueService):
                 )
 
             # Save etag
-            issue.github_issue_fetched_at = utc_now()
+            mark_issue_crawled(issue, changed=do_upsert)
             issue.github_issue_etag = res.headers.get("etag", None)
             await issue.save(session)
 
+    async def sync_issues_batch(
+        self,
+        session: AsyncSession,
+        *,
+        org: Organization,
+        repo: Repository,
+        issues: Sequence[Issue],
+        crawl_with_installation_id: int
+        | None = None,  # Override which installation to use when crawling
+    ) -> Sequence[Issue]:
+        """
+        Refresh issues of a repository with a single GraphQL query.
+
+        Only the issues modified since they were last fetched are upserted,
+        in bulk. The crawl of the whole batch is then recorded in one flush,
+        scheduling the next crawl of each issue.
+
+        GraphQL doesn't tell deleted issues from inaccessible ones:
+        the issues not found are synced one by one with the REST API,
+        soft-deleting the deleted ones.
+
+        Returns the upserted issues.
+        """
+        if len(issues) > SYNC_ISSUES_BATCH_SIZE:
+            raise ValueError(
+                f"Can't sync more than {SYNC_ISSUES_BATCH_SIZE} issues at once"
+            )
+        if not issues:
+            return []
+
+        installation_id = (
+            crawl_with_installation_id
+            if crawl_with_installation_id
+            else org.safe_installation_id
+        )
+        client = github.get_app_installation_client(installation_id)
+
+        log.info("github.sync_issues_batch", repository_id=repo.id, count=len(issues))
+
+        response = await client.arequest(
+            "POST",
+            "/graphql",
+            json=build_graphql_request(
+                _get_issues_batch_query([issue.number for issue in issues]),
+                {"owner": org.name, "name": repo.name},
+            ),
+            response_model=GraphQLResponse,
+        )
+        result = response.parsed_data
+        errors = result.errors or []
+        if any(error.type == "RATE_LIMITED" for error in errors):
+            raise PrimaryRateLimitExceeded(
+                response, client._extract_retry_after(response)
+            )
+        # Deleted, transferred or inaccessible issues are NOT_FOUND
+        if any(error.type != "NOT_FOUND" for error in errors):
+            raise GraphQLFailed(result)
+
+        repository_data = (result.data or {}).get("repository") or {}
+        create_schemas: list[IssueCreate] = []
+        changed_ids: set[UUID] = set()
+        not_found_issues: list[Issue] = []
+        for i, issue in enumerate(issues):
+            data = repository_data.get(f"issue{i}")
+            if not data:
+                not_found_issues.append(issue)
+                continue
+            # A pull request
+            if data["__typename"] != "Issue":
+                continue
+
+            # The issue moved, see sync_issue
+            if (
+                data["repository"]["databaseId"] != repo.external_id
+                or data["number"] != issue.number
+            ):
+                log.info(
+                    "github.sync_issues_batch.moved_skipping",
+                    issue_id=issue.id,
+                    got_repo_id=data["repository"]["databaseId"],
+                    got_issue_number=data["number"],
+                )
+                continue
+
+            # Nothing new, what the ETag is for with the REST API
+            modified_at = datetime.datetime.fromisoformat(data["updatedAt"])
+            if issue.issue_modified_at and modified_at <= issue.issue_modified_at:
+                continue
+
+            create_schemas.append(IssueCreate.from_github_graphql(data, org, repo))
+            changed_ids.add(issue.id)
+
+        records: Sequence[Issue] = []
+        if create_schemas:
+            records = await self.upsert_many(
+                session,
+                create_schemas,
+                constraints=[Issue.external_id],
+                mutable_keys=IssueCreate.__mutable_keys__ - {"closed_by"},
+                autocommit=False,
+            )
+
+        # Upserted records are the same instances, refreshed
+        for issue in issues:
+            if issue not in not_found_issues:
+                mark_issue_crawled(issue, changed=issue.id in changed_ids)
+        await session.commit()
+
+        for record in records:
+            await issue_upserted.call(IssueHook(session, record))
+
+        for issue in not_found_issues:
+            await self.sync_issue(
+                session,
+                org,
+                repo,
+                issue,
+                crawl_with_installation_id=crawl_with_installation_id,
+            )
+
+        log.info(
+            "github.sync_issues_batch.done",
+            repository_id=repo.id,
+            count=len(issues),
+            updated=len(records),
+            not_found=len(not_found_issues),
+        )
+        return records
+
     async def list_issues_to_crawl_issue(
         self,
         session: AsyncSession,
         organization: Organization,
     ) -> Sequence[Issue]:
-        current_time = utc_now()
-        cutoff_time = current_time - datetime.timedelta(hours=12)
+        """
+        Issues due for a crawl, as scheduled by `mark_issue_crawled`.
 
+        Never crawled ones come first.
+        """
         stmt = (
             sql.select(Issue)
             .join(Issue.organization)
             .join(Issue.repository)
             .where(
                 or_(
-                    Issue.github_issue_fetched_at.is_(None),
-                    Issue.github_issue_fetched_at < cutoff_time,
+                    Issue.github_issue_next_crawl_at.is_(None),
+                    Issue.github_issue_next_crawl_at <= utc_now(),
                 ),
                 Issue.deleted_at.is_(None),
                 Organization.deleted_at.is_(None),
@@ -402,7 +642,7 @@ class GithubIssueService(IssueService):
                 Organization.installation_id.is_not(None),
                 Organization.id == organization.id,
             )
-            .order_by(asc(Issue.github_issue_fetched_at))
+            .order_by(Issue.github_issue_next_crawl_at.asc().nulls_first())
             .limit(100)
         )
 
@@ -415,17 +655,19 @@ class GithubIssueService(IssueService):
         session: AsyncSession,
         organization: Organization,
     ) -> Sequence[Issue]:
-        current_time = utc_now()
-        cutoff_time = current_time - datetime.timedelta(hours=12)
+        """
+        Issues due for a crawl, as scheduled by `mark_timeline_crawled`.
 
+        Never crawled ones come first.
+        """
         stmt = (
             sql.select(Issue)
             .join(Issue.organization)
             .join(Issue.repository)
             .where(
                 or_(
-                    Issue.github_timeline_fetched_at.is_(None),
-                    Issue.github_timeline_fetched_at < cutoff_time,
+                    Issue.github_timeline_next_crawl_at.is_(None),
+                    Issue.github_timeline_next_crawl_at <= utc_now(),
                 ),
                 Issue.deleted_at.is_(None),
                 Organization.deleted_at.is_(None),
@@ -433,7 +675,7 @@ class GithubIssueService(IssueService):
                 Organization.installation_id.is_not(None),
                 Organization.id == organization.id,
             )
-            .order_by(asc(Issue.github_timeline_fetched_at))
+            .order_by(Issue.github_timeline_next_crawl_at.asc().nulls_first())
             .limit(100)
         )
 
@@ -499,12 +741,16 @@ class GithubIssueService(IssueService):
         github_labels: list[types.Label]
         | list[types.WebhookIssuesLabeledPropIssuePropLabelsItems]
         | list[types.WebhookIssuesUnlabeledPropIssuePropLabelsItems],
+        *,
+        modified_at: datetime.datetime | None = None,
     ) -> Issue:
         labels = [label.model_dump(mode="json") for label in github_labels]
         issue.labels = labels
         issue.has_pledge_badge_label = Issue.contains_pledge_badge_label(
             labels, repository.pledge_badge_label
         )
+        if modified_at is not None:
+            issue.issue_modified_at = modified_at
         session.add(issue)
         await session.commit()
 
@@ -650,10 +896,19 @@ class GithubIssueService(IssueService):
         state: Literal["open", "closed", "all"] = "open",
         sort: Literal["created", "updated", "comments"] = "updated",
         direction: Literal["asc", "desc"] = "desc",
-        per_page: int = 30,
+        per_page: int = 100,
+        full: bool = False,
         crawl_with_installation_id: int
         | None = None,  # Override which installation to use when crawling
     ) -> tuple[SyncedCount, ErrorCount]:
+        """
+        Sync the issues of the repository.
+
+        Unless `full` is set, only the issues updated since the last successful
+        sync are fetched, whatever their state, so closed ones are caught too.
+        The first sync of a repository is always a full one.
+        """
+
         # We get PRs in the issues list too, but super slim versions of them.
         # Since we sync PRs separately, we therefore skip them here.
         def skip_if_pr(
@@ -673,6 +928,16 @@ class GithubIssueService(IssueService):
 
         client = github.get_app_installation_client(installation_id)
 
+        since = None if full else repository.issues_synced_until
+        checkpoint = SyncCheckpoint(since)
+        if since is not None:
+            log.info(
+                "github.sync_issues.incremental",
+                repository_id=repository.id,
+                since=since,
+            )
+            state, sort, direction = "all", "updated", "desc"
+
         paginator: Paginator[types.Issue] = client.paginate(
             client.rest.issues.async_list_for_repo,
             owner=organization.name,
@@ -680,19 +945,37 @@ class GithubIssueService(IssueService):
             state=state,
             sort=sort,
             direction=direction,
+            # githubkit would send `str(since)`, which isn't ISO 8601
+            since=cast(datetime.datetime, since.isoformat())
+            if since is not None
+            else UNSET,
             per_page=per_page,
         )
         synced, errors = await github_paginated_service.store_paginated_resource(
             session,
-            paginator=paginator,
-            store_resource_method=github_issue.store,
+            paginator=checkpoint.track(paginator),
+            store_many_resource_method=github_issue.store_many,
             organization=organization,
             repository=repository,
             skip_condition=skip_if_pr,
             on_sync_signal=repository_issue_synced,
             on_completed_signal=repository_issues_sync_completed,
             resource_type="issue",
+            batch_size=per_page,
         )
+
+        # Resources which failed to store are below the mark:
+        # don't move it, so the next sync fetches them again
+        if errors == 0:
+            repository.issues_synced_until = checkpoint.updated_at
+            await repository.save(session)
+        else:
+            log.info(
+                "github.sync_issues.synced_until_kept",
+                repository_id=repository.id,
+                errors=errors,
+            )
+
         return (synced, errors)
 
     async def list_issues_from_starred(
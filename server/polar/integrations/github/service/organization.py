@@ -11,6 +11,9 @@ from githubkit.exception import RequestFailed
 from pydantic import BaseModel
 
 from polar.enums import Platforms
+from polar.eventstream.service import (
+    invalidate_members_cache as invalidate_eventstream_members_cache,
+)
 from polar.exceptions import ResourceAlreadyExists, ResourceNotFound
 from polar.integrations.github.service.user import github_user as github_user_service
 from polar.kit.utils import utc_now
@@ -455,6 +458,7 @@ class GithubOrganizationService(OrganizationService):
                 continue
 
             await user_organization_service.remove_member(session, db_m.user_id, org.id)
+            await invalidate_eventstream_members_cache(org.id)
 
         await subscription_service.update_organization_benefits_grants(session, org)
 
@@ -1,10 +1,16 @@
 from __future__ import annotations
 
-from collections.abc import Callable, Coroutine
-from typing import Any, Literal
+import datetime
+from collections.abc import (
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Coroutine,
+    Sequence,
+)
+from typing import Any, Literal, TypeVar
 
 import structlog
-from githubkit import Paginator
 
 from polar.kit.hook import Hook
 from polar.models import Issue, Organization, Repository
@@ -20,15 +26,46 @@ log = structlog.get_logger()
 SyncedCount = int
 ErrorCount = int
 
+PaginatedResource = TypeVar("PaginatedResource", types.Issue, types.PullRequestSimple)
+
+
+class SyncCheckpoint:
+    """
+    High-water mark of an incremental sync: the latest `updated_at`
+    of the resources seen so far.
+
+    Resources must be listed by `updated_at`, most recent first.
+    """
+
+    def __init__(self, since: datetime.datetime | None) -> None:
+        self.since = since
+        self.updated_at = since
+
+    async def track(
+        self, paginator: AsyncIterable[PaginatedResource]
+    ) -> AsyncIterator[PaginatedResource]:
+        """
+        Iterate over the resources, recording the high-water mark.
+
+        Stops at the first resource not updated since the previous mark,
+        for the APIs without a `since` parameter.
+        """
+        async for data in paginator:
+            if self.since is not None and data.updated_at < self.since:
+                return
+            if self.updated_at is None or data.updated_at > self.updated_at:
+                self.updated_at = data.updated_at
+            yield data
+
 
 class GitHubPaginatedService:
     async def store_paginated_resource(
         self,
         session: AsyncSession,
         *,
-        paginator: Paginator[types.Issue] | Paginator[types.PullRequestSimple],
-        store_resource_method: Callable[
-            ..., Coroutine[Any, Any, Issue | PullRequest | None]
+        paginator: AsyncIterable[types.Issue] | AsyncIterable[types.PullRequestSimple],
+        store_many_resource_method: Callable[
+            ..., Coroutine[Any, Any, Sequence[Issue] | Sequence[PullRequest]]
         ],
         organization: Organization,
         repository: Repository,
@@ -37,48 +74,72 @@ class GitHubPaginatedService:
         | None = None,
         on_sync_signal: Hook[SyncedHook] | None = None,
         on_completed_signal: Hook[SyncCompletedHook] | None = None,
+        batch_size: int = 100,
     ) -> tuple[SyncedCount, ErrorCount]:
+        """
+        Store the resources of the paginator in bulk.
+
+        Resources are upserted by batches of `batch_size`, the page size
+        of the paginator, with one `store_many_resource_method` call each.
+        `on_sync_signal` is called once per batch, with its last record.
+        """
         synced, errors = 0, 0
-        async for data in paginator:
-            synced += 1
+        batch: list[types.Issue | types.PullRequestSimple] = []
 
-            if skip_condition and skip_condition(data):
-                continue
+        async def store_batch() -> None:
+            nonlocal errors
+
+            # A resource updated during the sync can be listed twice,
+            # which a single upsert can't handle.
+            data = list({d.id: d for d in batch}.values())
 
-            record = await store_resource_method(
+            records = await store_many_resource_method(
                 session,
                 data=data,
                 organization=organization,
                 repository=repository,
             )
 
-            if not record:
+            if len(records) < len(data):
                 log.warning(
                     f"{resource_type}.sync.failed",
                     error="save was unsuccessful",
-                    received=data.model_dump(mode="json"),
+                    received=len(data),
+                    saved=len(records),
                 )
-                errors += 1
-                continue
+                errors += len(data) - len(records)
 
             log.debug(
                 f"{resource_type}.synced",
                 organization_id=organization.id,
                 repository_id=repository.id,
-                id=record.id,
-                title=record.title,
+                count=len(records),
             )
 
-            if on_sync_signal:
+            if on_sync_signal and records:
                 await on_sync_signal.call(
                     SyncedHook(
                         repository=repository,
                         organization=organization,
-                        record=record,
+                        record=records[-1],
                         synced=synced,
                     )
                 )
 
+        async for data in paginator:
+            synced += 1
+
+            if skip_condition and skip_condition(data):
+                continue
+
+            batch.append(data)
+            if len(batch) >= batch_size:
+                await store_batch()
+                batch = []
+
+        if batch:
+            await store_batch()
+
         log.info(
             f"{resource_type}.sync.completed",
             organization_id=organization.id,
@@ -13,7 +13,12 @@ from polar.pull_request.service import PullRequestService, full_pull_request
 
 from .. import client as github
 from .. import types
-from .paginated import ErrorCount, SyncedCount, github_paginated_service
+from .paginated import (
+    ErrorCount,
+    SyncCheckpoint,
+    SyncedCount,
+    github_paginated_service,
+)
 
 log = structlog.get_logger()
 
@@ -166,10 +171,19 @@ class GithubPullRequestService(PullRequestService):
         state: Literal["open", "closed", "all"] = "open",
         sort: Literal["created", "updated", "popularity", "long-running"] = "updated",
         direction: Literal["asc", "desc"] = "desc",
-        per_page: int = 30,
+        per_page: int = 100,
+        full: bool = False,
         crawl_with_installation_id: int
         | None = None,  # Override which installation to use when crawling
     ) -> tuple[SyncedCount, ErrorCount]:
+        """
+        Sync the pull requests of the repository.
+
+        Unless `full` is set, only the pull requests updated since the last
+        successful sync are fetched, whatever their state. The API has no
+        `since` parameter: they are listed by most recently updated,
+        stopping at the previous high-water mark.
+        """
         installation_id = (
             crawl_with_installation_id
             if crawl_with_installation_id
@@ -178,6 +192,16 @@ class GithubPullRequestService(PullRequestService):
 
         client = github.get_app_installation_client(installation_id)
 
+        since = None if full else repository.pull_requests_synced_until
+        checkpoint = SyncCheckpoint(since)
+        if since is not None:
+            log.info(
+                "github.sync_pull_requests.incremental",
+                repository_id=repository.id,
+                since=since,
+            )
+            state, sort, direction = "all", "updated", "desc"
+
         paginator: Paginator[types.PullRequestSimple] = client.paginate(
             client.rest.pulls.async_list,
             owner=organization.name,
@@ -190,12 +214,26 @@ class GithubPullRequestService(PullRequestService):
 
         synced, errors = await github_paginated_service.store_paginated_resource(
             session,
-            paginator=paginator,
-            store_resource_method=github_pull_request.store_simple,
+            paginator=checkpoint.track(paginator),
+            store_many_resource_method=github_pull_request.store_many_simple,
             organization=organization,
             repository=repository,
             resource_type="pull_request",
+            batch_size=per_page,
         )
+
+        # Resources which failed to store are below the mark:
+        # don't move it, so the next sync fetches them again
+        if errors == 0:
+            repository.pull_requests_synced_until = checkpoint.updated_at
+            await repository.save(session)
+        else:
+            log.info(
+                "github.sync_pull_requests.synced_until_kept",
+                repository_id=repository.id,
+                errors=errors,
+            )
+
         return (synced, errors)
 
 
@@ -32,6 +32,7 @@ from polar.worker import enqueue_job
 
 from .. import client as github
 from .. import types
+from ..crawl_schedule import mark_timeline_crawled
 
 log: Logger = structlog.get_logger()
 
@@ -228,7 +229,7 @@ class GitHubIssueReferencesService:
                 )
             except RequestFailed as e:
                 if e.response.status_code == 404:
-                    issue.github_timeline_fetched_at = utils.utc_now()
+                    mark_timeline_crawled(issue, changed=False)
                     await issue.save(session)
                     log.info("github.sync_issue_references.404.marking_as_crawled")
                     return
@@ -240,6 +241,8 @@ class GitHubIssueReferencesService:
                 log.info(
                     "github.sync_issue_references.etag_cache_hit", issue_id=issue.id
                 )
+                mark_timeline_crawled(issue, changed=False)
+                await issue.save(session)
                 return
 
             # Save ETag of the first page
@@ -248,7 +251,7 @@ class GitHubIssueReferencesService:
                     "github.sync_issue_references.etag_cache_miss", issue_id=issue.id
                 )
 
-                issue.github_timeline_fetched_at = utils.utc_now()
+                mark_timeline_crawled(issue, changed=True)
                 issue.github_timeline_etag = res.headers.get("etag", None)
                 await issue.save(session)
 
@@ -30,18 +30,26 @@ class GithubRepositoryService(RepositoryService):
         repository: Repository,
         crawl_with_installation_id: int
         | None = None,  # Override which installation to use when crawling
+        full: bool = False,
     ) -> None:
+        """
+        Sync the issues and pull requests of the repository.
+
+        Only what changed since the last sync is fetched, unless `full` is set.
+        """
         await enqueue_job(
             "github.repo.sync.issues",
             repository.organization_id,
             repository.id,
             crawl_with_installation_id=crawl_with_installation_id,
+            full=full,
         )
         await enqueue_job(
             "github.repo.sync.pull_requests",
             repository.organization_id,
             repository.id,
             crawl_with_installation_id=crawl_with_installation_id,
+            full=full,
         )
 
     async def install_for_organization(
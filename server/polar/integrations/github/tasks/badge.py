@@ -8,12 +8,18 @@ from polar.worker import (
     AsyncSessionMaker,
     JobContext,
     PolarWorkerContext,
+    TaskLane,
     enqueue_job,
     task,
 )
 
+from ..rate_limit import GitHubRateLimitPriority
 from ..service.issue import github_issue
-from .utils import get_organization_and_repo, github_rate_limit_retry
+from .utils import (
+    get_organization_and_repo,
+    github_rate_limit_priority,
+    github_rate_limit_retry,
+)
 
 log = structlog.get_logger()
 
@@ -22,6 +28,7 @@ BADGE_UPDATE_MAX_RETRIES = 5
 
 @task("github.badge.embed_on_issue")
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.badge)
 async def embed_badge(
     ctx: JobContext,
     issue_id: UUID,
@@ -59,6 +66,7 @@ async def embed_badge(
 
 @task("github.badge.update_on_issue")
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.badge)
 async def update_on_issue(
     ctx: JobContext,
     issue_id: UUID,
@@ -95,6 +103,7 @@ async def update_on_issue(
 
 @task("github.badge.remove_on_issue")
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.badge)
 async def remove_badge(
     ctx: JobContext,
     issue_id: UUID,
@@ -130,8 +139,9 @@ async def remove_badge(
                     raise
 
 
-@task("github.badge.embed_retroactively_on_repository")
+@task("github.badge.embed_retroactively_on_repository", lane=TaskLane.bulk)
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.badge)
 async def embed_badge_retroactively_on_repository(
     ctx: JobContext,
     organization_id: UUID,
@@ -158,8 +168,9 @@ async def embed_badge_retroactively_on_repository(
                 await enqueue_job("github.badge.embed_on_issue", i.id)
 
 
-@task("github.badge.remove_on_repository")
+@task("github.badge.remove_on_repository", lane=TaskLane.bulk)
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.badge)
 async def remove_badges_on_repository(
     ctx: JobContext,
     organization_id: UUID,
@@ -1,4 +1,6 @@
+import itertools
 import random
+from collections import defaultdict
 from uuid import UUID
 
 import structlog
@@ -6,26 +8,39 @@ import structlog
 from polar.integrations.github import service
 from polar.integrations.github.client import get_app_installation_client
 from polar.locker import Locker
+from polar.models import Organization
 from polar.organization.service import organization as organization_service
 from polar.redis import get_redis
 from polar.worker import (
     AsyncSessionMaker,
     JobContext,
+    PendingJob,
     PolarWorkerContext,
-    enqueue_job,
+    TaskLane,
+    enqueue_jobs,
     interval,
     task,
 )
 
+from ..rate_limit import (
+    GitHubRateLimitPriority,
+    get_installation_bucket,
+    rate_limit_budget,
+)
 from ..service.api import github_api
-from ..service.issue import github_issue
-from .utils import get_organization_and_repo, github_rate_limit_retry
+from ..service.issue import SYNC_ISSUES_BATCH_SIZE, github_issue
+from .utils import (
+    get_organization_and_repo,
+    github_rate_limit_priority,
+    github_rate_limit_retry,
+)
 
 log = structlog.get_logger()
 
 
-@task("github.issue.sync")
+@task("github.issue.sync", lane=TaskLane.bulk, dedupe_on=("issue_id",))
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.crawl)
 async def issue_sync(
     ctx: JobContext,
     issue_id: UUID,
@@ -57,8 +72,32 @@ async def issue_sync(
             )
 
 
-@task("github.issue.sync.issue_references")
+@task("github.issue.sync.batch", lane=TaskLane.bulk)
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.crawl)
+async def issue_sync_batch(
+    ctx: JobContext,
+    organization_id: UUID,
+    repository_id: UUID,
+    issue_ids: list[UUID],
+    polar_context: PolarWorkerContext,
+) -> None:
+    with polar_context.to_execution_context():
+        async with AsyncSessionMaker(ctx) as session:
+            organization, repository = await get_organization_and_repo(
+                session, organization_id, repository_id
+            )
+            issues = await github_issue.list_by_repository_and_ids(
+                session, repository.id, issue_ids
+            )
+            await github_issue.sync_issues_batch(
+                session, org=organization, repo=repository, issues=issues
+            )
+
+
+@task("github.issue.sync.issue_references", lane=TaskLane.bulk)
+@github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.crawl)
 async def issue_sync_issue_references(
     ctx: JobContext,
     issue_id: UUID,
@@ -90,8 +129,9 @@ async def issue_sync_issue_references(
             )
 
 
-@task("github.issue.sync.issue_dependencies")
+@task("github.issue.sync.issue_dependencies", lane=TaskLane.bulk)
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.crawl)
 async def issue_sync_issue_dependencies(
     ctx: JobContext,
     issue_id: UUID,
@@ -124,6 +164,32 @@ async def issue_sync_issue_dependencies(
             )
 
 
+async def _get_rate_limit_remaining(org: Organization) -> int | None:
+    """
+    Requests left to the installation of the organization.
+
+    Read from the shared rate limit budget, which is kept up-to-date
+    by every response; GitHub is only asked if it's not known yet.
+    """
+    remaining = await rate_limit_budget.get_remaining(
+        get_installation_bucket(org.safe_installation_id)
+    )
+    if remaining is not None:
+        return remaining
+
+    client = get_app_installation_client(org.safe_installation_id)
+    try:
+        rate_limit = await github_api.get_rate_limit(client)
+    except Exception as e:
+        log.info(
+            "failed to get rate limit, treating it as no remaining",
+            org_name=org.name,
+            err=e,
+        )
+        return None
+    return rate_limit.remaining
+
+
 @interval(
     minute={
         2,
@@ -136,6 +202,7 @@ async def issue_sync_issue_dependencies(
     second=0,
 )
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.crawl)
 async def cron_refresh_issues(ctx: JobContext) -> None:
     async with AsyncSessionMaker(ctx) as session:
         orgs = await organization_service.list_installed(session)
@@ -149,22 +216,15 @@ async def cron_refresh_issues(ctx: JobContext) -> None:
                 )
                 continue
 
-            client = get_app_installation_client(org.safe_installation_id)
-            try:
-                rate_limit = await github_api.get_rate_limit(client)
-            except Exception as e:
-                log.info(
-                    "failed to get rate limit, treating it as no remaining",
-                    org_name=org.name,
-                    err=e,
-                )
+            rate_limit_remaining = await _get_rate_limit_remaining(org)
+            if rate_limit_remaining is None:
                 continue
 
-            if rate_limit.remaining < 1000:
+            if rate_limit_remaining < 1000:
                 log.info(
                     "github.issue.sync.cron_refresh_issues.rate_limit_almost_exhausted",
                     org_name=org.name,
-                    rate_limit_remaining=rate_limit.remaining,
+                    rate_limit_remaining=rate_limit_remaining,
                 )
                 continue
 
@@ -172,16 +232,27 @@ async def cron_refresh_issues(ctx: JobContext) -> None:
                 "github.issue.sync.cron_refresh_issues",
                 org_name=org.name,
                 found_count=len(issues),
-                rate_limit_remaining=rate_limit.remaining,
+                rate_limit_remaining=rate_limit_remaining,
             )
 
+            issues_by_repository: dict[UUID, list[UUID]] = defaultdict(list)
             for issue in issues:
-                await enqueue_job(
-                    "github.issue.sync",
-                    issue.id,
-                    _job_id=f"github.issue.sync:{issue.id}",
-                    _defer_by=random.randint(0, 60 * 5),
-                )
+                issues_by_repository[issue.repository_id].append(issue.id)
+
+            await enqueue_jobs(
+                [
+                    PendingJob(
+                        "github.issue.sync.batch",
+                        org.id,
+                        repository_id,
+                        list(batch),
+                        _job_id=f"github.issue.sync.batch:{batch[0]}",
+                        _defer_by=random.randint(0, 60 * 5),
+                    )
+                    for repository_id, issue_ids in issues_by_repository.items()
+                    for batch in itertools.batched(issue_ids, SYNC_ISSUES_BATCH_SIZE)
+                ]
+            )
 
 
 @interval(
@@ -196,6 +267,7 @@ async def cron_refresh_issues(ctx: JobContext) -> None:
     second=0,
 )
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.crawl)
 async def cron_refresh_issue_timelines(ctx: JobContext) -> None:
     async with AsyncSessionMaker(ctx) as session:
         orgs = await organization_service.list_installed(session)
@@ -209,23 +281,15 @@ async def cron_refresh_issue_timelines(ctx: JobContext) -> None:
                 )
                 continue
 
-            client = get_app_installation_client(org.safe_installation_id)
-
-            try:
-                rate_limit = await github_api.get_rate_limit(client)
-            except Exception as e:
-                log.info(
-                    "failed to get rate limit, treating it as no remaining",
-                    org_name=org.name,
-                    err=e,
-                )
+            rate_limit_remaining = await _get_rate_limit_remaining(org)
+            if rate_limit_remaining is None:
                 continue
 
-            if rate_limit.remaining < 1000:
+            if rate_limit_remaining < 1000:
                 log.info(
                     "github.issue.sync.cron_refresh_issue_timelines.rate_limit_almost_exhausted",
                     org_name=org.name,
-                    rate_limit_remaining=rate_limit.remaining,
+                    rate_limit_remaining=rate_limit_remaining,
                 )
                 continue
 
@@ -233,13 +297,17 @@ async def cron_refresh_issue_timelines(ctx: JobContext) -> None:
                 "github.issue.sync.cron_refresh_issue_timelines",
                 org_name=org.name,
                 found_count=len(issues),
-                rate_limit_remaining=rate_limit.remaining,
+                rate_limit_remaining=rate_limit_remaining,
             )
 
-            for issue in issues:
-                await enqueue_job(
-                    "github.issue.sync.issue_references",
-                    issue.id,
-                    _job_id=f"github.issue.sync.issue_references:{issue.id}",
-                    _defer_by=random.randint(0, 60 * 5),
-                )
+            await enqueue_jobs(
+                [
+                    PendingJob(
+                        "github.issue.sync.issue_references",
+                        issue.id,
+                        _job_id=f"github.issue.sync.issue_references:{issue.id}",
+                        _defer_by=random.randint(0, 60 * 5),
+                    )
+                    for issue in issues
+                ]
+            )
@@ -2,7 +2,11 @@ from uuid import UUID
 
 import structlog
 
-from polar.integrations.github.tasks.utils import github_rate_limit_retry
+from polar.integrations.github.rate_limit import GitHubRateLimitPriority
+from polar.integrations.github.tasks.utils import (
+    github_rate_limit_priority,
+    github_rate_limit_retry,
+)
 from polar.organization.service import organization as organization_service
 from polar.worker import (
     AsyncSessionMaker,
@@ -35,6 +39,7 @@ async def cron_org_members_schedule(ctx: JobContext) -> None:
 
 @task("github.organization.synchronize_members")
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.crawl)
 async def organization_refresh_members(
     ctx: JobContext,
     organization_id: UUID,
@@ -71,6 +76,7 @@ async def cron_org_metadata(ctx: JobContext) -> None:
 
 @task("github.organization.populate_org_metadata")
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.crawl)
 async def populate_org_metadata(
     ctx: JobContext,
     organization_id: UUID,
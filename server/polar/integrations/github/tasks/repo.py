@@ -7,17 +7,24 @@ from polar.worker import (
     AsyncSessionMaker,
     JobContext,
     PolarWorkerContext,
+    TaskLane,
     enqueue_job,
     task,
 )
 
-from .utils import get_organization_and_repo, github_rate_limit_retry
+from ..rate_limit import GitHubRateLimitPriority
+from .utils import (
+    get_organization_and_repo,
+    github_rate_limit_priority,
+    github_rate_limit_retry,
+)
 
 log = structlog.get_logger()
 
 
-@task("github.repo.sync.repositories")
+@task("github.repo.sync.repositories", lane=TaskLane.bulk)
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.crawl)
 async def sync_repositories(
     ctx: JobContext,
     organization_id: UUID,
@@ -36,8 +43,13 @@ async def sync_repositories(
             )
 
 
-@task("github.repo.sync.issues")
+@task(
+    "github.repo.sync.issues",
+    lane=TaskLane.bulk,
+    dedupe_on=("repository_id", "full"),
+)
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.crawl)
 async def sync_repository_issues(
     ctx: JobContext,
     organization_id: UUID,
@@ -45,6 +57,7 @@ async def sync_repository_issues(
     polar_context: PolarWorkerContext,
     crawl_with_installation_id: int
     | None = None,  # Override which installation to use when crawling
+    full: bool = False,
 ) -> None:
     with polar_context.to_execution_context():
         async with AsyncSessionMaker(ctx) as session:
@@ -55,18 +68,25 @@ async def sync_repository_issues(
                 session,
                 organization=organization,
                 repository=repository,
+                full=full,
                 crawl_with_installation_id=crawl_with_installation_id,
             )
 
 
-@task("github.repo.sync.pull_requests")
+@task(
+    "github.repo.sync.pull_requests",
+    lane=TaskLane.bulk,
+    dedupe_on=("repository_id", "full"),
+)
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.crawl)
 async def sync_repository_pull_requests(
     ctx: JobContext,
     organization_id: UUID,
     repository_id: UUID,
     polar_context: PolarWorkerContext,
     crawl_with_installation_id: int | None = None,
+    full: bool = False,
 ) -> None:
     with polar_context.to_execution_context():
         async with AsyncSessionMaker(ctx) as session:
@@ -77,6 +97,7 @@ async def sync_repository_pull_requests(
                 session,
                 organization=organization,
                 repository=repository,
+                full=full,
                 crawl_with_installation_id=crawl_with_installation_id,
             )
             await enqueue_job(
@@ -87,8 +108,9 @@ async def sync_repository_pull_requests(
             )
 
 
-@task("github.repo.sync.issue_references")
+@task("github.repo.sync.issue_references", lane=TaskLane.bulk)
 @github_rate_limit_retry
+@github_rate_limit_priority(GitHubRateLimitPriority.crawl)
 async def repo_sync_issue_references(
     ctx: JobContext,
     organization_id: UUID,
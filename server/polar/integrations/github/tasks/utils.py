@@ -8,6 +8,11 @@ from arq import Retry
 from githubkit.exception import RateLimitExceeded
 
 from polar.integrations.github import service
+from polar.integrations.github.rate_limit import (
+    GitHubRateLimitPriority,
+    RateLimitBudgetExceeded,
+)
+from polar.integrations.github.rate_limit import priority as rate_limit_priority
 from polar.models import Organization, Repository
 from polar.postgres import AsyncSession
 
@@ -45,5 +50,30 @@ def github_rate_limit_retry(
             return await func(*args, **kwargs)
         except RateLimitExceeded as e:
             raise Retry(e.retry_after)
+        except RateLimitBudgetExceeded as e:
+            raise Retry(e.retry_after)
 
     return wrapper
+
+
+def github_rate_limit_priority(
+    value: GitHubRateLimitPriority,
+) -> Callable[
+    [Callable[Params, Awaitable[ReturnValue]]], Callable[Params, Awaitable[ReturnValue]]
+]:
+    """
+    Set the priority of the GitHub requests made by the task
+    in the rate limit budget. Defaults to the highest one.
+    """
+
+    def decorator(
+        func: Callable[Params, Awaitable[ReturnValue]],
+    ) -> Callable[Params, Awaitable[ReturnValue]]:
+        @functools.wraps(func)
+        async def wrapper(*args: Params.args, **kwargs: Params.kwargs) -> ReturnValue:
+            with rate_limit_priority(value):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
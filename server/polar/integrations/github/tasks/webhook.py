@@ -1,5 +1,7 @@
-from collections.abc import Sequence
-from typing import Any, Literal
+import functools
+from collections.abc import Awaitable, Callable, Sequence
+from datetime import datetime
+from typing import Any, Concatenate, Literal, ParamSpec, TypeVar
 from uuid import UUID
 
 import structlog
@@ -23,6 +25,7 @@ from polar.worker import (
 )
 
 from .. import service, types
+from ..webhook_ingestion import github_webhook_events, webhook_ingestion
 from .utils import (
     get_organization_and_repo,
     github_rate_limit_retry,
@@ -81,6 +84,59 @@ class UnknownIssueTransferOrganization(GitHubTasksWebhookError):
         super().__init__(message)
 
 
+class WebhookPayloadNotFound(GitHubTasksWebhookError):
+    def __init__(self, payload_key: str) -> None:
+        self.payload_key = payload_key
+        message = f"The webhook payload {payload_key} doesn't exist or has expired."
+        super().__init__(message)
+
+
+Params = ParamSpec("Params")
+Scope = TypeVar("Scope", bound=str)
+Action = TypeVar("Action", bound=str)
+ReturnValue = TypeVar("ReturnValue")
+
+
+def webhook_payload(
+    f: Callable[
+        Concatenate[JobContext, Scope, Action, dict[str, Any], Params],
+        Awaitable[ReturnValue],
+    ],
+) -> Callable[
+    Concatenate[JobContext, Scope, Action, str | dict[str, Any], Params],
+    Awaitable[ReturnValue],
+]:
+    """
+    Load the payload stored by the webhook endpoint before running the task,
+    and delete it once the task succeeded.
+
+    Payloads passed inline, like the ones of the jobs enqueued
+    before they were stored apart, are used as is.
+    """
+
+    @functools.wraps(f)
+    async def wrapper(
+        ctx: JobContext,
+        scope: Scope,
+        action: Action,
+        payload: str | dict[str, Any],
+        *args: Params.args,
+        **kwargs: Params.kwargs,
+    ) -> ReturnValue:
+        if isinstance(payload, dict):
+            return await f(ctx, scope, action, payload, *args, **kwargs)
+
+        loaded = await webhook_ingestion.load_payload(payload)
+        if loaded is None:
+            raise WebhookPayloadNotFound(payload)
+
+        r = await f(ctx, scope, action, loaded, *args, **kwargs)
+        await webhook_ingestion.delete_payload(payload)
+        return r
+
+    return wrapper
+
+
 # ------------------------------------------------------------------------------
 # ORGANIZATIONS
 # ------------------------------------------------------------------------------
@@ -129,6 +185,7 @@ async def organization_synchronize_members(
 
 
 @task(name="github.webhook.organization.renamed")
+@webhook_payload
 async def organizations_renamed(
     ctx: JobContext,
     scope: Literal["organization"],
@@ -146,6 +203,7 @@ async def organizations_renamed(
 
 
 @task(name="github.webhook.organization.member_added")
+@webhook_payload
 async def organizations_member_added(
     ctx: JobContext,
     scope: Literal["organization"],
@@ -163,6 +221,7 @@ async def organizations_member_added(
 
 
 @task(name="github.webhook.organization.member_removed")
+@webhook_payload
 async def organizations_member_removed(
     ctx: JobContext,
     scope: Literal["organization"],
@@ -271,6 +330,7 @@ async def remove_repositories(
 
 
 @task("github.webhook.installation_repositories.added")
+@webhook_payload
 async def repositories_added(
     ctx: JobContext,
     scope: Literal["installation_repositories"],
@@ -288,6 +348,7 @@ async def repositories_added(
 
 
 @task(name="github.webhook.installation_repositories.removed")
+@webhook_payload
 async def repositories_removed(
     ctx: JobContext,
     scope: Literal["installation_repositories"],
@@ -305,6 +366,7 @@ async def repositories_removed(
 
 
 @task(name="github.webhook.public")
+@webhook_payload
 async def repositories_public(
     ctx: JobContext,
     scope: Literal["public"],
@@ -322,6 +384,7 @@ async def repositories_public(
 
 
 @task(name="github.webhook.repository.renamed")
+@webhook_payload
 async def repositories_renamed(
     ctx: JobContext,
     scope: Literal["repository"],
@@ -339,6 +402,7 @@ async def repositories_renamed(
 
 
 @task(name="github.webhook.repository.edited")
+@webhook_payload
 async def repositories_redited(
     ctx: JobContext,
     scope: Literal["repository"],
@@ -356,6 +420,7 @@ async def repositories_redited(
 
 
 @task(name="github.webhook.repository.deleted")
+@webhook_payload
 async def repositories_deleted(
     ctx: JobContext,
     scope: Literal["repository"],
@@ -373,6 +438,7 @@ async def repositories_deleted(
 
 
 @task(name="github.webhook.repository.archived")
+@webhook_payload
 async def repositories_archived(
     ctx: JobContext,
     scope: Literal["repository"],
@@ -390,6 +456,7 @@ async def repositories_archived(
 
 
 @task(name="github.webhook.repository.transferred")
+@webhook_payload
 async def repositories_transferred(
     ctx: JobContext,
     scope: Literal["repository"],
@@ -495,6 +562,17 @@ async def repository_transferred(
         return dict(success=True)
 
 
+def is_outdated(stored_modified_at: datetime | None, updated_at: datetime) -> bool:
+    """
+    Whether the event carries an older state of the object than the one we stored.
+
+    Coalesced events are delayed, so they may be processed after a more recent
+    event of the same object, e.g. an edit followed by a close: their payload
+    shouldn't overwrite the newer state.
+    """
+    return stored_modified_at is not None and updated_at < stored_modified_at
+
+
 # ------------------------------------------------------------------------------
 # ISSUES
 # ------------------------------------------------------------------------------
@@ -529,6 +607,19 @@ async def handle_issue(
             f"failed to save issue (repo not found) external_id={event.issue.id}"
         )
 
+    existing_issue = await service.github_issue.get_by_external_id(
+        session, event.issue.id
+    )
+    if existing_issue is not None and is_outdated(
+        existing_issue.issue_modified_at, event.issue.updated_at
+    ):
+        log.info(
+            "github.webhook.issues.outdated",
+            action=action,
+            issue_id=existing_issue.id,
+        )
+        return existing_issue
+
     issue = await service.github_issue.store(
         session, data=event.issue, organization=organization, repository=repository
     )
@@ -584,6 +675,7 @@ async def handle_issue_transferred(
 
 
 @task("github.webhook.issues.opened")
+@webhook_payload
 async def issue_opened(
     ctx: JobContext,
     scope: Literal["issues"],
@@ -606,6 +698,7 @@ async def issue_opened(
 
 
 @task("github.webhook.issues.reopened")
+@webhook_payload
 async def issue_reopened(
     ctx: JobContext,
     scope: Literal["issues"],
@@ -628,6 +721,7 @@ async def issue_reopened(
 
 
 @task("github.webhook.issues.edited")
+@webhook_payload
 async def issue_edited(
     ctx: JobContext,
     scope: Literal["issues"],
@@ -650,6 +744,7 @@ async def issue_edited(
 
 
 @task("github.webhook.issues.closed")
+@webhook_payload
 async def issue_closed(
     ctx: JobContext,
     scope: Literal["issues"],
@@ -668,6 +763,7 @@ async def issue_closed(
 
 
 @task("github.webhook.issues.deleted")
+@webhook_payload
 async def issue_deleted(
     ctx: JobContext,
     scope: Literal["issues"],
@@ -696,6 +792,7 @@ async def issue_deleted(
 
 
 @task("github.webhook.issues.transferred")
+@webhook_payload
 async def issue_transferred(
     ctx: JobContext,
     scope: Literal["issues"],
@@ -714,6 +811,7 @@ async def issue_transferred(
 
 
 @task("github.webhook.issues.labeled")
+@webhook_payload
 async def issue_labeled(
     ctx: JobContext,
     scope: Literal["issues"],
@@ -732,6 +830,7 @@ async def issue_labeled(
 
 
 @task("github.webhook.issues.unlabeled")
+@webhook_payload
 async def issue_unlabeled(
     ctx: JobContext,
     scope: Literal["issues"],
@@ -810,6 +909,13 @@ async def issue_labeled_async(
         )
         return
 
+    # Labels are a full snapshot: an older one would restore removed labels
+    if is_outdated(issue.issue_modified_at, event.issue.updated_at):
+        log.info(
+            "github.webhook.issues.label.outdated", action=action, issue_id=issue.id
+        )
+        return
+
     repository = await service.github_repository.get(session, issue.repository_id)
     assert repository is not None
 
@@ -818,7 +924,9 @@ async def issue_labeled_async(
         labels = []
 
     had_polar_label = issue.has_pledge_badge_label
-    issue = await service.github_issue.set_labels(session, issue, repository, labels)
+    issue = await service.github_issue.set_labels(
+        session, issue, repository, labels, modified_at=event.issue.updated_at
+    )
 
     log.info(
         "github.webhook.issues.label",
@@ -840,6 +948,7 @@ async def issue_labeled_async(
 
 
 @task("github.webhook.issues.assigned")
+@webhook_payload
 async def issue_assigned(
     ctx: JobContext,
     scope: Literal["issues"],
@@ -858,6 +967,7 @@ async def issue_assigned(
 
 
 @task("github.webhook.issues.unassigned")
+@webhook_payload
 async def issue_unassigned(
     ctx: JobContext,
     scope: Literal["issues"],
@@ -938,6 +1048,19 @@ async def handle_pull_request(
     if not repository:
         return None
 
+    existing_pull_request = await service.github_pull_request.get_by_external_id(
+        session, event.pull_request.id
+    )
+    if existing_pull_request is not None and is_outdated(
+        existing_pull_request.issue_modified_at, event.pull_request.updated_at
+    ):
+        log.info(
+            "github.webhook.pull_request.outdated",
+            action=action,
+            pull_request_id=existing_pull_request.id,
+        )
+        return None
+
     await service.github_pull_request.store_many_full(
         session, [event.pull_request], organization=organization, repository=repository
     )
@@ -946,6 +1069,7 @@ async def handle_pull_request(
 
 
 @task("github.webhook.pull_request.opened")
+@webhook_payload
 async def pull_request_opened(
     ctx: JobContext,
     scope: Literal["pull_request"],
@@ -964,6 +1088,7 @@ async def pull_request_opened(
 
 
 @task("github.webhook.pull_request.edited")
+@webhook_payload
 async def pull_request_edited(
     ctx: JobContext,
     scope: Literal["pull_request"],
@@ -982,6 +1107,7 @@ async def pull_request_edited(
 
 
 @task("github.webhook.pull_request.closed")
+@webhook_payload
 async def pull_request_closed(
     ctx: JobContext,
     scope: Literal["pull_request"],
@@ -1000,6 +1126,7 @@ async def pull_request_closed(
 
 
 @task("github.webhook.pull_request.reopened")
+@webhook_payload
 async def pull_request_reopened(
     ctx: JobContext,
     scope: Literal["pull_request"],
@@ -1018,6 +1145,7 @@ async def pull_request_reopened(
 
 
 @task("github.webhook.pull_request.synchronize")
+@webhook_payload
 async def pull_request_synchronize(
     ctx: JobContext,
     scope: Literal["pull_request"],
@@ -1041,6 +1169,7 @@ async def pull_request_synchronize(
 
 
 @task("github.webhook.installation.created")
+@webhook_payload
 async def installation_created(
     ctx: JobContext,
     scope: Literal["installation"],
@@ -1059,6 +1188,7 @@ async def installation_created(
 
 
 @task("github.webhook.installation.new_permissions_accepted")
+@webhook_payload
 async def installation_new_permissions_accepted(
     ctx: JobContext,
     scope: Literal["installation"],
@@ -1094,6 +1224,7 @@ async def installation_new_permissions_accepted(
 
 
 @task("github.webhook.installation.deleted")
+@webhook_payload
 async def installation_delete(
     ctx: JobContext,
     scope: Literal["installation"],
@@ -1121,6 +1252,7 @@ async def installation_delete(
 
 
 @task("github.webhook.installation.suspend")
+@webhook_payload
 async def installation_suspend(
     ctx: JobContext,
     scope: Literal["installation"],
@@ -1146,6 +1278,7 @@ async def installation_suspend(
 
 
 @task("github.webhook.installation.unsuspend")
+@webhook_payload
 async def installation_unsuspend(
     ctx: JobContext,
     scope: Literal["installation"],
@@ -1161,3 +1294,31 @@ async def installation_unsuspend(
 
         async with AsyncSessionMaker(ctx) as session:
             await service.github_organization.unsuspend(session, event.installation.id)
+
+
+# ------------------------------------------------------------------------------
+# COALESCED
+# ------------------------------------------------------------------------------
+
+
+@task("github.webhook.coalesced")
+async def webhook_coalesced(
+    ctx: JobContext,
+    key: str,
+    polar_context: PolarWorkerContext,
+) -> None:
+    """Process the latest of the events coalesced under the key."""
+    pending = await webhook_ingestion.pop(key)
+    if pending is None:
+        log.warning("github.webhook.coalesced.not_found", key=key)
+        return
+
+    event_name = pending["event_name"]
+    with polar_context.to_execution_context():
+        await enqueue_job(
+            f"github.webhook.{event_name}",
+            pending["scope"],
+            pending["action"],
+            pending["payload"],
+        )
+    github_webhook_events.labels(event_name, "processed").inc()
@@ -2,6 +2,7 @@ from typing import Literal, TypedDict
 
 from githubkit.versions.latest.models import (
     AddedToProjectIssueEvent,
+    Collaborator,
     ConvertedNoteToIssueIssueEvent,
     DemilestonedIssueEvent,
     Enterprise,
@@ -155,6 +156,7 @@ class AppPermissionsType(TypedDict, total=False):
 __all__ = [
     "AppPermissionsType",
     "AddedToProjectIssueEvent",
+    "Collaborator",
     "ConvertedNoteToIssueIssueEvent",
     "DemilestonedIssueEvent",
     "Enterprise",
@@ -0,0 +1,186 @@
+import base64
+import json
+import uuid
+import zlib
+from collections.abc import Callable
+from typing import Any, TypedDict
+
+from prometheus_client import Counter
+
+from polar.redis import Redis
+from polar.redis import redis as default_redis
+
+github_webhook_events = Counter(
+    "github_webhook_events",
+    "GitHub webhook deliveries received, by outcome",
+    ["event", "outcome"],
+)
+
+# GitHub doesn't redeliver on its own, but manual and API redeliveries
+# can come days later: we keep the IDs around for as long as we reasonably can.
+DELIVERY_TTL_SECONDS = 3 * 24 * 3600
+
+# Events of the same object received within this window are processed once
+COALESCE_WINDOW_SECONDS = 5
+
+# Pending events and payloads are kept until processed,
+# unless the worker is *very* late
+PENDING_TTL_SECONDS = 24 * 3600
+PAYLOAD_TTL_SECONDS = 24 * 3600
+
+
+def _get_pull_request_key(payload: dict[str, Any]) -> str:
+    return f"pull_request:{payload['pull_request']['id']}"
+
+
+def _get_issue_label_key(payload: dict[str, Any]) -> str:
+    label = payload.get("label")
+    label_name = label["name"].lower() if label else ""
+    return f"issues.label:{payload['issue']['id']}:{label_name}"
+
+
+# Events whose handler only cares about the latest state of the object:
+# events sharing a key within the window are dropped in favor of the last one.
+#
+# Label events also depend on the label that changed, to add or remove the badge,
+# so they are only coalesced with the events of the same label.
+COALESCED_WEBHOOKS: dict[str, Callable[[dict[str, Any]], str]] = {
+    "issues.edited": lambda payload: f"issues.edited:{payload['issue']['id']}",
+    "issues.labeled": _get_issue_label_key,
+    "issues.unlabeled": _get_issue_label_key,
+    "pull_request.edited": _get_pull_request_key,
+    "pull_request.synchronize": _get_pull_request_key,
+}
+
+
+def get_coalescing_key(event_name: str, payload: dict[str, Any]) -> str | None:
+    """
+    Key under which the event is coalesced with the ones of the same object,
+    or `None` if it should be processed on its own.
+    """
+    get_object_key = COALESCED_WEBHOOKS.get(event_name)
+    if get_object_key is None:
+        return None
+
+    installation = payload.get("installation")
+    installation_id = installation["id"] if installation else None
+    return f"{installation_id}:{get_object_key(payload)}"
+
+
+class PendingWebhook(TypedDict):
+    event_name: str
+    scope: str
+    action: str | None
+    payload: str
+    """Key of the stored payload."""
+
+
+class WebhookIngestion:
+    """
+    Stage between the webhook endpoint and the jobs processing the events.
+
+    Redeliveries of an already received event are dropped,
+    and bursts of events on the same object are coalesced:
+    the first one schedules a job after a short window,
+    the next ones only replace the state that job will process.
+
+    Payloads are stored compressed next to the queue, and jobs only get their key:
+    installation and repository events can weigh hundreds of KB,
+    and arq would keep them in Redis for the whole lifetime of the job.
+    """
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+
+    def _get_delivery_key(self, delivery_id: str) -> str:
+        return f"github:webhook:delivery:{delivery_id}"
+
+    def _get_pending_key(self, key: str) -> str:
+        return f"github:webhook:pending:{key}"
+
+    def _get_payload_key(self, key: str) -> str:
+        return f"github:webhook:payload:{key}"
+
+    async def claim_delivery(self, delivery_id: str) -> bool:
+        """Record the delivery, returns `False` if it was already received."""
+        claimed = await self.redis.set(
+            self._get_delivery_key(delivery_id),
+            1,
+            ex=DELIVERY_TTL_SECONDS,
+            nx=True,
+        )
+        return bool(claimed)
+
+    async def release_delivery(self, delivery_id: str) -> None:
+        """Forget the delivery, so a redelivery is processed."""
+        await self.redis.delete(self._get_delivery_key(delivery_id))
+
+    async def store_payload(self, payload: dict[str, Any]) -> str:
+        """Store the payload, returns the key to load it."""
+        key = uuid.uuid4().hex
+        compressed = zlib.compress(
+            json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        )
+        # Our client decodes the responses, hence the base64
+        await self.redis.set(
+            self._get_payload_key(key),
+            base64.b64encode(compressed).decode("ascii"),
+            ex=PAYLOAD_TTL_SECONDS,
+        )
+        return key
+
+    async def load_payload(self, key: str) -> dict[str, Any] | None:
+        value = await self.redis.get(self._get_payload_key(key))
+        if value is None:
+            return None
+        payload: dict[str, Any] = json.loads(zlib.decompress(base64.b64decode(value)))
+        return payload
+
+    async def delete_payload(self, key: str) -> None:
+        await self.redis.delete(self._get_payload_key(key))
+
+    async def push(self, key: str, pending: PendingWebhook) -> bool:
+        """
+        Make the event the latest one pending for the key.
+
+        Returns `True` if an event was already pending,
+        i.e. a job processing the key is already scheduled.
+        """
+        previous = await self.redis.set(
+            self._get_pending_key(key),
+            json.dumps(pending),
+            ex=PENDING_TTL_SECONDS,
+            get=True,
+        )
+        # With `get`, the previous value is returned instead of a boolean
+        if not isinstance(previous, str):
+            return False
+
+        # Superseded, its payload won't ever be processed
+        previous_pending: PendingWebhook = json.loads(previous)
+        await self.delete_payload(previous_pending["payload"])
+        return True
+
+    async def pop(self, key: str) -> PendingWebhook | None:
+        """Take the latest event pending for the key."""
+        value = await self.redis.getdel(self._get_pending_key(key))
+        if value is None:
+            return None
+        pending: PendingWebhook = json.loads(value)
+        return pending
+
+    async def discard(self, key: str) -> None:
+        await self.redis.delete(self._get_pending_key(key))
+
+
+webhook_ingestion = WebhookIngestion(default_redis)
+
+
+__all__ = [
+    "COALESCE_WINDOW_SECONDS",
+    "PendingWebhook",
+    "WebhookIngestion",
+    "get_coalescing_key",
+    "github_webhook_events",
+    "webhook_ingestion",
+]
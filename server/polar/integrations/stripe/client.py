@@ -0,0 +1,107 @@
+import asyncio
+import functools
+import time
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+import stripe as stripe_lib
+import structlog
+from prometheus_client import Gauge, Histogram
+
+from polar.config import settings
+from polar.logging import Logger
+
+log: Logger = structlog.get_logger()
+
+T = TypeVar("T")
+
+stripe_lib.api_key = settings.STRIPE_SECRET_KEY
+# RequestsClient keeps one `requests.Session` per thread: since calls are made from
+# a fixed pool of threads, each of them reuses its keep-alive connections.
+stripe_lib.default_http_client = stripe_lib.http_client.RequestsClient(
+    timeout=settings.STRIPE_REQUEST_TIMEOUT_SECONDS
+)
+
+stripe_request_latency_seconds = Histogram(
+    "stripe_request_latency_seconds",
+    "Stripe API request response time",
+    ["operation", "outcome"],
+)
+stripe_requests_in_flight = Gauge(
+    "stripe_requests_in_flight",
+    "Stripe API requests waiting for or holding a connection slot",
+)
+
+
+def _get_operation_name(f: Callable[..., Any]) -> str:
+    name = getattr(f, "__name__", type(f).__name__)
+    bound_to = getattr(f, "__self__", None)
+    if bound_to is None:
+        return name
+    owner = bound_to if isinstance(bound_to, type) else type(bound_to)
+    return f"{owner.__name__}.{name}"
+
+
+class StripeClient:
+    """
+    Run the blocking Stripe SDK calls without blocking the event loop.
+
+    Calls are dispatched to a dedicated pool of threads, which bounds the number
+    of concurrent requests made to Stripe by the process.
+    """
+
+    def __init__(self, max_concurrency: int) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="stripe"
+        )
+
+    async def call(self, f: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        operation = _get_operation_name(f)
+        loop = asyncio.get_running_loop()
+        outcome = "success"
+        stripe_requests_in_flight.inc()
+        t0 = time.perf_counter()
+        try:
+            return await loop.run_in_executor(
+                self.executor, functools.partial(f, *args, **kwargs)
+            )
+        except stripe_lib.error.StripeError:
+            outcome = "error"
+            raise
+        finally:
+            duration = time.perf_counter() - t0
+            stripe_requests_in_flight.dec()
+            stripe_request_latency_seconds.labels(
+                operation=operation, outcome=outcome
+            ).observe(duration)
+            log.debug(
+                "stripe.request",
+                operation=operation,
+                outcome=outcome,
+                duration=duration,
+            )
+
+    async def iterate(
+        self, list_object: stripe_lib.ListObject[Any]
+    ) -> AsyncIterator[Any]:
+        """
+        Asynchronous equivalent of `ListObject.auto_paging_iter`.
+
+        The first page is expected to be already fetched,
+        e.g. through `await client.call(stripe_lib.Refund.list, ...)`.
+        """
+        page = list_object
+        while True:
+            for item in page.data:
+                yield item
+            if not page.has_more:
+                break
+            page = await self.call(page.next_page)
+            if page.is_empty:
+                break
+
+
+client = StripeClient(settings.STRIPE_MAX_CONCURRENT_REQUESTS)
+
+__all__ = ["StripeClient", "client"]
@@ -1,5 +1,5 @@
 import uuid
-from collections.abc import Iterator
+from collections.abc import AsyncIterator
 from typing import Literal, TypedDict, Unpack, cast
 from uuid import UUID
 
@@ -9,6 +9,7 @@ from stripe import error as stripe_lib_error
 from polar.account.schemas import AccountCreate
 from polar.config import settings
 from polar.exceptions import PolarError
+from polar.integrations.stripe.client import client
 from polar.integrations.stripe.schemas import (
     PledgePaymentIntentMetadata,
     ProductType,
@@ -20,8 +21,6 @@ from polar.models.repository import Repository
 from polar.models.user import User
 from polar.postgres import AsyncSession, sql
 
-stripe_lib.api_key = settings.STRIPE_SECRET_KEY
-
 StripeError = stripe_lib_error.StripeError
 
 
@@ -38,7 +37,7 @@ class MissingOrganizationBillingEmail(PolarError):
 
 
 class StripeService:
-    def create_anonymous_intent(
+    async def create_anonymous_intent(
         self,
         amount: int,
         transfer_group: str,
@@ -53,7 +52,8 @@ class StripeService:
             anonymous=True,
             anonymous_email=anonymous_email,
         )
-        return stripe_lib.PaymentIntent.create(
+        return await client.call(
+            stripe_lib.PaymentIntent.create,
             amount=amount,
             currency="USD",
             transfer_group=transfer_group,
@@ -88,7 +88,8 @@ class StripeService:
         if on_behalf_of_organization_id:
             metadata.on_behalf_of_organization_id = on_behalf_of_organization_id
 
-        return stripe_lib.PaymentIntent.create(
+        return await client.call(
+            stripe_lib.PaymentIntent.create,
             amount=amount,
             currency="USD",
             transfer_group=transfer_group,
@@ -98,7 +99,7 @@ class StripeService:
             description=f"Pledge to {pledge_issue_org.name}/{pledge_issue_repo.name}#{pledge_issue.number}",  # noqa: E501
         )
 
-    def create_organization_intent(
+    async def create_organization_intent(
         self,
         amount: int,
         transfer_group: str,
@@ -116,7 +117,8 @@ class StripeService:
             organization_name=organization.name,
         )
 
-        return stripe_lib.PaymentIntent.create(
+        return await client.call(
+            stripe_lib.PaymentIntent.create,
             amount=amount,
             currency="USD",
             transfer_group=transfer_group,
@@ -124,7 +126,7 @@ class StripeService:
             receipt_email=user.email,
         )
 
-    def modify_intent(
+    async def modify_intent(
         self,
         id: str,
         amount: int,
@@ -138,7 +140,8 @@ class StripeService:
             else "",  # Set to empty string to unset the value on Stripe.
         )
 
-        return stripe_lib.PaymentIntent.modify(
+        return await client.call(
+            stripe_lib.PaymentIntent.modify,
             id,
             amount=amount,
             receipt_email=receipt_email,
@@ -146,10 +149,10 @@ class StripeService:
             metadata=metadata.model_dump(exclude_none=True),
         )
 
-    def retrieve_intent(self, id: str) -> stripe_lib.PaymentIntent:
-        return stripe_lib.PaymentIntent.retrieve(id)
+    async def retrieve_intent(self, id: str) -> stripe_lib.PaymentIntent:
+        return await client.call(stripe_lib.PaymentIntent.retrieve, id)
 
-    def create_account(
+    async def create_account(
         self, account: AccountCreate, name: str | None
     ) -> stripe_lib.Account:
         create_params: stripe_lib.Account.CreateParams = {
@@ -166,45 +169,46 @@ class StripeService:
 
         if account.country != "US":
             create_params["tos_acceptance"] = {"service_agreement": "recipient"}
-        return stripe_lib.Account.create(**create_params)
+        return await client.call(stripe_lib.Account.create, **create_params)
 
-    def update_account(self, id: str, name: str | None) -> None:
+    async def update_account(self, id: str, name: str | None) -> None:
         obj = {}
         if name:
             obj["business_profile"] = {"name": name}
-        stripe_lib.Account.modify(id, **obj)
+        await client.call(stripe_lib.Account.modify, id, **obj)
 
-    def retrieve_account(self, id: str) -> stripe_lib.Account:
-        return stripe_lib.Account.retrieve(id)
+    async def retrieve_account(self, id: str) -> stripe_lib.Account:
+        return await client.call(stripe_lib.Account.retrieve, id)
 
-    def retrieve_balance(self, id: str) -> tuple[str, int]:
+    async def retrieve_balance(self, id: str) -> tuple[str, int]:
         # Return available balance in the account's default currency (we assume that
         # there is no balance in other currencies for now)
-        account = stripe_lib.Account.retrieve(id)
-        balance = stripe_lib.Balance.retrieve(stripe_account=id)
+        account = await client.call(stripe_lib.Account.retrieve, id)
+        balance = await client.call(stripe_lib.Balance.retrieve, stripe_account=id)
         for b in balance.available:
             if b.currency == account.default_currency:
                 return (b.currency, b.amount)
         return (cast(str, account.default_currency), 0)
 
-    def create_account_link(
+    async def create_account_link(
         self, stripe_id: str, return_path: str
     ) -> stripe_lib.AccountLink:
         refresh_url = settings.generate_external_url(
             f"/integrations/stripe/refresh?return_path={return_path}"
         )
         return_url = settings.generate_frontend_url(return_path)
-        return stripe_lib.AccountLink.create(
+        return await client.call(
+            stripe_lib.AccountLink.create,
             account=stripe_id,
             refresh_url=refresh_url,
             return_url=return_url,
             type="account_onboarding",
         )
 
-    def create_login_link(self, stripe_id: str) -> stripe_lib.LoginLink:
-        return stripe_lib.Account.create_login_link(stripe_id)
+    async def create_login_link(self, stripe_id: str) -> stripe_lib.LoginLink:
+        return await client.call(stripe_lib.Account.create_login_link, stripe_id)
 
-    def transfer(
+    async def transfer(
         self,
         destination_stripe_id: str,
         amount: int,
@@ -212,6 +216,8 @@ class StripeService:
         source_transaction: str | None = None,
         transfer_group: str | None = None,
         metadata: dict[str, str] | None = None,
+        expand: list[str] | None = None,
+        idempotency_key: str | None = None,
     ) -> stripe_lib.Transfer:
         create_params: stripe_lib.Transfer.CreateParams = {
             "amount": amount,
@@ -223,9 +229,13 @@ class StripeService:
             create_params["source_transaction"] = source_transaction
         if transfer_group is not None:
             create_params["transfer_group"] = transfer_group
-        return stripe_lib.Transfer.create(**create_params)
+        if expand is not None:
+            create_params["expand"] = expand
+        return await client.call(
+            stripe_lib.Transfer.create, idempotency_key=idempotency_key, **create_params
+        )
 
-    def reverse_transfer(
+    async def reverse_transfer(
         self,
         transfer_id: str,
         amount: int,
@@ -236,10 +246,12 @@ class StripeService:
             "amount": amount,
             "metadata": metadata or {},
         }
-        return stripe_lib.Transfer.create_reversal(transfer_id, **create_params)
+        return await client.call(
+            stripe_lib.Transfer.create_reversal, transfer_id, **create_params
+        )
 
-    def get_customer(self, customer_id: str) -> stripe_lib.Customer:
-        return stripe_lib.Customer.retrieve(customer_id)
+    async def get_customer(self, customer_id: str) -> stripe_lib.Customer:
+        return await client.call(stripe_lib.Customer.retrieve, customer_id)
 
     async def get_or_create_user_customer(
         self,
@@ -247,9 +259,10 @@ class StripeService:
         user: User,
     ) -> stripe_lib.Customer | None:
         if user.stripe_customer_id:
-            return self.get_customer(user.stripe_customer_id)
+            return await self.get_customer(user.stripe_customer_id)
 
-        customer = stripe_lib.Customer.create(
+        customer = await client.call(
+            stripe_lib.Customer.create,
             name=user.username,
             email=user.email,
             metadata={
@@ -276,12 +289,13 @@ class StripeService:
         self, session: AsyncSession, org: Organization
     ) -> stripe_lib.Customer | None:
         if org.stripe_customer_id:
-            return self.get_customer(org.stripe_customer_id)
+            return await self.get_customer(org.stripe_customer_id)
 
         if org.billing_email is None:
             raise MissingOrganizationBillingEmail(org.id)
 
-        customer = stripe_lib.Customer.create(
+        customer = await client.call(
+            stripe_lib.Customer.create,
             name=org.name,
             email=org.billing_email,
             metadata={
@@ -312,15 +326,16 @@ class StripeService:
         if not customer:
             return []
 
-        payment_methods = stripe_lib.PaymentMethod.list(
+        payment_methods = await client.call(
+            stripe_lib.PaymentMethod.list,
             customer=customer.id,
             type="card",
         )
 
         return payment_methods.data
 
-    def detach_payment_method(self, id: str) -> stripe_lib.PaymentMethod:
-        return stripe_lib.PaymentMethod.detach(id)
+    async def detach_payment_method(self, id: str) -> stripe_lib.PaymentMethod:
+        return await client.call(stripe_lib.PaymentMethod.detach, id)
 
     async def create_user_pledge_invoice(
         self,
@@ -337,12 +352,13 @@ class StripeService:
 
         # Sync user email
         if not customer.email or customer.email != user.email:
-            stripe_lib.Customer.modify(
+            await client.call(
+                stripe_lib.Customer.modify,
                 customer.id,
                 email=user.email,
             )
 
-        return self.create_pledge_invoice(
+        return await self.create_pledge_invoice(
             customer,
             pledge,
             pledge_issue,
@@ -368,12 +384,13 @@ class StripeService:
 
         # Sync billing email
         if not customer.email or customer.email != organization.billing_email:
-            stripe_lib.Customer.modify(
+            await client.call(
+                stripe_lib.Customer.modify,
                 customer.id,
                 email=organization.billing_email,
             )
 
-        return self.create_pledge_invoice(
+        return await self.create_pledge_invoice(
             customer,
             pledge,
             pledge_issue,
@@ -381,7 +398,7 @@ class StripeService:
             pledge_issue_org,
         )
 
-    def create_pledge_invoice(
+    async def create_pledge_invoice(
         self,
         customer: stripe_lib.Customer,
         pledge: Pledge,
@@ -390,7 +407,8 @@ class StripeService:
         pledge_issue_org: Organization,
     ) -> stripe_lib.Invoice | None:
         # Create an invoice, then add line items to it
-        invoice = stripe_lib.Invoice.create(
+        invoice = await client.call(
+            stripe_lib.Invoice.create,
             customer=customer.id,
             description=f"""You pledged to {pledge_issue_org.name}/{pledge_issue_repo.name}#{pledge_issue.number} on {pledge.created_at.strftime('%Y-%m-%d')}, which has now been fixed!
 
@@ -409,7 +427,8 @@ Thank you for your support!
 
         assert invoice.id is not None
 
-        stripe_lib.InvoiceItem.create(
+        await client.call(
+            stripe_lib.InvoiceItem.create,
             invoice=invoice.id,
             customer=customer.id,
             amount=pledge.amount_including_fee,
@@ -420,9 +439,11 @@ Thank you for your support!
             },
         )
 
-        stripe_lib.Invoice.finalize_invoice(invoice.id, auto_advance=True)
+        await client.call(
+            stripe_lib.Invoice.finalize_invoice, invoice.id, auto_advance=True
+        )
 
-        sent_invoice = stripe_lib.Invoice.send_invoice(invoice.id)
+        sent_invoice = await client.call(stripe_lib.Invoice.send_invoice, invoice.id)
 
         return sent_invoice
 
@@ -435,7 +456,8 @@ Thank you for your support!
         if not customer:
             return None
 
-        return stripe_lib.billing_portal.Session.create(
+        return await client.call(
+            stripe_lib.billing_portal.Session.create,
             customer=customer.id,
             return_url=f"{settings.FRONTEND_BASE_URL}/settings",
         )
@@ -449,12 +471,13 @@ Thank you for your support!
         if not customer:
             return None
 
-        return stripe_lib.billing_portal.Session.create(
+        return await client.call(
+            stripe_lib.billing_portal.Session.create,
             customer=customer.id,
             return_url=f"{settings.FRONTEND_BASE_URL}/team/{org.name}/settings",
         )
 
-    def create_product_with_price(
+    async def create_product_with_price(
         self,
         name: str,
         *,
@@ -474,9 +497,9 @@ Thank you for your support!
         }
         if description is not None:
             create_params["description"] = description
-        return stripe_lib.Product.create(**create_params)
+        return await client.call(stripe_lib.Product.create, **create_params)
 
-    def create_price_for_product(
+    async def create_price_for_product(
         self,
         product: str,
         price_amount: int,
@@ -484,28 +507,31 @@ Thank you for your support!
         *,
         set_default: bool = False,
     ) -> stripe_lib.Price:
-        price = stripe_lib.Price.create(
+        price = await client.call(
+            stripe_lib.Price.create,
             currency=price_currency,
             product=product,
             unit_amount=price_amount,
             recurring={"interval": "month"},
         )
         if set_default:
-            stripe_lib.Product.modify(product, default_price=price.id)
+            await client.call(
+                stripe_lib.Product.modify, product, default_price=price.id
+            )
         return price
 
-    def update_product(
+    async def update_product(
         self, product: str, **kwargs: Unpack[ProductUpdateKwargs]
     ) -> stripe_lib.Product:
-        return stripe_lib.Product.modify(product, **kwargs)
+        return await client.call(stripe_lib.Product.modify, product, **kwargs)
 
-    def archive_product(self, id: str) -> stripe_lib.Product:
-        return stripe_lib.Product.modify(id, active=False)
+    async def archive_product(self, id: str) -> stripe_lib.Product:
+        return await client.call(stripe_lib.Product.modify, id, active=False)
 
-    def archive_price(self, id: str) -> stripe_lib.Price:
-        return stripe_lib.Price.modify(id, active=False)
+    async def archive_price(self, id: str) -> stripe_lib.Price:
+        return await client.call(stripe_lib.Price.modify, id, active=False)
 
-    def create_subscription_checkout_session(
+    async def create_subscription_checkout_session(
         self,
         price: str,
         success_url: str,
@@ -537,18 +563,20 @@ Thank you for your support!
             create_params["customer_email"] = customer_email
         if subscription_metadata is not None:
             create_params["subscription_data"] = {"metadata": subscription_metadata}
-        return stripe_lib.checkout.Session.create(**create_params)
+        return await client.call(stripe_lib.checkout.Session.create, **create_params)
 
-    def get_checkout_session(self, id: str) -> stripe_lib.checkout.Session:
-        return stripe_lib.checkout.Session.retrieve(id)
+    async def get_checkout_session(self, id: str) -> stripe_lib.checkout.Session:
+        return await client.call(stripe_lib.checkout.Session.retrieve, id)
 
-    def get_subscription(self, id: str) -> stripe_lib.Subscription:
-        return stripe_lib.Subscription.retrieve(id, expand=["latest_invoice"])
+    async def get_subscription(self, id: str) -> stripe_lib.Subscription:
+        return await client.call(
+            stripe_lib.Subscription.retrieve, id, expand=["latest_invoice"]
+        )
 
-    def update_subscription_price(
+    async def update_subscription_price(
         self, id: str, *, old_price: str, new_price: str
     ) -> stripe_lib.Subscription:
-        subscription = stripe_lib.Subscription.retrieve(id)
+        subscription = await client.call(stripe_lib.Subscription.retrieve, id)
 
         old_items = subscription["items"]
         new_items: list[stripe_lib.Subscription.ModifyParamsItem] = []
@@ -557,22 +585,23 @@ Thank you for your support!
                 new_items.append({"id": item.id, "deleted": True})
         new_items.append({"price": new_price, "quantity": 1})
 
-        return stripe_lib.Subscription.modify(id, items=new_items)
+        return await client.call(stripe_lib.Subscription.modify, id, items=new_items)
 
-    def cancel_subscription(self, id: str) -> stripe_lib.Subscription:
-        return stripe_lib.Subscription.modify(
+    async def cancel_subscription(self, id: str) -> stripe_lib.Subscription:
+        return await client.call(
+            stripe_lib.Subscription.modify,
             id,
             cancel_at_period_end=True,
         )
 
-    def update_invoice(
+    async def update_invoice(
         self, id: str, *, metadata: dict[str, str] | None = None
     ) -> stripe_lib.Invoice:
-        return stripe_lib.Invoice.modify(id, metadata=metadata or {})
+        return await client.call(stripe_lib.Invoice.modify, id, metadata=metadata or {})
 
-    def get_customer_credit_balance(self, customer_id: str) -> int:
-        transactions = stripe_lib.Customer.list_balance_transactions(
-            customer_id, limit=1
+    async def get_customer_credit_balance(self, customer_id: str) -> int:
+        transactions = await client.call(
+            stripe_lib.Customer.list_balance_transactions, customer_id, limit=1
         )
 
         for transaction in transactions:
@@ -589,8 +618,8 @@ Thank you for your support!
         if not customer:
             return 0
 
-        transactions = stripe_lib.Customer.list_balance_transactions(
-            customer.id, limit=1
+        transactions = await client.call(
+            stripe_lib.Customer.list_balance_transactions, customer.id, limit=1
         )
 
         for transaction in transactions:
@@ -598,19 +627,21 @@ Thank you for your support!
 
         return 0
 
-    def get_balance_transaction(self, id: str) -> stripe_lib.BalanceTransaction:
-        return stripe_lib.BalanceTransaction.retrieve(id)
+    async def get_balance_transaction(self, id: str) -> stripe_lib.BalanceTransaction:
+        return await client.call(stripe_lib.BalanceTransaction.retrieve, id)
 
-    def get_invoice(self, id: str) -> stripe_lib.Invoice:
-        return stripe_lib.Invoice.retrieve(id, expand=["total_tax_amounts.tax_rate"])
+    async def get_invoice(self, id: str) -> stripe_lib.Invoice:
+        return await client.call(
+            stripe_lib.Invoice.retrieve, id, expand=["total_tax_amounts.tax_rate"]
+        )
 
-    def list_balance_transactions(
+    async def list_balance_transactions(
         self,
         *,
         account_id: str | None = None,
         payout: str | None = None,
         type: str | None = None,
-    ) -> Iterator[stripe_lib.BalanceTransaction]:
+    ) -> AsyncIterator[stripe_lib.BalanceTransaction]:
         params: stripe_lib.BalanceTransaction.ListParams = {
             "limit": 100,
             "stripe_account": account_id,
@@ -621,53 +652,68 @@ Thank you for your support!
         if type is not None:
             params["type"] = type
 
-        return stripe_lib.BalanceTransaction.list(**params).auto_paging_iter()
+        balance_transactions = await client.call(
+            stripe_lib.BalanceTransaction.list, **params
+        )
+        async for balance_transaction in client.iterate(balance_transactions):
+            yield balance_transaction
 
-    def list_refunds(
+    async def list_refunds(
         self,
         *,
         charge: str | None = None,
-    ) -> Iterator[stripe_lib.Refund]:
+    ) -> AsyncIterator[stripe_lib.Refund]:
         params: stripe_lib.Refund.ListParams = {"limit": 100}
         if charge is not None:
             params["charge"] = charge  # type: ignore
 
-        return stripe_lib.Refund.list(**params).auto_paging_iter()
+        refunds = await client.call(stripe_lib.Refund.list, **params)
+        async for refund in client.iterate(refunds):
+            yield refund
 
-    def get_charge(
+    async def get_charge(
         self,
         id: str,
         *,
         stripe_account: str | None = None,
         expand: list[str] | None = None,
     ) -> stripe_lib.Charge:
-        return stripe_lib.Charge.retrieve(
-            id, stripe_account=stripe_account, expand=expand or []
+        return await client.call(
+            stripe_lib.Charge.retrieve,
+            id,
+            stripe_account=stripe_account,
+            expand=expand or [],
         )
 
-    def get_refund(
+    async def get_refund(
         self,
         id: str,
         *,
         stripe_account: str | None = None,
         expand: list[str] | None = None,
     ) -> stripe_lib.Refund:
-        return stripe_lib.Refund.retrieve(
-            id, stripe_account=stripe_account, expand=expand or []
+        return await client.call(
+            stripe_lib.Refund.retrieve,
+            id,
+            stripe_account=stripe_account,
+            expand=expand or [],
         )
 
-    def get_dispute(
+    async def get_dispute(
         self,
         id: str,
         *,
         stripe_account: str | None = None,
         expand: list[str] | None = None,
     ) -> stripe_lib.Dispute:
-        return stripe_lib.Dispute.retrieve(
-            id, stripe_account=stripe_account, expand=expand or []
+        return await client.call(
+            stripe_lib.Dispute.retrieve,
+            id,
+            stripe_account=stripe_account,
+            expand=expand or [],
         )
 
-    def create_payout(
+    async def create_payout(
         self,
         *,
         stripe_account: str,
@@ -675,7 +721,8 @@ Thank you for your support!
         currency: str,
         metadata: dict[str, str] | None = None,
     ) -> stripe_lib.Payout:
-        return stripe_lib.Payout.create(
+        return await client.call(
+            stripe_lib.Payout.create,
             stripe_account=stripe_account,
             amount=amount,
             currency=currency,
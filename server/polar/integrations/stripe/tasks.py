@@ -33,7 +33,13 @@ from polar.transaction.service.payout import (
 from polar.transaction.service.refund import (
     refund_transaction as refund_transaction_service,
 )
-from polar.worker import AsyncSessionMaker, JobContext, PolarWorkerContext, task
+from polar.worker import (
+    AsyncSessionMaker,
+    JobContext,
+    PolarWorkerContext,
+    TaskLane,
+    task,
+)
 
 from .service import stripe as stripe_service
 
@@ -57,7 +63,7 @@ class UnsetAccountOnPayoutEvent(StripeTaskError):
         super().__init__(message)
 
 
-@task("stripe.webhook.account.updated")
+@task("stripe.webhook.account.updated", lane=TaskLane.critical)
 async def account_updated(
     ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
 ) -> None:
@@ -69,7 +75,7 @@ async def account_updated(
             )
 
 
-@task("stripe.webhook.payment_intent.succeeded")
+@task("stripe.webhook.payment_intent.succeeded", lane=TaskLane.critical)
 async def payment_intent_succeeded(
     ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
 ) -> None:
@@ -89,7 +95,7 @@ async def payment_intent_succeeded(
             # payment for pay_on_completion
             # metadata is on the invoice, not the payment_intent
             if payload.invoice:
-                invoice = stripe_service.get_invoice(payload.invoice)
+                invoice = await stripe_service.get_invoice(payload.invoice)
                 if (
                     invoice.metadata
                     and invoice.metadata.get("type") == ProductType.pledge
@@ -106,7 +112,7 @@ async def payment_intent_succeeded(
             )
 
 
-@task("stripe.webhook.charge.succeeded")
+@task("stripe.webhook.charge.succeeded", lane=TaskLane.critical)
 async def charge_succeeded(
     ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
 ) -> None:
@@ -129,7 +135,7 @@ async def charge_succeeded(
                     raise
 
 
-@task("stripe.webhook.charge.refunded")
+@task("stripe.webhook.charge.refunded", lane=TaskLane.critical)
 async def charge_refunded(
     ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
 ) -> None:
@@ -148,7 +154,7 @@ async def charge_refunded(
                 )
 
 
-@task("stripe.webhook.charge.dispute.created")
+@task("stripe.webhook.charge.dispute.created", lane=TaskLane.critical)
 async def charge_dispute_created(
     ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
 ) -> None:
@@ -168,7 +174,7 @@ async def charge_dispute_created(
                 else:
                     raise
 
-            charge = stripe_service.get_charge(dispute.charge)
+            charge = await stripe_service.get_charge(dispute.charge)
             if charge.metadata.get("type") == ProductType.pledge:
                 await pledge_service.mark_charge_disputed_by_payment_id(
                     session=session,
@@ -178,7 +184,7 @@ async def charge_dispute_created(
                 )
 
 
-@task("stripe.webhook.charge.dispute.funds_reinstated")
+@task("stripe.webhook.charge.dispute.funds_reinstated", lane=TaskLane.critical)
 async def charge_dispute_funds_reinstated(
     ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
 ) -> None:
@@ -191,7 +197,7 @@ async def charge_dispute_funds_reinstated(
             )
 
 
-@task("stripe.webhook.customer.subscription.created")
+@task("stripe.webhook.customer.subscription.created", lane=TaskLane.critical)
 async def customer_subscription_created(
     ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
 ) -> None:
@@ -205,7 +211,7 @@ async def customer_subscription_created(
             )
 
 
-@task("stripe.webhook.customer.subscription.updated")
+@task("stripe.webhook.customer.subscription.updated", lane=TaskLane.critical)
 async def customer_subscription_updated(
     ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
 ) -> None:
@@ -227,7 +233,7 @@ async def customer_subscription_updated(
                     raise
 
 
-@task("stripe.webhook.customer.subscription.deleted")
+@task("stripe.webhook.customer.subscription.deleted", lane=TaskLane.critical)
 async def customer_subscription_deleted(
     ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
 ) -> None:
@@ -249,7 +255,7 @@ async def customer_subscription_deleted(
                     raise
 
 
-@task("stripe.webhook.invoice.paid")
+@task("stripe.webhook.invoice.paid", lane=TaskLane.critical)
 async def invoice_paid(
     ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
 ) -> None:
@@ -273,7 +279,7 @@ async def invoice_paid(
                     raise
 
 
-@task("stripe.webhook.payout.paid")
+@task("stripe.webhook.payout.paid", lane=TaskLane.critical)
 async def payout_paid(
     ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
 ) -> None:
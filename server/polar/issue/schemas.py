@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from enum import Enum
-from typing import Literal, Self, cast
+from typing import Any, Literal, Self, cast
 from uuid import UUID
 
 import structlog
@@ -374,6 +374,128 @@ class IssueCreate(IssueAndPullRequestBase):
 
         return ret
 
+    @classmethod
+    def from_github_graphql(
+        cls,
+        data: dict[str, Any],
+        organization: OrganizationModel,
+        repository: RepositoryModel,
+    ) -> Self:
+        """
+        Build from an issue of the GitHub GraphQL API,
+        as queried by the batched issue crawler.
+
+        JSON fields are stored in the same shape as the REST API.
+        `closed_by` isn't available there.
+        """
+
+        def actor(data: dict[str, Any] | None) -> dict[str, Any] | None:
+            if not data:
+                return None
+            return {
+                "id": data.get("databaseId"),
+                "login": data["login"],
+                "avatar_url": data["avatarUrl"],
+                "html_url": data["url"],
+                "type": data.get("__typename"),
+            }
+
+        reaction_counts = {
+            _GRAPHQL_REACTIONS[group["content"]]: group["reactors"]["totalCount"]
+            for group in data["reactionGroups"] or []
+            if group["content"] in _GRAPHQL_REACTIONS
+        }
+        reactions = Reactions(
+            total_count=sum(reaction_counts.values()),
+            plus_one=reaction_counts.get("plus_one", 0),
+            minus_one=reaction_counts.get("minus_one", 0),
+            laugh=reaction_counts.get("laugh", 0),
+            hooray=reaction_counts.get("hooray", 0),
+            confused=reaction_counts.get("confused", 0),
+            heart=reaction_counts.get("heart", 0),
+            rocket=reaction_counts.get("rocket", 0),
+            eyes=reaction_counts.get("eyes", 0),
+        )
+
+        labels = [
+            {
+                "node_id": label["id"],
+                "name": label["name"],
+                "color": label["color"],
+                "description": label["description"],
+                "default": label["isDefault"],
+            }
+            for label in data["labels"]["nodes"]
+        ]
+        assignees = [actor(assignee) for assignee in data["assignees"]["nodes"]]
+        milestone = data["milestone"]
+        comments = data["comments"]["totalCount"]
+
+        ret = cls(
+            platform=Platforms.github,
+            external_id=data["databaseId"],
+            organization_id=organization.id,
+            repository_id=repository.id,
+            number=data["number"],
+            title=data["title"],
+            body=data["body"] if data["body"] else "",
+            comments=comments,
+            author=actor(data["author"]),
+            author_association=data["authorAssociation"],
+            labels=labels if labels else None,
+            assignee=assignees[0] if assignees else None,
+            assignees=assignees if assignees else None,
+            milestone={
+                "number": milestone["number"],
+                "title": milestone["title"],
+                "state": milestone["state"].lower(),
+                "due_on": milestone["dueOn"],
+                "html_url": milestone["url"],
+            }
+            if milestone
+            else None,
+            closed_by=None,
+            reactions=reactions.model_dump(mode="json"),
+            state=IssueModel.State(data["state"].lower()),
+            state_reason=data["stateReason"].lower() if data["stateReason"] else None,
+            issue_closed_at=data["closedAt"],
+            issue_created_at=data["createdAt"],
+            issue_modified_at=data["updatedAt"],
+        )
+
+        ret.external_lookup_key = f"{organization.name}/{repository.name}/{ret.number}"
+        ret.has_pledge_badge_label = IssueModel.contains_pledge_badge_label(
+            ret.labels, repository.pledge_badge_label
+        )
+        if ret.body and GithubBadge.badge_is_embedded(ret.body):
+            ret.pledge_badge_embedded_at = ret.issue_modified_at
+
+        # excluding: confused, minus_one
+        ret.positive_reactions_count = (
+            reactions.plus_one
+            + reactions.laugh
+            + reactions.heart
+            + reactions.hooray
+            + reactions.eyes
+            + reactions.rocket
+        )
+        ret.total_engagement_count = reactions.total_count + comments
+
+        return ret
+
+
+# GraphQL reaction contents, to the keys of the REST API
+_GRAPHQL_REACTIONS = {
+    "THUMBS_UP": "plus_one",
+    "THUMBS_DOWN": "minus_one",
+    "LAUGH": "laugh",
+    "HOORAY": "hooray",
+    "CONFUSED": "confused",
+    "HEART": "heart",
+    "ROCKET": "rocket",
+    "EYES": "eyes",
+}
+
 
 class IssueUpdate(IssueCreate):
     ...
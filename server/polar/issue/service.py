@@ -142,6 +142,18 @@ class IssueService(ResourceService[Issue, IssueCreate, IssueUpdate]):
         issues = res.scalars().unique().all()
         return issues
 
+    async def list_by_repository_and_ids(
+        self, session: AsyncSession, repository_id: UUID, ids: list[UUID]
+    ) -> Sequence[Issue]:
+        statement = sql.select(Issue).where(
+            Issue.repository_id == repository_id,
+            Issue.id.in_(ids),
+            Issue.deleted_at.is_(None),
+        )
+        res = await session.execute(statement)
+        issues = res.scalars().unique().all()
+        return issues
+
     async def list_by_repository_type_and_status(
         self,
         session: AsyncSession,
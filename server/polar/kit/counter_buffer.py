@@ -0,0 +1,92 @@
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from prometheus_client import Histogram
+
+from polar.redis import Redis
+
+counter_buffer_flush_lag_seconds = Histogram(
+    "counter_buffer_flush_lag_seconds",
+    "Time between the oldest buffered increment and its flush to the database",
+    ["buffer"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+
+# Stored alongside the counters, so it's snapshotted atomically with them
+_SINCE_FIELD = ":since"
+
+# Rows applied per statement, to stay under the bind parameters limit
+FLUSH_BATCH_SIZE = 1000
+# Outlives any flush, so the lock only expires if its holder died
+FLUSH_LOCK_TTL_SECONDS = 300
+
+
+class CounterBuffer:
+    """
+    Write-behind buffer for counters incremented on hot paths.
+
+    Increments are aggregated in a Redis hash instead of hitting the database,
+    and a periodic job flushes the accumulated deltas in bulk.
+
+    Flushing first moves the hash to a snapshot key, so increments
+    happening during the flush go to a fresh hash. The snapshot is only
+    deleted once the deltas are applied: if the flush fails, it's retried
+    on the next run. Hence, increments are only lost if Redis loses its data
+    before they're flushed, i.e. at most one flush interval.
+
+    Flushes are serialized by a lock, so overlapping runs can't apply
+    the same snapshot twice.
+    """
+
+    def __init__(self, redis: Redis, name: str) -> None:
+        self.redis = redis
+        self.name = name
+        self.key = f"counter_buffer:{name}"
+        self.flushing_key = f"counter_buffer:{name}:flushing"
+        self.lock_key = f"counter_buffer:{name}:lock"
+
+    async def incr(self, field: str, amount: int = 1) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hincrby(self.key, field, amount)
+            pipe.hsetnx(self.key, _SINCE_FIELD, time.time())
+            await pipe.execute()
+
+    @asynccontextmanager
+    async def flush(self) -> AsyncIterator[dict[str, int]]:
+        """
+        Yield the pending deltas, by field.
+
+        They are discarded from the buffer only if the block exits without error.
+        """
+        # Another flush is in progress, it'll apply the pending deltas
+        if not await self.redis.set(
+            self.lock_key, 1, ex=FLUSH_LOCK_TTL_SECONDS, nx=True
+        ):
+            yield {}
+            return
+
+        try:
+            # A snapshot left by a failed flush is retried before taking a new one
+            if not await self.redis.exists(self.flushing_key):
+                if not await self.redis.exists(self.key):
+                    yield {}
+                    return
+                await self.redis.rename(self.key, self.flushing_key)
+
+            values = await self.redis.hgetall(self.flushing_key)
+            since = values.pop(_SINCE_FIELD, None)
+            deltas = {field: int(value) for field, value in values.items()}
+
+            yield deltas
+
+            await self.redis.delete(self.flushing_key)
+            if since is not None:
+                counter_buffer_flush_lag_seconds.labels(buffer=self.name).observe(
+                    time.time() - float(since)
+                )
+        finally:
+            await self.redis.delete(self.lock_key)
+
+
+__all__ = ["CounterBuffer", "FLUSH_BATCH_SIZE"]
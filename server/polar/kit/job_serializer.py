@@ -0,0 +1,60 @@
+import io
+import pickle
+import uuid
+import zlib
+from typing import Any
+
+from pydantic import BaseModel
+
+# Jobs bigger than this are compressed, if it's worth it
+COMPRESSION_THRESHOLD = 1024
+
+# First byte of a zlib stream with the default window size.
+# It can't be mistaken for a pickle, which starts with the PROTO opcode (0x80).
+_ZLIB_HEADER = 0x78
+
+
+def _rebuild_model(cls: type[BaseModel], values: dict[str, Any]) -> BaseModel:
+    return cls.model_construct(**values)
+
+
+class _JobPickler(pickle.Pickler):
+    """
+    Pickler with compact representations of the values we pass to tasks.
+
+    By default, a UUID is pickled as an object holding a 128-bit integer and
+    a `SafeUUID` enum, and a Pydantic model with all its internal attributes.
+    The output is still a regular pickle, so no custom unpickler is needed.
+    """
+
+    def reducer_override(self, obj: Any) -> Any:
+        # Not called for the builtin types, so this doesn't slow them down
+        if type(obj) is uuid.UUID:
+            return (uuid.UUID, (None, obj.bytes))
+        if isinstance(obj, BaseModel):
+            return (_rebuild_model, (type(obj), obj.__dict__))
+        return NotImplemented
+
+
+def serialize_job(data: dict[str, Any]) -> bytes:
+    buffer = io.BytesIO()
+    _JobPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(data)
+    serialized = buffer.getvalue()
+
+    if len(serialized) > COMPRESSION_THRESHOLD:
+        compressed = zlib.compress(serialized, level=1)
+        if len(compressed) < len(serialized):
+            return compressed
+
+    return serialized
+
+
+def deserialize_job(data: bytes) -> dict[str, Any]:
+    if data[0] == _ZLIB_HEADER:
+        data = zlib.decompress(data)
+    # Also loads the jobs enqueued with arq's default serializer
+    deserialized: dict[str, Any] = pickle.loads(data)
+    return deserialized
+
+
+__all__ = ["serialize_job", "deserialize_job"]
@@ -1,16 +1,39 @@
+import base64
+import binascii
+import datetime
+import enum
+import hashlib
+import json
 import math
+import uuid
 from collections.abc import Sequence
+from decimal import Decimal
 from typing import Annotated, Any, Generic, NamedTuple, Self, TypeVar, overload
 
 from fastapi import Depends, Query
 from pydantic import BaseModel
-from sqlalchemy import Select, func, over
+from sqlalchemy import (
+    ColumnElement,
+    Select,
+    UnaryExpression,
+    and_,
+    false,
+    func,
+    inspect,
+    or_,
+    over,
+    select,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import operators
 from sqlalchemy.sql._typing import _ColumnsClauseArgument
 
 from polar.config import settings
+from polar.exceptions import BadRequest
 from polar.kit.db.models import RecordModel
 from polar.kit.db.postgres import AsyncSession
 from polar.kit.schemas import Schema
+from polar.redis import redis
 
 T = TypeVar("T", bound=Any)
 M = TypeVar("M", bound=RecordModel)
@@ -74,6 +97,239 @@ async def paginate(
     return results, count
 
 
+class CursorPaginationParams(NamedTuple):
+    cursor: str | None
+    limit: int
+    with_total_count: bool = False
+
+
+class _KeysetColumn(NamedTuple):
+    expression: ColumnElement[Any]
+    is_desc: bool
+
+
+def _get_keyset_columns(statement: Select[Any]) -> list[_KeysetColumn]:
+    columns: list[_KeysetColumn] = []
+    for clause in statement._order_by_clauses:
+        if isinstance(clause, UnaryExpression) and clause.modifier in (
+            operators.desc_op,
+            operators.asc_op,
+        ):
+            columns.append(
+                _KeysetColumn(clause.element, clause.modifier == operators.desc_op)
+            )
+        elif isinstance(clause, UnaryExpression):
+            raise ValueError(f"Unsupported ordering for keyset pagination: {clause}")
+        else:
+            columns.append(_KeysetColumn(clause, False))
+
+    # Make the ordering total, so no row is skipped or repeated between pages
+    tiebreakers: list[ColumnElement[Any]]
+    entity = statement.column_descriptions[0]["entity"]
+    if statement._group_by_clauses:
+        tiebreakers = list(statement._group_by_clauses)
+    elif entity is not None:
+        tiebreakers = list(inspect(entity).primary_key)
+    else:
+        raise ValueError("Keyset pagination requires an entity or grouped statement")
+
+    for tiebreaker in tiebreakers:
+        if not any(column.expression.compare(tiebreaker) for column in columns):
+            columns.append(_KeysetColumn(tiebreaker, False))
+
+    return columns
+
+
+def _get_keyset_clause(
+    columns: Sequence[_KeysetColumn], values: Sequence[Any]
+) -> ColumnElement[bool]:
+    """
+    Build the clause selecting the rows after the cursor.
+
+    NULL values are handled following PostgreSQL's default ordering,
+    i.e. they come last in ascending order and first in descending order.
+    """
+    clauses: list[ColumnElement[bool]] = []
+    for i, (expression, is_desc) in enumerate(columns):
+        value = values[i]
+        after: ColumnElement[bool]
+        if value is None:
+            after = expression.is_not(None) if is_desc else false()
+        elif is_desc:
+            after = expression < value
+        else:
+            after = or_(expression > value, expression.is_(None))
+
+        previous_equal = [
+            previous_expression.is_not_distinct_from(previous_value)
+            for (previous_expression, _), previous_value in zip(columns[:i], values)
+        ]
+        clauses.append(and_(*previous_equal, after))
+
+    return or_(*clauses)
+
+
+def _encode_cursor_value(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        value = value.value
+    if isinstance(value, datetime.datetime):
+        return {"t": "datetime", "v": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"t": "date", "v": value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {"t": "uuid", "v": str(value)}
+    if isinstance(value, Decimal):
+        return {"t": "decimal", "v": str(value)}
+    if value is None or isinstance(value, bool | int | float | str):
+        return value
+    raise ValueError(f"Unsupported value for keyset pagination: {value!r}")
+
+
+def _decode_cursor_value(value: Any) -> Any:
+    if not isinstance(value, dict):
+        return value
+    match value["t"]:
+        case "datetime":
+            return datetime.datetime.fromisoformat(value["v"])
+        case "date":
+            return datetime.date.fromisoformat(value["v"])
+        case "uuid":
+            return uuid.UUID(value["v"])
+        case "decimal":
+            return Decimal(value["v"])
+    raise ValueError(value["t"])
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    data = json.dumps([_encode_cursor_value(value) for value in values])
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> list[Any]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(data, list):
+            raise ValueError()
+        return [_decode_cursor_value(value) for value in data]
+    except (ValueError, KeyError, TypeError, binascii.Error) as e:
+        raise BadRequest("Invalid cursor") from e
+
+
+async def get_cached_count(session: AsyncSession, statement: Select[Any]) -> int:
+    """
+    Count the rows of the statement, caching the result for a short time.
+
+    Saves counting the whole result set again when browsing its pages.
+    """
+    count_statement = select(func.count()).select_from(
+        statement.order_by(None).subquery()
+    )
+
+    compiled = count_statement.compile(dialect=postgresql.dialect())
+    cache_key_data = f"{compiled}{sorted(compiled.params.items())!r}"
+    cache_key = (
+        f"pagination:count:{hashlib.sha256(cache_key_data.encode()).hexdigest()}"
+    )
+
+    cached = await redis.get(cache_key)
+    if cached is not None:
+        return int(cached)
+
+    count = (await session.execute(count_statement)).scalar_one()
+    await redis.setex(
+        cache_key, settings.API_PAGINATION_COUNT_CACHE_TTL_SECONDS, str(count)
+    )
+    return count
+
+
+@overload
+async def paginate_cursor(
+    session: AsyncSession,
+    statement: Select[tuple[M]],
+    *,
+    pagination: CursorPaginationParams,
+) -> tuple[Sequence[M], str | None, int | None]:
+    ...
+
+
+@overload
+async def paginate_cursor(
+    session: AsyncSession,
+    statement: Select[T],
+    *,
+    pagination: CursorPaginationParams,
+) -> tuple[Sequence[T], str | None, int | None]:
+    ...
+
+
+async def paginate_cursor(
+    session: AsyncSession,
+    statement: Select[Any],
+    *,
+    pagination: CursorPaginationParams,
+) -> tuple[Sequence[Any], str | None, int | None]:
+    """
+    Paginate an ordered statement using the values of the last row as cursor.
+
+    Contrary to `paginate`, the cost of fetching a page doesn't depend on its depth,
+    and the result set isn't counted, unless `with_total_count` is set.
+
+    The keyset is derived from the `ORDER BY` of the statement, so any statement
+    built for `paginate` can be used as is.
+
+    Returns the results, the cursor of the next page, if any, and the total count.
+    """
+    cursor, limit, with_total_count = pagination
+
+    total_count: int | None = None
+    if with_total_count:
+        total_count = await get_cached_count(session, statement)
+
+    columns = _get_keyset_columns(statement)
+
+    if cursor is not None:
+        values = decode_cursor(cursor)
+        if len(values) != len(columns):
+            raise BadRequest("Invalid cursor")
+        keyset_clause = _get_keyset_clause(columns, values)
+        if statement._group_by_clauses:
+            statement = statement.having(keyset_clause)
+        else:
+            statement = statement.where(keyset_clause)
+
+    statement = (
+        statement.order_by(None)
+        .order_by(
+            *(
+                expression.desc() if is_desc else expression.asc()
+                for expression, is_desc in columns
+            )
+        )
+        .add_columns(*(expression for expression, _ in columns))
+        .limit(limit + 1)
+    )
+
+    result = await session.execute(statement)
+    rows = result.unique().all()
+
+    results: list[Any] = []
+    last_values: Sequence[Any] = []
+    for row in rows[:limit]:
+        row_tuple = row._tuple()
+        queried_data = row_tuple[: -len(columns)]
+        last_values = row_tuple[-len(columns) :]
+        if len(queried_data) == 1:
+            results.append(queried_data[0])
+        else:
+            results.append(queried_data)
+
+    next_cursor: str | None = None
+    if len(rows) > limit:
+        next_cursor = encode_cursor(last_values)
+
+    return results, next_cursor, total_count
+
+
 async def get_pagination_params(
     page: int = Query(1, description="Page number, defaults to 1.", gt=0),
     limit: int = Query(
@@ -91,6 +347,36 @@ async def get_pagination_params(
 PaginationParamsQuery = Annotated[PaginationParams, Depends(get_pagination_params)]
 
 
+async def get_cursor_pagination_params(
+    cursor: str | None = Query(
+        None,
+        description=(
+            "Cursor of the page to fetch, as returned in the pagination "
+            "of the previous page. Omit it to fetch the first page."
+        ),
+    ),
+    limit: int = Query(
+        10,
+        description=(
+            f"Size of a page, defaults to 10. "
+            f"Maximum is {settings.API_PAGINATION_MAX_LIMIT}"
+        ),
+        gt=0,
+    ),
+    with_total_count: bool = Query(
+        False, description="Whether to return the total count of items."
+    ),
+) -> CursorPaginationParams:
+    return CursorPaginationParams(
+        cursor, min(settings.API_PAGINATION_MAX_LIMIT, limit), with_total_count
+    )
+
+
+CursorPaginationParamsQuery = Annotated[
+    CursorPaginationParams, Depends(get_cursor_pagination_params)
+]
+
+
 class Pagination(Schema):
     total_count: int
     max_page: int
@@ -111,3 +397,24 @@ class ListResource(BaseModel, Generic[T]):
                 max_page=math.ceil(total_count / pagination_params.limit),
             ),
         )
+
+
+class CursorPagination(Schema):
+    next_cursor: str | None
+    total_count: int | None = None
+
+
+class CursorListResource(BaseModel, Generic[T]):
+    items: Sequence[T] = []
+    pagination: CursorPagination
+
+    @classmethod
+    def from_paginated_results(
+        cls, items: Sequence[T], next_cursor: str | None, total_count: int | None
+    ) -> Self:
+        return cls(
+            items=items,
+            pagination=CursorPagination(
+                next_cursor=next_cursor, total_count=total_count
+            ),
+        )
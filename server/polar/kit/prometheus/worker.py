@@ -0,0 +1,81 @@
+import asyncio
+import contextlib
+import time
+from collections.abc import Iterator
+
+from arq import Retry
+from prometheus_client import Counter, Gauge, Histogram
+
+_TASK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+_QUEUE_WAIT_BUCKETS = (0.1, 0.5, 1, 5, 15, 30, 60, 300, 900, 1800, 3600)
+
+worker_task_duration_seconds = Histogram(
+    "worker_task_duration_seconds",
+    "Task execution time",
+    ["task", "outcome"],
+    buckets=_TASK_BUCKETS,
+)
+worker_task_queue_wait_seconds = Histogram(
+    "worker_task_queue_wait_seconds",
+    "Time between a job being due and it starting",
+    ["task", "lane"],
+    buckets=_QUEUE_WAIT_BUCKETS,
+)
+worker_task_outcomes = Counter(
+    "worker_task_outcomes",
+    "Task executions, by outcome",
+    ["task", "outcome"],
+)
+worker_task_retries = Counter(
+    "worker_task_retries",
+    "Task executions that are a retry of a previous try",
+    ["task"],
+)
+worker_queue_depth = Gauge(
+    "worker_queue_depth",
+    "Jobs ready to run and waiting for a worker",
+    ["lane"],
+)
+
+
+def _get_outcome(exception: BaseException | None) -> str:
+    if exception is None:
+        return "success"
+    if isinstance(exception, Retry):
+        return "retry"
+    # Timeouts and aborts cancel the job
+    if isinstance(exception, asyncio.CancelledError):
+        return "cancelled"
+    return "error"
+
+
+@contextlib.contextmanager
+def observe_task(task: str, lane: str, *, job_try: int, score: int) -> Iterator[None]:
+    """
+    Record the metrics of a task execution.
+
+    `score` is when the job was due, as a timestamp in milliseconds.
+    """
+    t0 = time.perf_counter()
+
+    worker_task_queue_wait_seconds.labels(task=task, lane=lane).observe(
+        max(time.time() - score / 1000, 0)
+    )
+    if job_try > 1:
+        worker_task_retries.labels(task=task).inc()
+
+    exception: BaseException | None = None
+    try:
+        yield
+    except BaseException as e:
+        exception = e
+        raise
+    finally:
+        outcome = _get_outcome(exception)
+        worker_task_duration_seconds.labels(task=task, outcome=outcome).observe(
+            time.perf_counter() - t0
+        )
+        worker_task_outcomes.labels(task=task, outcome=outcome).inc()
+
+
+__all__ = ["observe_task", "worker_queue_depth"]
@@ -0,0 +1,45 @@
+import structlog
+import uvicorn
+from fastapi import FastAPI
+
+from .endpoints import router
+
+log = structlog.get_logger()
+
+
+class _MetricsServer(uvicorn.Server):
+    def install_signal_handlers(self) -> None:
+        # Signals are handled by the process running the server
+        pass
+
+
+def create_metrics_app() -> FastAPI:
+    app = FastAPI(openapi_url=None, docs_url=None, redoc_url=None)
+    app.include_router(router)
+    return app
+
+
+async def serve_metrics(port: int) -> None:
+    """
+    Serve the Prometheus metrics of the current process,
+    for the processes not running the API, like the worker.
+
+    Failing to start, e.g. when the port is already bound, is only logged:
+    the metrics must not take the process down with them.
+    """
+    config = uvicorn.Config(
+        create_metrics_app(),
+        host="0.0.0.0",
+        port=port,
+        lifespan="off",
+        access_log=False,
+        log_config=None,
+    )
+    try:
+        await _MetricsServer(config).serve()
+    # uvicorn exits the process when it can't start
+    except (OSError, SystemExit) as e:
+        log.warning("polar.metrics.serve_failed", port=port, error=repr(e))
+
+
+__all__ = ["serve_metrics"]
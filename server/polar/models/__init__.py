@@ -24,6 +24,7 @@ from .subscription_benefit_grant import SubscriptionBenefitGrant
 from .subscription_tier import SubscriptionTier
 from .subscription_tier_benefit import SubscriptionTierBenefit
 from .traffic import Traffic
+from .traffic_rollup import TrafficReferrerRollup, TrafficRollup
 from .transaction import Transaction
 from .user import OAuthAccount, User
 from .user_notification import UserNotification
@@ -60,6 +61,8 @@ __all__ = [
     "TimestampedModel",
     "Transaction",
     "Traffic",
+    "TrafficReferrerRollup",
+    "TrafficRollup",
     "User",
     "UserNotification",
     "UserOrganization",
@@ -88,6 +88,13 @@ class Article(RecordModel):
     email_sent_to_count: Mapped[int | None] = mapped_column(
         Integer, nullable=True, default=None
     )
+    email_delivered_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0
+    )
+    email_delivered_until: Mapped[UUID | None] = mapped_column(
+        PostgresUUID, nullable=True, default=None
+    )
+    """Last user the email was delivered to, receivers being ordered by ID."""
     email_open_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
 
     web_view_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
@@ -152,6 +152,16 @@ class Issue(IssueFields, RecordModel):
             "idx_issues_positive_total_engagement_count",
             "total_engagement_count",
         ),
+        Index(
+            "idx_issues_organization_id_github_issue_next_crawl_at",
+            "organization_id",
+            "github_issue_next_crawl_at",
+        ),
+        Index(
+            "idx_issues_organization_id_github_timeline_next_crawl_at",
+            "organization_id",
+            "github_timeline_next_crawl_at",
+        ),
     )
 
     TRANSFERRABLE_PROPERTIES: ClassVar[set[str]] = {
@@ -189,11 +199,24 @@ class Issue(IssueFields, RecordModel):
     github_issue_fetched_at: Mapped[datetime | None] = mapped_column(
         TIMESTAMP(timezone=True), nullable=True
     )
+    github_issue_next_crawl_at: Mapped[datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+    # Consecutive crawls which found nothing new, to back off dormant issues
+    github_issue_unchanged_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0
+    )
 
     github_timeline_etag: Mapped[str | None] = mapped_column(String, nullable=True)
     github_timeline_fetched_at: Mapped[datetime | None] = mapped_column(
         TIMESTAMP(timezone=True), nullable=True
     )
+    github_timeline_next_crawl_at: Mapped[datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+    github_timeline_unchanged_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0
+    )
 
     @declared_attr
     def references(cls) -> "Mapped[list[IssueReference]]":
@@ -67,6 +67,14 @@ class Repository(RecordModel):
     issues_references_synced_at: Mapped[datetime | None] = mapped_column(
         TIMESTAMP(timezone=True), nullable=True, default=None
     )
+    # High-water marks of the issues and pull requests syncs:
+    # the latest `updated_at` on GitHub after the last successful one.
+    issues_synced_until: Mapped[datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True, default=None
+    )
+    pull_requests_synced_until: Mapped[datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True, default=None
+    )
 
     # Automatically badge all new issues
     pledge_badge_auto_embed: Mapped[bool] = mapped_column(
@@ -0,0 +1,115 @@
+import datetime
+import enum
+from uuid import UUID
+
+from sqlalchemy import DATE, ForeignKey, Index, Integer, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from polar.kit.db.models.base import Model
+from polar.kit.extensions.sqlalchemy import PostgresUUID
+from polar.kit.extensions.sqlalchemy.types import StringEnum
+from polar.kit.utils import generate_uuid
+
+
+class TrafficRollupPeriod(str, enum.Enum):
+    day = "day"
+    week = "week"  # starting on monday
+    month = "month"
+
+    def get_start_date(self, date: datetime.date) -> datetime.date:
+        if self == TrafficRollupPeriod.week:
+            return date - datetime.timedelta(days=date.weekday())
+        if self == TrafficRollupPeriod.month:
+            return date.replace(day=1)
+        return date
+
+
+class TrafficRollup(Model):
+    """
+    Views of `Traffic` summed by period, to compute statistics
+    without scanning the whole history.
+    """
+
+    __tablename__ = "traffic_rollups"
+
+    __table_args__ = (
+        UniqueConstraint(
+            "period",
+            "start_date",
+            "organization_id",
+            "article_id",
+            name="traffic_rollups_unique_key",
+            postgresql_nulls_not_distinct=True,
+        ),
+        Index("ix_traffic_rollups_article_id", "article_id", "period", "start_date"),
+        Index(
+            "ix_traffic_rollups_organization_id",
+            "organization_id",
+            "period",
+            "start_date",
+        ),
+    )
+
+    id: Mapped[UUID] = mapped_column(
+        PostgresUUID, primary_key=True, default=generate_uuid
+    )
+
+    period: Mapped[TrafficRollupPeriod] = mapped_column(
+        StringEnum(TrafficRollupPeriod), nullable=False
+    )
+
+    start_date: Mapped[datetime.date] = mapped_column(DATE, nullable=False)
+
+    article_id: Mapped[UUID | None] = mapped_column(
+        PostgresUUID, ForeignKey("articles.id"), nullable=True
+    )
+
+    organization_id: Mapped[UUID | None] = mapped_column(
+        PostgresUUID, ForeignKey("organizations.id"), nullable=True
+    )
+
+    views: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class TrafficReferrerRollup(Model):
+    """
+    Views of articles summed by referrer and period.
+
+    Only daily and monthly periods are maintained.
+    """
+
+    __tablename__ = "traffic_referrer_rollups"
+
+    __table_args__ = (
+        UniqueConstraint(
+            "period",
+            "start_date",
+            "article_id",
+            "referrer",
+            name="traffic_referrer_rollups_unique_key",
+        ),
+        Index(
+            "ix_traffic_referrer_rollups_article_id",
+            "article_id",
+            "period",
+            "start_date",
+        ),
+    )
+
+    id: Mapped[UUID] = mapped_column(
+        PostgresUUID, primary_key=True, default=generate_uuid
+    )
+
+    period: Mapped[TrafficRollupPeriod] = mapped_column(
+        StringEnum(TrafficRollupPeriod), nullable=False
+    )
+
+    start_date: Mapped[datetime.date] = mapped_column(DATE, nullable=False)
+
+    article_id: Mapped[UUID] = mapped_column(
+        PostgresUUID, ForeignKey("articles.id"), nullable=False
+    )
+
+    referrer: Mapped[str] = mapped_column(String, nullable=False)
+
+    views: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
@@ -17,7 +17,7 @@ from polar.postgres import AsyncSession
 from polar.user_organization.service import (
     user_organization as user_organization_service,
 )
-from polar.worker import enqueue_job
+from polar.worker import PendingJob, enqueue_job, enqueue_jobs
 
 log = structlog.get_logger()
 
@@ -89,12 +89,26 @@ class NotificationsService:
             org_id,
             is_admin=True,
         )
-        for member in members:
-            await self.send_to_user(
-                session=session,
+        notifications = [
+            Notification(
                 user_id=member.user_id,
-                notif=notif,
+                type=notif.type,
+                issue_id=notif.issue_id,
+                pledge_id=notif.pledge_id,
+                pull_request_id=notif.pull_request_id,
+                payload=notif.payload.model_dump(mode="json"),
             )
+            for member in members
+        ]
+
+        session.add_all(notifications)
+        await session.commit()
+        await enqueue_jobs(
+            [
+                PendingJob("notifications.send", notification_id=notification.id)
+                for notification in notifications
+            ]
+        )
 
     async def send_to_anonymous_email(
         self,
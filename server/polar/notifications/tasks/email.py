@@ -5,14 +5,20 @@ import structlog
 from polar.email.sender import get_email_sender
 from polar.notifications.service import notifications
 from polar.user.service import user as user_service
-from polar.worker import AsyncSessionMaker, JobContext, PolarWorkerContext, task
+from polar.worker import (
+    AsyncSessionMaker,
+    JobContext,
+    PolarWorkerContext,
+    TaskLane,
+    task,
+)
 
 log = structlog.get_logger()
 
 sender = get_email_sender()
 
 
-@task("notifications.send")
+@task("notifications.send", lane=TaskLane.critical)
 async def notifications_send(
     ctx: JobContext,
     notification_id: UUID,
@@ -8,6 +8,9 @@ from sqlalchemy.exc import IntegrityError
 from polar.account.service import account as account_service
 from polar.authz.service import AccessType, Authz
 from polar.enums import Platforms
+from polar.eventstream.service import (
+    invalidate_members_cache as invalidate_eventstream_members_cache,
+)
 from polar.exceptions import BadRequest, PolarError
 from polar.integrations.loops.service import loops as loops_service
 from polar.kit.services import ResourceService
@@ -163,6 +166,7 @@ class OrganizationService(
             await session.execute(stmt)
             await session.commit()
         finally:
+            await invalidate_eventstream_members_cache(organization.id)
             await loops_service.organization_installed(session, user=user)
 
     async def update_settings(
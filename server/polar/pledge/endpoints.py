@@ -1,6 +1,7 @@
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
 from polar import locker
 from polar.auth.dependencies import Auth, UserRequiredAuth
@@ -12,8 +13,14 @@ from polar.issue.service import issue as issue_service
 from polar.kit.pagination import ListResource, Pagination
 from polar.models.pledge import Pledge
 from polar.models.user import User
+from polar.organization.dependencies import OrganizationNamePlatform
 from polar.organization.service import organization as organization_service
-from polar.postgres import AsyncSession, get_db_session
+from polar.postgres import (
+    AsyncSession,
+    AsyncSessionMaker,
+    get_db_session,
+    get_db_sessionmaker,
+)
 from polar.repository.service import repository as repository_service
 from polar.tags.api import Tags
 from polar.user_organization.service import (
@@ -273,6 +280,43 @@ async def search(
     )
 
 
+@router.get(
+    "/pledges/export",
+    tags=[Tags.PUBLIC],
+    description="Export the pledges received by an organization as CSV. Requires authentication.",  # noqa: E501
+    summary="Export pledges (Public API)",
+    status_code=200,
+    responses={404: {}},
+)
+async def export(
+    auth: UserRequiredAuth,
+    organization_name_platform: OrganizationNamePlatform,
+    session: AsyncSession = Depends(get_db_session),
+    sessionmaker: AsyncSessionMaker = Depends(get_db_sessionmaker),
+    authz: Authz = Depends(Authz.authz),
+) -> StreamingResponse:
+    organization_name, platform = organization_name_platform
+    organization = await organization_service.get_by_name(
+        session, platform, organization_name
+    )
+    if organization is None:
+        raise ResourceNotFound("Organization not found")
+
+    if not await authz.can(auth.subject, AccessType.write, organization):
+        raise Unauthorized()
+
+    content = pledge_service.get_receiving_organization_csv(
+        sessionmaker, organization_id=organization.id
+    )
+    filename = f"{organization.name}_pledges.csv"
+
+    return StreamingResponse(
+        content,
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @router.get(
     "/pledges/summary",
     response_model=PledgePledgesSummary,
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import datetime
-from collections.abc import Awaitable, Callable, Sequence
+from collections.abc import AsyncIterable, Awaitable, Callable, Sequence
 from datetime import timedelta
 from typing import Any
 from uuid import UUID
@@ -32,6 +32,8 @@ from polar.integrations.stripe.schemas import PaymentIntentSuccessWebhook
 from polar.integrations.stripe.service import stripe as stripe_service
 from polar.issue.schemas import ConfirmIssueSplit
 from polar.issue.service import issue as issue_service
+from polar.kit.csv import IterableCSVWriter
+from polar.kit.db.postgres import async_sessionmaker
 from polar.kit.hook import Hook
 from polar.kit.money import get_cents_in_dollar_string
 from polar.kit.services import ResourceServiceReader
@@ -210,6 +212,54 @@ class PledgeService(ResourceServiceReader[Pledge]):
         res = await session.execute(statement)
         return res.scalars().unique().all()
 
+    async def get_receiving_organization_csv(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        *,
+        organization_id: UUID,
+    ) -> AsyncIterable[str]:
+        statement = (
+            sql.select(Pledge)
+            .where(
+                Pledge.organization_id == organization_id,
+                Pledge.state != PledgeState.initiated,
+            )
+            .order_by(Pledge.created_at.desc())
+            .options(
+                # Joined collections can't be streamed
+                joinedload(Pledge.user).raiseload(User.oauth_accounts),
+                joinedload(Pledge.by_organization),
+                joinedload(Pledge.on_behalf_of_organization),
+                joinedload(Pledge.issue).options(
+                    joinedload(Issue.organization), joinedload(Issue.repository)
+                ),
+            )
+            .execution_options(yield_per=settings.POSTGRES_STREAM_YIELD_PER)
+        )
+
+        csv_writer = IterableCSVWriter(dialect="excel")
+        yield csv_writer.getrow(
+            ("Date", "Pledge ID", "Issue", "Pledger", "Type", "State", "Amount")
+        )
+
+        # StreamingResponse is running its own async task to exhaust the iterator:
+        # use a dedicated session, the request one might already be closed.
+        async with sessionmaker() as session:
+            pledges = await session.stream_scalars(statement)
+            async for pledge in pledges:
+                pledger = Pledger.from_pledge(pledge)
+                yield csv_writer.getrow(
+                    (
+                        pledge.created_at.isoformat(),
+                        str(pledge.id),
+                        pledge.issue.reference_key,
+                        pledger.name if pledger is not None else "",
+                        pledge.type,
+                        pledge.state,
+                        pledge.amount / 100,
+                    )
+                )
+
     async def get_by_issue_ids(
         self,
         session: AsyncSession,
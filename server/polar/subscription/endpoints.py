@@ -1,4 +1,3 @@
-from collections.abc import AsyncGenerator
 from datetime import date
 from typing import Annotated
 
@@ -12,7 +11,7 @@ from polar.authz.service import AccessType, Authz
 from polar.enums import UserSignupType
 from polar.exceptions import BadRequest, ResourceNotFound, Unauthorized
 from polar.kit.csv import get_emails_from_csv, get_iterable_from_binary_io
-from polar.kit.pagination import ListResource, PaginationParams, PaginationParamsQuery
+from polar.kit.pagination import ListResource, PaginationParamsQuery
 from polar.kit.sorting import Sorting, SortingGetter
 from polar.models import Repository, Subscription, SubscriptionBenefit, SubscriptionTier
 from polar.models.organization import Organization
@@ -23,12 +22,18 @@ from polar.organization.dependencies import (
     OrganizationNamePlatform,
 )
 from polar.organization.service import organization as organization_service
-from polar.postgres import AsyncSession, get_db_session
+from polar.postgres import (
+    AsyncSession,
+    AsyncSessionMaker,
+    get_db_session,
+    get_db_sessionmaker,
+)
 from polar.posthog import posthog
 from polar.repository.dependencies import OptionalRepositoryNameQuery
 from polar.repository.service import repository as repository_service
 from polar.tags.api import Tags
 from polar.user.service import user as user_service
+from polar.worker import enqueue_job
 
 from .schemas import (
     FreeSubscriptionCreate,
@@ -51,7 +56,7 @@ from .schemas import Subscription as SubscriptionSchema
 from .schemas import SubscriptionBenefit as SubscriptionBenefitSchema
 from .schemas import SubscriptionTier as SubscriptionTierSchema
 from .service.subscribe_session import subscribe_session as subscribe_session_service
-from .service.subscription import AlreadySubscribed, SearchSortProperty
+from .service.subscription import SearchSortProperty
 from .service.subscription import subscription as subscription_service
 from .service.subscription_benefit import (
     subscription_benefit as subscription_benefit_service,
@@ -762,34 +767,17 @@ async def subscriptions_import(
 
     emails = get_emails_from_csv(get_iterable_from_binary_io(file.file))
 
-    count = 0
-
-    for email in emails:
-        try:
-            user = await user_service.get_by_email_or_signup(
-                session, email, signup_type=UserSignupType.imported
-            )
-            await subscription_service.create_arbitrary_subscription(
-                session, user=user, subscription_tier=free_tier
-            )
-            count += 1
-        except AlreadySubscribed:
-            pass
-        except Exception as e:
-            log.error("subscriptions_import.failed", e=e)
-
-    posthog.user_event(
-        auth.user,
-        "subscriptions",
-        "import",
-        "create",
-        {
-            "subscription_tier_id": free_tier.id,
-            "email_count": count,
-        },
+    # Large lists take a while: import them in the background,
+    # the progress is reported through the event stream.
+    emails_key = await subscription_service.store_import_emails(sorted(emails))
+    await enqueue_job(
+        "subscription.subscription.import_subscribers",
+        subscription_tier_id=free_tier.id,
+        emails_key=emails_key,
+        importer_id=auth.user.id,
     )
 
-    return SubscriptionsImported(count=count)
+    return SubscriptionsImported(count=len(emails))
 
 
 @router.get(
@@ -802,6 +790,7 @@ async def subscriptions_export(
     repository_name: OptionalRepositoryNameQuery = None,
     authz: Authz = Depends(Authz.authz),
     session: AsyncSession = Depends(get_db_session),
+    sessionmaker: AsyncSessionMaker = Depends(get_db_sessionmaker),
 ) -> Response:
     organization: Organization | None = None
     if organization_name_platform is not None:
@@ -828,37 +817,15 @@ async def subscriptions_export(
     if not await authz.can(auth.subject, AccessType.write, organization):
         raise Unauthorized()
 
-    async def create_csv() -> AsyncGenerator[str, None]:
-        # CSV header
-        yield "email,name,created_at,active,tier\n"
-
-        (subscribers, _) = await subscription_service.search(
-            session,
-            user=auth.subject,
-            organization=organization,
-            repository=repository,
-            pagination=PaginationParams(limit=1000000, page=1),
-        )
-
-        for sub in subscribers:
-            fields = [
-                sub.user.email,
-                sub.user.username,
-                sub.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                "true" if sub.active else "false",
-                sub.subscription_tier.name,
-            ]
-
-            # strip commas (poor mans CSV)
-            fields = [f.replace(",", "") for f in fields]
-
-            yield ",".join(fields) + "\n"
+    content = subscription_service.get_subscribers_csv(
+        sessionmaker, auth.subject, organization=organization, repository=repository
+    )
 
     posthog.user_event(auth.user, "subscriptions", "export", "create")
 
     name = f"{organization.name}_subscribers.csv"
     headers = {"Content-Disposition": f'attachment; filename="{name}"'}
-    return StreamingResponse(create_csv(), headers=headers, media_type="text/csv")
+    return StreamingResponse(content, headers=headers, media_type="text/csv")
 
 
 @router.post(
@@ -10,6 +10,7 @@ from polar.subscription.service.benefits.ads import SubscriptionBenefitAdsServic
 
 from .articles import SubscriptionBenefitArticlesService
 from .base import (
+    SubscriptionBenefitPacingError,
     SubscriptionBenefitPreconditionError,
     SubscriptionBenefitPropertiesValidationError,
     SubscriptionBenefitRetriableError,
@@ -43,6 +44,7 @@ def get_subscription_benefit_service(
 __all__ = [
     "SubscriptionBenefitServiceProtocol",
     "SubscriptionBenefitPropertiesValidationError",
+    "SubscriptionBenefitPacingError",
     "SubscriptionBenefitPreconditionError",
     "SubscriptionBenefitRetriableError",
     "SubscriptionBenefitServiceError",
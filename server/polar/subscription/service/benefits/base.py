@@ -75,6 +75,16 @@ class SubscriptionBenefitRetriableError(SubscriptionBenefitServiceError):
         super().__init__(message)
 
 
+class SubscriptionBenefitPacingError(SubscriptionBenefitRetriableError):
+    """
+    The benefit can't be granted or revoked yet, to pace the calls
+    to an external API.
+
+    Nothing failed: the job can be deferred instead of retried,
+    so waiting its turn doesn't count as a try.
+    """
+
+
 class SubscriptionBenefitPreconditionError(SubscriptionBenefitServiceError):
     """
     Some conditions are missing to grant the benefit.
@@ -1,4 +1,6 @@
+import dataclasses
 from typing import Any, cast
+from uuid import UUID
 
 import structlog
 from githubkit.exception import RateLimitExceeded, RequestError, RequestTimeout
@@ -7,6 +9,11 @@ from polar.authz.service import AccessType, Authz
 from polar.config import settings
 from polar.integrations.github import client as github
 from polar.integrations.github import types
+from polar.integrations.github.rate_limit import (
+    RateLimitBudgetExceeded,
+    get_installation_bucket,
+    wait_for_write_slot,
+)
 from polar.logging import Logger
 from polar.models import Repository, Subscription, User
 from polar.models.subscription_benefit import (
@@ -17,10 +24,12 @@ from polar.models.user import OAuthPlatform
 from polar.notifications.notification import (
     SubscriptionBenefitPreconditionErrorNotificationContextualPayload,
 )
+from polar.postgres import AsyncSession
 from polar.posthog import posthog
 from polar.repository.service import repository as repository_service
 
 from .base import (
+    SubscriptionBenefitPacingError,
     SubscriptionBenefitPreconditionError,
     SubscriptionBenefitPropertiesValidationError,
     SubscriptionBenefitRetriableError,
@@ -64,12 +73,36 @@ https://litmus.com/blog/a-guide-to-bulletproof-buttons-in-email-design -->
 """
 
 
+# Roles of the collaborators matching the permissions we grant
+_PERMISSION_ROLES: dict[str, str] = {"pull": "read", "push": "write"}
+
+
+def _get_permission_role(permission: str) -> str:
+    return _PERMISSION_ROLES.get(permission, permission)
+
+
+@dataclasses.dataclass
+class _RepositoryAccess:
+    """Who has access to a repository, or has been invited to."""
+
+    collaborators: dict[int, str]
+    """Role of the direct collaborators, by GitHub user ID."""
+    invitations: dict[int, types.RepositoryInvitation]
+    """Pending invitations, by GitHub user ID."""
+
+
 class SubscriptionBenefitGitHubRepositoryService(
     SubscriptionBenefitServiceProtocol[
         SubscriptionBenefitGitHubRepository,
         SubscriptionBenefitGitHubRepositoryProperties,
     ]
 ):
+    def __init__(self, session: AsyncSession) -> None:
+        super().__init__(session)
+        # Grants are processed in batches sharing the same service:
+        # the access to each repository is fetched once for the whole batch.
+        self._repository_access: dict[UUID, _RepositoryAccess] = {}
+
     async def grant(
         self,
         benefit: SubscriptionBenefitGitHubRepository,
@@ -114,33 +147,47 @@ class SubscriptionBenefitGitHubRepositoryService(
             )
 
         client = github.get_app_installation_client(installation_id)
+        account_id = int(oauth_account.account_id)
 
-        # If we already granted this benefit, make sure we revoke the previous config
-        if update and grant_properties:
-            bound_logger.debug("Grant benefit update")
-            invitation = await self._get_invitation(
-                client, repository, int(oauth_account.account_id)
-            )
-            # The repository changed, or the invitation is still pending: revoke
-            if (
-                repository_id != grant_properties["repository_id"]
-                or invitation is not None
+        try:
+            access = await self._get_repository_access(client, repository)
+
+            # If we already granted this benefit, make sure we revoke the previous config
+            if update and grant_properties:
+                bound_logger.debug("Grant benefit update")
+                # The repository changed, or the invitation is still pending: revoke
+                if (
+                    repository_id != grant_properties["repository_id"]
+                    or account_id in access.invitations
+                ):
+                    await self.revoke(
+                        benefit, subscription, user, grant_properties, attempt=attempt
+                    )
+                # The permission changed, and the invitation is already accepted
+                elif permission != grant_properties["permission"]:
+                    # The permission change will be handled by the add_collaborator call
+                    pass
+
+            role = _get_permission_role(permission)
+            invitation = access.invitations.get(account_id)
+            if access.collaborators.get(account_id) == role or (
+                invitation is not None and invitation.permissions == role
             ):
-                await self.revoke(
-                    benefit, subscription, user, grant_properties, attempt=attempt
+                bound_logger.debug("User already has access, skipping")
+            else:
+                await wait_for_write_slot(get_installation_bucket(installation_id))
+                await client.rest.repos.async_add_collaborator(
+                    organization.name,
+                    repository.name,
+                    user.username,
+                    data={"permission": permission},
                 )
-            # The permission changed, and the invitation is already accepted
-            elif permission != grant_properties["permission"]:
-                # The permission change will be handled by the add_collaborator call
-                pass
-
-        try:
-            await client.rest.repos.async_add_collaborator(
-                organization.name,
-                repository.name,
-                user.username,
-                data={"permission": permission},
-            )
+                # We don't know if they were invited or directly added:
+                # next time, we'll check with GitHub
+                access.collaborators.pop(account_id, None)
+                access.invitations.pop(account_id, None)
+        except RateLimitBudgetExceeded as e:
+            raise SubscriptionBenefitPacingError(e.retry_after) from e
         except RateLimitExceeded as e:
             raise SubscriptionBenefitRetriableError(
                 int(e.retry_after.total_seconds())
@@ -186,23 +233,29 @@ class SubscriptionBenefitGitHubRepositoryService(
             raise
 
         client = github.get_app_installation_client(installation_id)
-
-        invitation = await self._get_invitation(
-            client, repository, int(oauth_account.account_id)
-        )
-        if invitation is not None:
-            bound_logger.debug("Invitation not yet accepted, removing it")
-            revoke_request = client.rest.repos.async_delete_invitation(
-                organization.name, repository.name, invitation.id
-            )
-        else:
-            bound_logger.debug("Invitation not found, removing the user")
-            revoke_request = client.rest.repos.async_remove_collaborator(
-                organization.name, repository.name, user.username
-            )
+        account_id = int(oauth_account.account_id)
 
         try:
-            await revoke_request
+            access = await self._get_repository_access(client, repository)
+            invitation = access.invitations.get(account_id)
+            if invitation is not None:
+                bound_logger.debug("Invitation not yet accepted, removing it")
+                await wait_for_write_slot(get_installation_bucket(installation_id))
+                await client.rest.repos.async_delete_invitation(
+                    organization.name, repository.name, invitation.id
+                )
+                del access.invitations[account_id]
+            elif account_id in access.collaborators:
+                bound_logger.debug("Invitation not found, removing the user")
+                await wait_for_write_slot(get_installation_bucket(installation_id))
+                await client.rest.repos.async_remove_collaborator(
+                    organization.name, repository.name, user.username
+                )
+                del access.collaborators[account_id]
+            else:
+                bound_logger.debug("User has no access, skipping")
+        except RateLimitBudgetExceeded as e:
+            raise SubscriptionBenefitPacingError(e.retry_after) from e
         except RateLimitExceeded as e:
             raise SubscriptionBenefitRetriableError(
                 int(e.retry_after.total_seconds())
@@ -284,15 +337,31 @@ class SubscriptionBenefitGitHubRepositoryService(
             },
         )
 
-    async def _get_invitation(
-        self, client: github.GitHub[Any], repository: Repository, user_id: int
-    ) -> types.RepositoryInvitation | None:
+    async def _get_repository_access(
+        self, client: github.GitHub[Any], repository: Repository
+    ) -> _RepositoryAccess:
+        access = self._repository_access.get(repository.id)
+        if access is not None:
+            return access
+
+        collaborators: dict[int, str] = {}
+        async for collaborator in client.paginate(
+            client.rest.repos.async_list_collaborators,
+            owner=repository.organization.name,
+            repo=repository.name,
+            affiliation="direct",
+        ):
+            collaborators[collaborator.id] = collaborator.role_name
+
+        invitations: dict[int, types.RepositoryInvitation] = {}
         async for invitation in client.paginate(
             client.rest.repos.async_list_invitations,
             owner=repository.organization.name,
             repo=repository.name,
         ):
-            if invitation.invitee and invitation.invitee.id == user_id:
-                return invitation
+            if invitation.invitee:
+                invitations[invitation.invitee.id] = invitation
 
-        return None
+        access = _RepositoryAccess(collaborators=collaborators, invitations=invitations)
+        self._repository_access[repository.id] = access
+        return access
@@ -1,11 +1,15 @@
+import base64
+import itertools
 import uuid
-from collections.abc import Sequence
+import zlib
+from collections.abc import AsyncIterable, Sequence
 from datetime import UTC, date, datetime
 from enum import StrEnum
 from typing import Any, cast, overload
 
 import stripe as stripe_lib
 from sqlalchemy import (
+    ColumnElement,
     Select,
     UnaryExpression,
     and_,
@@ -19,18 +23,21 @@ from sqlalchemy import (
     text,
     tuple_,
 )
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import aliased, contains_eager, joinedload
 
 from polar.auth.dependencies import AuthMethod
 from polar.authz.service import AccessType, Authz, Subject
 from polar.config import settings
 from polar.enums import UserSignupType
+from polar.eventstream.service import publish as eventstream_publish
 from polar.exceptions import NotPermitted, PolarError, ResourceNotFound
 from polar.held_balance.service import held_balance as held_balance_service
 from polar.integrations.loops.service import loops as loops_service
 from polar.integrations.stripe.service import stripe as stripe_service
 from polar.integrations.stripe.utils import get_expandable_id
-from polar.kit.db.postgres import AsyncSession
+from polar.kit.csv import IterableCSVWriter
+from polar.kit.db.postgres import AsyncSession, async_sessionmaker
 from polar.kit.pagination import PaginationParams, paginate
 from polar.kit.services import ResourceServiceReader
 from polar.kit.sorting import Sorting
@@ -47,7 +54,10 @@ from polar.models import (
     UserOrganization,
 )
 from polar.models.subscription import SubscriptionStatus
-from polar.models.subscription_benefit import SubscriptionBenefitType
+from polar.models.subscription_benefit import (
+    SubscriptionBenefitArticles,
+    SubscriptionBenefitType,
+)
 from polar.models.subscription_tier import SubscriptionTierType
 from polar.models.transaction import TransactionType
 from polar.models.user import OAuthPlatform
@@ -61,6 +71,7 @@ from polar.notifications.service import notifications as notification_service
 from polar.notifications.service import notifications as notifications_service
 from polar.organization.service import organization as organization_service
 from polar.posthog import posthog
+from polar.redis import redis
 from polar.transaction.service.balance import PaymentTransactionForChargeDoesNotExist
 from polar.transaction.service.balance import (
     balance_transaction as balance_transaction_service,
@@ -72,7 +83,7 @@ from polar.user.service import user as user_service
 from polar.user_organization.service import (
     user_organization as user_organization_service,
 )
-from polar.worker import enqueue_job
+from polar.worker import PendingJob, enqueue_job, enqueue_jobs
 
 from ..schemas import (
     FreeSubscriptionCreate,
@@ -85,6 +96,9 @@ from .subscription_benefit_grant import (
 )
 from .subscription_tier import subscription_tier as subscription_tier_service
 
+# Imported emails are kept until imported, unless the worker is *very* late
+IMPORT_EMAILS_TTL_SECONDS = 24 * 3600
+
 
 class SubscriptionError(PolarError):
     ...
@@ -236,44 +250,18 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
             (SearchSortProperty.started_at, True)
         ],
     ) -> tuple[Sequence[Subscription], int]:
-        statement = self._get_readable_subscriptions_statement(user).where(
-            Subscription.started_at.is_not(None)
+        statement = self._get_search_statement(
+            user,
+            organization=organization,
+            repository=repository,
+            direct_organization=direct_organization,
+            type=type,
+            subscription_tier_id=subscription_tier_id,
+            subscriber_user_id=subscriber_user_id,
+            subscriber_organization_id=subscriber_organization_id,
+            active=active,
         )
 
-        statement = statement.join(Subscription.user)
-
-        if organization is not None:
-            clauses = [SubscriptionTier.organization_id == organization.id]
-            if not direct_organization:
-                clauses.append(Repository.organization_id == organization.id)
-            statement = statement.where(or_(*clauses))
-
-        if repository is not None:
-            statement = statement.where(SubscriptionTier.repository_id == repository.id)
-
-        if type is not None:
-            statement = statement.where(SubscriptionTier.type == type)
-
-        if subscription_tier_id is not None:
-            statement = statement.where(SubscriptionTier.id == subscription_tier_id)
-
-        if subscriber_user_id is not None:
-            statement = statement.where(
-                Subscription.user_id == subscriber_user_id,
-                Subscription.organization_id.is_(None),
-            )
-
-        if subscriber_organization_id is not None:
-            statement = statement.where(
-                Subscription.organization_id == subscriber_organization_id
-            )
-
-        if active is not None:
-            if active:
-                statement = statement.where(Subscription.active.is_(True))
-            else:
-                statement = statement.where(Subscription.canceled.is_(True))
-
         order_by_clauses: list[UnaryExpression[Any]] = []
         for criterion, is_desc in sorting:
             clause_function = desc if is_desc else asc
@@ -305,6 +293,45 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
 
         return results, count
 
+    async def get_subscribers_csv(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        user: User,
+        *,
+        organization: Organization,
+        repository: Repository | None = None,
+    ) -> AsyncIterable[str]:
+        statement = (
+            self._get_search_statement(
+                user, organization=organization, repository=repository
+            )
+            .order_by(Subscription.started_at.desc())
+            .options(
+                contains_eager(Subscription.subscription_tier),
+                # Joined collections can't be streamed
+                contains_eager(Subscription.user).raiseload(User.oauth_accounts),
+            )
+            .execution_options(yield_per=settings.POSTGRES_STREAM_YIELD_PER)
+        )
+
+        csv_writer = IterableCSVWriter(dialect="excel")
+        yield csv_writer.getrow(("email", "name", "created_at", "active", "tier"))
+
+        # StreamingResponse is running its own async task to exhaust the iterator:
+        # use a dedicated session, the request one might already be closed.
+        async with sessionmaker() as session:
+            subscriptions = await session.stream_scalars(statement)
+            async for subscription in subscriptions:
+                yield csv_writer.getrow(
+                    (
+                        subscription.user.email,
+                        subscription.user.username,
+                        subscription.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                        "true" if subscription.active else "false",
+                        subscription.subscription_tier.name,
+                    )
+                )
+
     async def search_subscribed(
         self,
         session: AsyncSession,
@@ -544,6 +571,123 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
 
         return subscription
 
+    async def store_import_emails(self, emails: Sequence[str]) -> str:
+        """
+        Store the emails to import, returns the key to load them.
+
+        A list can hold tens of thousands of emails: it's stored compressed,
+        instead of being kept by arq in the arguments of the import job.
+        """
+        key = uuid.uuid4().hex
+        compressed = zlib.compress("\n".join(emails).encode("utf-8"))
+        # Our client decodes the responses, hence the base64
+        await redis.set(
+            self._get_import_emails_key(key),
+            base64.b64encode(compressed).decode("ascii"),
+            ex=IMPORT_EMAILS_TTL_SECONDS,
+        )
+        return key
+
+    async def load_import_emails(self, key: str) -> list[str] | None:
+        value = await redis.get(self._get_import_emails_key(key))
+        if value is None:
+            return None
+        emails = zlib.decompress(base64.b64decode(value)).decode("utf-8")
+        return emails.split("\n") if emails else []
+
+    async def delete_import_emails(self, key: str) -> None:
+        await redis.delete(self._get_import_emails_key(key))
+
+    async def import_subscribers(
+        self,
+        session: AsyncSession,
+        *,
+        subscription_tier: SubscriptionTier,
+        emails: Sequence[str],
+        importer: User,
+        batch_size: int = 1000,
+    ) -> int:
+        """
+        Subscribe users by email to a free tier, signing them up if needed.
+
+        Emails are processed by batches: users are resolved and created
+        with set-based queries, and subscriptions are inserted in bulk.
+        The progress is reported to the importer through the event stream.
+
+        Returns the number of created subscriptions.
+        """
+        count = 0
+        processed = 0
+        for emails_batch in itertools.batched(emails, batch_size):
+            user_ids = await user_service.get_or_signup_ids_by_emails(
+                session, emails_batch
+            )
+
+            subscribed_statement = (
+                select(Subscription.user_id)
+                .join(Subscription.subscription_tier)
+                .where(
+                    Subscription.user_id.in_(user_ids.values()),
+                    Subscription.active.is_(True),
+                )
+            )
+            if subscription_tier.organization_id is not None:
+                subscribed_statement = subscribed_statement.where(
+                    SubscriptionTier.organization_id
+                    == subscription_tier.organization_id
+                )
+            if subscription_tier.repository_id is not None:
+                subscribed_statement = subscribed_statement.where(
+                    SubscriptionTier.repository_id == subscription_tier.repository_id
+                )
+            result = await session.execute(subscribed_statement)
+            subscribed_user_ids = set(result.scalars().all())
+
+            start = utc_now()
+            new_subscriptions = [
+                {
+                    "status": SubscriptionStatus.active,
+                    "current_period_start": start,
+                    "cancel_at_period_end": False,
+                    "started_at": start,
+                    "price_currency": subscription_tier.price_currency,
+                    "price_amount": subscription_tier.price_amount,
+                    "user_id": user_id,
+                    "subscription_tier_id": subscription_tier.id,
+                }
+                for user_id in user_ids.values()
+                if user_id not in subscribed_user_ids
+            ]
+            subscription_ids: Sequence[uuid.UUID] = []
+            if new_subscriptions:
+                result = await session.execute(
+                    insert(Subscription)
+                    .values(new_subscriptions)
+                    .returning(Subscription.id)
+                )
+                subscription_ids = result.scalars().all()
+                await session.commit()
+
+                await enqueue_job(
+                    "subscription.subscription.enqueue_benefits_grants_many",
+                    subscription_ids,
+                )
+
+            count += len(subscription_ids)
+            processed += len(emails_batch)
+            await eventstream_publish(
+                "subscription.subscriptions_import.progress",
+                {
+                    "subscription_tier_id": subscription_tier.id,
+                    "processed": processed,
+                    "total": len(emails),
+                    "count": count,
+                },
+                user_id=importer.id,
+            )
+
+        return count
+
     async def create_subscription_from_stripe(
         self, session: AsyncSession, *, stripe_subscription: stripe_lib.Subscription
     ) -> Subscription:
@@ -601,7 +745,7 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
         subscription.set_started_at()
 
         customer_id = get_expandable_id(stripe_subscription.customer)
-        customer = stripe_service.get_customer(customer_id)
+        customer = await stripe_service.get_customer(customer_id)
         customer_email = cast(str, customer.email)
 
         # Subscribe as organization
@@ -789,6 +933,14 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
             session, balance_transactions=balance_transactions
         )
 
+    async def enqueue_benefits_grants_many(
+        self, session: AsyncSession, subscription_ids: Sequence[uuid.UUID]
+    ) -> None:
+        statement = select(Subscription).where(Subscription.id.in_(subscription_ids))
+        result = await session.execute(statement)
+        for subscription in result.scalars().all():
+            await self.enqueue_benefits_grants(session, subscription)
+
     async def enqueue_benefits_grants(
         self, session: AsyncSession, subscription: Subscription
     ) -> None:
@@ -816,81 +968,133 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
         else:
             users_ids = [subscription.user_id]
 
+        jobs: list[PendingJob] = []
         task = "grant" if subscription.active else "revoke"
         for benefit in subscription_tier.benefits:
             # FIXME: Hack to prevent GitHub Repository benefit abuse
             # Only enqueue it for the subscriber user.
             # Remove this when we have proper per-seat support
             if benefit.type == SubscriptionBenefitType.github_repository:
-                await enqueue_job(
-                    f"subscription.subscription_benefit.{task}",
-                    subscription_id=subscription.id,
-                    user_id=subscription.user_id,
-                    subscription_benefit_id=benefit.id,
-                )
-            else:
-                for user_id in users_ids:
-                    await enqueue_job(
+                jobs.append(
+                    PendingJob(
                         f"subscription.subscription_benefit.{task}",
                         subscription_id=subscription.id,
-                        user_id=user_id,
+                        user_id=subscription.user_id,
                         subscription_benefit_id=benefit.id,
                     )
+                )
+            else:
+                for user_id in users_ids:
+                    jobs.append(
+                        PendingJob(
+                            f"subscription.subscription_benefit.{task}",
+                            subscription_id=subscription.id,
+                            user_id=user_id,
+                            subscription_benefit_id=benefit.id,
+                        )
+                    )
+
+        # Special hard-coded logic to make sure
+        # we always at least subscribe to public articles
+        free_articles_benefit: SubscriptionBenefitArticles | None = None
+        if users_ids and subscription_tier.get_articles_benefit() is None:
+            await session.refresh(subscription_tier, {"organization", "repository"})
+            (
+                free_articles_benefit,
+                _,
+            ) = await subscription_benefit_service.get_or_create_articles_benefits(
+                session,
+                subscription_tier.organization,
+                subscription_tier.repository,
+            )
 
         for user_id in users_ids:
             for outdated_grant in outdated_grants:
-                await enqueue_job(
-                    "subscription.subscription_benefit.revoke",
-                    subscription_id=subscription.id,
-                    user_id=user_id,
-                    subscription_benefit_id=outdated_grant.subscription_benefit_id,
+                jobs.append(
+                    PendingJob(
+                        "subscription.subscription_benefit.revoke",
+                        subscription_id=subscription.id,
+                        user_id=user_id,
+                        subscription_benefit_id=outdated_grant.subscription_benefit_id,
+                    )
                 )
 
-            # Special hard-coded logic to make sure
-            # we always at least subscribe to public articles
-            if subscription_tier.get_articles_benefit() is None:
-                await session.refresh(subscription_tier, {"organization", "repository"})
-                (
-                    free_articles_benefit,
-                    _,
-                ) = await subscription_benefit_service.get_or_create_articles_benefits(
-                    session,
-                    subscription_tier.organization,
-                    subscription_tier.repository,
-                )
-                await enqueue_job(
-                    f"subscription.subscription_benefit.{task}",
-                    subscription_id=subscription.id,
-                    user_id=user_id,
-                    subscription_benefit_id=free_articles_benefit.id,
+            if free_articles_benefit is not None:
+                jobs.append(
+                    PendingJob(
+                        f"subscription.subscription_benefit.{task}",
+                        subscription_id=subscription.id,
+                        user_id=user_id,
+                        subscription_benefit_id=free_articles_benefit.id,
+                    )
                 )
 
+        await enqueue_jobs(jobs)
+
     async def update_subscription_tier_benefits_grants(
         self, session: AsyncSession, subscription_tier: SubscriptionTier
     ) -> None:
-        statement = select(Subscription).where(
+        await self._enqueue_subscription_tier_grants_sync(
+            session,
+            subscription_tier,
             Subscription.subscription_tier_id == subscription_tier.id,
-            Subscription.deleted_at.is_(None),
         )
-        subscriptions = await session.stream_scalars(statement)
-        async for subscription in subscriptions:
-            await enqueue_job(
-                "subscription.subscription.enqueue_benefits_grants", subscription.id
-            )
 
     async def update_organization_benefits_grants(
         self, session: AsyncSession, organization: Organization
     ) -> None:
-        statement = select(Subscription).where(
-            Subscription.organization_id == organization.id,
-            Subscription.deleted_at.is_(None),
+        statement = select(SubscriptionTier).where(
+            SubscriptionTier.id.in_(
+                select(Subscription.subscription_tier_id).where(
+                    Subscription.organization_id == organization.id,
+                    Subscription.deleted_at.is_(None),
+                )
+            )
         )
-        subscriptions = await session.stream_scalars(statement)
-        async for subscription in subscriptions:
-            await enqueue_job(
-                "subscription.subscription.enqueue_benefits_grants", subscription.id
+        result = await session.execute(statement)
+        for subscription_tier in result.scalars().all():
+            await self._enqueue_subscription_tier_grants_sync(
+                session,
+                subscription_tier,
+                Subscription.subscription_tier_id == subscription_tier.id,
+                Subscription.organization_id == organization.id,
             )
 
+    async def _enqueue_subscription_tier_grants_sync(
+        self,
+        session: AsyncSession,
+        subscription_tier: SubscriptionTier,
+        *subscriptions_criteria: ColumnElement[bool],
+    ) -> None:
+        """
+        Same as `enqueue_benefits_grants`,
+        for all the subscriptions of the tier matching the criteria at once.
+        """
+        benefits = list(subscription_tier.benefits)
+
+        # Special hard-coded logic to make sure
+        # we always at least subscribe to public articles
+        if subscription_tier.get_articles_benefit() is None:
+            await session.refresh(subscription_tier, {"organization", "repository"})
+            (
+                free_articles_benefit,
+                _,
+            ) = await subscription_benefit_service.get_or_create_articles_benefits(
+                session,
+                subscription_tier.organization,
+                subscription_tier.repository,
+            )
+            benefits.append(free_articles_benefit)
+
+        await subscription_benefit_grant_service.enqueue_grants_sync(
+            session,
+            benefits,
+            Subscription.status.not_in(
+                [SubscriptionStatus.incomplete, SubscriptionStatus.incomplete_expired]
+            ),
+            *subscriptions_criteria,
+        )
+
     async def upgrade_subscription(
         self,
         session: AsyncSession,
@@ -936,7 +1140,7 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
             raise InvalidSubscriptionTierUpgrade(new_subscription_tier.id)
 
         assert old_subscription_tier.stripe_price_id is not None
-        stripe_service.update_subscription_price(
+        await stripe_service.update_subscription_price(
             subscription.stripe_subscription_id,
             old_price=old_subscription_tier.stripe_price_id,
             new_price=new_subscription_tier.stripe_price_id,
@@ -969,7 +1173,9 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
             raise AlreadyCanceledSubscription(subscription)
 
         if subscription.stripe_subscription_id is not None:
-            stripe_service.cancel_subscription(subscription.stripe_subscription_id)
+            await stripe_service.cancel_subscription(
+                subscription.stripe_subscription_id
+            )
         else:
             subscription.ended_at = utc_now()
             subscription.cancel_at_period_end = True
@@ -1183,6 +1389,59 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
 
         return statistics_periods
 
+    def _get_search_statement(
+        self,
+        user: User,
+        *,
+        organization: Organization,
+        repository: Repository | None = None,
+        direct_organization: bool = True,
+        type: SubscriptionTierType | None = None,
+        subscription_tier_id: uuid.UUID | None = None,
+        subscriber_user_id: uuid.UUID | None = None,
+        subscriber_organization_id: uuid.UUID | None = None,
+        active: bool | None = None,
+    ) -> Select[Any]:
+        statement = self._get_readable_subscriptions_statement(user).where(
+            Subscription.started_at.is_not(None)
+        )
+
+        statement = statement.join(Subscription.user)
+
+        if organization is not None:
+            clauses = [SubscriptionTier.organization_id == organization.id]
+            if not direct_organization:
+                clauses.append(Repository.organization_id == organization.id)
+            statement = statement.where(or_(*clauses))
+
+        if repository is not None:
+            statement = statement.where(SubscriptionTier.repository_id == repository.id)
+
+        if type is not None:
+            statement = statement.where(SubscriptionTier.type == type)
+
+        if subscription_tier_id is not None:
+            statement = statement.where(SubscriptionTier.id == subscription_tier_id)
+
+        if subscriber_user_id is not None:
+            statement = statement.where(
+                Subscription.user_id == subscriber_user_id,
+                Subscription.organization_id.is_(None),
+            )
+
+        if subscriber_organization_id is not None:
+            statement = statement.where(
+                Subscription.organization_id == subscriber_organization_id
+            )
+
+        if active is not None:
+            if active:
+                statement = statement.where(Subscription.active.is_(True))
+            else:
+                statement = statement.where(Subscription.canceled.is_(True))
+
+        return statement
+
     def _get_readable_subscriptions_statement(self, user: User) -> Select[Any]:
         statement = (
             select(Subscription)
@@ -1244,5 +1503,8 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
             )
         )
 
+    def _get_import_emails_key(self, key: str) -> str:
+        return f"subscription:import_emails:{key}"
+
 
 subscription = SubscriptionService(Subscription)
@@ -1,7 +1,11 @@
+import itertools
+import uuid
+from collections import defaultdict
 from collections.abc import Sequence
 
 import structlog
-from sqlalchemy import select
+from sqlalchemy import ColumnElement, and_, insert, not_, or_, select, true, union_all
+from sqlalchemy.orm import joinedload
 
 from polar.eventstream.service import publish as eventstream_publish
 from polar.kit.services import ResourceServiceReader
@@ -13,6 +17,7 @@ from polar.models import (
     SubscriptionTier,
     SubscriptionTierBenefit,
     User,
+    UserOrganization,
 )
 from polar.models.subscription_benefit import (
     SubscriptionBenefitProperties,
@@ -27,15 +32,24 @@ from polar.notifications.service import notifications as notification_service
 from polar.organization.service import organization as organization_service
 from polar.postgres import AsyncSession
 from polar.user.service import user as user_service
-from polar.worker import enqueue_job
+from polar.worker import PendingJob, enqueue_job, enqueue_jobs
 
 from .benefits import (
     SubscriptionBenefitPreconditionError,
+    SubscriptionBenefitRetriableError,
     get_subscription_benefit_service,
 )
 
 log: Logger = structlog.get_logger()
 
+# Grants processed by a single job, by benefit type.
+# Lower for the benefits calling rate-limited external APIs.
+GRANTS_BATCH_SIZES: dict[SubscriptionBenefitType, int] = {
+    SubscriptionBenefitType.discord: 20,
+    SubscriptionBenefitType.github_repository: 20,
+}
+DEFAULT_GRANTS_BATCH_SIZE = 100
+
 
 class SubscriptionBenefitGrantService(ResourceServiceReader[SubscriptionBenefitGrant]):
     async def grant_benefit(
@@ -140,6 +154,326 @@ class SubscriptionBenefitGrantService(ResourceServiceReader[SubscriptionBenefitG
 
         return grant
 
+    async def grant_benefits(
+        self,
+        session: AsyncSession,
+        subscription_benefit: SubscriptionBenefit,
+        grant_ids: Sequence[uuid.UUID],
+        *,
+        attempt: int = 1,
+    ) -> None:
+        """
+        Grant a benefit through existing grants, like `grant_benefit` does for one.
+
+        Already granted ones are skipped, so the batch can be retried
+        after a `SubscriptionBenefitRetriableError`. Other errors only fail
+        their grant: they're logged, and the rest of the batch is granted.
+        """
+        grants = await self._get_by_ids_with_subscription_and_user(session, grant_ids)
+        benefit_service = get_subscription_benefit_service(
+            subscription_benefit.type, session
+        )
+
+        granted_grants: list[SubscriptionBenefitGrant] = []
+        try:
+            for grant in grants:
+                if grant.is_granted:
+                    continue
+                try:
+                    properties = await benefit_service.grant(
+                        subscription_benefit,
+                        grant.subscription,
+                        grant.user,
+                        grant.properties,
+                        attempt=attempt,
+                    )
+                except SubscriptionBenefitPreconditionError as e:
+                    await self.handle_precondition_error(
+                        session, e, grant.subscription, grant.user, subscription_benefit
+                    )
+                    grant.granted_at = None
+                except SubscriptionBenefitRetriableError:
+                    raise
+                except Exception:
+                    log.exception(
+                        "subscription.benefit_grant.grant_failed",
+                        grant_id=grant.id,
+                        subscription_benefit_id=subscription_benefit.id,
+                    )
+                    continue
+                else:
+                    grant.properties = properties
+                    grant.set_granted()
+                session.add(grant)
+                granted_grants.append(grant)
+        finally:
+            # Keep what was done, the retry won't do it again
+            await session.commit()
+
+            for grant in granted_grants:
+                await eventstream_publish(
+                    "subscription.subscription_benefit_grant.granted",
+                    {
+                        "subscription_benefit_id": subscription_benefit.id,
+                        "subscription_benefit_type": subscription_benefit.type,
+                    },
+                    user_id=grant.user_id,
+                )
+
+    async def revoke_benefits(
+        self,
+        session: AsyncSession,
+        subscription_benefit: SubscriptionBenefit,
+        grant_ids: Sequence[uuid.UUID],
+        *,
+        attempt: int = 1,
+    ) -> None:
+        """
+        Revoke a benefit from existing grants, like `revoke_benefit` does for one.
+
+        Already revoked ones are skipped, so the batch can be retried
+        after a `SubscriptionBenefitRetriableError`. Other errors only fail
+        their grant: they're logged, and the rest of the batch is revoked.
+        """
+        grants = await self._get_by_ids_with_subscription_and_user(session, grant_ids)
+        benefit_service = get_subscription_benefit_service(
+            subscription_benefit.type, session
+        )
+
+        revoked_grants: list[SubscriptionBenefitGrant] = []
+        try:
+            for grant in grants:
+                if grant.is_revoked:
+                    continue
+                try:
+                    properties = await benefit_service.revoke(
+                        subscription_benefit,
+                        grant.subscription,
+                        grant.user,
+                        grant.properties,
+                        attempt=attempt,
+                    )
+                except SubscriptionBenefitRetriableError:
+                    raise
+                except Exception:
+                    log.exception(
+                        "subscription.benefit_grant.revoke_failed",
+                        grant_id=grant.id,
+                        subscription_benefit_id=subscription_benefit.id,
+                    )
+                    continue
+                grant.properties = properties
+                grant.set_revoked()
+                session.add(grant)
+                revoked_grants.append(grant)
+        finally:
+            # Keep what was done, the retry won't do it again
+            await session.commit()
+
+            for grant in revoked_grants:
+                await eventstream_publish(
+                    "subscription.subscription_benefit_grant.revoked",
+                    {
+                        "subscription_benefit_id": subscription_benefit.id,
+                        "subscription_benefit_type": subscription_benefit.type,
+                    },
+                    user_id=grant.user_id,
+                )
+
+    async def enqueue_grants_sync(
+        self,
+        session: AsyncSession,
+        subscription_benefits: Sequence[SubscriptionBenefit],
+        *subscriptions_criteria: ColumnElement[bool],
+    ) -> None:
+        """
+        Bring the grants of many subscriptions in line with their benefits.
+
+        Set-based equivalent of enqueuing the grant and revoke jobs
+        of each subscription: the desired grants are compared to the existing ones
+        in SQL, the missing grants are inserted in bulk, and the benefits are
+        granted or revoked by jobs processing a batch of grants of one benefit.
+
+        Args:
+            subscription_benefits: The benefits the subscriptions give.
+            subscriptions_criteria: The criteria selecting the subscriptions.
+        """
+        subscriptions = (
+            select(
+                Subscription.id,
+                Subscription.user_id,
+                Subscription.organization_id,
+                Subscription.active.label("active"),
+            )
+            .where(Subscription.deleted_at.is_(None), *subscriptions_criteria)
+            .cte("subscriptions")
+        )
+        benefits = (
+            select(SubscriptionBenefit.id, SubscriptionBenefit.type)
+            .where(
+                SubscriptionBenefit.id.in_(
+                    [benefit.id for benefit in subscription_benefits]
+                )
+            )
+            .cte("benefits")
+        )
+
+        # Granted to all members of the organization if any, or the user.
+        # FIXME: Hack to prevent GitHub Repository benefit abuse:
+        # only granted to the subscriber user.
+        # Remove this when we have proper per-seat support
+        is_github_repository = (
+            benefits.c.type == SubscriptionBenefitType.github_repository
+        )
+        desired = union_all(
+            select(
+                subscriptions.c.id.label("subscription_id"),
+                subscriptions.c.user_id.label("user_id"),
+                benefits.c.id.label("subscription_benefit_id"),
+                benefits.c.type.label("subscription_benefit_type"),
+                subscriptions.c.active,
+            )
+            .select_from(subscriptions.join(benefits, true()))
+            .where(
+                subscriptions.c.user_id.is_not(None),
+                or_(subscriptions.c.organization_id.is_(None), is_github_repository),
+            ),
+            select(
+                subscriptions.c.id,
+                UserOrganization.user_id,
+                benefits.c.id,
+                benefits.c.type,
+                subscriptions.c.active,
+            )
+            .select_from(
+                subscriptions.join(
+                    UserOrganization,
+                    and_(
+                        UserOrganization.organization_id
+                        == subscriptions.c.organization_id,
+                        UserOrganization.deleted_at.is_(None),
+                    ),
+                ).join(benefits, true())
+            )
+            .where(not_(is_github_repository)),
+        ).cte("desired")
+
+        # Desired grants of active subscriptions which are not granted
+        to_grant_statement = (
+            select(
+                desired.c.subscription_id,
+                desired.c.user_id,
+                desired.c.subscription_benefit_id,
+                desired.c.subscription_benefit_type,
+                SubscriptionBenefitGrant.id,
+            )
+            .select_from(desired)
+            .join(
+                SubscriptionBenefitGrant,
+                and_(
+                    SubscriptionBenefitGrant.subscription_id
+                    == desired.c.subscription_id,
+                    SubscriptionBenefitGrant.user_id == desired.c.user_id,
+                    SubscriptionBenefitGrant.subscription_benefit_id
+                    == desired.c.subscription_benefit_id,
+                    SubscriptionBenefitGrant.deleted_at.is_(None),
+                ),
+                isouter=True,
+            )
+            .where(
+                desired.c.active.is_(True),
+                SubscriptionBenefitGrant.granted_at.is_(None),
+            )
+        )
+
+        # Granted grants which are not desired anymore,
+        # or whose subscription is not active anymore
+        to_revoke_statement = (
+            select(
+                SubscriptionBenefitGrant.id,
+                SubscriptionBenefitGrant.subscription_benefit_id,
+                SubscriptionBenefit.type,
+            )
+            .join(
+                subscriptions,
+                subscriptions.c.id == SubscriptionBenefitGrant.subscription_id,
+            )
+            .join(SubscriptionBenefit)
+            .join(
+                desired,
+                and_(
+                    desired.c.subscription_id
+                    == SubscriptionBenefitGrant.subscription_id,
+                    desired.c.user_id == SubscriptionBenefitGrant.user_id,
+                    desired.c.subscription_benefit_id
+                    == SubscriptionBenefitGrant.subscription_benefit_id,
+                ),
+                isouter=True,
+            )
+            .where(
+                SubscriptionBenefitGrant.is_granted.is_(True),
+                SubscriptionBenefitGrant.deleted_at.is_(None),
+                or_(
+                    desired.c.subscription_id.is_(None),
+                    desired.c.active.is_(False),
+                ),
+            )
+        )
+
+        to_grant: dict[uuid.UUID, list[uuid.UUID]] = defaultdict(list)
+        to_revoke: dict[uuid.UUID, list[uuid.UUID]] = defaultdict(list)
+        benefit_types: dict[uuid.UUID, SubscriptionBenefitType] = {}
+
+        missing_grants: list[dict[str, uuid.UUID]] = []
+        result = await session.execute(to_grant_statement)
+        for subscription_id, user_id, benefit_id, benefit_type, grant_id in result:
+            benefit_types[benefit_id] = benefit_type
+            if grant_id is None:
+                missing_grants.append(
+                    {
+                        "subscription_id": subscription_id,
+                        "user_id": user_id,
+                        "subscription_benefit_id": benefit_id,
+                    }
+                )
+            else:
+                to_grant[benefit_id].append(grant_id)
+
+        if missing_grants:
+            result = await session.execute(
+                insert(SubscriptionBenefitGrant).returning(
+                    SubscriptionBenefitGrant.id,
+                    SubscriptionBenefitGrant.subscription_benefit_id,
+                ),
+                missing_grants,
+            )
+            for grant_id, benefit_id in result:
+                to_grant[benefit_id].append(grant_id)
+
+        result = await session.execute(to_revoke_statement)
+        for grant_id, benefit_id, benefit_type in result:
+            benefit_types[benefit_id] = benefit_type
+            to_revoke[benefit_id].append(grant_id)
+
+        # The jobs need the grants to exist
+        await session.commit()
+
+        jobs: list[PendingJob] = []
+        for task, grant_ids_by_benefit in (("grant", to_grant), ("revoke", to_revoke)):
+            for benefit_id, grant_ids in grant_ids_by_benefit.items():
+                batch_size = GRANTS_BATCH_SIZES.get(
+                    benefit_types[benefit_id], DEFAULT_GRANTS_BATCH_SIZE
+                )
+                for batch in itertools.batched(grant_ids, batch_size):
+                    jobs.append(
+                        PendingJob(
+                            f"subscription.subscription_benefit.{task}_many",
+                            subscription_benefit_id=benefit_id,
+                            subscription_benefit_grant_ids=list(batch),
+                        )
+                    )
+        await enqueue_jobs(jobs)
+
     async def enqueue_benefit_grant_updates(
         self,
         session: AsyncSession,
@@ -301,14 +635,18 @@ class SubscriptionBenefitGrantService(ResourceServiceReader[SubscriptionBenefitG
         grants = await self._get_by_user_and_benefit_type(
             session, user, subscription_benefit_type
         )
-        for grant in grants:
-            if not grant.is_granted and not grant.is_revoked:
-                await enqueue_job(
+        await enqueue_jobs(
+            [
+                PendingJob(
                     "subscription.subscription_benefit.grant",
                     subscription_id=grant.subscription_id,
                     user_id=user.id,
                     subscription_benefit_id=grant.subscription_benefit_id,
                 )
+                for grant in grants
+                if not grant.is_granted and not grant.is_revoked
+            ]
+        )
 
     async def get_outdated_grants(
         self,
@@ -368,6 +706,24 @@ class SubscriptionBenefitGrantService(ResourceServiceReader[SubscriptionBenefitG
         result = await session.execute(statement)
         return result.scalars().all()
 
+    async def _get_by_ids_with_subscription_and_user(
+        self, session: AsyncSession, grant_ids: Sequence[uuid.UUID]
+    ) -> Sequence[SubscriptionBenefitGrant]:
+        statement = (
+            select(SubscriptionBenefitGrant)
+            .where(
+                SubscriptionBenefitGrant.id.in_(grant_ids),
+                SubscriptionBenefitGrant.deleted_at.is_(None),
+            )
+            .options(
+                joinedload(SubscriptionBenefitGrant.subscription),
+                joinedload(SubscriptionBenefitGrant.user),
+            )
+        )
+
+        result = await session.execute(statement)
+        return result.scalars().unique().all()
+
     async def _get_by_user_and_benefit_type(
         self,
         session: AsyncSession,
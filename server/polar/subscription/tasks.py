@@ -1,17 +1,30 @@
 import uuid
 
+import structlog
 from arq import Retry
 from discord_webhook import AsyncDiscordWebhook, DiscordEmbed
 
 from polar.config import settings
 from polar.exceptions import PolarError
 from polar.kit.money import get_cents_in_dollar_string
+from polar.logging import Logger
 from polar.models.subscription_benefit import SubscriptionBenefitType
 from polar.organization.service import organization as organization_service
+from polar.posthog import posthog
 from polar.user.service import user as user_service
-from polar.worker import AsyncSessionMaker, JobContext, PolarWorkerContext, task
+from polar.worker import (
+    AsyncSessionMaker,
+    JobContext,
+    PolarWorkerContext,
+    TaskLane,
+    enqueue_job,
+    task,
+)
 
-from .service.benefits import SubscriptionBenefitRetriableError
+from .service.benefits import (
+    SubscriptionBenefitPacingError,
+    SubscriptionBenefitRetriableError,
+)
 from .service.subscription import subscription as subscription_service
 from .service.subscription_benefit import (
     subscription_benefit as subscription_benefit_service,
@@ -21,6 +34,8 @@ from .service.subscription_benefit_grant import (
 )
 from .service.subscription_tier import subscription_tier as subscription_tier_service
 
+log: Logger = structlog.get_logger()
+
 
 class SubscriptionTaskError(PolarError):
     ...
@@ -69,7 +84,10 @@ class SubscriptionBenefitGrantDoesNotExist(SubscriptionTaskError):
         super().__init__(message, 500)
 
 
-@task("subscription.subscription.enqueue_benefits_grants")
+@task(
+    "subscription.subscription.enqueue_benefits_grants",
+    dedupe_on=("subscription_id",),
+)
 async def subscription_enqueue_benefits_grants(
     ctx: JobContext, subscription_id: uuid.UUID, polar_context: PolarWorkerContext
 ) -> None:
@@ -81,7 +99,70 @@ async def subscription_enqueue_benefits_grants(
         await subscription_service.enqueue_benefits_grants(session, subscription)
 
 
-@task("subscription.subscription.update_subscription_tier_benefits_grants")
+@task("subscription.subscription.enqueue_benefits_grants_many")
+async def subscription_enqueue_benefits_grants_many(
+    ctx: JobContext,
+    subscription_ids: list[uuid.UUID],
+    polar_context: PolarWorkerContext,
+) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        await subscription_service.enqueue_benefits_grants_many(
+            session, subscription_ids
+        )
+
+
+@task("subscription.subscription.import_subscribers", lane=TaskLane.bulk)
+async def subscription_import_subscribers(
+    ctx: JobContext,
+    subscription_tier_id: uuid.UUID,
+    emails_key: str,
+    importer_id: uuid.UUID,
+    polar_context: PolarWorkerContext,
+) -> None:
+    emails = await subscription_service.load_import_emails(emails_key)
+    if emails is None:
+        log.warning(
+            "subscription.import_subscribers.emails_expired",
+            subscription_tier_id=subscription_tier_id,
+        )
+        return
+
+    async with AsyncSessionMaker(ctx) as session:
+        subscription_tier = await subscription_tier_service.get(
+            session, subscription_tier_id
+        )
+        if subscription_tier is None:
+            raise SubscriptionTierDoesNotExist(subscription_tier_id)
+
+        importer = await user_service.get(session, importer_id)
+        if importer is None:
+            raise UserDoesNotExist(importer_id)
+
+        count = await subscription_service.import_subscribers(
+            session,
+            subscription_tier=subscription_tier,
+            emails=emails,
+            importer=importer,
+        )
+
+        posthog.user_event(
+            importer,
+            "subscriptions",
+            "import",
+            "create",
+            {
+                "subscription_tier_id": subscription_tier.id,
+                "email_count": count,
+            },
+        )
+
+    await subscription_service.delete_import_emails(emails_key)
+
+
+@task(
+    "subscription.subscription.update_subscription_tier_benefits_grants",
+    dedupe_on=("subscription_tier_id",),
+)
 async def subscription_update_subscription_tier_benefits_grants(
     ctx: JobContext, subscription_tier_id: uuid.UUID, polar_context: PolarWorkerContext
 ) -> None:
@@ -97,7 +178,7 @@ async def subscription_update_subscription_tier_benefits_grants(
         )
 
 
-@task("subscription.subscription_benefit.grant")
+@task("subscription.subscription_benefit.grant", lane=TaskLane.critical)
 async def subscription_benefit_grant(
     ctx: JobContext,
     subscription_id: uuid.UUID,
@@ -132,7 +213,7 @@ async def subscription_benefit_grant(
             raise Retry(e.defer_seconds) from e
 
 
-@task("subscription.subscription_benefit.revoke")
+@task("subscription.subscription_benefit.revoke", lane=TaskLane.critical)
 async def subscription_benefit_revoke(
     ctx: JobContext,
     subscription_id: uuid.UUID,
@@ -167,7 +248,76 @@ async def subscription_benefit_revoke(
             raise Retry(e.defer_seconds) from e
 
 
-@task("subscription.subscription_benefit.update")
+@task("subscription.subscription_benefit.grant_many", lane=TaskLane.bulk)
+async def subscription_benefit_grant_many(
+    ctx: JobContext,
+    subscription_benefit_id: uuid.UUID,
+    subscription_benefit_grant_ids: list[uuid.UUID],
+    polar_context: PolarWorkerContext,
+) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        subscription_benefit = await subscription_benefit_service.get(
+            session, subscription_benefit_id
+        )
+        if subscription_benefit is None:
+            raise SubscriptionBenefitDoesNotExist(subscription_benefit_id)
+
+        try:
+            await subscription_benefit_grant_service.grant_benefits(
+                session,
+                subscription_benefit,
+                subscription_benefit_grant_ids,
+                attempt=ctx["job_try"],
+            )
+        # Continued by a new job, the processed grants are skipped
+        except SubscriptionBenefitPacingError as e:
+            await enqueue_job(
+                "subscription.subscription_benefit.grant_many",
+                subscription_benefit_id=subscription_benefit_id,
+                subscription_benefit_grant_ids=subscription_benefit_grant_ids,
+                _defer_by=e.defer_seconds,
+            )
+        except SubscriptionBenefitRetriableError as e:
+            raise Retry(e.defer_seconds) from e
+
+
+@task("subscription.subscription_benefit.revoke_many", lane=TaskLane.bulk)
+async def subscription_benefit_revoke_many(
+    ctx: JobContext,
+    subscription_benefit_id: uuid.UUID,
+    subscription_benefit_grant_ids: list[uuid.UUID],
+    polar_context: PolarWorkerContext,
+) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        subscription_benefit = await subscription_benefit_service.get(
+            session, subscription_benefit_id
+        )
+        if subscription_benefit is None:
+            raise SubscriptionBenefitDoesNotExist(subscription_benefit_id)
+
+        try:
+            await subscription_benefit_grant_service.revoke_benefits(
+                session,
+                subscription_benefit,
+                subscription_benefit_grant_ids,
+                attempt=ctx["job_try"],
+            )
+        # Continued by a new job, the processed grants are skipped
+        except SubscriptionBenefitPacingError as e:
+            await enqueue_job(
+                "subscription.subscription_benefit.revoke_many",
+                subscription_benefit_id=subscription_benefit_id,
+                subscription_benefit_grant_ids=subscription_benefit_grant_ids,
+                _defer_by=e.defer_seconds,
+            )
+        except SubscriptionBenefitRetriableError as e:
+            raise Retry(e.defer_seconds) from e
+
+
+@task(
+    "subscription.subscription_benefit.update",
+    dedupe_on=("subscription_benefit_grant_id",),
+)
 async def subscription_benefit_update(
     ctx: JobContext,
     subscription_benefit_grant_id: uuid.UUID,
@@ -1,4 +1,5 @@
 from polar.account import tasks as account
+from polar.advertisement import tasks as advertisement
 from polar.article import tasks as article
 from polar.integrations.github import tasks as github
 from polar.integrations.loops import tasks as loops
@@ -7,11 +8,13 @@ from polar.magic_link import tasks as magic_link
 from polar.notifications import tasks as notifications
 from polar.organization import tasks as organization
 from polar.subscription import tasks as subscription
+from polar.traffic import tasks as traffic
 from polar.transaction import tasks as transaction
 from polar.user import tasks as user
 
 __all__ = [
     "account",
+    "advertisement",
     "article",
     "github",
     "loops",
@@ -20,6 +23,7 @@ __all__ = [
     "notifications",
     "organization",
     "subscription",
+    "traffic",
     "transaction",
     "user",
 ]
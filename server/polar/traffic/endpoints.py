@@ -38,11 +38,9 @@ router = APIRouter(prefix="", tags=["traffic"])
 )
 async def track_page_view(
     track: TrackPageView,
-    session: AsyncSession = Depends(get_db_session),
 ) -> TrackPageViewResponse:
     if track.article_id or track.organization_id:
-        await traffic_service.add(
-            session,
+        await traffic_service.track(
             location_href=track.location_href,
             referrer=track.referrer,
             article_id=track.article_id,
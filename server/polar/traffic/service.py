@@ -1,21 +1,47 @@
+import bisect
+import collections
 import datetime
-from collections.abc import Sequence
-from typing import Literal
+import itertools
+import json
+from collections.abc import Iterable, Sequence
+from typing import Any, Literal
 from uuid import UUID
 
-from sqlalchemy import ColumnExpressionArgument, and_, desc, func, null, text
+from sqlalchemy import ColumnExpressionArgument, and_, desc, func, or_
 
+from polar.kit.counter_buffer import FLUSH_BATCH_SIZE, CounterBuffer
 from polar.kit.pagination import PaginationParams, paginate
 from polar.kit.utils import utc_now
 from polar.models.traffic import Traffic
+from polar.models.traffic_rollup import (
+    TrafficReferrerRollup,
+    TrafficRollup,
+    TrafficRollupPeriod,
+)
 from polar.postgres import AsyncSession, sql
+from polar.redis import redis
 from polar.traffic.schemas import TrafficReferrer, TrafficStatisticsPeriod
 
+views_buffer = CounterBuffer(redis, "traffic_views")
+
+REFERRER_ROLLUP_PERIODS = (TrafficRollupPeriod.day, TrafficRollupPeriod.month)
+
+
+def _add_interval(
+    date: datetime.date, interval: Literal["month", "week", "day"]
+) -> datetime.date:
+    if interval == "month":
+        if date.month == 12:
+            return date.replace(year=date.year + 1, month=1)
+        return date.replace(month=date.month + 1)
+    if interval == "week":
+        return date + datetime.timedelta(weeks=1)
+    return date + datetime.timedelta(days=1)
+
 
 class TrafficService:
-    async def add(
+    async def track(
         self,
-        session: AsyncSession,
         *,
         location_href: str,
         date: datetime.date,
@@ -23,25 +49,49 @@ class TrafficService:
         article_id: UUID | None = None,
         organization_id: UUID | None = None,
     ) -> None:
+        """
+        Count a page view in the views buffer.
+
+        It'll be written to the database on the next `flush_views`.
+        """
         if article_id is None and organization_id is None:
             raise Exception("article_id or organization_id must be set")
 
-        insert_stmt = sql.insert(Traffic).values(
-            location_href=location_href,
-            referrer=referrer,
-            article_id=article_id,
-            organization_id=organization_id,
-            date=date,
-            views=1,
+        key = json.dumps(
+            [
+                str(organization_id) if organization_id else None,
+                str(article_id) if article_id else None,
+                date.isoformat(),
+                location_href,
+                referrer,
+            ]
         )
+        await views_buffer.incr(key)
 
-        do_update = insert_stmt.on_conflict_do_update(
-            constraint="traffic_unique_key",
-            set_=dict(views=Traffic.views + 1),
-        )
+    async def flush_views(self, session: AsyncSession) -> None:
+        async with views_buffer.flush() as deltas:
+            if not deltas:
+                return
 
-        await session.execute(do_update)
-        await session.commit()
+            values = []
+            for key, views in deltas.items():
+                organization_id, article_id, date, location_href, referrer = json.loads(
+                    key
+                )
+                values.append(
+                    dict(
+                        location_href=location_href,
+                        referrer=referrer,
+                        article_id=UUID(article_id) if article_id else None,
+                        organization_id=(
+                            UUID(organization_id) if organization_id else None
+                        ),
+                        date=datetime.date.fromisoformat(date),
+                        views=views,
+                    )
+                )
+
+            await self._add_views(session, values)
 
     async def views_statistics(
         self,
@@ -58,61 +108,67 @@ class TrafficService:
         if article_ids is None and organization_id is None:
             raise Exception("neither article_ids nor organization_id is set")
 
-        interval_txt = {
-            "month": "interval 'P1M'",
-            "week": "interval 'P1W'",
-            "day": "interval 'P1D'",
-        }[interval]
-
-        sql_interval = text(interval_txt)
+        start_of_last_period = start_of_last_period or utc_now().date().replace(day=1)
 
-        start_date_column = func.generate_series(
-            start_date, end_date, sql_interval
-        ).column_valued("start_date")
-        end_date_column = start_date_column + sql_interval
+        period_start_dates: list[datetime.date] = []
+        period_start_date = start_date
+        while period_start_date <= min(end_date, start_of_last_period):
+            period_start_dates.append(period_start_date)
+            period_start_date = _add_interval(period_start_date, interval)
+        if not period_start_dates:
+            return []
+        periods_end_date = _add_interval(period_start_dates[-1], interval)
 
-        start_of_last_period = start_of_last_period or utc_now().date().replace(day=1)
+        # Periods not aligned on the rollups are summed from the daily ones
+        rollup_period = TrafficRollupPeriod(interval)
+        if rollup_period.get_start_date(start_date) != start_date:
+            rollup_period = TrafficRollupPeriod.day
 
-        joinclauses: list[ColumnExpressionArgument[bool]] = []
+        clauses: list[ColumnExpressionArgument[bool]] = [
+            TrafficRollup.period == rollup_period,
+            TrafficRollup.start_date >= start_date,
+            TrafficRollup.start_date < periods_end_date,
+        ]
         if article_ids is not None:
-            joinclauses.append(Traffic.article_id.in_(article_ids))
+            clauses.append(TrafficRollup.article_id.in_(article_ids))
         if organization_id is not None:
-            joinclauses.append(Traffic.organization_id == organization_id)
+            clauses.append(TrafficRollup.organization_id == organization_id)
 
         stmt = (
             sql.select(
-                start_date_column,
-            )
-            .add_columns(
-                end_date_column,
-                Traffic.article_id if group_by_article else null(),
-                func.coalesce(
-                    func.sum(Traffic.views).filter(
-                        Traffic.date >= start_date_column,
-                        Traffic.date < end_date_column,
-                    ),
-                    0,
-                ),
-            )
-            .join(
-                Traffic,
-                onclause=and_(True, *joinclauses),
+                TrafficRollup.start_date,
+                TrafficRollup.article_id,
+                func.sum(TrafficRollup.views),
             )
-            .where(start_date_column <= start_of_last_period)
-            .group_by(start_date_column)
-            .order_by(start_date_column)
+            .where(*clauses)
+            .group_by(TrafficRollup.start_date, TrafficRollup.article_id)
         )
-
         res = await session.execute(stmt)
 
+        views: dict[tuple[datetime.date, UUID | None], int] = collections.Counter()
+        for row_start_date, article_id, row_views in res.tuples().all():
+            period_index = bisect.bisect_right(period_start_dates, row_start_date) - 1
+            key = (
+                period_start_dates[period_index],
+                article_id if group_by_article else None,
+            )
+            views[key] += row_views
+
+        group_article_ids: Sequence[UUID | None] = [None]
+        if group_by_article:
+            group_article_ids = sorted(
+                {article_id for (_, article_id) in views if article_id is not None}
+            )
+
         return [
             TrafficStatisticsPeriod(
-                start_date=row_start_date,
-                end_date=row_end_date,
+                start_date=period_start_date,
+                end_date=_add_interval(period_start_date, interval),
                 article_id=article_id,
-                views=views,
+                views=views.get((period_start_date, article_id), 0),
             )
-            for (row_start_date, row_end_date, article_id, views) in res.tuples().all()
+            for period_start_date in period_start_dates
+            for article_id in group_article_ids
         ]
 
     async def referrers(
@@ -124,17 +180,44 @@ class TrafficService:
         end_date: datetime.date,
         pagination: PaginationParams,
     ) -> tuple[Sequence[TrafficReferrer], int]:
+        # Sum the monthly rollups for the full months of the range,
+        # and the daily ones for the remaining days at its edges.
+        months_start_date = TrafficRollupPeriod.month.get_start_date(
+            start_date - datetime.timedelta(days=1)
+        )
+        months_start_date = _add_interval(months_start_date, "month")
+        months_end_date = TrafficRollupPeriod.month.get_start_date(
+            end_date + datetime.timedelta(days=1)
+        )
+        if months_start_date >= months_end_date:
+            months_start_date = months_end_date = end_date + datetime.timedelta(days=1)
+
         statement = (
-            sql.select(Traffic.referrer, func.sum(Traffic.views))
+            sql.select(
+                TrafficReferrerRollup.referrer, func.sum(TrafficReferrerRollup.views)
+            )
             .where(
-                Traffic.article_id.in_(article_ids),
-                Traffic.date >= start_date,
-                Traffic.date <= end_date,
-                Traffic.referrer.is_not(None),
-                Traffic.referrer != "",
+                TrafficReferrerRollup.article_id.in_(article_ids),
+                or_(
+                    and_(
+                        TrafficReferrerRollup.period == TrafficRollupPeriod.day,
+                        TrafficReferrerRollup.start_date >= start_date,
+                        TrafficReferrerRollup.start_date < months_start_date,
+                    ),
+                    and_(
+                        TrafficReferrerRollup.period == TrafficRollupPeriod.month,
+                        TrafficReferrerRollup.start_date >= months_start_date,
+                        TrafficReferrerRollup.start_date < months_end_date,
+                    ),
+                    and_(
+                        TrafficReferrerRollup.period == TrafficRollupPeriod.day,
+                        TrafficReferrerRollup.start_date >= months_end_date,
+                        TrafficReferrerRollup.start_date <= end_date,
+                    ),
+                ),
             )
-            .group_by(Traffic.referrer)
-            .order_by(desc(func.sum(Traffic.views)))
+            .group_by(TrafficReferrerRollup.referrer)
+            .order_by(desc(func.sum(TrafficReferrerRollup.views)))
         )
 
         results, count = await paginate(session, statement, pagination=pagination)
@@ -147,5 +230,114 @@ class TrafficService:
             for (referrer, views) in results
         ], count
 
+    async def _add_views(
+        self, session: AsyncSession, values: Iterable[dict[str, Any]]
+    ) -> None:
+        """
+        Add views to the traffic, maintaining its rollups in the same transaction.
+
+        Rows are written in batches, as a flush can hold many distinct keys.
+        """
+        values = list(values)
+
+        rollups: dict[
+            tuple[TrafficRollupPeriod, datetime.date, UUID | None, UUID | None], int
+        ] = collections.Counter()
+        referrer_rollups: dict[
+            tuple[TrafficRollupPeriod, datetime.date, UUID, str], int
+        ] = collections.Counter()
+        for value in values:
+            for period in TrafficRollupPeriod:
+                period_start_date = period.get_start_date(value["date"])
+                rollups[
+                    (
+                        period,
+                        period_start_date,
+                        value["article_id"],
+                        value["organization_id"],
+                    )
+                ] += value["views"]
+                if (
+                    period in REFERRER_ROLLUP_PERIODS
+                    and value["article_id"] is not None
+                    and value["referrer"]
+                ):
+                    referrer_rollups[
+                        (
+                            period,
+                            period_start_date,
+                            value["article_id"],
+                            value["referrer"],
+                        )
+                    ] += value["views"]
+
+        for batch in itertools.batched(values, FLUSH_BATCH_SIZE):
+            insert_stmt = sql.insert(Traffic).values(batch)
+            await session.execute(
+                insert_stmt.on_conflict_do_update(
+                    constraint="traffic_unique_key",
+                    set_=dict(views=Traffic.views + insert_stmt.excluded.views),
+                )
+            )
+
+        for rollups_batch in itertools.batched(rollups.items(), FLUSH_BATCH_SIZE):
+            rollups_insert_stmt = sql.insert(TrafficRollup).values(
+                [
+                    dict(
+                        period=period,
+                        start_date=period_start_date,
+                        article_id=article_id,
+                        organization_id=organization_id,
+                        views=views,
+                    )
+                    for (
+                        period,
+                        period_start_date,
+                        article_id,
+                        organization_id,
+                    ), views in rollups_batch
+                ]
+            )
+            await session.execute(
+                rollups_insert_stmt.on_conflict_do_update(
+                    constraint="traffic_rollups_unique_key",
+                    set_=dict(
+                        views=TrafficRollup.views + rollups_insert_stmt.excluded.views
+                    ),
+                )
+            )
+
+        for referrer_rollups_batch in itertools.batched(
+            referrer_rollups.items(), FLUSH_BATCH_SIZE
+        ):
+            referrer_rollups_insert_stmt = sql.insert(TrafficReferrerRollup).values(
+                [
+                    dict(
+                        period=period,
+                        start_date=period_start_date,
+                        article_id=article_id,
+                        referrer=referrer,
+                        views=views,
+                    )
+                    for (
+                        period,
+                        period_start_date,
+                        article_id,
+                        referrer,
+                    ), views in referrer_rollups_batch
+                ]
+            )
+            await session.execute(
+                referrer_rollups_insert_stmt.on_conflict_do_update(
+                    constraint="traffic_referrer_rollups_unique_key",
+                    set_=dict(
+                        views=TrafficReferrerRollup.views
+                        + referrer_rollups_insert_stmt.excluded.views
+                    ),
+                )
+            )
+
+        await session.commit()
+
 
 traffic_service = TrafficService()
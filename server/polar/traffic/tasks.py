@@ -0,0 +1,9 @@
+from polar.worker import AsyncSessionMaker, JobContext, interval
+
+from .service import traffic_service
+
+
+@interval(second=30)
+async def traffic_flush_views(ctx: JobContext) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        await traffic_service.flush_views(session)
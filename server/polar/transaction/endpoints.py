@@ -10,6 +10,7 @@ from polar.authz.service import AccessType, Authz
 from polar.exceptions import NotPermitted, ResourceNotFound
 from polar.kit.pagination import ListResource, PaginationParamsQuery
 from polar.kit.sorting import Sorting, SortingGetter
+from polar.kit.utils import utc_now
 from polar.models import Transaction as TransactionModel
 from polar.models.transaction import TransactionType
 from polar.postgres import (
@@ -71,6 +72,34 @@ async def search_transactions(
     )
 
 
+@router.get("/export", tags=[Tags.PUBLIC])
+async def export_transactions(
+    auth: UserRequiredAuth,
+    type: TransactionType | None = Query(None),
+    account_id: UUID4 | None = Query(None),
+    payment_user_id: UUID4 | None = Query(None),
+    payment_organization_id: UUID4 | None = Query(None),
+    exclude_platform_fees: bool = Query(False),
+    sessionmaker: AsyncSessionMaker = Depends(get_db_sessionmaker),
+) -> StreamingResponse:
+    content = transaction_service.get_transactions_csv(
+        sessionmaker,
+        auth.subject,
+        type=type,
+        account_id=account_id,
+        payment_user_id=payment_user_id,
+        payment_organization_id=payment_organization_id,
+        exclude_platform_fees=exclude_platform_fees,
+    )
+    filename = f"polar-transactions-{utc_now().date().isoformat()}.csv"
+
+    return StreamingResponse(
+        content,
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
 @router.get("/lookup", response_model=TransactionDetails, tags=[Tags.PUBLIC])
 async def lookup_transaction(
     transaction_id: UUID4,
@@ -14,6 +14,22 @@ class BaseTransactionServiceError(PolarError):
 
 
 class BaseTransactionService(ResourceServiceReader[Transaction]):
+    def _get_csv_description(self, transaction: Transaction) -> str:
+        """
+        Describe the transaction for CSV exports.
+
+        `Transaction.pledge` and `Transaction.subscription` are expected to be loaded.
+        """
+        if transaction.platform_fee_type is not None:
+            if transaction.platform_fee_type == "platform":
+                return "Polar fee"
+            return f"Payment processor fee ({transaction.platform_fee_type})"
+        if transaction.pledge is not None:
+            return f"Pledge to {transaction.pledge.issue.reference_key}"
+        if transaction.subscription is not None:
+            return f"Subscription to {transaction.subscription.subscription_tier.name}"
+        return ""
+
     async def _get_balance_transactions_for_payment(
         self, session: AsyncSession, *, payment_transaction: Transaction
     ) -> list[tuple[Transaction, Transaction]]:
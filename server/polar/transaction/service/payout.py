@@ -1,3 +1,4 @@
+import asyncio
 from collections.abc import AsyncIterable, Sequence
 from typing import cast
 
@@ -7,7 +8,9 @@ from sqlalchemy import select
 from sqlalchemy.orm import joinedload, selectinload
 
 from polar.account.service import account as account_service
+from polar.config import settings
 from polar.enums import AccountType
+from polar.integrations.stripe.service import StripeError
 from polar.integrations.stripe.service import stripe as stripe_service
 from polar.integrations.stripe.utils import get_expandable_id
 from polar.kit.csv import IterableCSVWriter
@@ -26,6 +29,8 @@ from .transaction import transaction as transaction_service
 
 log: Logger = structlog.get_logger()
 
+STRIPE_TRANSFERS_BATCH_SIZE = 10
+
 
 class PayoutTransactionError(BaseTransactionServiceError):
     ...
@@ -161,9 +166,8 @@ class PayoutTransactionService(BaseTransactionService):
         payout_fees = balance_amount - balance_amount_after_fees
 
         if account.account_type == AccountType.stripe:
-            transaction = await self._prepare_stripe_payout(
+            transaction = self._prepare_stripe_payout(
                 transaction=transaction,
-                account=account,
                 unpaid_balance_transactions=unpaid_balance_transactions,
                 payout_fees=payout_fees,
             )
@@ -181,6 +185,20 @@ class PayoutTransactionService(BaseTransactionService):
         session.add(transaction)
         await session.commit()
 
+        if account.account_type == AccountType.stripe:
+            # The payout is committed: `trigger_stripe_payouts` resumes the transfers
+            try:
+                await self._transfer_stripe_payout(
+                    session,
+                    payout=transaction,
+                    account=account,
+                    transfers=self._get_stripe_transfers(
+                        unpaid_balance_transactions, payout_fees
+                    ),
+                )
+            except StripeError:
+                pass
+
         return transaction
 
     async def trigger_stripe_payouts(self, session: AsyncSession) -> None:
@@ -198,7 +216,19 @@ class PayoutTransactionService(BaseTransactionService):
             account = payout.account
             assert account is not None
             assert account.stripe_id is not None
-            _, balance = stripe_service.retrieve_balance(account.stripe_id)
+
+            # Resume the transfers if the first step was interrupted
+            try:
+                await self._transfer_stripe_payout(
+                    session,
+                    payout=payout,
+                    account=account,
+                    transfers=await self._get_pending_stripe_transfers(session, payout),
+                )
+            except StripeError:
+                continue
+
+            _, balance = await stripe_service.retrieve_balance(account.stripe_id)
 
             if balance < -payout.account_amount:
                 log.info(
@@ -213,7 +243,7 @@ class PayoutTransactionService(BaseTransactionService):
                 continue
 
             # Trigger a payout on the Stripe Connect account
-            stripe_payout = stripe_service.create_payout(
+            stripe_payout = await stripe_service.create_payout(
                 stripe_account=account.stripe_id,
                 amount=-payout.account_amount,
                 currency=payout.account_currency,
@@ -271,7 +301,7 @@ class PayoutTransactionService(BaseTransactionService):
         balance_transactions = stripe_service.list_balance_transactions(
             account_id=account.stripe_id, payout=payout.id
         )
-        for balance_transaction in balance_transactions:
+        async for balance_transaction in balance_transactions:
             source = balance_transaction.source
             if source is not None:
                 source_transfer: str | None = getattr(source, "source_transfer", None)
@@ -314,7 +344,7 @@ class PayoutTransactionService(BaseTransactionService):
                 Transaction.payout_transaction_id == payout.id,
                 Transaction.account_id == account.id,
             )
-            .order_by(Transaction.created_at)
+            .order_by(Transaction.created_at, Transaction.id)
             .options(
                 # Subscription
                 selectinload(Transaction.subscription).joinedload(
@@ -328,6 +358,7 @@ class PayoutTransactionService(BaseTransactionService):
                     joinedload(Issue.repository),
                 ),
             )
+            .execution_options(yield_per=settings.POSTGRES_STREAM_YIELD_PER)
         )
 
         csv_writer = IterableCSVWriter(dialect="excel")
@@ -352,18 +383,7 @@ class PayoutTransactionService(BaseTransactionService):
         async with sessionmaker() as session:
             transactions = await session.stream_scalars(statement)
             async for transaction in transactions:
-                description = ""
-                if transaction.platform_fee_type is not None:
-                    if transaction.platform_fee_type == "platform":
-                        description = "Polar fee"
-                    else:
-                        description = (
-                            f"Payment processor fee ({transaction.platform_fee_type})"
-                        )
-                elif transaction.pledge is not None:
-                    description = f"Pledge to {transaction.pledge.issue.reference_key}"
-                elif transaction.subscription is not None:
-                    description = f"Subscription to {transaction.subscription.subscription_tier.name}"
+                description = self._get_csv_description(transaction)
 
                 transaction_id = (
                     str(transaction.id)
@@ -385,11 +405,10 @@ class PayoutTransactionService(BaseTransactionService):
                     )
                 )
 
-    async def _prepare_stripe_payout(
+    def _prepare_stripe_payout(
         self,
         *,
         transaction: Transaction,
-        account: Account,
         unpaid_balance_transactions: Sequence[Transaction],
         payout_fees: int,
     ) -> Transaction:
@@ -400,14 +419,35 @@ class PayoutTransactionService(BaseTransactionService):
         2. Trigger a payout on the Stripe Connect account,
         but later once the balance is actually available.
 
-        This function performs the first step and returns the transaction
-        with an empty payout_id.
+        This function checks that the first step is feasible and returns
+        the transaction with an empty payout_id.
         """
         transaction.processor = PaymentProcessor.stripe
-        transfer_group = str(transaction.id)
 
-        transfers: list[tuple[str, int, Transaction]] = []
-        for balance_transaction in unpaid_balance_transactions:
+        transfers = self._get_stripe_transfers(unpaid_balance_transactions, payout_fees)
+        transfers_sum = sum(amount for _, _, amount in transfers)
+        if transfers_sum != -transaction.amount:
+            raise UnmatchingTransfersAmount()
+
+        # If the account currency is different from the transaction currency,
+        # Set the account amount to 0 and get the converted amount when making transfers
+        if transaction.currency != transaction.account_currency:
+            transaction.account_amount = 0
+
+        return transaction
+
+    def _get_stripe_transfers(
+        self, balance_transactions: Sequence[Transaction], payout_fees: int
+    ) -> list[tuple[Transaction, str, int]]:
+        """
+        Split the balance transactions into transfers,
+        with the payment transaction charge as source.
+
+        The payout fees are deducted from the first transfers, so the result is
+        deterministic as long as the balance transactions are in the same order.
+        """
+        transfers: list[tuple[Transaction, str, int]] = []
+        for balance_transaction in balance_transactions:
             if (
                 balance_transaction.payment_transaction is not None
                 and balance_transaction.payment_transaction.charge_id is not None
@@ -416,60 +456,133 @@ class PayoutTransactionService(BaseTransactionService):
                 transfer_amount = max(balance_transaction.net_amount - payout_fees, 0)
                 if transfer_amount > 0:
                     transfers.append(
-                        (source_transaction, transfer_amount, balance_transaction)
+                        (balance_transaction, source_transaction, transfer_amount)
                     )
                 payout_fees -= balance_transaction.net_amount - transfer_amount
+        return transfers
 
-        transfers_sum = sum(amount for _, amount, _ in transfers)
-        if transfers_sum != -transaction.amount:
-            raise UnmatchingTransfersAmount()
+    async def _get_pending_stripe_transfers(
+        self, session: AsyncSession, payout: Transaction
+    ) -> list[tuple[Transaction, str, int]]:
+        statement = (
+            select(Transaction)
+            .where(
+                Transaction.type == TransactionType.balance,
+                Transaction.payout_transaction_id == payout.id,
+                Transaction.account_id == payout.account_id,
+            )
+            .order_by(Transaction.created_at, Transaction.id)
+            .options(
+                selectinload(Transaction.account_incurred_transactions),
+                selectinload(Transaction.payment_transaction),
+            )
+        )
+        result = await session.execute(statement)
+        paid_transactions = result.scalars().all()
+
+        # Transfers were validated to sum up to the payout amount,
+        # so we can infer the fees that were deducted from them.
+        eligible_amount = sum(
+            paid_transaction.net_amount
+            for paid_transaction in paid_transactions
+            if paid_transaction.payment_transaction is not None
+            and paid_transaction.payment_transaction.charge_id is not None
+        )
+        payout_fees = eligible_amount + payout.amount
 
-        # If the account currency is different from the transaction currency,
-        # Set the account amount to 0 and get the converted amount when making transfers
-        if transaction.currency != transaction.account_currency:
-            transaction.account_amount = 0
+        return self._get_stripe_transfers(paid_transactions, payout_fees)
 
-        # Make individual transfers with the payment transaction as source
+    async def _transfer_stripe_payout(
+        self,
+        session: AsyncSession,
+        *,
+        payout: Transaction,
+        account: Account,
+        transfers: Sequence[tuple[Transaction, str, int]],
+    ) -> None:
+        """
+        Make the transfers of a Stripe payout, concurrently and by batches.
+
+        The `transfer_id` of each balance transaction is committed after each batch,
+        so an interrupted payout can be resumed without transferring twice.
+        Each transfer has an idempotency key, so a transfer which succeeded
+        on Stripe but couldn't be committed on our side is not made twice either.
+        """
         assert account.stripe_id is not None
-        for source_transaction, amount, balance_transaction in transfers:
-            stripe_transfer = stripe_service.transfer(
-                account.stripe_id,
-                amount,
-                source_transaction=source_transaction,
-                transfer_group=transfer_group,
-                metadata={"payout_transaction_id": str(transaction.id)},
+        different_currencies = payout.currency != payout.account_currency
+
+        pending_transfers = [
+            transfer for transfer in transfers if transfer[0].transfer_id is None
+        ]
+        for i in range(0, len(pending_transfers), STRIPE_TRANSFERS_BATCH_SIZE):
+            batch = pending_transfers[i : i + STRIPE_TRANSFERS_BATCH_SIZE]
+            results = await asyncio.gather(
+                *(
+                    stripe_service.transfer(
+                        account.stripe_id,
+                        amount,
+                        source_transaction=source_transaction,
+                        transfer_group=str(payout.id),
+                        metadata={"payout_transaction_id": str(payout.id)},
+                        # Get the converted amount without an extra request
+                        expand=["destination_payment.balance_transaction"]
+                        if different_currencies
+                        else None,
+                        idempotency_key=(
+                            f"payout_transfer_{payout.id}_{balance_transaction.id}"
+                        ),
+                    )
+                    for balance_transaction, source_transaction, amount in batch
+                ),
+                return_exceptions=True,
             )
-            balance_transaction.transfer_id = stripe_transfer.id
-
-            # Different source and destination currencies: get the converted amount
-            if transaction.currency != transaction.account_currency:
-                assert stripe_transfer.destination_payment is not None
-                stripe_destination_charge = stripe_service.get_charge(
-                    get_expandable_id(stripe_transfer.destination_payment),
-                    stripe_account=account.stripe_id,
-                    expand=["balance_transaction"],
-                )
-                stripe_destination_balance_transaction = cast(
-                    stripe_lib.BalanceTransaction,
-                    stripe_destination_charge.balance_transaction,
-                )
-                transaction.account_amount -= (
-                    stripe_destination_balance_transaction.amount
-                )
-                log.info(
-                    (
-                        "Source and destination currency don't match. "
-                        "A conversion has been done by Stripe."
-                    ),
-                    source_currency=transaction.currency,
-                    destination_currency=transaction.account_currency,
-                    source_amount=amount,
-                    destination_amount=stripe_destination_balance_transaction.amount,
-                    exchange_rate=stripe_destination_balance_transaction.exchange_rate,
+
+            error: BaseException | None = None
+            for (balance_transaction, _, amount), result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    error = error or result
+                    continue
+
+                balance_transaction.transfer_id = result.id
+                session.add(balance_transaction)
+
+                # Different source and destination currencies: get the converted amount
+                if different_currencies:
+                    assert result.destination_payment is not None
+                    stripe_destination_charge = cast(
+                        stripe_lib.Charge, result.destination_payment
+                    )
+                    stripe_destination_balance_transaction = cast(
+                        stripe_lib.BalanceTransaction,
+                        stripe_destination_charge.balance_transaction,
+                    )
+                    payout.account_amount -= (
+                        stripe_destination_balance_transaction.amount
+                    )
+                    log.info(
+                        (
+                            "Source and destination currency don't match. "
+                            "A conversion has been done by Stripe."
+                        ),
+                        source_currency=payout.currency,
+                        destination_currency=payout.account_currency,
+                        source_amount=amount,
+                        destination_amount=stripe_destination_balance_transaction.amount,
+                        exchange_rate=stripe_destination_balance_transaction.exchange_rate,
+                        account_id=str(account.id),
+                    )
+
+            session.add(payout)
+            await session.commit()
+
+            if error is not None:
+                log.warning(
+                    "A Stripe payout transfer failed, it'll be resumed later",
+                    payout_id=str(payout.id),
                     account_id=str(account.id),
+                    error=str(error),
                 )
-
-        return transaction
+                raise error
 
     async def _get_unpaid_balance_transactions(
         self, session: AsyncSession, account: Account
@@ -481,6 +594,7 @@ class PayoutTransactionService(BaseTransactionService):
                 Transaction.account_id == account.id,
                 Transaction.payout_transaction_id.is_(None),
             )
+            .order_by(Transaction.created_at, Transaction.id)
             .options(
                 selectinload(Transaction.account_incurred_transactions),
                 selectinload(Transaction.payment_transaction),
@@ -41,7 +41,7 @@ class RefundTransactionService(BaseTransactionService):
 
         refund_transactions: list[Transaction] = []
         # Handle each individual refund
-        for refund in refunds:
+        async for refund in refunds:
             if refund.status != "succeeded":
                 continue
 
@@ -1,14 +1,17 @@
 import uuid
-from collections.abc import Sequence
+from collections.abc import AsyncIterable, Sequence
 from enum import StrEnum
 from typing import Any, cast
 
 from sqlalchemy import Select, UnaryExpression, asc, desc, func, or_, select
 from sqlalchemy.exc import NoResultFound
-from sqlalchemy.orm import aliased, joinedload, subqueryload
+from sqlalchemy.orm import aliased, joinedload, selectinload, subqueryload
 
 from polar.authz.service import AccessType, Authz
+from polar.config import settings
 from polar.exceptions import NotPermitted, ResourceNotFound
+from polar.kit.csv import IterableCSVWriter
+from polar.kit.db.postgres import async_sessionmaker
 from polar.kit.pagination import PaginationParams, paginate
 from polar.kit.sorting import Sorting
 from polar.models import (
@@ -53,7 +56,14 @@ class TransactionService(BaseTransactionService):
             (SearchSortProperty.created_at, True)
         ],
     ) -> tuple[Sequence[Transaction], int]:
-        statement = self._get_readable_transactions_statement(user)
+        statement = self._get_search_statement(
+            user,
+            type=type,
+            account_id=account_id,
+            payment_user_id=payment_user_id,
+            payment_organization_id=payment_organization_id,
+            exclude_platform_fees=exclude_platform_fees,
+        )
 
         statement = statement.options(
             # Incurred transactions
@@ -77,19 +87,6 @@ class TransactionService(BaseTransactionService):
             ),
         )
 
-        if type is not None:
-            statement = statement.where(Transaction.type == type)
-        if account_id is not None:
-            statement = statement.where(Transaction.account_id == account_id)
-        if payment_user_id is not None:
-            statement = statement.where(Transaction.payment_user_id == payment_user_id)
-        if payment_organization_id is not None:
-            statement = statement.where(
-                Transaction.payment_organization_id == payment_organization_id
-            )
-        if exclude_platform_fees:
-            statement = statement.where(Transaction.platform_fee_type.is_(None))
-
         order_by_clauses: list[UnaryExpression[Any]] = []
         for criterion, is_desc in sorting:
             clause_function = desc if is_desc else asc
@@ -103,6 +100,75 @@ class TransactionService(BaseTransactionService):
 
         return results, count
 
+    async def get_transactions_csv(
+        self,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        user: User,
+        *,
+        type: TransactionType | None = None,
+        account_id: uuid.UUID | None = None,
+        payment_user_id: uuid.UUID | None = None,
+        payment_organization_id: uuid.UUID | None = None,
+        exclude_platform_fees: bool = False,
+    ) -> AsyncIterable[str]:
+        statement = (
+            self._get_search_statement(
+                user,
+                type=type,
+                account_id=account_id,
+                payment_user_id=payment_user_id,
+                payment_organization_id=payment_organization_id,
+                exclude_platform_fees=exclude_platform_fees,
+            )
+            .order_by(Transaction.created_at.desc())
+            .options(
+                # Subscription
+                selectinload(Transaction.subscription).joinedload(
+                    Subscription.subscription_tier
+                ),
+                # Pledge
+                selectinload(Transaction.pledge)
+                .joinedload(Pledge.issue)
+                .options(
+                    joinedload(Issue.organization),
+                    joinedload(Issue.repository),
+                ),
+            )
+            .execution_options(yield_per=settings.POSTGRES_STREAM_YIELD_PER)
+        )
+
+        csv_writer = IterableCSVWriter(dialect="excel")
+        yield csv_writer.getrow(
+            (
+                "Date",
+                "Transaction ID",
+                "Type",
+                "Description",
+                "Currency",
+                "Amount",
+                "Account Currency",
+                "Account Amount",
+            )
+        )
+
+        # StreamingResponse is running its own async task to exhaust the iterator:
+        # use a dedicated session, the request one might already be closed.
+        async with sessionmaker() as session:
+            transactions = await session.stream_scalars(statement)
+            async for transaction in transactions:
+                yield csv_writer.getrow(
+                    (
+                        transaction.created_at.isoformat(),
+                        str(transaction.id),
+                        transaction.type,
+                        self._get_csv_description(transaction),
+                        transaction.currency,
+                        transaction.amount / 100,
+                        transaction.account_currency,
+                        transaction.account_amount / 100,
+                    )
+                )
+
     async def lookup(
         self, session: AsyncSession, id: uuid.UUID, user: User
     ) -> Transaction:
@@ -234,6 +300,33 @@ class TransactionService(BaseTransactionService):
         result = await session.execute(statement)
         return result.scalar_one()
 
+    def _get_search_statement(
+        self,
+        user: User,
+        *,
+        type: TransactionType | None = None,
+        account_id: uuid.UUID | None = None,
+        payment_user_id: uuid.UUID | None = None,
+        payment_organization_id: uuid.UUID | None = None,
+        exclude_platform_fees: bool = False,
+    ) -> Select[Any]:
+        statement = self._get_readable_transactions_statement(user)
+
+        if type is not None:
+            statement = statement.where(Transaction.type == type)
+        if account_id is not None:
+            statement = statement.where(Transaction.account_id == account_id)
+        if payment_user_id is not None:
+            statement = statement.where(Transaction.payment_user_id == payment_user_id)
+        if payment_organization_id is not None:
+            statement = statement.where(
+                Transaction.payment_organization_id == payment_organization_id
+            )
+        if exclude_platform_fees:
+            statement = statement.where(Transaction.platform_fee_type.is_(None))
+
+        return statement
+
     def _get_readable_transactions_statement(self, user: User) -> Select[Any]:
         PaymentUserOrganization = aliased(UserOrganization)
         statement = (
@@ -1,7 +1,10 @@
+from collections.abc import Sequence
+from typing import cast
 from uuid import UUID
 
 import structlog
-from sqlalchemy import func
+from sqlalchemy import String, func, select
+from sqlalchemy.dialects.postgresql import insert
 
 from polar.account.service import account as account_service
 from polar.authz.service import AccessType, Authz
@@ -95,6 +98,52 @@ class UserService(ResourceService[User, UserCreate, UserUpdate]):
 
         return user
 
+    async def get_or_signup_ids_by_emails(
+        self, session: AsyncSession, emails: Sequence[str]
+    ) -> dict[str, UUID]:
+        """
+        Bulk version of `get_by_email_or_signup` for imported users,
+        returning user ids by lowercased email.
+
+        Missing users are created with a single multi-row insert.
+        As imported users, they're not synced to Loops.
+        Emails belonging to deleted users are left out.
+        """
+        emails_map = {email.lower(): email for email in emails}
+        if not emails_map:
+            return {}
+
+        # The email is used as username, which is shorter
+        username_type = cast(String, User.__table__.c.username.type)
+        new_users = [
+            {"username": email, "email": email}
+            for email in emails_map.values()
+            if username_type.length is None or len(email) <= username_type.length
+        ]
+        created_ids: Sequence[UUID] = []
+        if new_users:
+            insert_statement = (
+                insert(User)
+                .values(new_users)
+                .on_conflict_do_nothing()
+                .returning(User.id)
+            )
+            result = await session.execute(insert_statement)
+            created_ids = result.scalars().all()
+            await session.commit()
+
+        for user_id in created_ids:
+            await enqueue_job("user.on_after_signup", user_id=user_id)
+        if created_ids:
+            log.info("users imported by email", count=len(created_ids))
+
+        statement = select(User.id, User.email).where(
+            func.lower(User.email).in_(emails_map.keys()),
+            User.deleted_at.is_(None),
+        )
+        users = await session.execute(statement)
+        return {email.lower(): user_id for user_id, email in users.tuples().all()}
+
     async def update_preferences(
         self, session: AsyncSession, user: User, settings: UserUpdateSettings
     ) -> User:
@@ -34,6 +34,16 @@ class UserOrganizationervice:
         res = await session.execute(stmt)
         return res.scalars().unique().all()
 
+    async def list_user_ids_by_org(
+        self, session: AsyncSession, org_id: UUID
+    ) -> Sequence[UUID]:
+        stmt = sql.select(UserOrganization.user_id).where(
+            UserOrganization.organization_id == org_id,
+            UserOrganization.deleted_at.is_(None),
+        )
+        res = await session.execute(stmt)
+        return res.scalars().all()
+
     async def list_by_user_id(
         self, session: AsyncSession, user_id: UUID
     ) -> Sequence[UserOrganization]:
@@ -1,10 +1,25 @@
+import asyncio
 import functools
+import inspect
+import itertools
+import signal
+import time
 import uuid
-from collections.abc import AsyncIterator, Awaitable, Callable
+from collections.abc import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Mapping,
+    Sequence,
+)
 from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from datetime import datetime
+from enum import StrEnum
 from typing import (
     Any,
+    NotRequired,
     ParamSpec,
     TypedDict,
     TypeVar,
@@ -12,29 +27,40 @@ from typing import (
 )
 
 import structlog
-from arq import cron, func
+from arq import Retry, cron, func
 from arq.connections import ArqRedis, RedisSettings
 from arq.connections import create_pool as arq_create_pool
+from arq.constants import default_queue_name, job_key_prefix, result_key_prefix
 from arq.cron import CronJob
 from arq.jobs import Job
+from arq.jobs import serialize_job as serialize_arq_job
 from arq.typing import OptionType, SecondsTimedelta, WeekdayOptionType
-from arq.worker import Function
+from arq.utils import timestamp_ms, to_ms
+from arq.worker import Function, create_worker
 from pydantic import BaseModel
 
 from polar.config import settings
 from polar.context import ExecutionContext
+from polar.integrations.github.registry import registry as github_client_registry
 from polar.kit.db.postgres import (
     AsyncEngine,
     AsyncSession,
     async_sessionmaker,
     create_sessionmaker,
 )
+from polar.kit.job_serializer import deserialize_job, serialize_job
+from polar.kit.prometheus.worker import observe_task, worker_queue_depth
 from polar.logging import generate_correlation_id
+from polar.metrics.server import serve_metrics
 from polar.postgres import create_engine
 
 
 async def create_pool() -> ArqRedis:
-    return await arq_create_pool(WorkerSettings.redis_settings)
+    return await arq_create_pool(
+        WorkerSettings.redis_settings,
+        job_serializer=serialize_job,
+        job_deserializer=deserialize_job,
+    )
 
 
 arq_pool: ArqRedis | None = None
@@ -44,9 +70,11 @@ arq_pool: ArqRedis | None = None
 async def lifespan() -> AsyncIterator[ArqRedis]:
     global arq_pool
     arq_pool = await create_pool()
-    yield arq_pool
-    await arq_pool.close(True)
-    arq_pool = None
+    try:
+        yield arq_pool
+    finally:
+        await arq_pool.close(True)
+        arq_pool = None
 
 
 log = structlog.get_logger()
@@ -54,10 +82,81 @@ log = structlog.get_logger()
 redis_settings = RedisSettings().from_dsn(settings.redis_url)
 
 
+class TaskLane(StrEnum):
+    """
+    Queue a task runs from.
+
+    Each lane is consumed by its own workers, so a backlog
+    in one of them doesn't delay the tasks of the others.
+    """
+
+    critical = "critical"
+    """Latency-sensitive tasks, like payments and their consequences."""
+    default = "default"
+    bulk = "bulk"
+    """Background crawls and fan-outs, which can wait."""
+
+    @property
+    def queue_name(self) -> str:
+        # The default lane is where all the jobs were enqueued before lanes
+        if self == TaskLane.default:
+            return default_queue_name
+        return f"{default_queue_name}:{self}"
+
+
+# Lane of each task, by name
+_task_lanes: dict[str, TaskLane] = {}
+
+
+def get_task_lane(name: str) -> TaskLane:
+    return _task_lanes.get(name, TaskLane.default)
+
+
+@dataclass(frozen=True)
+class _TaskDedupe:
+    signature: inspect.Signature
+    on: tuple[str, ...]
+    rerun: bool
+
+    def get_key(self, name: str, args: Sequence[Any], kwargs: dict[str, Any]) -> str:
+        # Skip the job options and the arguments every job gets
+        task_kwargs = {
+            k: v for k, v in kwargs.items() if k in self.signature.parameters
+        }
+        # First argument is the job context
+        arguments = self.signature.bind_partial(None, *args, **task_kwargs)
+        arguments.apply_defaults()
+        values = ":".join(str(arguments.arguments.get(arg)) for arg in self.on)
+        return f"worker:dedupe:{name}:{values}"
+
+
+# Deduplication of each task, by name
+_task_dedupes: dict[str, _TaskDedupe] = {}
+
+# Deduplication states expire after this long, in case a job is lost
+DEDUPE_TTL_SECONDS = 3600
+
+# A deduplication key whose job doesn't exist in arq anymore, e.g. failed
+# after a timeout or its last try, is taken over by the next request.
+# Not before this delay, since the key is claimed right before enqueuing the job.
+DEDUPE_CLAIM_GRACE_SECONDS = 60
+
+
+def _get_dedupe_state(state: str, job_id: str) -> str:
+    """Value of a deduplication key: its state, the job owning it and when."""
+    return f"{state}:{job_id}:{time.time()}"
+
+
+# Interval at which the depth of the lanes is measured
+QUEUE_DEPTH_INTERVAL_SECONDS = 15
+
+
 class WorkerContext(TypedDict):
     redis: ArqRedis
     engine: AsyncEngine
     sessionmaker: async_sessionmaker[AsyncSession]
+    lane: TaskLane
+    owns_arq_pool: NotRequired[bool]
 
 
 class JobContext(WorkerContext):
@@ -80,14 +179,22 @@ class WorkerSettings:
 
     redis_settings = RedisSettings().from_dsn(settings.redis_url)
 
+    job_serializer = serialize_job
+    job_deserializer = deserialize_job
+
     @staticmethod
     async def on_startup(ctx: WorkerContext) -> None:
-        log.info("polar.worker.startup")
+        # Set by `run_lanes`, the arq CLI only runs the default lane
+        lane = ctx.setdefault("lane", TaskLane.default)
+        log.info("polar.worker.startup", lane=lane)
+
+        # `run_lanes` creates the pool shared by its lanes, before starting them
         global arq_pool
-        if arq_pool:
-            raise Exception("arq_pool already exists in startup")
-        arq_pool = await create_pool()
+        if arq_pool is None:
+            arq_pool = await create_pool()
+            ctx["owns_arq_pool"] = True
 
+        # One per lane, so a lane can't exhaust the connections of the others
         engine = create_engine("worker")
         sessionmaker = create_sessionmaker(engine)
         ctx.update({"engine": engine, "sessionmaker": sessionmaker})
@@ -95,16 +202,19 @@ class WorkerSettings:
     @staticmethod
     async def on_shutdown(ctx: WorkerContext) -> None:
         global arq_pool
-        if arq_pool:
-            await arq_pool.close(True)
-            arq_pool = None
-        else:
-            raise Exception("arq_pool not set in shutdown")
+        if ctx.get("owns_arq_pool"):
+            if arq_pool:
+                await arq_pool.close(True)
+                arq_pool = None
+            else:
+                raise Exception("arq_pool not set in shutdown")
+
+            await github_client_registry.close()
 
         engine = ctx["engine"]
         await engine.dispose()
 
-        log.info("polar.worker.shutdown")
+        log.info("polar.worker.shutdown", lane=ctx["lane"])
 
     @staticmethod
     async def on_job_start(ctx: JobContext) -> None:
@@ -131,7 +241,8 @@ class WorkerSettings:
         """
 
 
-async def enqueue_job(name: str, *args: Any, **kwargs: Any) -> Job | None:
+def _get_polar_job_kwargs(name: str, kwargs: dict[str, Any]) -> dict[str, Any]:
+    """Add the arguments every job gets to the ones of the job."""
     ctx = ExecutionContext.current()
     polar_context = PolarWorkerContext(
         is_during_installation=ctx.is_during_installation,
@@ -144,21 +255,338 @@ async def enqueue_job(name: str, *args: Any, **kwargs: Any) -> Job | None:
     # Prefix job ID by task name by default
     _job_id = kwargs.pop("_job_id", f"{name}:{uuid.uuid4().hex}")
 
-    return await _enqueue_job(
-        name,
-        *args,
-        request_correlation_id=request_correlation_id,
-        polar_context=polar_context,
+    # Lane of the task by default
+    lane: TaskLane = kwargs.pop("_lane", None) or get_task_lane(name)
+
+    return {
+        "request_correlation_id": request_correlation_id,
+        "polar_context": polar_context,
         **kwargs,
-        _job_id=_job_id,
-    )
+        "_job_id": _job_id,
+        "_queue_name": lane.queue_name,
+    }
+
+
+async def enqueue_job(name: str, *args: Any, **kwargs: Any) -> Job | None:
+    """
+    Enqueue a job of the task `name`.
+
+    Takes the arguments of `ArqRedis.enqueue_job`, plus `_lane` to enqueue it
+    in another lane than the task's one.
+    """
+    return await _enqueue_job(name, *args, **_get_polar_job_kwargs(name, kwargs))
 
 
 async def _enqueue_job(name: str, *args: Any, **kwargs: Any) -> Job | None:
     if not arq_pool:
         raise Exception("arq_pool is not initialized")
 
-    return await arq_pool.enqueue_job(name, *args, **kwargs)
+    (deduped_job,) = await _dedupe_jobs(arq_pool, [PendingJob(name, *args, **kwargs)])
+    if deduped_job is None:
+        return None
+
+    try:
+        job = await arq_pool.enqueue_job(name, *deduped_job.args, **deduped_job.kwargs)
+    except BaseException:
+        await _release_dedupe_keys(arq_pool, [deduped_job])
+        raise
+
+    # Job ID already taken: no job will ever release the key
+    if job is None:
+        await _release_dedupe_keys(arq_pool, [deduped_job])
+
+    return job
+
+
+@dataclass(init=False)
+class PendingJob:
+    """
+    A job to enqueue with `enqueue_jobs`.
+
+    Takes the same arguments as `enqueue_job`.
+    """
+
+    name: str
+    args: tuple[Any, ...]
+    kwargs: dict[str, Any]
+
+    def __init__(self, name: str, *args: Any, **kwargs: Any) -> None:
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+
+
+# Jobs sent to Redis in one script call
+ENQUEUE_JOBS_BATCH_SIZE = 500
+
+# Same as `ArqRedis.enqueue_job`, for many jobs at once.
+# A job whose ID is already queued or has a result is skipped.
+#
+# KEYS: job key, result key, queue name; for each job
+# ARGV: job ID, serialized job, score, expiration in ms; for each job
+# Returns 1 for each enqueued job, 0 for each skipped one.
+_ENQUEUE_JOBS_SCRIPT = """
+local enqueued = {}
+for i = 0, #ARGV / 4 - 1 do
+    local job_key = KEYS[i * 3 + 1]
+    if redis.call("EXISTS", job_key, KEYS[i * 3 + 2]) == 0 then
+        redis.call("PSETEX", job_key, ARGV[i * 4 + 4], ARGV[i * 4 + 2])
+        redis.call("ZADD", KEYS[i * 3 + 3], ARGV[i * 4 + 3], ARGV[i * 4 + 1])
+        enqueued[i + 1] = 1
+    else
+        enqueued[i + 1] = 0
+    end
+end
+return enqueued
+"""
+
+
+# Records that a job is queued for each deduplication key, unless there is one.
+# If a job is running instead and the task reruns, records that it has to.
+# A key whose job is gone from arq without releasing it is taken over.
+#
+# KEYS: deduplication key; for each job
+# ARGV: TTL in seconds, now, grace delay in seconds, arq job key prefix;
+#       then whether the task reruns and the job ID, for each job
+# Returns 1 for each job to enqueue, 0 for each dropped one.
+_CLAIM_DEDUPE_KEYS_SCRIPT = """
+local ttl = ARGV[1]
+local now = tonumber(ARGV[2])
+local grace = tonumber(ARGV[3])
+local job_key_prefix = ARGV[4]
+
+local claimed = {}
+for i, key in ipairs(KEYS) do
+    local rerun = ARGV[i * 2 + 3]
+    local job_id = ARGV[i * 2 + 4]
+
+    local value = redis.call("GET", key)
+    if value then
+        local state, owner_id, since = string.match(value, "^(%a+):(.+):([%d%.]+)$")
+        if owner_id
+            and now - tonumber(since) > grace
+            and redis.call("EXISTS", job_key_prefix .. owner_id) == 0
+        then
+            value = nil
+        elseif state == "running" and rerun == "1" then
+            redis.call("SET", key, "rerun:" .. owner_id .. ":" .. since, "EX", ttl)
+        end
+    end
+
+    if not value then
+        redis.call("SET", key, "queued:" .. job_id .. ":" .. ARGV[2], "EX", ttl)
+        claimed[i] = 1
+    else
+        claimed[i] = 0
+    end
+end
+return claimed
+"""
+
+
+async def _dedupe_jobs(
+    redis: ArqRedis, jobs: Sequence[PendingJob]
+) -> list[PendingJob | None]:
+    """
+    Drop the jobs of deduplicated tasks whose key already has a job.
+
+    The remaining ones get their key in the `dedupe_key` argument,
+    for `task_hooks` to release it.
+    """
+    keys: list[str] = []
+    argv: list[str | int] = []
+    indices: list[int] = []
+    for i, job in enumerate(jobs):
+        dedupe = _task_dedupes.get(job.name)
+        if dedupe is not None:
+            keys.append(dedupe.get_key(job.name, job.args, job.kwargs))
+            argv.extend((int(dedupe.rerun), job.kwargs["_job_id"]))
+            indices.append(i)
+
+    deduped_jobs: list[PendingJob | None] = list(jobs)
+    if not keys:
+        return deduped_jobs
+
+    claimed = await redis.eval(
+        _CLAIM_DEDUPE_KEYS_SCRIPT,
+        len(keys),
+        *keys,
+        DEDUPE_TTL_SECONDS,
+        str(time.time()),
+        DEDUPE_CLAIM_GRACE_SECONDS,
+        job_key_prefix,
+        *argv,
+    )
+    for i, key, is_claimed in zip(indices, keys, claimed):
+        job = jobs[i]
+        if is_claimed:
+            deduped_jobs[i] = PendingJob(
+                job.name, *job.args, **job.kwargs, dedupe_key=key
+            )
+        else:
+            log.debug("polar.worker.job_deduplicated", name=job.name, key=key)
+            deduped_jobs[i] = None
+
+    return deduped_jobs
+
+
+async def _release_dedupe_keys(redis: ArqRedis, jobs: Sequence[PendingJob]) -> None:
+    dedupe_keys = [
+        job.kwargs["dedupe_key"] for job in jobs if "dedupe_key" in job.kwargs
+    ]
+    if dedupe_keys:
+        await redis.delete(*dedupe_keys)
+
+
+async def enqueue_jobs(jobs: Iterable[PendingJob]) -> list[Job | None]:
+    """
+    Enqueue many jobs at once, with one round-trip to Redis per batch,
+    instead of one per job with `enqueue_job`.
+
+    Returns the enqueued jobs, in order, or `None` for the ones
+    skipped because a job with the same ID or deduplication key already exists.
+    """
+    return await _enqueue_jobs(
+        [
+            PendingJob(
+                job.name, *job.args, **_get_polar_job_kwargs(job.name, job.kwargs)
+            )
+            for job in jobs
+        ]
+    )
+
+
+async def _enqueue_jobs(jobs: list[PendingJob]) -> list[Job | None]:
+    if not arq_pool:
+        raise Exception("arq_pool is not initialized")
+
+    deduped_jobs = await _dedupe_jobs(arq_pool, jobs)
+    queued_jobs = [job for job in deduped_jobs if job is not None]
+    try:
+        enqueued_jobs = await _enqueue_batches(arq_pool, queued_jobs)
+    except BaseException:
+        await _release_dedupe_keys(arq_pool, queued_jobs)
+        raise
+
+    # Job IDs already taken: no job will ever release their key
+    await _release_dedupe_keys(
+        arq_pool,
+        [
+            job
+            for job, enqueued_job in zip(queued_jobs, enqueued_jobs)
+            if enqueued_job is None
+        ],
+    )
+
+    enqueued_jobs_iterator = iter(enqueued_jobs)
+    return [
+        next(enqueued_jobs_iterator) if job is not None else None
+        for job in deduped_jobs
+    ]
+
+
+async def _enqueue_batches(
+    arq_pool: ArqRedis, jobs: list[PendingJob]
+) -> list[Job | None]:
+    enqueued_jobs: list[Job | None] = []
+    for batch in itertools.batched(jobs, ENQUEUE_JOBS_BATCH_SIZE):
+        keys: list[str] = []
+        argv: list[str | bytes | int] = []
+        queued_jobs: list[tuple[str, str]] = []
+        enqueue_time_ms = timestamp_ms()
+        for job in batch:
+            kwargs = dict(job.kwargs)
+            job_id: str = kwargs.pop("_job_id")
+            queue_name: str = kwargs.pop("_queue_name", arq_pool.default_queue_name)
+            defer_by_ms = to_ms(kwargs.pop("_defer_by", None))
+
+            score = enqueue_time_ms + (defer_by_ms or 0)
+            expires_ms = score - enqueue_time_ms + arq_pool.expires_extra_ms
+            serialized = serialize_arq_job(
+                job.name,
+                job.args,
+                kwargs,
+                None,
+                enqueue_time_ms,
+                serializer=arq_pool.job_serializer,
+            )
+
+            keys.extend(
+                (job_key_prefix + job_id, result_key_prefix + job_id, queue_name)
+            )
+            argv.extend((job_id, serialized, score, expires_ms))
+            queued_jobs.append((job_id, queue_name))
+
+        results = await arq_pool.eval(_ENQUEUE_JOBS_SCRIPT, len(keys), *keys, *argv)
+        for (job_id, queue_name), result in zip(queued_jobs, results):
+            enqueued_jobs.append(
+                Job(
+                    job_id,
+                    redis=arq_pool,
+                    _queue_name=queue_name,
+                    _deserializer=arq_pool.job_deserializer,
+                )
+                if result
+                else None
+            )
+
+    return enqueued_jobs
+
+
+# Releases the deduplication key of a job which ran,
+# unless the task has to rerun: then records that a new job is queued.
+#
+# KEYS: deduplication key
+# ARGV: TTL in seconds, new deduplication state
+# Returns 1 if the task has to rerun.
+_FINISH_DEDUPE_KEY_SCRIPT = """
+local value = redis.call("GET", KEYS[1])
+if value and string.sub(value, 1, 6) == "rerun:" then
+    redis.call("SET", KEYS[1], ARGV[2], "EX", ARGV[1])
+    return 1
+end
+redis.call("DEL", KEYS[1])
+return 0
+"""
+
+
+async def _finish_deduplicated_job(
+    redis: ArqRedis,
+    name: str,
+    job_id: str,
+    dedupe_key: str,
+    args: Sequence[Any],
+    kwargs: dict[str, Any],
+    *,
+    retried: bool,
+) -> None:
+    # The job may run again, and will see the latest changes.
+    # If arq fails it instead, e.g. on a timeout or after its last try,
+    # the next request takes the key over since the job doesn't exist anymore.
+    if retried:
+        await redis.set(
+            dedupe_key, _get_dedupe_state("queued", job_id), ex=DEDUPE_TTL_SECONDS
+        )
+        return
+
+    rerun_kwargs = _get_polar_job_kwargs(name, {**kwargs, "dedupe_key": dedupe_key})
+    rerun = await redis.eval(
+        _FINISH_DEDUPE_KEY_SCRIPT,
+        1,
+        dedupe_key,
+        DEDUPE_TTL_SECONDS,
+        _get_dedupe_state("queued", rerun_kwargs["_job_id"]),
+    )
+    if not rerun:
+        return
+
+    # Requested while running: the resource may have changed since we read it
+    log.debug("polar.worker.job_rerun", name=name, key=dedupe_key)
+    try:
+        await redis.enqueue_job(name, *args, **rerun_kwargs)
+    except BaseException:
+        await redis.delete(dedupe_key)
+        raise
 
 
 Params = ParamSpec("Params")
@@ -166,6 +594,7 @@ ReturnValue = TypeVar("ReturnValue")
 
 
 def task_hooks(
+    name: str,
     f: Callable[Params, Awaitable[ReturnValue]],
 ) -> Callable[Params, Awaitable[ReturnValue]]:
     @functools.wraps(f)
@@ -185,9 +614,39 @@ def task_hooks(
                 request_correlation_id=request_correlation_id
             )
 
+        dedupe_key = cast(str | None, kwargs.pop("dedupe_key", None))
+        if dedupe_key is not None:
+            await job_context["redis"].set(
+                dedupe_key,
+                _get_dedupe_state("running", job_context["job_id"]),
+                ex=DEDUPE_TTL_SECONDS,
+            )
+
         log.info("polar.worker.job_started")
 
-        r = await f(*args, **kwargs)
+        retried = False
+        try:
+            with observe_task(
+                name,
+                job_context["lane"],
+                job_try=job_context["job_try"],
+                score=job_context["score"],
+            ):
+                r = await f(*args, **kwargs)
+        except (Retry, asyncio.CancelledError):
+            retried = True
+            raise
+        finally:
+            if dedupe_key is not None:
+                await _finish_deduplicated_job(
+                    job_context["redis"],
+                    name,
+                    job_context["job_id"],
+                    dedupe_key,
+                    args[1:],
+                    kwargs,
+                    retried=retried,
+                )
 
         log.info("polar.worker.job_ended")
         structlog.contextvars.unbind_contextvars(
@@ -207,17 +666,35 @@ def task_hooks(
 def task(
     name: str,
     *,
+    lane: TaskLane = TaskLane.default,
     keep_result: SecondsTimedelta | None = None,
     timeout: SecondsTimedelta | None = None,
     keep_result_forever: bool | None = None,
     max_tries: int | None = None,
+    dedupe_on: Sequence[str] | None = None,
+    dedupe_rerun: bool = True,
 ) -> Callable[
     [Callable[Params, Awaitable[ReturnValue]]], Callable[Params, Awaitable[ReturnValue]]
 ]:
+    """
+    Register a task.
+
+    With `dedupe_on`, the names of arguments identifying the resource
+    the task works on, a job is only enqueued if there is none queued or running
+    for the same values. If one is running, the task reruns once it's done,
+    unless `dedupe_rerun` is `False`: the running job may have read
+    the resource before the change which triggered the new request.
+    """
+
     def decorator(
         f: Callable[Params, Awaitable[ReturnValue]],
     ) -> Callable[Params, Awaitable[ReturnValue]]:
-        wrapped = task_hooks(f)
+        wrapped = task_hooks(name, f)
+        _task_lanes[name] = lane
+        if dedupe_on is not None:
+            _task_dedupes[name] = _TaskDedupe(
+                inspect.signature(f), tuple(dedupe_on), dedupe_rerun
+            )
 
         new_task = func(
             wrapped,  # type: ignore
@@ -248,10 +725,12 @@ def interval(
     def decorator(
         f: Callable[Params, Awaitable[ReturnValue]],
     ) -> Callable[Params, Awaitable[ReturnValue]]:
-        wrapped = task_hooks(f)
+        name = f"cron:{f.__qualname__}"
+        wrapped = task_hooks(name, f)
 
         new_cron = cron(
             wrapped,  # type: ignore
+            name=name,
             month=month,
             day=day,
             weekday=weekday,
@@ -267,6 +746,77 @@ def interval(
     return decorator
 
 
+async def _monitor_queue_depth(lanes: Iterable[TaskLane]) -> None:
+    redis = await create_pool()
+    try:
+        while True:
+            for lane in lanes:
+                depth = await redis.zcount(lane.queue_name, "-inf", timestamp_ms())
+                worker_queue_depth.labels(lane).set(depth)
+            await asyncio.sleep(QUEUE_DEPTH_INTERVAL_SECONDS)
+    finally:
+        await redis.close(True)
+
+
+async def _run_lanes(lanes: Mapping[TaskLane, int]) -> None:
+    # Shared by the lanes, created before they start concurrently
+    async with lifespan():
+        await _run_lane_workers(lanes)
+
+
+async def _run_lane_workers(lanes: Mapping[TaskLane, int]) -> None:
+    workers = [
+        create_worker(
+            WorkerSettings,  # type: ignore[arg-type]
+            queue_name=lane.queue_name,
+            max_jobs=max_jobs,
+            # Scheduled once, by the default lane
+            cron_jobs=WorkerSettings.cron_jobs if lane == TaskLane.default else [],
+            ctx={"lane": lane},
+            handle_signals=False,
+        )
+        for lane, max_jobs in lanes.items()
+    ]
+
+    def handle_signal(signum: signal.Signals) -> None:
+        for worker in workers:
+            worker.handle_sig(signum)
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, handle_signal, signum)
+
+    background_tasks = [asyncio.create_task(_monitor_queue_depth(lanes))]
+    if settings.WORKER_METRICS_PORT is not None:
+        background_tasks.append(
+            asyncio.create_task(serve_metrics(settings.WORKER_METRICS_PORT))
+        )
+    try:
+        await asyncio.gather(*(worker.async_run() for worker in workers))
+    except asyncio.CancelledError:
+        pass
+    finally:
+        for background_task in background_tasks:
+            background_task.cancel()
+        for worker in workers:
+            await worker.close()
+        await github_client_registry.close()
+
+
+def run_lanes(lanes: Mapping[TaskLane, int] | None = None) -> None:
+    """
+    Run a worker for each lane, concurrently in this process.
+
+    Each lane has its own concurrency, so the lanes can be weighted
+    or dedicated to a process. Defaults to `settings.WORKER_LANES`.
+    """
+    if lanes is None:
+        lanes = {
+            TaskLane(lane): max_jobs for lane, max_jobs in settings.WORKER_LANES.items()
+        }
+    asyncio.run(_run_lanes(lanes))
+
+
 @asynccontextmanager
 async def AsyncSessionMaker(ctx: JobContext) -> AsyncIterator[AsyncSession]:
     """Helper to open an AsyncSession context manager from the job context."""
@@ -276,9 +826,13 @@ async def AsyncSessionMaker(ctx: JobContext) -> AsyncIterator[AsyncSession]:
 
 __all__ = [
     "WorkerSettings",
+    "TaskLane",
+    "run_lanes",
     "task",
     "lifespan",
     "enqueue_job",
+    "enqueue_jobs",
+    "PendingJob",
     "JobContext",
     "AsyncSessionMaker",
 ]
@@ -10,4 +10,7 @@ configure_sentry()
 
 from polar.receivers import *  # noqa
 from polar.tasks import *  # noqa
-from polar.worker import WorkerSettings  # noqa
+from polar.worker import WorkerSettings, run_lanes  # noqa
+
+if __name__ == "__main__":
+    run_lanes()
@@ -0,0 +1,92 @@
+import json
+import pickle
+import timeit
+import uuid
+from collections.abc import Callable
+from typing import Any
+
+import typer
+
+from polar.kit.job_serializer import deserialize_job, serialize_job
+from polar.models.subscription_benefit import SubscriptionBenefitType
+from polar.worker import PolarWorkerContext
+
+#
+# Compare our arq job serializer with arq's default, pickle,
+# on payloads representative of what we enqueue.
+#
+
+cli = typer.Typer()
+
+
+def _job(function: str, *args: Any, **kwargs: Any) -> dict[str, Any]:
+    # As built by `polar.worker.enqueue_job` and `ArqRedis.enqueue_job`
+    return {
+        "t": 1,
+        "f": function,
+        "a": args,
+        "k": {
+            "request_correlation_id": str(uuid.uuid4()),
+            "polar_context": PolarWorkerContext(),
+            **kwargs,
+        },
+        "et": 1710000000000,
+    }
+
+
+def _get_payloads() -> dict[str, dict[str, Any]]:
+    with open(
+        "tests/fixtures/cassettes/github/webhooks/installation.created.json"
+    ) as fp:
+        webhook = json.load(fp)
+
+    return {
+        "ids": _job("github.badge.embed_on_issue", uuid.uuid4()),
+        "kwargs": _job(
+            "subscription.subscription_benefit.precondition_fulfilled",
+            user_id=uuid.uuid4(),
+            subscription_benefit_type=SubscriptionBenefitType.discord,
+        ),
+        "issue batch": _job(
+            "github.issue.sync.batch",
+            uuid.uuid4(),
+            uuid.uuid4(),
+            [uuid.uuid4() for _ in range(100)],
+        ),
+        "inline webhook": _job(
+            "github.webhook.installation.created", "installation", "created", webhook
+        ),
+    }
+
+
+def _time(f: Callable[[], Any], number: int) -> float:
+    """Best time of a call, in microseconds."""
+    return min(timeit.repeat(f, number=number, repeat=5)) / number * 1e6
+
+
+@cli.command()
+def benchmark(number: int = 2000) -> None:
+    typer.echo(
+        f"{'payload':<16}{'serializer':<12}{'bytes':>8}{'dumps (µs)':>12}"
+        f"{'loads (µs)':>12}"
+    )
+    serializers: list[
+        tuple[str, Callable[[dict[str, Any]], bytes], Callable[[bytes], Any]]
+    ] = [
+        ("pickle", pickle.dumps, pickle.loads),
+        ("polar", serialize_job, deserialize_job),
+    ]
+    for name, job in _get_payloads().items():
+        for serializer_name, dumps, loads in serializers:
+            serialized = dumps(job)
+            assert loads(serialized)["a"] == job["a"]
+            dumps_time = _time(lambda: dumps(job), number)
+            loads_time = _time(lambda: loads(serialized), number)
+            typer.echo(
+                f"{name:<16}{serializer_name:<12}{len(serialized):>8}"
+                f"{dumps_time:>12.1f}{loads_time:>12.1f}"
+            )
+
+
+if __name__ == "__main__":
+    cli()
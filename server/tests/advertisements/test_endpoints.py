@@ -1,6 +1,7 @@
 import pytest
 from httpx import AsyncClient
 
+from polar.advertisement.service import advertisement_campaign_service
 from polar.config import settings
 from polar.kit.db.postgres import AsyncSession
 from polar.kit.utils import utc_now
@@ -353,7 +354,8 @@ class TestAdvertisementCampaign:
         assert track.status_code == 200
         assert track.json()["image_url"] == advertisement_campaign.image_url
 
-        # check bumped view counter
+        # check bumped view counter, once the buffered views are flushed
+        await advertisement_campaign_service.flush_views(session)
 
         got = await client.get(
             f"/api/v1/advertisements/campaigns/{advertisement_campaign.id}",
@@ -1,6 +1,7 @@
 import pytest
 from httpx import AsyncClient
 
+from polar.article.service import article_service
 from polar.config import settings
 from polar.models.articles_subscription import ArticlesSubscription
 from polar.models.organization import Organization
@@ -701,6 +702,9 @@ async def test_view_counter(
         )
         assert viewed.status_code == 200
 
+    # views are buffered until flushed
+    await article_service.flush_views(session)
+
     # get again
     get = await client.get(
         f"/api/v1/articles/{res['id']}",
@@ -6,8 +6,9 @@ from datetime import datetime
 
 import pytest
 import pytest_asyncio
+from pytest_mock import MockerFixture
 
-from polar.article.service import article_service
+from polar.article.service import ArticleReceiver, article_service
 from polar.authz.service import Anonymous, Subject
 from polar.kit.pagination import PaginationParams
 from polar.kit.utils import utc_now
@@ -754,3 +755,86 @@ class TestListReceivers:
         receivers = await article_service.list_receivers(session, organization.id, True)
         assert len(receivers) == 1
         assert receivers[0] == (user.id, True, True)
+
+
+@pytest.mark.asyncio
+class TestListReceiversBatch:
+    async def test_pagination(
+        self,
+        session: AsyncSession,
+        user: User,
+        user_organization: UserOrganization,
+        article_public_free_published: Article,
+    ) -> None:
+        subscriptions: list[ArticlesSubscription] = []
+        for _ in range(4):
+            subscriber = await create_user(session)
+            subscriptions.append(
+                await create_articles_subscription(
+                    session,
+                    user=subscriber,
+                    organization=article_public_free_published.organization,
+                    paid_subscriber=False,
+                )
+            )
+
+        # then
+        session.expunge_all()
+
+        receivers: list[ArticleReceiver] = []
+        after: uuid.UUID | None = None
+        while batch := await article_service.list_receivers_batch(
+            session, article_public_free_published, after=after, limit=2
+        ):
+            assert len(batch) <= 2
+            receivers.extend(batch)
+            after = batch[-1].user_id
+
+        assert len(receivers) == 5
+        assert [r.user_id for r in receivers] == sorted(r.user_id for r in receivers)
+
+        member = next(r for r in receivers if r.user_id == user.id)
+        assert member.email == user.email
+        assert member.is_organization_member is True
+        assert member.subscriber_id is None
+
+        assert {r.subscriber_id for r in receivers if r.user_id != user.id} == {
+            s.id for s in subscriptions
+        }
+
+        count = await article_service.count_all_receivers(
+            session, article_public_free_published.organization_id, False
+        )
+        assert count == 5
+
+
+@pytest.mark.asyncio
+class TestSendToSubscribers:
+    async def test_valid(
+        self,
+        mocker: MockerFixture,
+        session: AsyncSession,
+        user: User,
+        user_organization: UserOrganization,
+        article_public_free_published: Article,
+    ) -> None:
+        enqueue_job_mock = mocker.patch("polar.article.service.enqueue_job")
+
+        article_public_free_published.notify_subscribers = True
+        session.add(article_public_free_published)
+        await session.commit()
+
+        # then
+        session.expunge_all()
+
+        article = await article_service.get_loaded(
+            session, article_public_free_published.id
+        )
+        assert article is not None
+        await article_service.send_to_subscribers(session, article)
+
+        assert article.notifications_sent_at is not None
+        assert article.email_sent_to_count == 1
+        enqueue_job_mock.assert_awaited_once_with(
+            "articles.send_to_subscribers", article_id=article.id
+        )
@@ -0,0 +1,225 @@
+import json
+
+import httpx
+import pytest
+import respx
+from arq import Retry
+from pytest_mock import MockerFixture
+
+from polar.article.tasks import articles_send_to_subscribers
+from polar.config import settings
+from polar.email.sender import EmailSender
+from polar.models import Article, Organization, User, UserOrganization
+from polar.postgres import AsyncSession
+from polar.worker import JobContext, PolarWorkerContext
+from tests.article.test_service import create_article, create_articles_subscription
+from tests.fixtures.random_objects import create_user
+
+
+@pytest.mark.asyncio
+class TestArticlesSendToSubscribers:
+    async def test_render_once_per_variant(
+        self,
+        mocker: MockerFixture,
+        respx_mock: respx.MockRouter,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        session: AsyncSession,
+        organization: Organization,
+        user: User,
+        user_organization: UserOrganization,
+    ) -> None:
+        mocker.patch.object(settings, "ARTICLE_EMAIL_BATCH_SIZE", 2)
+        email_sender_mock = mocker.MagicMock(spec=EmailSender)
+        mocker.patch(
+            "polar.article.tasks.get_email_sender", return_value=email_sender_mock
+        )
+
+        article = await create_article(
+            session,
+            created_by_user=user,
+            organization=organization,
+            visibility=Article.Visibility.public,
+            paid_subscribers_only=False,
+        )
+        subscriptions = [
+            await create_articles_subscription(
+                session,
+                user=await create_user(session),
+                organization=organization,
+                paid_subscriber=False,
+            )
+            for _ in range(3)
+        ]
+
+        def render(request: httpx.Request) -> httpx.Response:
+            render_data = json.loads(request.content)
+            return httpx.Response(
+                200, text=f"ARTICLE {render_data.get('unsubscribe_link', '')}"
+            )
+
+        render_route = respx_mock.post(
+            f"{settings.FRONTEND_BASE_URL}/email/article/{article.id}"
+        ).mock(side_effect=render)
+
+        # then
+        session.expunge_all()
+
+        await articles_send_to_subscribers(
+            job_context, article.id, polar_worker_context
+        )
+
+        # Organization member without subscription and free subscribers
+        assert render_route.call_count == 2
+
+        messages = [
+            message
+            for call in email_sender_mock.send_batch_to_users.call_args_list
+            for message in call.args[0]
+        ]
+        assert len(messages) == 4
+
+        for subscription in subscriptions:
+            message = next(
+                m for m in messages if m["to_email_addr"] == subscription.user.email
+            )
+            assert str(subscription.id) in message["html_content"]
+            assert str(subscription.id) in message["email_headers"]["List-Unsubscribe"]
+
+        member_message = next(m for m in messages if m["to_email_addr"] == user.email)
+        assert "List-Unsubscribe" not in member_message["email_headers"]
+
+        updated_article = await session.get(Article, article.id)
+        assert updated_article is not None
+        assert updated_article.email_delivered_count == 4
+
+    async def test_resume_after_failure(
+        self,
+        mocker: MockerFixture,
+        respx_mock: respx.MockRouter,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        session: AsyncSession,
+        organization: Organization,
+        user: User,
+        user_organization: UserOrganization,
+    ) -> None:
+        mocker.patch.object(settings, "ARTICLE_EMAIL_BATCH_SIZE", 2)
+        email_sender_mock = mocker.MagicMock(spec=EmailSender)
+        mocker.patch(
+            "polar.article.tasks.get_email_sender", return_value=email_sender_mock
+        )
+
+        article = await create_article(
+            session,
+            created_by_user=user,
+            organization=organization,
+            visibility=Article.Visibility.public,
+            paid_subscribers_only=False,
+        )
+        for _ in range(3):
+            await create_articles_subscription(
+                session,
+                user=await create_user(session),
+                organization=organization,
+                paid_subscriber=False,
+            )
+
+        respx_mock.post(
+            f"{settings.FRONTEND_BASE_URL}/email/article/{article.id}"
+        ).mock(return_value=httpx.Response(200, text="ARTICLE"))
+
+        # then
+        session.expunge_all()
+
+        # The second batch fails, e.g. the job times out
+        email_sender_mock.send_batch_to_users.side_effect = [None, Exception()]
+        with pytest.raises(Exception):
+            await articles_send_to_subscribers(
+                job_context, article.id, polar_worker_context
+            )
+
+        email_sender_mock.send_batch_to_users.side_effect = None
+        session.expunge_all()
+        await articles_send_to_subscribers(
+            job_context, article.id, polar_worker_context
+        )
+
+        calls = email_sender_mock.send_batch_to_users.call_args_list
+        first_batch, failed_batch, retried_batch = (call.args[0] for call in calls)
+        assert len(first_batch) == 2
+        assert retried_batch == failed_batch
+
+        session.expunge_all()
+        updated_article = await session.get(Article, article.id)
+        assert updated_article is not None
+        assert updated_article.email_delivered_count == 4
+
+    async def test_render_failure(
+        self,
+        mocker: MockerFixture,
+        respx_mock: respx.MockRouter,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        session: AsyncSession,
+        organization: Organization,
+        user: User,
+        user_organization: UserOrganization,
+    ) -> None:
+        mocker.patch.object(settings, "ARTICLE_EMAIL_BATCH_SIZE", 2)
+        email_sender_mock = mocker.MagicMock(spec=EmailSender)
+        mocker.patch(
+            "polar.article.tasks.get_email_sender", return_value=email_sender_mock
+        )
+
+        article = await create_article(
+            session,
+            created_by_user=user,
+            organization=organization,
+            visibility=Article.Visibility.public,
+            paid_subscribers_only=False,
+        )
+        for _ in range(3):
+            await create_articles_subscription(
+                session,
+                user=await create_user(session),
+                organization=organization,
+                paid_subscriber=False,
+            )
+
+        respx_mock.post(
+            f"{settings.FRONTEND_BASE_URL}/email/article/{article.id}"
+        ).mock(
+            side_effect=[
+                httpx.Response(500),
+                httpx.Response(200, text="ARTICLE"),
+                httpx.Response(200, text="ARTICLE"),
+            ]
+        )
+
+        # then
+        session.expunge_all()
+
+        with pytest.raises(Retry):
+            await articles_send_to_subscribers(
+                job_context, article.id, polar_worker_context
+            )
+
+        session.expunge_all()
+        await articles_send_to_subscribers(
+            job_context, article.id, polar_worker_context
+        )
+
+        # Every receiver gets the article, once
+        recipients = [
+            message["to_email_addr"]
+            for call in email_sender_mock.send_batch_to_users.call_args_list
+            for message in call.args[0]
+        ]
+        assert len(recipients) == 4
+        assert len(set(recipients)) == 4
+
+        session.expunge_all()
+        updated_article = await session.get(Article, article.id)
+        assert updated_article is not None
+        assert updated_article.email_delivered_count == 4
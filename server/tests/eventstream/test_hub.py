@@ -0,0 +1,83 @@
+import asyncio
+from collections.abc import AsyncIterator
+
+import pytest
+import pytest_asyncio
+
+from polar.eventstream.hub import EventStreamHub
+from polar.redis import Redis, get_redis
+
+
+@pytest_asyncio.fixture
+async def redis() -> Redis:
+    return get_redis()
+
+
+@pytest_asyncio.fixture
+async def hub(redis: Redis) -> AsyncIterator[EventStreamHub]:
+    hub = EventStreamHub(redis, queue_size=2)
+    yield hub
+    await hub.close()
+
+
+async def wait_for_subscriptions_count(redis: Redis, channel: str, count: int) -> None:
+    """Subscriptions are sent without waiting for their acknowledgment."""
+    for _ in range(100):
+        subscriptions = await redis.pubsub_numsub(channel)
+        if int(subscriptions[0][1]) == count:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"{channel} doesn't have {count} subscriptions")
+
+
+@pytest.mark.asyncio
+async def test_dispatch(hub: EventStreamHub) -> None:
+    async with (
+        hub.subscribe(["user:1", "org:1"]) as subscriber_1,
+        hub.subscribe(["user:2", "org:1"]) as subscriber_2,
+    ):
+        hub.dispatch("user:1", "USER_1_EVENT")
+        hub.dispatch("org:1", "ORG_1_EVENT")
+
+        assert await subscriber_1.get(timeout=0.1) == "USER_1_EVENT"
+        assert await subscriber_1.get(timeout=0.1) == "ORG_1_EVENT"
+        assert await subscriber_2.get(timeout=0.1) == "ORG_1_EVENT"
+        assert await subscriber_2.get(timeout=0.1) is None
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_eviction(hub: EventStreamHub) -> None:
+    async with (
+        hub.subscribe(["org:1"]) as slow_subscriber,
+        hub.subscribe(["org:1"]) as subscriber,
+    ):
+        for i in range(3):
+            hub.dispatch("org:1", f"EVENT_{i}")
+            assert await subscriber.get(timeout=0.1) == f"EVENT_{i}"
+
+        assert slow_subscriber.evicted.is_set()
+        assert not subscriber.evicted.is_set()
+
+        hub.dispatch("org:1", "EVENT_3")
+        assert await subscriber.get(timeout=0.1) == "EVENT_3"
+
+
+@pytest.mark.asyncio
+async def test_shared_connection(hub: EventStreamHub, redis: Redis) -> None:
+    async with (
+        hub.subscribe(["user:1", "org:1"]) as subscriber_1,
+        hub.subscribe(["user:2", "org:1"]) as subscriber_2,
+    ):
+        await wait_for_subscriptions_count(redis, "org:1", 1)
+
+        await redis.publish("org:1", "ORG_1_EVENT")
+
+        assert await subscriber_1.get(timeout=1) == "ORG_1_EVENT"
+        assert await subscriber_2.get(timeout=1) == "ORG_1_EVENT"
+
+        async with hub.subscribe(["user:1"]):
+            pass
+        await wait_for_subscriptions_count(redis, "user:1", 1)
+
+    await wait_for_subscriptions_count(redis, "user:1", 0)
+    await wait_for_subscriptions_count(redis, "org:1", 0)
@@ -0,0 +1,95 @@
+import json
+from collections.abc import AsyncIterator
+from typing import Any
+
+import pytest
+import pytest_asyncio
+from redis.asyncio.client import PubSub
+
+from polar.eventstream.service import (
+    Event,
+    invalidate_members_cache,
+    publish_members,
+    send,
+)
+from polar.kit.utils import generate_uuid
+from polar.models import Organization, UserOrganization
+from polar.postgres import AsyncSession
+from polar.redis import get_redis
+from polar.user_organization.service import (
+    user_organization as user_organization_service,
+)
+
+
+@pytest_asyncio.fixture
+async def pubsub() -> AsyncIterator[PubSub]:
+    pubsub = get_redis().pubsub()
+    yield pubsub
+    await pubsub.close()
+
+
+async def subscribe(pubsub: PubSub, *channels: str) -> None:
+    await pubsub.subscribe(*channels)
+    # Wait for the acknowledgments, so we don't miss the events published after
+    for _ in channels:
+        message = await pubsub.get_message(timeout=1)
+        assert message is not None and message["type"] == "subscribe"
+
+
+async def get_messages(pubsub: PubSub) -> list[tuple[str, dict[str, Any]]]:
+    messages: list[tuple[str, dict[str, Any]]] = []
+    while True:
+        message = await pubsub.get_message(timeout=0.1)
+        if message is None:
+            return messages
+        messages.append((message["channel"], json.loads(message["data"])))
+
+
+@pytest.mark.asyncio
+async def test_send_deduplicates_channels(pubsub: PubSub) -> None:
+    await subscribe(pubsub, "user:1", "org:1")
+    event = Event(id=generate_uuid(), key="test", payload={"foo": "bar"})
+
+    await send(event, ["user:1", "org:1", "user:1"])
+
+    messages = await get_messages(pubsub)
+    assert sorted(channel for channel, _ in messages) == ["org:1", "user:1"]
+    for _, data in messages:
+        assert data["id"] == str(event.id)
+
+
+@pytest.mark.asyncio
+async def test_publish_members(
+    session: AsyncSession,
+    pubsub: PubSub,
+    organization: Organization,
+    user_organization: UserOrganization,
+    user_organization_second: UserOrganization,
+) -> None:
+    await invalidate_members_cache(organization.id)
+    user_channel = f"user:{user_organization.user_id}"
+    user_second_channel = f"user:{user_organization_second.user_id}"
+    await subscribe(pubsub, user_channel, user_second_channel)
+
+    session.expunge_all()
+
+    await publish_members(session, "organization.updated", {}, organization.id)
+
+    messages = await get_messages(pubsub)
+    assert sorted(channel for channel, _ in messages) == sorted(
+        [user_channel, user_second_channel]
+    )
+    # Same event, serialized once, for every member
+    assert len({data["id"] for _, data in messages}) == 1
+
+    # Membership is served from the cache until it's invalidated
+    await user_organization_service.remove_member(
+        session, user_organization_second.user_id, organization.id
+    )
+    await publish_members(session, "organization.updated", {}, organization.id)
+    assert len(await get_messages(pubsub)) == 2
+
+    await invalidate_members_cache(organization.id)
+    await publish_members(session, "organization.updated", {}, organization.id)
+    messages = await get_messages(pubsub)
+    assert [channel for channel, _ in messages] == [user_channel]
@@ -1,4 +1,6 @@
+import contextlib
 from collections.abc import AsyncIterator
+from typing import cast
 from uuid import UUID
 
 import pytest
@@ -8,7 +10,7 @@ from sqlalchemy import Integer, String
 from sqlalchemy.orm import Mapped, mapped_column
 from sqlalchemy.sql import text
 
-from polar.kit.db.postgres import AsyncEngine, AsyncSession
+from polar.kit.db.postgres import AsyncEngine, AsyncSession, async_sessionmaker
 from polar.kit.extensions.sqlalchemy import PostgresUUID
 from polar.kit.utils import generate_uuid
 from polar.models import Model
@@ -75,3 +77,17 @@ async def session(
     # This is to ensure that we don't rely on the existing state in the Session
     # from creating the tests.
     expunge_spy.assert_called()
+
+
+@pytest.fixture
+def sessionmaker(session: AsyncSession) -> async_sessionmaker[AsyncSession]:
+    """
+    Sessionmaker yielding the test session,
+    for implementations opening their own session, like streaming responses.
+    """
+
+    @contextlib.asynccontextmanager
+    async def _sessionmaker() -> AsyncIterator[AsyncSession]:
+        yield session
+
+    return cast(async_sessionmaker[AsyncSession], _sessionmaker)
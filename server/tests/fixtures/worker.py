@@ -9,7 +9,7 @@ from pytest_mock import MockerFixture
 
 from polar.kit.db.postgres import AsyncEngine, AsyncSession, async_sessionmaker
 from polar.kit.utils import utc_now
-from polar.worker import JobContext, PolarWorkerContext
+from polar.worker import JobContext, PolarWorkerContext, TaskLane
 
 
 @pytest.fixture
@@ -26,6 +26,7 @@ def job_context(engine: AsyncEngine, session: AsyncSession) -> JobContext:
         "job_try": 1,
         "enqueue_time": utc_now(),
         "score": 0,
+        "lane": TaskLane.default,
     }
 
 
@@ -37,3 +38,8 @@ def polar_worker_context() -> PolarWorkerContext:
 @pytest.fixture(autouse=True)
 def mock_enqueue_job(mocker: MockerFixture) -> MagicMock:
     return mocker.patch("polar.worker._enqueue_job")
+
+
+@pytest.fixture(autouse=True)
+def mock_enqueue_jobs(mocker: MockerFixture) -> MagicMock:
+    return mocker.patch("polar.worker._enqueue_jobs")
@@ -1,8 +1,20 @@
+import json
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+import httpx
 import pytest
+import respx
+from pytest_mock import MockerFixture
 
 from polar.integrations.github.client import get_client
 from polar.integrations.github.service.issue import github_issue
+from polar.integrations.github.service.repository import github_repository
+from polar.kit.utils import utc_now
+from polar.models import Issue, Organization, Repository
 from polar.postgres import AsyncSession
+from tests.fixtures.random_objects import create_issue
+from tests.fixtures.vcr import read_cassette
 
 
 @pytest.mark.asyncio
@@ -35,3 +47,296 @@ async def test_sync_external_org_with_repo_and_issue(
     )
 
     assert issue is not None
+
+
+def _graphql_issue(
+    issue: Issue, repository: Repository, *, title: str, updated_at: datetime
+) -> dict[str, Any]:
+    return {
+        "__typename": "Issue",
+        "databaseId": issue.external_id,
+        "number": issue.number,
+        "title": title,
+        "body": "Body",
+        "state": "CLOSED",
+        "stateReason": "COMPLETED",
+        "authorAssociation": "MEMBER",
+        "createdAt": "2024-01-01T00:00:00Z",
+        "updatedAt": updated_at.isoformat(),
+        "closedAt": updated_at.isoformat(),
+        "author": {
+            "__typename": "User",
+            "login": "octocat",
+            "avatarUrl": "https://avatars.githubusercontent.com/u/1",
+            "url": "https://github.com/octocat",
+            "databaseId": 1,
+        },
+        "comments": {"totalCount": 2},
+        "labels": {
+            "nodes": [
+                {
+                    "id": "LA_1",
+                    "name": "bug",
+                    "color": "d73a4a",
+                    "description": None,
+                    "isDefault": True,
+                }
+            ]
+        },
+        "assignees": {"nodes": []},
+        "milestone": None,
+        "reactionGroups": [
+            {"content": "THUMBS_UP", "reactors": {"totalCount": 3}},
+            {"content": "CONFUSED", "reactors": {"totalCount": 1}},
+        ],
+        "repository": {"databaseId": repository.external_id},
+    }
+
+
+@pytest.mark.asyncio
+async def test_sync_issues_batch(
+    session: AsyncSession,
+    organization: Organization,
+    public_repository: Repository,
+    respx_mock: respx.MockRouter,
+    mocker: MockerFixture,
+) -> None:
+    mocker.patch(
+        "polar.integrations.github.client.get_app_installation_client",
+        return_value=get_client("TOKEN"),
+    )
+
+    updated_issue = await create_issue(session, organization, public_repository)
+    unchanged_issue = await create_issue(session, organization, public_repository)
+    deleted_issue = await create_issue(session, organization, public_repository)
+    assert unchanged_issue.issue_modified_at is not None
+
+    graphql_route = respx_mock.post("https://api.github.com/graphql").respond(
+        200,
+        json={
+            "data": {
+                "repository": {
+                    "issue0": _graphql_issue(
+                        updated_issue,
+                        public_repository,
+                        title="Updated title",
+                        updated_at=utc_now() + timedelta(minutes=1),
+                    ),
+                    "issue1": _graphql_issue(
+                        unchanged_issue,
+                        public_repository,
+                        title="Unchanged title",
+                        updated_at=unchanged_issue.issue_modified_at.replace(tzinfo=UTC)
+                        - timedelta(days=1),
+                    ),
+                    "issue2": None,
+                }
+            },
+            "errors": [
+                {
+                    "type": "NOT_FOUND",
+                    "path": ["repository", "issue2"],
+                    "message": "Could not resolve to an issue or pull request.",
+                }
+            ],
+        },
+    )
+
+    # Deleted: GraphQL can't tell it from an inaccessible issue, REST can
+    rest_route = respx_mock.get(
+        f"https://api.github.com/repos/{organization.name}/{public_repository.name}"
+        f"/issues/{deleted_issue.number}"
+    ).respond(410, json={"message": "This issue was deleted"})
+
+    # then
+    session.expunge_all()
+
+    issues = await github_issue.list_by_repository_and_ids(
+        session,
+        public_repository.id,
+        [updated_issue.id, unchanged_issue.id, deleted_issue.id],
+    )
+    issues = sorted(
+        issues,
+        key=lambda i: [updated_issue.id, unchanged_issue.id, deleted_issue.id].index(
+            i.id
+        ),
+    )
+    records = await github_issue.sync_issues_batch(
+        session, org=organization, repo=public_repository, issues=issues
+    )
+
+    assert graphql_route.call_count == 1
+    assert rest_route.call_count == 1
+    query = json.loads(graphql_route.calls.last.request.content)["query"]
+    assert f"issue0: issueOrPullRequest(number: {updated_issue.number})" in query
+
+    assert len(records) == 1
+    record = records[0]
+    assert record.id == updated_issue.id
+    assert record.title == "Updated title"
+    assert record.state == Issue.State.CLOSED
+    assert record.state_reason == "completed"
+    assert record.labels == [
+        {
+            "node_id": "LA_1",
+            "name": "bug",
+            "color": "d73a4a",
+            "description": None,
+            "default": True,
+        }
+    ]
+    assert record.reactions == {
+        "total_count": 4,
+        "plus_one": 3,
+        "minus_one": 0,
+        "laugh": 0,
+        "hooray": 0,
+        "confused": 1,
+        "heart": 0,
+        "rocket": 0,
+        "eyes": 0,
+    }
+
+    session.expunge_all()
+    assert await github_issue.get(session, deleted_issue.id) is None
+
+    for issue_id in (updated_issue.id, unchanged_issue.id):
+        issue = await github_issue.get(session, issue_id)
+        assert issue is not None
+        assert issue.github_issue_fetched_at is not None
+        assert issue.github_issue_next_crawl_at is not None
+        assert issue.github_issue_next_crawl_at > utc_now()
+
+    updated = await github_issue.get(session, updated_issue.id)
+    assert updated is not None
+    assert updated.github_issue_unchanged_count == 0
+
+    unchanged = await github_issue.get(session, unchanged_issue.id)
+    assert unchanged is not None
+    assert unchanged.title == "issue title"
+    assert unchanged.github_issue_unchanged_count == 1
+
+
+@pytest.mark.asyncio
+async def test_list_issues_to_crawl_issue(
+    session: AsyncSession,
+    organization: Organization,
+    public_repository: Repository,
+) -> None:
+    never_crawled = await create_issue(session, organization, public_repository)
+    due = await create_issue(session, organization, public_repository)
+    due.github_issue_next_crawl_at = utc_now() - timedelta(minutes=1)
+    not_due = await create_issue(session, organization, public_repository)
+    not_due.github_issue_next_crawl_at = utc_now() + timedelta(hours=1)
+    session.add_all([due, not_due])
+    await session.commit()
+
+    # then
+    session.expunge_all()
+
+    issues = await github_issue.list_issues_to_crawl_issue(session, organization)
+
+    assert [issue.id for issue in issues] == [never_crawled.id, due.id]
+
+
+@pytest.mark.asyncio
+async def test_sync_issues_incremental(
+    session: AsyncSession,
+    organization: Organization,
+    public_repository: Repository,
+    respx_mock: respx.MockRouter,
+    mocker: MockerFixture,
+) -> None:
+    mocker.patch(
+        "polar.integrations.github.client.get_app_installation_client",
+        return_value=get_client("TOKEN"),
+    )
+
+    synced_until = datetime(2024, 1, 1, tzinfo=UTC)
+    public_repository.issues_synced_until = synced_until
+    session.add(public_repository)
+    await session.commit()
+
+    issue_data = read_cassette("github/webhooks/issues.opened.json")["body"]["issue"]
+    issue_data["updated_at"] = "2024-01-02T10:00:00Z"
+    issue_data["pull_request"] = None
+    list_route = respx_mock.get(
+        f"https://api.github.com/repos/{organization.name}/{public_repository.name}/issues"
+    ).mock(
+        side_effect=[
+            httpx.Response(200, json=[issue_data]),
+            httpx.Response(200, json=[]),
+        ]
+    )
+
+    # then
+    session.expunge_all()
+
+    repository = await github_repository.get(session, public_repository.id)
+    assert repository is not None
+    synced, errors = await github_issue.sync_issues(
+        session, organization=organization, repository=repository
+    )
+
+    assert (synced, errors) == (1, 0)
+    params = list_route.calls.last.request.url.params
+    assert params["since"] == synced_until.isoformat()
+    assert params["state"] == "all"
+
+    issue = await github_issue.get_by_external_id(session, issue_data["id"])
+    assert issue is not None
+
+    session.expunge_all()
+    repository = await github_repository.get(session, public_repository.id)
+    assert repository is not None
+    assert repository.issues_synced_until == datetime(2024, 1, 2, 10, tzinfo=UTC)
+
+
+@pytest.mark.asyncio
+async def test_sync_issues_incremental_errors(
+    session: AsyncSession,
+    organization: Organization,
+    public_repository: Repository,
+    respx_mock: respx.MockRouter,
+    mocker: MockerFixture,
+) -> None:
+    mocker.patch(
+        "polar.integrations.github.client.get_app_installation_client",
+        return_value=get_client("TOKEN"),
+    )
+    # The issue fails to store
+    mocker.patch.object(github_issue, "store_many", return_value=[])
+
+    synced_until = datetime(2024, 1, 1, tzinfo=UTC)
+    public_repository.issues_synced_until = synced_until
+    session.add(public_repository)
+    await session.commit()
+
+    issue_data = read_cassette("github/webhooks/issues.opened.json")["body"]["issue"]
+    issue_data["updated_at"] = "2024-01-02T10:00:00Z"
+    issue_data["pull_request"] = None
+    respx_mock.get(
+        f"https://api.github.com/repos/{organization.name}/{public_repository.name}/issues"
+    ).mock(
+        side_effect=[
+            httpx.Response(200, json=[issue_data]),
+            httpx.Response(200, json=[]),
+        ]
+    )
+
+    # then
+    session.expunge_all()
+
+    repository = await github_repository.get(session, public_repository.id)
+    assert repository is not None
+    synced, errors = await github_issue.sync_issues(
+        session, organization=organization, repository=repository
+    )
+
+    assert (synced, errors) == (1, 1)
+
+    session.expunge_all()
+    repository = await github_repository.get(session, public_repository.id)
+    assert repository is not None
+    assert repository.issues_synced_until == synced_until
@@ -0,0 +1,112 @@
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime
+from typing import Any, cast
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from githubkit import Paginator
+
+from polar.integrations.github import types
+from polar.integrations.github.service.paginated import (
+    SyncCheckpoint,
+    github_paginated_service,
+)
+from polar.kit.hook import Hook
+from polar.models import Organization, Repository
+from polar.postgres import AsyncSession
+from polar.repository.hooks import SyncCompletedHook, SyncedHook
+
+
+async def _paginate(count: int) -> AsyncIterator[MagicMock]:
+    for i in range(count):
+        yield MagicMock(number=i)
+
+
+@pytest.mark.asyncio
+async def test_store_paginated_resource_batches(
+    session: AsyncSession, organization: Organization, public_repository: Repository
+) -> None:
+    async def store_many(
+        session: AsyncSession, *, data: list[Any], **kwargs: Any
+    ) -> list[Any]:
+        # Odd numbers are not saved
+        return [d for d in data if d.number % 2 == 0]
+
+    store_many_mock = AsyncMock(side_effect=store_many)
+    on_synced = AsyncMock()
+    on_sync_signal: Hook[SyncedHook] = Hook()
+    on_sync_signal.add(on_synced)
+    on_completed = AsyncMock()
+    on_completed_signal: Hook[SyncCompletedHook] = Hook()
+    on_completed_signal.add(on_completed)
+
+    # then
+    session.expunge_all()
+
+    synced, errors = await github_paginated_service.store_paginated_resource(
+        session,
+        paginator=cast(Paginator[types.Issue], _paginate(260)),
+        store_many_resource_method=store_many_mock,
+        organization=organization,
+        repository=public_repository,
+        resource_type="issue",
+        skip_condition=lambda data: data.number >= 250,
+        on_sync_signal=on_sync_signal,
+        on_completed_signal=on_completed_signal,
+        batch_size=100,
+    )
+
+    assert synced == 260
+    assert errors == 125
+
+    assert [len(call.kwargs["data"]) for call in store_many_mock.call_args_list] == [
+        100,
+        100,
+        50,
+    ]
+
+    # Once per batch
+    assert on_synced.call_count == 3
+    assert [call.args[0].synced for call in on_synced.call_args_list] == [
+        100,
+        200,
+        260,
+    ]
+    assert on_synced.call_args_list[0].args[0].record.number == 98
+
+    on_completed.assert_called_once()
+
+
+async def _updated(*days: int) -> AsyncIterator[MagicMock]:
+    for day in days:
+        yield MagicMock(updated_at=datetime(2024, 1, day, tzinfo=UTC))
+
+
+@pytest.mark.asyncio
+class TestSyncCheckpoint:
+    async def test_full(self) -> None:
+        checkpoint = SyncCheckpoint(None)
+
+        items = [item async for item in checkpoint.track(_updated(3, 5, 1))]
+
+        assert len(items) == 3
+        assert checkpoint.updated_at == datetime(2024, 1, 5, tzinfo=UTC)
+
+    async def test_incremental(self) -> None:
+        since = datetime(2024, 1, 4, tzinfo=UTC)
+        checkpoint = SyncCheckpoint(since)
+
+        items = [item async for item in checkpoint.track(_updated(9, 6, 4, 2, 8))]
+
+        # Stops at the first one not updated since the mark
+        assert len(items) == 3
+        assert checkpoint.updated_at == datetime(2024, 1, 9, tzinfo=UTC)
+
+    async def test_incremental_unchanged(self) -> None:
+        since = datetime(2024, 1, 4, tzinfo=UTC)
+        checkpoint = SyncCheckpoint(since)
+
+        items = [item async for item in checkpoint.track(_updated(1))]
+
+        assert items == []
+        assert checkpoint.updated_at == since
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import copy
+import uuid
 from typing import Any
 from unittest.mock import ANY, patch
 
@@ -11,12 +13,14 @@ from polar.enums import Platforms
 from polar.integrations.github import client as github
 from polar.integrations.github import service, types
 from polar.integrations.github.tasks import webhook as webhook_tasks
+from polar.integrations.github.webhook_ingestion import WebhookIngestion
 from polar.kit import utils
 from polar.kit.extensions.sqlalchemy import sql
 from polar.models.organization import Organization
 from polar.models.repository import Repository
 from polar.organization.schemas import OrganizationCreate
 from polar.postgres import AsyncSession
+from polar.redis import get_redis
 from polar.repository.schemas import RepositoryCreate
 from polar.worker import JobContext, PolarWorkerContext
 from tests.fixtures import random_objects
@@ -468,6 +472,9 @@ async def test_webhook_issues_opened(
 
     issue = await service.github_issue.get_by_external_id(session, issue_id)
     assert issue is not None
+    # Fresh from the webhook, no need to crawl it soon
+    assert issue.github_issue_next_crawl_at is not None
+    assert issue.github_issue_next_crawl_at > utils.utc_now()
 
 
 @pytest.mark.asyncio
@@ -552,6 +559,98 @@ async def test_webhook_issues_labeled(
     assert issue.labels[0]["name"] == hook["issue"]["labels"][0]["name"]
 
 
+@pytest.mark.asyncio
+async def test_webhook_issues_edited_after_closed(
+    job_context: JobContext,
+    mocker: MockerFixture,
+    session: AsyncSession,
+    github_webhook: TestWebhookFactory,
+) -> None:
+    # Capture and prevent any calls to enqueue_job
+    mocker.patch("polar.worker._enqueue_job")
+
+    await create_issue(job_context, session, github_webhook)
+
+    # Edited before being closed, but delayed by the coalescing window
+    closed_hook = github_webhook.create("issues.closed")
+    edited_json = copy.deepcopy(closed_hook.json)
+    edited_json["action"] = "edited"
+    edited_json["changes"] = {"title": {"from": edited_json["issue"]["title"]}}
+    edited_json["issue"].update(
+        title="Edited title",
+        state="open",
+        closed_at=None,
+        updated_at="2022-10-23T10:35:00Z",
+    )
+
+    # then
+    session.expunge_all()
+
+    await webhook_tasks.issue_closed(
+        job_context,
+        "issues",
+        "closed",
+        closed_hook.json,
+        polar_context=PolarWorkerContext(),
+    )
+    await webhook_tasks.issue_edited(
+        job_context,
+        "issues",
+        "edited",
+        edited_json,
+        polar_context=PolarWorkerContext(),
+    )
+
+    issue = await service.github_issue.get_by_external_id(
+        session, closed_hook["issue"]["id"]
+    )
+    assert issue is not None
+    assert issue.state == "closed"
+    assert issue.issue_closed_at is not None
+    assert issue.title == closed_hook["issue"]["title"]
+
+
+@pytest.mark.asyncio
+async def test_webhook_issues_labeled_outdated(
+    job_context: JobContext,
+    session: AsyncSession,
+    mocker: MockerFixture,
+    github_webhook: TestWebhookFactory,
+) -> None:
+    # Capture and prevent any calls to enqueue_job
+    mocker.patch("polar.worker._enqueue_job")
+
+    hook = await create_issue(job_context, session, github_webhook)
+
+    labeled_hook = github_webhook.create("issues.labeled")
+    # The label was removed afterwards
+    unlabeled_json = copy.deepcopy(labeled_hook.json)
+    unlabeled_json["action"] = "unlabeled"
+    unlabeled_json["issue"].update(labels=[], updated_at="2022-10-23T10:32:00Z")
+
+    # then
+    session.expunge_all()
+
+    await webhook_tasks.issue_unlabeled(
+        job_context,
+        "issues",
+        "unlabeled",
+        unlabeled_json,
+        polar_context=PolarWorkerContext(),
+    )
+    await webhook_tasks.issue_labeled(
+        job_context,
+        "issues",
+        "labeled",
+        labeled_hook.json,
+        polar_context=PolarWorkerContext(),
+    )
+
+    issue = await service.github_issue.get_by_external_id(session, hook["issue"]["id"])
+    assert issue is not None
+    assert issue.labels == []
+
+
 @pytest.mark.asyncio
 async def test_webhook_pull_request_opened(
     job_context: JobContext,
@@ -1022,3 +1121,91 @@ async def test_webhook_issue_transferred(
     )
     assert updated_old_issue is not None
     assert updated_old_issue.deleted_at is not None
+
+
+@pytest.mark.asyncio
+async def test_webhook_coalesced(
+    job_context: JobContext,
+    session: AsyncSession,
+    mocker: MockerFixture,
+) -> None:
+    enqueue_job_mock = mocker.patch("polar.worker._enqueue_job")
+    ingestion = WebhookIngestion(get_redis())
+    mocker.patch("polar.integrations.github.tasks.webhook.webhook_ingestion", ingestion)
+
+    key = f"test_{uuid.uuid4()}"
+    for title in ("First", "Last"):
+        payload_key = await ingestion.store_payload({"issue": {"title": title}})
+        await ingestion.push(
+            key,
+            {
+                "event_name": "issues.edited",
+                "scope": "issues",
+                "action": "edited",
+                "payload": payload_key,
+            },
+        )
+
+    # then
+    session.expunge_all()
+
+    await webhook_tasks.webhook_coalesced(
+        job_context, key, polar_context=PolarWorkerContext()
+    )
+    # Nothing left: the job is a no-op
+    await webhook_tasks.webhook_coalesced(
+        job_context, key, polar_context=PolarWorkerContext()
+    )
+
+    enqueue_job_mock.assert_called_once_with(
+        "github.webhook.issues.edited",
+        "issues",
+        "edited",
+        payload_key,
+        request_correlation_id=ANY,
+        polar_context=ANY,
+        _job_id=ANY,
+        _queue_name=ANY,
+    )
+
+
+@pytest.mark.asyncio
+async def test_webhook_stored_payload(
+    job_context: JobContext,
+    session: AsyncSession,
+    mocker: MockerFixture,
+    github_webhook: TestWebhookFactory,
+) -> None:
+    # Capture and prevent any calls to enqueue_job
+    mocker.patch("polar.worker._enqueue_job")
+    ingestion = WebhookIngestion(get_redis())
+    mocker.patch("polar.integrations.github.tasks.webhook.webhook_ingestion", ingestion)
+
+    org = await create_org(session, github_webhook, status=Organization.Status.INACTIVE)
+
+    hook = github_webhook.create("installation.suspend")
+    payload_key = await ingestion.store_payload(hook.json)
+
+    # then
+    session.expunge_all()
+
+    await webhook_tasks.installation_suspend(
+        job_context,
+        "installation",
+        "suspend",
+        payload_key,
+        polar_context=PolarWorkerContext(),
+    )
+
+    org = await get_asserted_org(session, id=org.id)
+    assert org.status == org.Status.SUSPENDED
+
+    assert await ingestion.load_payload(payload_key) is None
+    with pytest.raises(webhook_tasks.WebhookPayloadNotFound):
+        await webhook_tasks.installation_suspend(
+            job_context,
+            "installation",
+            "suspend",
+            payload_key,
+            polar_context=PolarWorkerContext(),
+        )
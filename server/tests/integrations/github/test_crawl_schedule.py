@@ -0,0 +1,84 @@
+import datetime
+
+from polar.integrations.github.crawl_schedule import (
+    BASE_INTERVAL,
+    MAX_INTERVAL,
+    MIN_INTERVAL,
+    get_crawl_interval,
+    mark_issue_crawled,
+)
+from polar.kit.utils import utc_now
+from polar.models import Issue
+
+
+def _issue(
+    *,
+    state: Issue.State = Issue.State.OPEN,
+    modified_ago: datetime.timedelta = datetime.timedelta(days=30),
+    pledged_amount_sum: int = 0,
+    has_pledge_badge_label: bool = False,
+) -> Issue:
+    return Issue(
+        state=state,
+        issue_modified_at=utc_now() - modified_ago,
+        pledged_amount_sum=pledged_amount_sum,
+        has_pledge_badge_label=has_pledge_badge_label,
+        pledge_badge_embedded_at=None,
+        github_issue_unchanged_count=0,
+    )
+
+
+def test_base_interval() -> None:
+    assert get_crawl_interval(_issue(), 0) == BASE_INTERVAL
+
+
+def test_hot_issues() -> None:
+    pledged = get_crawl_interval(_issue(pledged_amount_sum=1000), 0)
+    badged = get_crawl_interval(_issue(has_pledge_badge_label=True), 0)
+    recent = get_crawl_interval(_issue(modified_ago=datetime.timedelta(hours=1)), 0)
+
+    assert pledged < badged < BASE_INTERVAL
+    assert recent < BASE_INTERVAL
+
+
+def test_cold_issues() -> None:
+    closed = get_crawl_interval(_issue(state=Issue.State.CLOSED), 0)
+    dormant = get_crawl_interval(
+        _issue(modified_ago=datetime.timedelta(days=5 * 365)), 0
+    )
+
+    assert closed > BASE_INTERVAL
+    assert dormant > BASE_INTERVAL
+
+
+def test_unchanged_backoff() -> None:
+    issue = _issue()
+    assert get_crawl_interval(issue, 1) == BASE_INTERVAL * 2
+    assert get_crawl_interval(issue, 2) == BASE_INTERVAL * 4
+    # Bounded number of doublings
+    assert get_crawl_interval(issue, 100) == get_crawl_interval(issue, 4)
+
+
+def test_bounds() -> None:
+    hottest = _issue(
+        pledged_amount_sum=1000, modified_ago=datetime.timedelta(minutes=1)
+    )
+    assert get_crawl_interval(hottest, 0) >= MIN_INTERVAL
+
+    coldest = _issue(
+        state=Issue.State.CLOSED, modified_ago=datetime.timedelta(days=5 * 365)
+    )
+    assert get_crawl_interval(coldest, 4) == MAX_INTERVAL
+
+
+def test_mark_issue_crawled() -> None:
+    issue = _issue()
+
+    mark_issue_crawled(issue, changed=False)
+    assert issue.github_issue_unchanged_count == 1
+    assert issue.github_issue_fetched_at is not None
+    assert issue.github_issue_next_crawl_at is not None
+    assert issue.github_issue_next_crawl_at > utc_now() + BASE_INTERVAL
+
+    mark_issue_crawled(issue, changed=True)
+    assert issue.github_issue_unchanged_count == 0
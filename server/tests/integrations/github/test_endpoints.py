@@ -0,0 +1,51 @@
+import json
+import uuid
+from typing import Any
+
+import pytest
+from pytest_mock import MockerFixture
+from starlette.requests import Request
+
+from polar.integrations.github.endpoints import enqueue
+from polar.integrations.github.webhook_ingestion import webhook_ingestion
+
+
+def _build_request(event: str, delivery_id: str, payload: dict[str, Any]) -> Request:
+    body = json.dumps(payload).encode()
+
+    async def receive() -> dict[str, Any]:
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    return Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "headers": [
+                (b"x-github-event", event.encode()),
+                (b"x-github-delivery", delivery_id.encode()),
+            ],
+        },
+        receive,
+    )
+
+
+@pytest.mark.asyncio
+class TestEnqueue:
+    async def test_enqueue_error(self, mocker: MockerFixture) -> None:
+        mocker.patch(
+            "polar.integrations.github.endpoints.enqueue_job",
+            side_effect=ConnectionError(),
+        )
+        delete_payload_mock = mocker.spy(webhook_ingestion, "delete_payload")
+        delivery_id = f"test_{uuid.uuid4()}"
+        request = _build_request(
+            "issues", delivery_id, {"action": "opened", "issue": {"id": 1}}
+        )
+
+        with pytest.raises(ConnectionError):
+            await enqueue(request)
+
+        # Released, so GitHub's redelivery is processed
+        delete_payload_mock.assert_awaited_once()
+        assert await webhook_ingestion.claim_delivery(delivery_id)
+        await webhook_ingestion.release_delivery(delivery_id)
@@ -0,0 +1,146 @@
+import time
+import uuid
+from collections.abc import AsyncIterator
+
+import pytest
+import pytest_asyncio
+from pytest_mock import MockerFixture
+
+from polar.integrations.github.rate_limit import (
+    MAX_PACING_DELAY_SECONDS,
+    GitHubRateLimitPriority,
+    RateLimitBudget,
+    RateLimitBudgetExceeded,
+    priority,
+    wait_for_budget,
+    wait_for_write_slot,
+)
+from polar.redis import get_redis
+
+
+@pytest_asyncio.fixture
+async def budget() -> AsyncIterator[RateLimitBudget]:
+    redis = get_redis()
+    yield RateLimitBudget(redis)
+    async for key in redis.scan_iter("github:rate_limit:test_*"):
+        await redis.delete(key)
+
+
+def _bucket() -> str:
+    return f"test_{uuid.uuid4()}"
+
+
+def _headers(limit: int, remaining: int, reset: int) -> dict[str, str]:
+    return {
+        "x-ratelimit-limit": str(limit),
+        "x-ratelimit-remaining": str(remaining),
+        "x-ratelimit-reset": str(reset),
+        "x-ratelimit-resource": "core",
+    }
+
+
+@pytest.mark.asyncio
+class TestRateLimitBudget:
+    async def test_unknown(self, budget: RateLimitBudget) -> None:
+        bucket = _bucket()
+        assert await budget.get_remaining(bucket) is None
+        assert await budget.acquire(bucket, GitHubRateLimitPriority.crawl) == 0
+
+    async def test_update(self, budget: RateLimitBudget) -> None:
+        bucket = _bucket()
+        await budget.update(bucket, _headers(5000, 4000, int(time.time()) + 600))
+        assert await budget.get_remaining(bucket) == 4000
+
+        assert await budget.acquire(bucket, GitHubRateLimitPriority.webhook) == 0
+        assert await budget.get_remaining(bucket) == 3999
+
+    async def test_update_missing_headers(self, budget: RateLimitBudget) -> None:
+        bucket = _bucket()
+        await budget.update(bucket, {})
+        assert await budget.get_remaining(bucket) is None
+
+    async def test_reserve(self, budget: RateLimitBudget) -> None:
+        bucket = _bucket()
+        await budget.update(bucket, _headers(100, 20, int(time.time()) + 600))
+
+        # 30% are reserved to the higher priorities
+        assert await budget.acquire(bucket, GitHubRateLimitPriority.crawl) > 500
+        assert await budget.acquire(bucket, GitHubRateLimitPriority.badge) == 0
+        assert await budget.acquire(bucket, GitHubRateLimitPriority.webhook) == 0
+        assert await budget.get_remaining(bucket) == 18
+
+    async def test_exhausted_reset(self, budget: RateLimitBudget) -> None:
+        bucket = _bucket()
+        await budget.update(bucket, _headers(100, 0, int(time.time()) - 1))
+
+        assert await budget.acquire(bucket, GitHubRateLimitPriority.webhook) == 0
+        assert await budget.get_remaining(bucket) == 99
+
+    async def test_crawl_pacing(self, budget: RateLimitBudget) -> None:
+        bucket = _bucket()
+        await budget.update(bucket, _headers(1000, 1000, int(time.time()) + 700))
+
+        assert await budget.acquire(bucket, GitHubRateLimitPriority.crawl) == 0
+        # 700 requests available over ~700 seconds
+        wait = await budget.acquire(bucket, GitHubRateLimitPriority.crawl)
+        assert 0 < wait <= 1
+        # Not paced
+        assert await budget.acquire(bucket, GitHubRateLimitPriority.webhook) == 0
+
+    async def test_crawl_pacing_capped(self, budget: RateLimitBudget) -> None:
+        bucket = _bucket()
+        # 100 requests available over ~3000 seconds
+        await budget.update(bucket, _headers(5000, 1600, int(time.time()) + 3000))
+
+        assert await budget.acquire(bucket, GitHubRateLimitPriority.crawl) == 0
+        wait = await budget.acquire(bucket, GitHubRateLimitPriority.crawl)
+        assert 0 < wait <= MAX_PACING_DELAY_SECONDS
+
+    async def test_reserve_write(self, budget: RateLimitBudget) -> None:
+        bucket = _bucket()
+
+        assert await budget.reserve_write(bucket, interval=5, max_wait=7) == 0
+        wait = await budget.reserve_write(bucket, interval=5, max_wait=7)
+        assert 4 < wait <= 5
+        # Too far: not reserved
+        wait = await budget.reserve_write(bucket, interval=5, max_wait=7)
+        assert 9 < wait <= 10
+        wait = await budget.reserve_write(bucket, interval=5, max_wait=7)
+        assert 9 < wait <= 10
+
+
+@pytest.mark.asyncio
+async def test_wait_for_budget_exceeded(
+    budget: RateLimitBudget, mocker: MockerFixture
+) -> None:
+    mocker.patch("polar.integrations.github.rate_limit.rate_limit_budget", budget)
+    bucket = _bucket()
+    await budget.update(bucket, _headers(100, 10, int(time.time()) + 600))
+
+    with priority(GitHubRateLimitPriority.crawl):
+        with pytest.raises(RateLimitBudgetExceeded) as e:
+            await wait_for_budget(bucket)
+    assert e.value.retry_after > 500
+
+    await wait_for_budget(bucket)
+    assert await budget.get_remaining(bucket) == 9
+
+
+@pytest.mark.asyncio
+async def test_wait_for_write_slot_exceeded(
+    budget: RateLimitBudget, mocker: MockerFixture
+) -> None:
+    mocker.patch("polar.integrations.github.rate_limit.rate_limit_budget", budget)
+    sleep_mock = mocker.patch("polar.integrations.github.rate_limit.asyncio.sleep")
+    bucket = _bucket()
+
+    await wait_for_write_slot(bucket)
+    sleep_mock.assert_not_called()
+
+    for _ in range(10):
+        await wait_for_write_slot(bucket)
+    assert sleep_mock.call_count == 10
+
+    with pytest.raises(RateLimitBudgetExceeded) as e:
+        await wait_for_write_slot(bucket)
+    assert e.value.retry_after > 10
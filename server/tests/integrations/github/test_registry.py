@@ -0,0 +1,81 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator
+
+import pytest
+import pytest_asyncio
+import respx
+from pytest_mock import MockerFixture
+
+from polar.integrations.github.registry import GitHubClientRegistry, PooledGitHub
+
+
+@pytest_asyncio.fixture
+async def registry() -> AsyncIterator[GitHubClientRegistry]:
+    registry = GitHubClientRegistry(
+        idle_timeout=60, max_clients=2, max_connections=10, http2=False
+    )
+    yield registry
+    await registry.close()
+
+
+@pytest.mark.asyncio
+class TestGitHubClientRegistry:
+    async def test_reuse_clients(self, registry: GitHubClientRegistry) -> None:
+        client = registry.get_token_client("TOKEN_1")
+        assert isinstance(client, PooledGitHub)
+        assert registry.get_token_client("TOKEN_1") is client
+        assert registry.get_token_client("TOKEN_2") is not client
+
+        installation_client = registry.get_installation_client(123)
+        assert registry.get_installation_client(123) is installation_client
+        assert (
+            registry.get_installation_client(123, permissions={"contents": "read"})
+            is not installation_client
+        )
+
+    async def test_reuse_http_client(
+        self, registry: GitHubClientRegistry, respx_mock: respx.MockRouter
+    ) -> None:
+        respx_mock.get("https://api.github.com/user").respond(200, json={})
+
+        client = registry.get_token_client("TOKEN")
+        await client.arequest("GET", "/user")
+        async with client.get_async_client() as http_client_1:
+            pass
+        await client.arequest("GET", "/user")
+        async with client.get_async_client() as http_client_2:
+            pass
+
+        assert http_client_1 is http_client_2
+        assert not http_client_1.is_closed
+
+    async def test_capacity_eviction(self, registry: GitHubClientRegistry) -> None:
+        client_1 = registry.get_token_client("TOKEN_1")
+        registry.get_token_client("TOKEN_2")
+        registry.get_token_client("TOKEN_1")
+        registry.get_token_client("TOKEN_3")
+
+        # TOKEN_2 was the least recently used
+        assert registry.get_token_client("TOKEN_1") is client_1
+        assert len(registry._clients) == 2
+
+    async def test_idle_eviction(
+        self, registry: GitHubClientRegistry, mocker: MockerFixture
+    ) -> None:
+        client = registry.get_token_client("TOKEN")
+        async with client.get_async_client() as http_client:
+            pass
+
+        now = time.monotonic()
+        mocker.patch(
+            "polar.integrations.github.registry.time.monotonic",
+            return_value=now + 120,
+        )
+
+        new_client = registry.get_token_client("TOKEN")
+        assert new_client is not client
+
+        # Let the eviction close the HTTP client
+        await asyncio.sleep(0)
+        assert http_client.is_closed
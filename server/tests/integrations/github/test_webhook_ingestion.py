@@ -0,0 +1,114 @@
+import json
+import uuid
+from collections.abc import AsyncIterator
+
+import pytest
+import pytest_asyncio
+
+from polar.integrations.github.webhook_ingestion import (
+    PendingWebhook,
+    WebhookIngestion,
+    get_coalescing_key,
+)
+from polar.redis import get_redis
+
+
+@pytest_asyncio.fixture
+async def ingestion() -> AsyncIterator[WebhookIngestion]:
+    redis = get_redis()
+    yield WebhookIngestion(redis)
+    async for key in redis.scan_iter("github:webhook:*test_*"):
+        await redis.delete(key)
+    async for key in redis.scan_iter("github:webhook:payload:*"):
+        await redis.delete(key)
+
+
+def _key() -> str:
+    return f"test_{uuid.uuid4()}"
+
+
+def _pending(action: str, payload_key: str) -> PendingWebhook:
+    return {
+        "event_name": f"issues.{action}",
+        "scope": "issues",
+        "action": action,
+        "payload": payload_key,
+    }
+
+
+class TestGetCoalescingKey:
+    def test_not_coalesced(self) -> None:
+        assert get_coalescing_key("issues.opened", {"issue": {"id": 1}}) is None
+
+    def test_same_object(self) -> None:
+        edited = get_coalescing_key(
+            "pull_request.edited",
+            {"installation": {"id": 10}, "pull_request": {"id": 1}},
+        )
+        synchronize = get_coalescing_key(
+            "pull_request.synchronize",
+            {"installation": {"id": 10}, "pull_request": {"id": 1}},
+        )
+        other = get_coalescing_key(
+            "pull_request.synchronize",
+            {"installation": {"id": 10}, "pull_request": {"id": 2}},
+        )
+        assert edited is not None
+        assert edited == synchronize
+        assert edited != other
+
+    def test_labels(self) -> None:
+        labeled = get_coalescing_key(
+            "issues.labeled",
+            {"installation": {"id": 10}, "issue": {"id": 1}, "label": {"name": "Fund"}},
+        )
+        unlabeled = get_coalescing_key(
+            "issues.unlabeled",
+            {"installation": {"id": 10}, "issue": {"id": 1}, "label": {"name": "fund"}},
+        )
+        other_label = get_coalescing_key(
+            "issues.labeled",
+            {"installation": {"id": 10}, "issue": {"id": 1}, "label": {"name": "bug"}},
+        )
+        assert labeled == unlabeled
+        assert labeled != other_label
+
+
+@pytest.mark.asyncio
+class TestWebhookIngestion:
+    async def test_claim_delivery(self, ingestion: WebhookIngestion) -> None:
+        delivery_id = _key()
+        assert await ingestion.claim_delivery(delivery_id) is True
+        assert await ingestion.claim_delivery(delivery_id) is False
+
+        await ingestion.release_delivery(delivery_id)
+        assert await ingestion.claim_delivery(delivery_id) is True
+
+    async def test_payload(self, ingestion: WebhookIngestion) -> None:
+        payload = {"action": "created", "repositories": [{"id": 1, "name": "é"}] * 100}
+        payload_key = await ingestion.store_payload(payload)
+
+        stored = await ingestion.redis.get(f"github:webhook:payload:{payload_key}")
+        assert stored is not None
+        assert len(stored) < len(json.dumps(payload))
+
+        assert await ingestion.load_payload(payload_key) == payload
+
+        await ingestion.delete_payload(payload_key)
+        assert await ingestion.load_payload(payload_key) is None
+
+    async def test_coalesce(self, ingestion: WebhookIngestion) -> None:
+        key = _key()
+        first_payload_key = await ingestion.store_payload({"title": "A"})
+        last_payload_key = await ingestion.store_payload({"title": "B"})
+
+        assert await ingestion.push(key, _pending("edited", first_payload_key)) is False
+        assert await ingestion.push(key, _pending("edited", last_payload_key)) is True
+        # Superseded
+        assert await ingestion.load_payload(first_payload_key) is None
+
+        assert await ingestion.pop(key) == _pending("edited", last_payload_key)
+        assert await ingestion.pop(key) is None
+
+        # Received after the job took the pending one
+        assert await ingestion.push(key, _pending("edited", _key())) is False
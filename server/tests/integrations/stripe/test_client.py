@@ -0,0 +1,61 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+import stripe as stripe_lib
+
+from polar.integrations.stripe.client import StripeClient
+
+
+def build_list_object(
+    ids: list[str], *, has_more: bool, next_page: MagicMock | None = None
+) -> MagicMock:
+    list_object = MagicMock(spec=stripe_lib.ListObject)
+    list_object.data = [
+        stripe_lib.Refund.construct_from({"id": id}, None) for id in ids
+    ]
+    list_object.has_more = has_more
+    list_object.is_empty = len(ids) == 0
+    list_object.next_page.return_value = next_page
+    return list_object
+
+
+@pytest.mark.asyncio
+async def test_call_runs_outside_event_loop_thread() -> None:
+    client = StripeClient(max_concurrency=1)
+    main_thread = threading.current_thread()
+
+    def get_thread(value: str) -> tuple[threading.Thread, str]:
+        return threading.current_thread(), value
+
+    thread, value = await client.call(get_thread, "VALUE")
+
+    assert thread != main_thread
+    assert thread.name.startswith("stripe")
+    assert value == "VALUE"
+
+
+@pytest.mark.asyncio
+async def test_call_propagates_errors() -> None:
+    client = StripeClient(max_concurrency=1)
+
+    def raise_error() -> None:
+        raise stripe_lib.error.APIConnectionError("Timeout")
+
+    with pytest.raises(stripe_lib.error.APIConnectionError):
+        await client.call(raise_error)
+
+
+@pytest.mark.asyncio
+async def test_iterate() -> None:
+    client = StripeClient(max_concurrency=1)
+    last_page = build_list_object(["REFUND_3"], has_more=False)
+    first_page = build_list_object(
+        ["REFUND_1", "REFUND_2"], has_more=True, next_page=last_page
+    )
+
+    ids = [refund.id async for refund in client.iterate(first_page)]
+
+    assert ids == ["REFUND_1", "REFUND_2", "REFUND_3"]
+    first_page.next_page.assert_called_once()
+    last_page.next_page.assert_not_called()
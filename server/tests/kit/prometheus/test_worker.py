@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import pytest
+from arq import Retry
+from prometheus_client import REGISTRY
+
+from polar.kit.prometheus.worker import observe_task
+
+
+def get_outcome_count(task: str, outcome: str) -> float:
+    value = REGISTRY.get_sample_value(
+        "worker_task_outcomes_total", {"task": task, "outcome": outcome}
+    )
+    return value or 0
+
+
+def get_retries_count(task: str) -> float:
+    value = REGISTRY.get_sample_value("worker_task_retries_total", {"task": task})
+    return value or 0
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class TestObserveTask:
+    def test_success(self) -> None:
+        with observe_task("test.success", "default", job_try=1, score=now_ms()):
+            pass
+
+        assert get_outcome_count("test.success", "success") == 1
+        assert get_retries_count("test.success") == 0
+        duration_count = REGISTRY.get_sample_value(
+            "worker_task_duration_seconds_count",
+            {"task": "test.success", "outcome": "success"},
+        )
+        assert duration_count == 1
+
+    def test_queue_wait(self) -> None:
+        with observe_task("test.queue_wait", "bulk", job_try=1, score=now_ms() - 2000):
+            pass
+
+        wait_sum = REGISTRY.get_sample_value(
+            "worker_task_queue_wait_seconds_sum",
+            {"task": "test.queue_wait", "lane": "bulk"},
+        )
+        assert wait_sum is not None
+        assert 2 <= wait_sum < 10
+
+    @pytest.mark.parametrize(
+        "exception,outcome",
+        [
+            (Retry(10), "retry"),
+            (asyncio.CancelledError(), "cancelled"),
+            (ValueError(), "error"),
+        ],
+    )
+    def test_failure(self, exception: BaseException, outcome: str) -> None:
+        task = f"test.failure.{outcome}"
+        with pytest.raises(type(exception)):
+            with observe_task(task, "default", job_try=2, score=now_ms()):
+                raise exception
+
+        assert get_outcome_count(task, outcome) == 1
+        assert get_outcome_count(task, "success") == 0
+        assert get_retries_count(task) == 1
@@ -0,0 +1,75 @@
+import uuid
+from collections.abc import AsyncIterator
+
+import pytest
+import pytest_asyncio
+
+from polar.kit.counter_buffer import CounterBuffer
+from polar.redis import get_redis
+
+
+@pytest_asyncio.fixture
+async def counter_buffer() -> AsyncIterator[CounterBuffer]:
+    redis = get_redis()
+    counter_buffer = CounterBuffer(redis, f"test_{uuid.uuid4()}")
+    yield counter_buffer
+    await redis.delete(
+        counter_buffer.key, counter_buffer.flushing_key, counter_buffer.lock_key
+    )
+
+
+@pytest.mark.asyncio
+async def test_flush_empty(counter_buffer: CounterBuffer) -> None:
+    async with counter_buffer.flush() as deltas:
+        assert deltas == {}
+
+
+@pytest.mark.asyncio
+async def test_flush(counter_buffer: CounterBuffer) -> None:
+    await counter_buffer.incr("a")
+    await counter_buffer.incr("a")
+    await counter_buffer.incr("b", 5)
+
+    async with counter_buffer.flush() as deltas:
+        assert deltas == {"a": 2, "b": 5}
+        # increments during the flush go to the next one
+        await counter_buffer.incr("a")
+
+    async with counter_buffer.flush() as deltas:
+        assert deltas == {"a": 1}
+
+    async with counter_buffer.flush() as deltas:
+        assert deltas == {}
+
+
+@pytest.mark.asyncio
+async def test_flush_error_retried(counter_buffer: CounterBuffer) -> None:
+    await counter_buffer.incr("a")
+
+    with pytest.raises(RuntimeError):
+        async with counter_buffer.flush() as deltas:
+            assert deltas == {"a": 1}
+            await counter_buffer.incr("a")
+            raise RuntimeError()
+
+    # the failed snapshot is retried first, then the new increments
+    async with counter_buffer.flush() as deltas:
+        assert deltas == {"a": 1}
+
+    async with counter_buffer.flush() as deltas:
+        assert deltas == {"a": 1}
+
+
+@pytest.mark.asyncio
+async def test_flush_concurrent(counter_buffer: CounterBuffer) -> None:
+    await counter_buffer.incr("a")
+
+    async with counter_buffer.flush() as deltas:
+        assert deltas == {"a": 1}
+        # an overlapping flush doesn't get the same snapshot
+        async with counter_buffer.flush() as concurrent_deltas:
+            assert concurrent_deltas == {}
+
+    await counter_buffer.incr("a")
+    async with counter_buffer.flush() as deltas:
+        assert deltas == {"a": 1}
@@ -0,0 +1,52 @@
+import datetime
+import pickle
+import uuid
+from typing import Any
+
+from polar.kit.job_serializer import deserialize_job, serialize_job
+from polar.models.subscription_benefit import SubscriptionBenefitType
+from polar.worker import PolarWorkerContext
+
+
+def _job(*args: Any) -> dict[str, Any]:
+    return {
+        "t": 1,
+        "f": "github.issue.sync.batch",
+        "a": args,
+        "k": {
+            "request_correlation_id": str(uuid.uuid4()),
+            "polar_context": PolarWorkerContext(is_during_installation=True),
+            "subscription_benefit_type": SubscriptionBenefitType.discord,
+        },
+        "et": 1710000000000,
+    }
+
+
+def test_round_trip() -> None:
+    job = _job(uuid.uuid4(), datetime.datetime.now(datetime.UTC), ValueError("Oops"))
+
+    deserialized = deserialize_job(serialize_job(job))
+
+    assert deserialized["a"][:2] == job["a"][:2]
+    assert isinstance(deserialized["a"][2], ValueError)
+    assert deserialized["k"] == job["k"]
+    assert isinstance(deserialized["k"]["polar_context"], PolarWorkerContext)
+
+
+def test_smaller_than_pickle() -> None:
+    job = _job(uuid.uuid4(), uuid.uuid4())
+    assert len(serialize_job(job)) < len(pickle.dumps(job))
+
+
+def test_compressed() -> None:
+    job = _job({"body": "Lorem ipsum " * 1000})
+
+    serialized = serialize_job(job)
+
+    assert len(serialized) < 1000
+    assert deserialize_job(serialized) == job
+
+
+def test_legacy_pickle() -> None:
+    job = _job(uuid.uuid4())
+    assert deserialize_job(pickle.dumps(job)) == job
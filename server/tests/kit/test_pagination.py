@@ -0,0 +1,136 @@
+import uuid
+from collections.abc import Sequence
+from typing import Any
+
+import pytest
+from sqlalchemy import Select, func, select
+
+from polar.exceptions import BadRequest
+from polar.kit.pagination import (
+    CursorPaginationParams,
+    decode_cursor,
+    encode_cursor,
+    paginate_cursor,
+)
+from polar.models import User
+from polar.postgres import AsyncSession
+
+
+async def create_users(
+    session: AsyncSession, avatar_urls: Sequence[str | None]
+) -> list[User]:
+    users = [
+        User(
+            id=uuid.uuid4(),
+            username=f"testuser{uuid.uuid4()}",
+            email=f"test{uuid.uuid4()}@example.com",
+            avatar_url=avatar_url,
+        )
+        for avatar_url in avatar_urls
+    ]
+    session.add_all(users)
+    await session.commit()
+    return users
+
+
+async def paginate_all(
+    session: AsyncSession, statement: Select[Any], limit: int
+) -> list[Any]:
+    results: list[Any] = []
+    cursor: str | None = None
+    while True:
+        page, cursor, _ = await paginate_cursor(
+            session,
+            statement,
+            pagination=CursorPaginationParams(cursor, limit),
+        )
+        assert len(page) <= limit
+        results.extend(page)
+        if cursor is None:
+            return results
+
+
+def test_cursor_encoding() -> None:
+    values = [None, 1, "a", uuid.uuid4(), True]
+    assert decode_cursor(encode_cursor(values)) == values
+
+    with pytest.raises(BadRequest):
+        decode_cursor("INVALID")
+
+
+@pytest.mark.asyncio
+async def test_paginate_cursor(session: AsyncSession) -> None:
+    users = await create_users(session, ["a", "b", "c", "d", "e"])
+
+    session.expunge_all()
+
+    statement = select(User).order_by(User.avatar_url.desc())
+
+    results, next_cursor, total_count = await paginate_cursor(
+        session,
+        statement,
+        pagination=CursorPaginationParams(None, 2, with_total_count=True),
+    )
+    assert [user.avatar_url for user in results] == ["e", "d"]
+    assert next_cursor is not None
+    assert total_count == len(users)
+
+    results, next_cursor, total_count = await paginate_cursor(
+        session, statement, pagination=CursorPaginationParams(next_cursor, 2)
+    )
+    assert [user.avatar_url for user in results] == ["c", "b"]
+    assert next_cursor is not None
+    assert total_count is None
+
+    results, next_cursor, _ = await paginate_cursor(
+        session, statement, pagination=CursorPaginationParams(next_cursor, 2)
+    )
+    assert [user.avatar_url for user in results] == ["a"]
+    assert next_cursor is None
+
+
+@pytest.mark.asyncio
+async def test_paginate_cursor_ties_and_nulls(session: AsyncSession) -> None:
+    users = await create_users(session, [None, "a", "a", None, "b", "a", None])
+
+    session.expunge_all()
+
+    for is_desc in (False, True):
+        order_by = User.avatar_url.desc() if is_desc else User.avatar_url.asc()
+        statement = select(User).order_by(order_by)
+        result = await session.execute(statement.order_by(User.id))
+        expected = result.scalars().unique().all()
+
+        results = await paginate_all(session, statement, 2)
+
+        assert [user.id for user in results] == [user.id for user in expected]
+        assert len(results) == len(users)
+
+
+@pytest.mark.asyncio
+async def test_paginate_cursor_grouped(session: AsyncSession) -> None:
+    await create_users(session, ["a", "a", "a", "b", "b", "c"])
+
+    session.expunge_all()
+
+    statement = (
+        select(User.avatar_url, func.count())
+        .group_by(User.avatar_url)
+        .order_by(func.count().desc())
+    )
+
+    results = await paginate_all(session, statement, 1)
+
+    assert [tuple(result) for result in results] == [("a", 3), ("b", 2), ("c", 1)]
+
+
+@pytest.mark.asyncio
+async def test_paginate_cursor_invalid_cursor(session: AsyncSession) -> None:
+    session.expunge_all()
+
+    with pytest.raises(BadRequest):
+        await paginate_cursor(
+            session,
+            select(User).order_by(User.created_at),
+            pagination=CursorPaginationParams(encode_cursor([1, 2, 3]), 2),
+        )
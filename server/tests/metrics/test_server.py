@@ -0,0 +1,16 @@
+import socket
+
+import pytest
+
+from polar.metrics.server import serve_metrics
+
+
+@pytest.mark.asyncio
+async def test_serve_metrics_port_in_use() -> None:
+    with socket.socket() as sock:
+        sock.bind(("0.0.0.0", 0))
+        sock.listen()
+        port = sock.getsockname()[1]
+
+        # Returns instead of exiting the process
+        await serve_metrics(port)
@@ -15,6 +15,7 @@ from polar.enums import AccountType, Platforms
 from polar.exceptions import NotPermitted
 from polar.issue.hooks import IssueHook, issue_upserted
 from polar.issue.schemas import ConfirmIssueSplit
+from polar.kit.db.postgres import async_sessionmaker
 from polar.kit.utils import utc_now
 from polar.models.account import Account
 from polar.models.issue import Issue
@@ -1257,3 +1258,29 @@ async def test_pledge_states(
 
             if tc.pay_on_completion:
                 assert create_invoice.call_count == 2 if tc.other_pledged_first else 1
+
+
+@pytest.mark.asyncio
+async def test_get_receiving_organization_csv(
+    session: AsyncSession,
+    sessionmaker: async_sessionmaker[AsyncSession],
+    organization: Organization,
+    pledge: Pledge,
+    pledge_by_user: Pledge,
+) -> None:
+    # then
+    session.expunge_all()
+
+    rows = [
+        row
+        async for row in pledge_service.get_receiving_organization_csv(
+            sessionmaker, organization_id=organization.id
+        )
+    ]
+
+    assert rows[0] == "Date,Pledge ID,Issue,Pledger,Type,State,Amount\r\n"
+    assert len(rows) == 3
+    assert {row.split(",")[1] for row in rows[1:]} == {
+        str(pledge.id),
+        str(pledge_by_user.id),
+    }
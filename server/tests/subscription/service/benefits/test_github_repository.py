@@ -0,0 +1,219 @@
+from collections.abc import AsyncIterator, Callable
+from typing import Any
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from polar.enums import Platforms
+from polar.integrations.github.rate_limit import RateLimitBudgetExceeded
+from polar.models import OAuthAccount, Organization, Repository, Subscription, User
+from polar.models.subscription_benefit import (
+    SubscriptionBenefitGitHubRepository,
+    SubscriptionBenefitType,
+)
+from polar.postgres import AsyncSession
+from polar.subscription.service.benefits.base import SubscriptionBenefitPacingError
+from polar.subscription.service.benefits.github_repository import (
+    SubscriptionBenefitGitHubRepositoryService,
+)
+from polar.user.service import user as user_service
+from tests.fixtures.random_objects import create_subscription_benefit, create_user
+
+_MODULE = "polar.subscription.service.benefits.github_repository"
+
+
+def _paginate(
+    collaborators: list[Any], invitations: list[Any]
+) -> Callable[..., AsyncIterator[Any]]:
+    async def paginate(request: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        items = (
+            collaborators
+            if request.__name__ == "async_list_collaborators"
+            else invitations
+        )
+        for item in items:
+            yield item
+
+    return paginate
+
+
+@pytest.fixture
+def client(mocker: MockerFixture) -> MagicMock:
+    client = MagicMock()
+    client.rest.repos.async_list_collaborators.__name__ = "async_list_collaborators"
+    client.rest.repos.async_list_invitations.__name__ = "async_list_invitations"
+    client.rest.repos.async_add_collaborator = AsyncMock()
+    client.rest.repos.async_delete_invitation = AsyncMock()
+    client.rest.repos.async_remove_collaborator = AsyncMock()
+    client.paginate = MagicMock(side_effect=_paginate([], []))
+    mocker.patch(f"{_MODULE}.github.get_app_installation_client", return_value=client)
+    return client
+
+
+@pytest.fixture(autouse=True)
+def wait_for_write_slot_mock(mocker: MockerFixture) -> AsyncMock:
+    return mocker.patch(f"{_MODULE}.wait_for_write_slot", new_callable=AsyncMock)
+
+
+async def _create_github_user(session: AsyncSession, account_id: int) -> User:
+    user = await create_user(session)
+    await OAuthAccount(
+        platform=Platforms.github,
+        access_token="xxyyzz",
+        account_id=str(account_id),
+        account_email=user.email,
+        user_id=user.id,
+    ).save(session)
+    await session.commit()
+    session.expunge_all()
+    loaded_user = await user_service.get(session, user.id)
+    assert loaded_user is not None
+    return loaded_user
+
+
+async def _create_benefit(
+    session: AsyncSession, organization: Organization, repository: Repository
+) -> SubscriptionBenefitGitHubRepository:
+    benefit = await create_subscription_benefit(
+        session,
+        type=SubscriptionBenefitType.github_repository,
+        organization=organization,
+        properties={
+            "repository_id": str(repository.id),
+            "repository_owner": organization.name,
+            "repository_name": repository.name,
+            "permission": "pull",
+        },
+    )
+    return benefit  # type: ignore[return-value]
+
+
+@pytest.mark.asyncio
+class TestGrant:
+    async def test_batch(
+        self,
+        session: AsyncSession,
+        organization: Organization,
+        repository: Repository,
+        subscription: Subscription,
+        client: MagicMock,
+        wait_for_write_slot_mock: AsyncMock,
+    ) -> None:
+        benefit = await _create_benefit(session, organization, repository)
+        collaborator = await _create_github_user(session, 1)
+        invited = await _create_github_user(session, 2)
+        new = await _create_github_user(session, 3)
+        client.paginate.side_effect = _paginate(
+            [MagicMock(id=1, role_name="read")],
+            [MagicMock(invitee=MagicMock(id=2), permissions="read")],
+        )
+
+        # then
+        session.expunge_all()
+
+        service = SubscriptionBenefitGitHubRepositoryService(session)
+        for user in (collaborator, invited, new):
+            properties = await service.grant(benefit, subscription, user, {})
+            assert properties == {
+                "repository_id": str(repository.id),
+                "permission": "pull",
+            }
+
+        # Collaborators and invitations fetched once for the batch
+        assert client.paginate.call_count == 2
+        client.rest.repos.async_add_collaborator.assert_awaited_once_with(
+            organization.name,
+            repository.name,
+            new.username,
+            data={"permission": "pull"},
+        )
+        wait_for_write_slot_mock.assert_awaited_once_with(
+            f"installation:{organization.installation_id}"
+        )
+
+    async def test_permission_changed(
+        self,
+        session: AsyncSession,
+        organization: Organization,
+        repository: Repository,
+        subscription: Subscription,
+        client: MagicMock,
+    ) -> None:
+        benefit = await _create_benefit(session, organization, repository)
+        user = await _create_github_user(session, 1)
+        client.paginate.side_effect = _paginate(
+            [MagicMock(id=1, role_name="write")], []
+        )
+
+        # then
+        session.expunge_all()
+
+        service = SubscriptionBenefitGitHubRepositoryService(session)
+        await service.grant(benefit, subscription, user, {})
+
+        client.rest.repos.async_add_collaborator.assert_awaited_once()
+
+    async def test_write_budget_exceeded(
+        self,
+        session: AsyncSession,
+        organization: Organization,
+        repository: Repository,
+        subscription: Subscription,
+        client: MagicMock,
+        wait_for_write_slot_mock: AsyncMock,
+    ) -> None:
+        benefit = await _create_benefit(session, organization, repository)
+        user = await _create_github_user(session, 1)
+        wait_for_write_slot_mock.side_effect = RateLimitBudgetExceeded("bucket", 42)
+
+        # then
+        session.expunge_all()
+
+        service = SubscriptionBenefitGitHubRepositoryService(session)
+        with pytest.raises(SubscriptionBenefitPacingError) as e:
+            await service.grant(benefit, subscription, user, {})
+
+        assert e.value.defer_seconds == 42
+        client.rest.repos.async_add_collaborator.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+class TestRevoke:
+    async def test_batch(
+        self,
+        session: AsyncSession,
+        organization: Organization,
+        repository: Repository,
+        subscription: Subscription,
+        client: MagicMock,
+        wait_for_write_slot_mock: AsyncMock,
+    ) -> None:
+        benefit = await _create_benefit(session, organization, repository)
+        collaborator = await _create_github_user(session, 1)
+        invited = await _create_github_user(session, 2)
+        removed = await _create_github_user(session, 3)
+        invitation = MagicMock(id=123, invitee=MagicMock(id=2), permissions="read")
+        client.paginate.side_effect = _paginate(
+            [MagicMock(id=1, role_name="read")], [invitation]
+        )
+
+        # then
+        session.expunge_all()
+
+        service = SubscriptionBenefitGitHubRepositoryService(session)
+        for user in (collaborator, invited, removed):
+            await service.revoke(benefit, subscription, user, {})
+
+        assert client.paginate.call_count == 2
+        client.rest.repos.async_remove_collaborator.assert_awaited_once_with(
+            organization.name, repository.name, collaborator.username
+        )
+        client.rest.repos.async_delete_invitation.assert_awaited_once_with(
+            organization.name, repository.name, 123
+        )
+        assert wait_for_write_slot_mock.await_count == 2
+
+        # Already revoked: nothing left to do
+        await service.revoke(benefit, subscription, collaborator, {})
+        client.rest.repos.async_remove_collaborator.assert_awaited_once()
@@ -1,10 +1,11 @@
 import uuid
 from datetime import UTC, date, datetime, timedelta
-from unittest.mock import MagicMock, call
+from unittest.mock import MagicMock
 
 import pytest
 import stripe as stripe_lib
 from pytest_mock import MockerFixture
+from sqlalchemy import select
 
 from polar.auth.dependencies import AuthMethod
 from polar.authz.service import Anonymous, Authz
@@ -12,6 +13,7 @@ from polar.config import settings
 from polar.exceptions import NotPermitted, ResourceNotFound
 from polar.held_balance.service import held_balance as held_balance_service
 from polar.integrations.stripe.service import StripeService
+from polar.kit.db.postgres import async_sessionmaker
 from polar.kit.pagination import PaginationParams
 from polar.models import (
     Account,
@@ -42,6 +44,9 @@ from polar.subscription.service.subscription import (
     SubscriptionDoesNotExist,
 )
 from polar.subscription.service.subscription import subscription as subscription_service
+from polar.subscription.service.subscription_tier import (
+    subscription_tier as subscription_tier_service,
+)
 from polar.transaction.service.balance import (
     BalanceTransactionService,
 )
@@ -49,6 +54,7 @@ from polar.transaction.service.platform_fee import (
     PlatformFeeTransactionService,
 )
 from polar.user.service import user as user_service
+from polar.worker import PendingJob
 from tests.fixtures.random_objects import (
     add_subscription_benefits,
     create_active_subscription,
@@ -382,6 +388,91 @@ class TestCreateArbitrarySubscription:
         )
 
 
+@pytest.mark.asyncio
+class TestImportEmails:
+    async def test_store_load(self) -> None:
+        emails = ["a@example.com", "b@example.com"]
+        key = await subscription_service.store_import_emails(emails)
+
+        assert await subscription_service.load_import_emails(key) == emails
+
+        await subscription_service.delete_import_emails(key)
+        assert await subscription_service.load_import_emails(key) is None
+
+    async def test_empty(self) -> None:
+        key = await subscription_service.store_import_emails([])
+
+        assert await subscription_service.load_import_emails(key) == []
+
+        await subscription_service.delete_import_emails(key)
+
+
+@pytest.mark.asyncio
+class TestImportSubscribers:
+    async def test_valid(
+        self,
+        mocker: MockerFixture,
+        session: AsyncSession,
+        subscription_tier_organization_free: SubscriptionTier,
+        user: User,
+        user_second: User,
+    ) -> None:
+        enqueue_job_mock = mocker.patch(
+            "polar.subscription.service.subscription.enqueue_job"
+        )
+        mocker.patch("polar.user.service.enqueue_job")
+        eventstream_publish_mock = mocker.patch(
+            "polar.subscription.service.subscription.eventstream_publish"
+        )
+
+        await create_active_subscription(
+            session,
+            subscription_tier=subscription_tier_organization_free,
+            user=user_second,
+            stripe_subscription_id=None,
+        )
+
+        # then
+        session.expunge_all()
+
+        emails = [
+            user.email.upper(),
+            user_second.email,
+            "new.subscriber@example.com",
+        ]
+        count = await subscription_service.import_subscribers(
+            session,
+            subscription_tier=subscription_tier_organization_free,
+            emails=emails,
+            importer=user,
+            batch_size=2,
+        )
+
+        assert count == 2
+
+        new_user = await user_service.get_by_email(
+            session, "new.subscriber@example.com"
+        )
+        assert new_user is not None
+
+        for subscriber in (user, new_user):
+            subscriptions = await subscription_service.get_active_user_subscriptions(
+                session,
+                subscriber,
+                organization_id=subscription_tier_organization_free.organization_id,
+            )
+            assert len(subscriptions) == 1
+
+        assert enqueue_job_mock.await_count == 2
+        assert eventstream_publish_mock.await_count == 2
+        assert eventstream_publish_mock.await_args_list[-1].args[1] == {
+            "subscription_tier_id": subscription_tier_organization_free.id,
+            "processed": 3,
+            "total": 3,
+            "count": 2,
+        }
+
+
 @pytest.mark.asyncio
 class TestCreateSubscriptionFromStripe:
     async def test_not_existing_subscription_tier(self, session: AsyncSession) -> None:
@@ -761,8 +852,8 @@ class TestEnqueueBenefitsGrants:
         subscription_benefits: list[SubscriptionBenefit],
         subscription: Subscription,
     ) -> None:
-        enqueue_job_mock = mocker.patch(
-            "polar.subscription.service.subscription.enqueue_job"
+        enqueue_jobs_mock = mocker.patch(
+            "polar.subscription.service.subscription.enqueue_jobs"
         )
 
         subscription_tier_organization = await add_subscription_benefits(
@@ -777,7 +868,7 @@ class TestEnqueueBenefitsGrants:
 
         await subscription_service.enqueue_benefits_grants(session, subscription)
 
-        enqueue_job_mock.assert_not_called()
+        enqueue_jobs_mock.assert_not_called()
 
     @pytest.mark.parametrize(
         "status", [SubscriptionStatus.trialing, SubscriptionStatus.active]
@@ -791,8 +882,8 @@ class TestEnqueueBenefitsGrants:
         subscription_benefits: list[SubscriptionBenefit],
         subscription: Subscription,
     ) -> None:
-        enqueue_job_mock = mocker.patch(
-            "polar.subscription.service.subscription.enqueue_job"
+        enqueue_jobs_mock = mocker.patch(
+            "polar.subscription.service.subscription.enqueue_jobs"
         )
 
         subscription_tier_organization = await add_subscription_benefits(
@@ -807,9 +898,10 @@ class TestEnqueueBenefitsGrants:
 
         await subscription_service.enqueue_benefits_grants(session, subscription)
 
-        enqueue_job_mock.assert_has_awaits(
+        jobs = enqueue_jobs_mock.call_args[0][0]
+        assert jobs[: len(subscription_benefits)] == (
             [
-                call(
+                PendingJob(
                     "subscription.subscription_benefit.grant",
                     subscription_id=subscription.id,
                     user_id=subscription.user_id,
@@ -836,8 +928,8 @@ class TestEnqueueBenefitsGrants:
         subscription_benefits: list[SubscriptionBenefit],
         subscription: Subscription,
     ) -> None:
-        enqueue_job_mock = mocker.patch(
-            "polar.subscription.service.subscription.enqueue_job"
+        enqueue_jobs_mock = mocker.patch(
+            "polar.subscription.service.subscription.enqueue_jobs"
         )
 
         subscription_tier_organization = await add_subscription_benefits(
@@ -852,9 +944,10 @@ class TestEnqueueBenefitsGrants:
 
         await subscription_service.enqueue_benefits_grants(session, subscription)
 
-        enqueue_job_mock.assert_has_awaits(
+        jobs = enqueue_jobs_mock.call_args[0][0]
+        assert jobs[: len(subscription_benefits)] == (
             [
-                call(
+                PendingJob(
                     "subscription.subscription_benefit.revoke",
                     subscription_id=subscription.id,
                     user_id=subscription.user_id,
@@ -873,8 +966,8 @@ class TestEnqueueBenefitsGrants:
         subscription: Subscription,
         user: User,
     ) -> None:
-        enqueue_job_mock = mocker.patch(
-            "polar.subscription.service.subscription.enqueue_job"
+        enqueue_jobs_mock = mocker.patch(
+            "polar.subscription.service.subscription.enqueue_jobs"
         )
 
         grant = SubscriptionBenefitGrant(
@@ -898,11 +991,15 @@ class TestEnqueueBenefitsGrants:
 
         await subscription_service.enqueue_benefits_grants(session, subscription)
 
-        enqueue_job_mock.assert_any_await(
-            "subscription.subscription_benefit.revoke",
-            subscription_id=subscription.id,
-            user_id=subscription.user_id,
-            subscription_benefit_id=subscription_benefits[0].id,
+        jobs = enqueue_jobs_mock.call_args[0][0]
+        assert (
+            PendingJob(
+                "subscription.subscription_benefit.revoke",
+                subscription_id=subscription.id,
+                user_id=subscription.user_id,
+                subscription_benefit_id=subscription_benefits[0].id,
+            )
+            in jobs
         )
 
     async def test_subscription_organization(
@@ -915,8 +1012,8 @@ class TestEnqueueBenefitsGrants:
         organization_subscriber_admin: User,
         organization_subscriber_members: list[User],
     ) -> None:
-        enqueue_job_mock = mocker.patch(
-            "polar.subscription.service.subscription.enqueue_job"
+        enqueue_jobs_mock = mocker.patch(
+            "polar.subscription.service.subscription.enqueue_jobs"
         )
 
         subscription_tier_organization = await add_subscription_benefits(
@@ -935,23 +1032,28 @@ class TestEnqueueBenefitsGrants:
 
         members_count = len(organization_subscriber_members) + 1  # Members + admin
         benefits_count = len(subscription_benefits) + 1  # Benefits + articles
-        assert enqueue_job_mock.call_count == members_count * benefits_count
+        jobs = enqueue_jobs_mock.call_args[0][0]
+        assert len(jobs) == members_count * benefits_count
 
         for benefit in subscription_benefits:
-            enqueue_job_mock.assert_has_awaits(
-                [
-                    call(
+            for user_id in [
+                organization_subscriber_admin.id,
+                *[member.id for member in organization_subscriber_members],
+            ]:
+                assert (
+                    PendingJob(
                         "subscription.subscription_benefit.grant",
                         subscription_id=subscription_organization.id,
                         user_id=user_id,
                         subscription_benefit_id=benefit.id,
                     )
-                    for user_id in [
-                        organization_subscriber_admin.id,
-                        *[member.id for member in organization_subscriber_members],
-                    ]
-                ]
-            )
+                    in jobs
+                )
+
+
+async def get_grants(session: AsyncSession) -> list[SubscriptionBenefitGrant]:
+    result = await session.execute(select(SubscriptionBenefitGrant))
+    return list(result.scalars().all())
 
 
 @pytest.mark.asyncio
@@ -963,37 +1065,54 @@ class TestUpdateSubscriptionTierBenefitsGrants:
         user: User,
         subscription_tier_organization: SubscriptionTier,
         subscription_tier_organization_second: SubscriptionTier,
+        subscription_benefit_organization: SubscriptionBenefit,
     ) -> None:
-        enqueue_job_mock = mocker.patch(
-            "polar.subscription.service.subscription.enqueue_job"
+        enqueue_jobs_mock = mocker.patch(
+            "polar.subscription.service.subscription_benefit_grant.enqueue_jobs"
+        )
+        subscription_tier_organization = await add_subscription_benefits(
+            session,
+            subscription_tier=subscription_tier_organization,
+            subscription_benefits=[subscription_benefit_organization],
         )
-        subscription_1 = await create_subscription(
+        subscription_1 = await create_active_subscription(
             session, subscription_tier=subscription_tier_organization, user=user
         )
-        subscription_2 = await create_subscription(
+        subscription_2 = await create_active_subscription(
             session, subscription_tier=subscription_tier_organization, user=user
         )
-        await create_subscription(
+        await create_active_subscription(
             session, subscription_tier=subscription_tier_organization_second, user=user
         )
 
         # then
         session.expunge_all()
 
+        subscription_tier = await subscription_tier_service.get(
+            session, subscription_tier_organization.id
+        )
+        assert subscription_tier is not None
         await subscription_service.update_subscription_tier_benefits_grants(
-            session, subscription_tier_organization
+            session, subscription_tier
         )
 
-        assert enqueue_job_mock.call_count == 2
-
-        enqueue_job_mock.assert_any_await(
-            "subscription.subscription.enqueue_benefits_grants",
+        grants = await get_grants(session)
+        # The benefit and the free articles one
+        assert len(grants) == 4
+        assert {grant.subscription_id for grant in grants} == {
             subscription_1.id,
-        )
-        enqueue_job_mock.assert_any_await(
-            "subscription.subscription.enqueue_benefits_grants",
             subscription_2.id,
-        )
+        }
+
+        jobs: list[PendingJob] = enqueue_jobs_mock.call_args[0][0]
+        assert {job.name for job in jobs} == {
+            "subscription.subscription_benefit.grant_many"
+        }
+        assert sorted(
+            grant_id
+            for job in jobs
+            for grant_id in job.kwargs["subscription_benefit_grant_ids"]
+        ) == sorted(grant.id for grant in grants)
 
 
 @pytest.mark.asyncio
@@ -1004,25 +1123,36 @@ class TestUpdateOrganizationBenefitsGrants:
         mocker: MockerFixture,
         user: User,
         organization_subscriber: Organization,
+        organization_subscriber_members: list[User],
         subscription_tier_organization: SubscriptionTier,
         subscription_tier_organization_second: SubscriptionTier,
+        subscription_benefit_organization: SubscriptionBenefit,
     ) -> None:
-        enqueue_job_mock = mocker.patch(
-            "polar.subscription.service.subscription.enqueue_job"
-        )
-        subscription_1 = await create_subscription(
+        enqueue_jobs_mock = mocker.patch(
+            "polar.subscription.service.subscription_benefit_grant.enqueue_jobs"
+        )
+        for subscription_tier in (
+            subscription_tier_organization,
+            subscription_tier_organization_second,
+        ):
+            await add_subscription_benefits(
+                session,
+                subscription_tier=subscription_tier,
+                subscription_benefits=[subscription_benefit_organization],
+            )
+        subscription_1 = await create_active_subscription(
             session,
             subscription_tier=subscription_tier_organization,
             user=user,
             organization=organization_subscriber,
         )
-        subscription_2 = await create_subscription(
+        subscription_2 = await create_active_subscription(
             session,
             subscription_tier=subscription_tier_organization_second,
             user=user,
             organization=organization_subscriber,
         )
-        await create_subscription(
+        await create_active_subscription(
             session, subscription_tier=subscription_tier_organization, user=user
         )
 
@@ -1033,16 +1163,15 @@ class TestUpdateOrganizationBenefitsGrants:
             session, organization_subscriber
         )
 
-        assert enqueue_job_mock.call_count == 2
-
-        enqueue_job_mock.assert_any_await(
-            "subscription.subscription.enqueue_benefits_grants",
+        grants = await get_grants(session)
+        assert {grant.subscription_id for grant in grants} == {
             subscription_1.id,
-        )
-        enqueue_job_mock.assert_any_await(
-            "subscription.subscription.enqueue_benefits_grants",
             subscription_2.id,
-        )
+        }
+        assert {grant.user_id for grant in grants} == {
+            member.id for member in organization_subscriber_members
+        }
+        assert enqueue_jobs_mock.call_count == 2
 
 
 @pytest.mark.asyncio
@@ -1142,6 +1271,41 @@ class TestSearch:
         assert count == 1
 
 
+@pytest.mark.asyncio
+class TestGetSubscribersCSV:
+    async def test_valid(
+        self,
+        session: AsyncSession,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        organization: Organization,
+        user: User,
+        user_second: User,
+        user_organization: UserOrganization,
+        subscription_tier_organization: SubscriptionTier,
+    ) -> None:
+        await create_active_subscription(
+            session,
+            subscription_tier=subscription_tier_organization,
+            user=user_second,
+            started_at=datetime(2023, 1, 1),
+        )
+
+        # then
+        session.expunge_all()
+
+        rows = [
+            row
+            async for row in subscription_service.get_subscribers_csv(
+                sessionmaker, user, organization=organization
+            )
+        ]
+
+        assert len(rows) == 2
+        assert rows[0] == "email,name,created_at,active,tier\r\n"
+        assert rows[1].startswith(f"{user_second.email},{user_second.username},")
+        assert rows[1].endswith(f",true,{subscription_tier_organization.name}\r\n")
+
+
 @pytest.mark.asyncio
 class TestSearchSubscribed:
     async def test_valid(
@@ -2,13 +2,18 @@ from unittest.mock import MagicMock
 
 import pytest
 from pytest_mock import MockerFixture
+from sqlalchemy import select
 
 from polar.models import (
+    Organization,
     Subscription,
     SubscriptionBenefit,
     SubscriptionBenefitGrant,
+    SubscriptionTier,
     User,
 )
+from polar.models.subscription import SubscriptionStatus
+from polar.models.subscription_benefit import SubscriptionBenefitType
 from polar.notifications.notification import (
     SubscriptionBenefitPreconditionErrorNotificationContextualPayload,
 )
@@ -16,6 +21,7 @@ from polar.notifications.service import NotificationsService
 from polar.postgres import AsyncSession
 from polar.subscription.service.benefits import (
     SubscriptionBenefitPreconditionError,
+    SubscriptionBenefitRetriableError,
     SubscriptionBenefitServiceProtocol,
 )
 from polar.subscription.service.subscription import subscription as subscription_service
@@ -25,6 +31,13 @@ from polar.subscription.service.subscription_benefit_grant import (  # type: ign
 from polar.subscription.service.subscription_benefit_grant import (
     subscription_benefit_grant as subscription_benefit_grant_service,
 )
+from polar.worker import PendingJob
+from tests.fixtures.random_objects import (
+    create_active_subscription,
+    create_subscription,
+    create_subscription_benefit,
+    create_subscription_benefit_grant,
+)
 
 
 @pytest.fixture(autouse=True)
@@ -621,8 +634,8 @@ class TestEnqueueGrantsAfterPreconditionFulfilled:
 
         await session.commit()
 
-        enqueue_job_mock = mocker.patch(
-            "polar.subscription.service.subscription_benefit_grant.enqueue_job"
+        enqueue_jobs_mock = mocker.patch(
+            "polar.subscription.service.subscription_benefit_grant.enqueue_jobs"
         )
 
         # then
@@ -632,9 +645,385 @@ class TestEnqueueGrantsAfterPreconditionFulfilled:
             session, user, subscription_benefit_organization.type
         )
 
-        enqueue_job_mock.assert_called_once_with(
-            "subscription.subscription_benefit.grant",
-            subscription_id=pending_grant.subscription_id,
-            user_id=user.id,
-            subscription_benefit_id=pending_grant.subscription_benefit_id,
+        enqueue_jobs_mock.assert_called_once_with(
+            [
+                PendingJob(
+                    "subscription.subscription_benefit.grant",
+                    subscription_id=pending_grant.subscription_id,
+                    user_id=user.id,
+                    subscription_benefit_id=pending_grant.subscription_benefit_id,
+                )
+            ]
+        )
+
+
+@pytest.mark.asyncio
+class TestGrantBenefits:
+    async def test_valid(
+        self,
+        session: AsyncSession,
+        subscription: Subscription,
+        user: User,
+        user_second: User,
+        subscription_benefit_organization: SubscriptionBenefit,
+        subscription_benefit_service_mock: MagicMock,
+    ) -> None:
+        subscription_benefit_service_mock.grant.return_value = {"external_id": "abc"}
+        pending_grant = await create_subscription_benefit_grant(
+            session, user, subscription, subscription_benefit_organization
+        )
+        granted_grant = await create_subscription_benefit_grant(
+            session, user_second, subscription, subscription_benefit_organization
+        )
+        granted_grant.set_granted()
+        session.add(granted_grant)
+        await session.commit()
+
+        # then
+        session.expunge_all()
+
+        await subscription_benefit_grant_service.grant_benefits(
+            session,
+            subscription_benefit_organization,
+            [pending_grant.id, granted_grant.id],
+        )
+
+        subscription_benefit_service_mock.grant.assert_called_once()
+        updated_grant = await subscription_benefit_grant_service.get(
+            session, pending_grant.id
+        )
+        assert updated_grant is not None
+        assert updated_grant.is_granted
+        assert updated_grant.properties == {"external_id": "abc"}
+
+    async def test_retriable_error(
+        self,
+        session: AsyncSession,
+        subscription: Subscription,
+        user: User,
+        user_second: User,
+        subscription_benefit_organization: SubscriptionBenefit,
+        subscription_benefit_service_mock: MagicMock,
+    ) -> None:
+        subscription_benefit_service_mock.grant.side_effect = [
+            {},
+            SubscriptionBenefitRetriableError(10),
+        ]
+        grant_1 = await create_subscription_benefit_grant(
+            session, user, subscription, subscription_benefit_organization
+        )
+        grant_2 = await create_subscription_benefit_grant(
+            session, user_second, subscription, subscription_benefit_organization
+        )
+
+        # then
+        session.expunge_all()
+
+        with pytest.raises(SubscriptionBenefitRetriableError):
+            await subscription_benefit_grant_service.grant_benefits(
+                session, subscription_benefit_organization, [grant_1.id, grant_2.id]
+            )
+
+        # Granted ones are kept for the retry
+        session.expunge_all()
+        grants = [
+            await subscription_benefit_grant_service.get(session, grant.id)
+            for grant in (grant_1, grant_2)
+        ]
+        assert sorted(grant.is_granted for grant in grants if grant) == [False, True]
+
+    async def test_error(
+        self,
+        session: AsyncSession,
+        subscription: Subscription,
+        user: User,
+        user_second: User,
+        subscription_benefit_organization: SubscriptionBenefit,
+        subscription_benefit_service_mock: MagicMock,
+    ) -> None:
+        subscription_benefit_service_mock.grant.side_effect = [Exception(), {}]
+        grant_1 = await create_subscription_benefit_grant(
+            session, user, subscription, subscription_benefit_organization
+        )
+        grant_2 = await create_subscription_benefit_grant(
+            session, user_second, subscription, subscription_benefit_organization
+        )
+
+        # then
+        session.expunge_all()
+
+        await subscription_benefit_grant_service.grant_benefits(
+            session, subscription_benefit_organization, [grant_1.id, grant_2.id]
+        )
+
+        # The failed grant doesn't prevent the others
+        assert subscription_benefit_service_mock.grant.call_count == 2
+        session.expunge_all()
+        grants = [
+            await subscription_benefit_grant_service.get(session, grant.id)
+            for grant in (grant_1, grant_2)
+        ]
+        assert sorted(grant.is_granted for grant in grants if grant) == [False, True]
+
+
+@pytest.mark.asyncio
+class TestRevokeBenefits:
+    async def test_valid(
+        self,
+        session: AsyncSession,
+        subscription: Subscription,
+        user: User,
+        user_second: User,
+        subscription_benefit_organization: SubscriptionBenefit,
+        subscription_benefit_service_mock: MagicMock,
+    ) -> None:
+        granted_grant = await create_subscription_benefit_grant(
+            session, user, subscription, subscription_benefit_organization
+        )
+        granted_grant.set_granted()
+        session.add(granted_grant)
+        revoked_grant = await create_subscription_benefit_grant(
+            session, user_second, subscription, subscription_benefit_organization
+        )
+        revoked_grant.set_revoked()
+        session.add(revoked_grant)
+        await session.commit()
+
+        # then
+        session.expunge_all()
+
+        await subscription_benefit_grant_service.revoke_benefits(
+            session,
+            subscription_benefit_organization,
+            [granted_grant.id, revoked_grant.id],
+        )
+
+        subscription_benefit_service_mock.revoke.assert_called_once()
+        updated_grant = await subscription_benefit_grant_service.get(
+            session, granted_grant.id
+        )
+        assert updated_grant is not None
+        assert updated_grant.is_revoked
+
+    async def test_error(
+        self,
+        session: AsyncSession,
+        subscription: Subscription,
+        user: User,
+        user_second: User,
+        subscription_benefit_organization: SubscriptionBenefit,
+        subscription_benefit_service_mock: MagicMock,
+    ) -> None:
+        subscription_benefit_service_mock.revoke.side_effect = [Exception(), {}]
+        grant_1 = await create_subscription_benefit_grant(
+            session, user, subscription, subscription_benefit_organization
+        )
+        grant_2 = await create_subscription_benefit_grant(
+            session, user_second, subscription, subscription_benefit_organization
+        )
+        for grant in (grant_1, grant_2):
+            grant.set_granted()
+            session.add(grant)
+        await session.commit()
+
+        # then
+        session.expunge_all()
+
+        await subscription_benefit_grant_service.revoke_benefits(
+            session, subscription_benefit_organization, [grant_1.id, grant_2.id]
         )
+
+        # The failed revocation doesn't prevent the others
+        assert subscription_benefit_service_mock.revoke.call_count == 2
+        session.expunge_all()
+        grants = [
+            await subscription_benefit_grant_service.get(session, grant.id)
+            for grant in (grant_1, grant_2)
+        ]
+        assert sorted(grant.is_revoked for grant in grants if grant) == [False, True]
+
+
+async def get_grants(
+    session: AsyncSession, subscription: Subscription
+) -> list[SubscriptionBenefitGrant]:
+    result = await session.execute(
+        select(SubscriptionBenefitGrant).where(
+            SubscriptionBenefitGrant.subscription_id == subscription.id
+        )
+    )
+    return list(result.scalars().all())
+
+
+@pytest.mark.asyncio
+class TestEnqueueGrantsSync:
+    async def test_active_subscription(
+        self,
+        mocker: MockerFixture,
+        session: AsyncSession,
+        subscription_tier_organization: SubscriptionTier,
+        subscription_benefits: list[SubscriptionBenefit],
+        user: User,
+    ) -> None:
+        enqueue_jobs_mock = mocker.patch(
+            "polar.subscription.service.subscription_benefit_grant.enqueue_jobs"
+        )
+        granted_benefit, new_benefit, outdated_benefit = subscription_benefits
+        subscription = await create_active_subscription(
+            session, subscription_tier=subscription_tier_organization, user=user
+        )
+        granted_grant = await create_subscription_benefit_grant(
+            session, user, subscription, granted_benefit
+        )
+        granted_grant.set_granted()
+        session.add(granted_grant)
+        outdated_grant = await create_subscription_benefit_grant(
+            session, user, subscription, outdated_benefit
+        )
+        outdated_grant.set_granted()
+        session.add(outdated_grant)
+        await session.commit()
+
+        # then
+        session.expunge_all()
+
+        await subscription_benefit_grant_service.enqueue_grants_sync(
+            session,
+            [granted_benefit, new_benefit],
+            Subscription.subscription_tier_id == subscription_tier_organization.id,
+        )
+
+        grants = await get_grants(session, subscription)
+        assert len(grants) == 3
+        new_grant = next(
+            grant for grant in grants if grant.subscription_benefit_id == new_benefit.id
+        )
+        assert new_grant.user_id == user.id
+        assert not new_grant.is_granted
+
+        enqueue_jobs_mock.assert_called_once_with(
+            [
+                PendingJob(
+                    "subscription.subscription_benefit.grant_many",
+                    subscription_benefit_id=new_benefit.id,
+                    subscription_benefit_grant_ids=[new_grant.id],
+                ),
+                PendingJob(
+                    "subscription.subscription_benefit.revoke_many",
+                    subscription_benefit_id=outdated_benefit.id,
+                    subscription_benefit_grant_ids=[outdated_grant.id],
+                ),
+            ]
+        )
+
+    async def test_inactive_subscription(
+        self,
+        mocker: MockerFixture,
+        session: AsyncSession,
+        subscription_tier_organization: SubscriptionTier,
+        subscription_benefit_organization: SubscriptionBenefit,
+        user: User,
+    ) -> None:
+        enqueue_jobs_mock = mocker.patch(
+            "polar.subscription.service.subscription_benefit_grant.enqueue_jobs"
+        )
+        subscription = await create_subscription(
+            session,
+            subscription_tier=subscription_tier_organization,
+            user=user,
+            status=SubscriptionStatus.canceled,
+        )
+        grant = await create_subscription_benefit_grant(
+            session, user, subscription, subscription_benefit_organization
+        )
+        grant.set_granted()
+        session.add(grant)
+        await session.commit()
+
+        # then
+        session.expunge_all()
+
+        await subscription_benefit_grant_service.enqueue_grants_sync(
+            session,
+            [subscription_benefit_organization],
+            Subscription.subscription_tier_id == subscription_tier_organization.id,
+        )
+
+        assert len(await get_grants(session, subscription)) == 1
+        enqueue_jobs_mock.assert_called_once_with(
+            [
+                PendingJob(
+                    "subscription.subscription_benefit.revoke_many",
+                    subscription_benefit_id=subscription_benefit_organization.id,
+                    subscription_benefit_grant_ids=[grant.id],
+                ),
+            ]
+        )
+
+    async def test_organization_subscription(
+        self,
+        mocker: MockerFixture,
+        session: AsyncSession,
+        subscription_tier_organization: SubscriptionTier,
+        organization: Organization,
+        organization_subscriber: Organization,
+        organization_subscriber_members: list[User],
+        user_second: User,
+    ) -> None:
+        mocker.patch(
+            "polar.subscription.service.subscription_benefit_grant.DEFAULT_GRANTS_BATCH_SIZE",
+            2,
+        )
+        enqueue_jobs_mock = mocker.patch(
+            "polar.subscription.service.subscription_benefit_grant.enqueue_jobs"
+        )
+        custom_benefit = await create_subscription_benefit(
+            session, organization=organization
+        )
+        github_repository_benefit = await create_subscription_benefit(
+            session,
+            type=SubscriptionBenefitType.github_repository,
+            organization=organization,
+        )
+        subscription = await create_active_subscription(
+            session,
+            subscription_tier=subscription_tier_organization,
+            user=user_second,
+            organization=organization_subscriber,
+        )
+
+        # then
+        session.expunge_all()
+
+        await subscription_benefit_grant_service.enqueue_grants_sync(
+            session,
+            [custom_benefit, github_repository_benefit],
+            Subscription.subscription_tier_id == subscription_tier_organization.id,
+        )
+
+        grants = await get_grants(session, subscription)
+        custom_grants = [
+            grant
+            for grant in grants
+            if grant.subscription_benefit_id == custom_benefit.id
+        ]
+        assert {grant.user_id for grant in custom_grants} == {
+            member.id for member in organization_subscriber_members
+        }
+        github_repository_grants = [
+            grant
+            for grant in grants
+            if grant.subscription_benefit_id == github_repository_benefit.id
+        ]
+        assert [grant.user_id for grant in github_repository_grants] == [user_second.id]
+
+        jobs: list[PendingJob] = enqueue_jobs_mock.call_args[0][0]
+        custom_jobs = [
+            job
+            for job in jobs
+            if job.kwargs["subscription_benefit_id"] == custom_benefit.id
+        ]
+        # 5 members, by batches of 2
+        assert [
+            len(job.kwargs["subscription_benefit_grant_ids"]) for job in custom_jobs
+        ] == [2, 2, 1]
+        assert len(jobs) == 4
@@ -13,7 +13,10 @@ from polar.models import (
 )
 from polar.models.subscription_benefit import SubscriptionBenefitType
 from polar.postgres import AsyncSession
-from polar.subscription.service.benefits import SubscriptionBenefitRetriableError
+from polar.subscription.service.benefits import (
+    SubscriptionBenefitPacingError,
+    SubscriptionBenefitRetriableError,
+)
 from polar.subscription.service.subscription import SubscriptionService
 from polar.subscription.service.subscription_benefit_grant import (
     SubscriptionBenefitGrantService,
@@ -26,11 +29,14 @@ from polar.subscription.tasks import (  # type: ignore[attr-defined]
     UserDoesNotExist,
     subscription_benefit_delete,
     subscription_benefit_grant,
+    subscription_benefit_grant_many,
     subscription_benefit_grant_service,
     subscription_benefit_precondition_fulfilled,
     subscription_benefit_revoke,
+    subscription_benefit_revoke_many,
     subscription_benefit_update,
     subscription_enqueue_benefits_grants,
+    subscription_import_subscribers,
     subscription_service,
     subscription_update_subscription_tier_benefits_grants,
 )
@@ -359,6 +365,282 @@ class TestSubscriptionBenefitRevoke:
             )
 
 
+@pytest.mark.asyncio
+class TestSubscriptionImportSubscribers:
+    async def test_valid(
+        self,
+        mocker: MockerFixture,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        subscription_tier_organization_free: SubscriptionTier,
+        user: User,
+        session: AsyncSession,
+    ) -> None:
+        import_subscribers_mock = mocker.patch.object(
+            subscription_service,
+            "import_subscribers",
+            spec=SubscriptionService.import_subscribers,
+            return_value=1,
+        )
+        emails = ["a@example.com", "b@example.com"]
+        emails_key = await subscription_service.store_import_emails(emails)
+
+        # then
+        session.expunge_all()
+
+        await subscription_import_subscribers(
+            job_context,
+            subscription_tier_organization_free.id,
+            emails_key,
+            user.id,
+            polar_worker_context,
+        )
+
+        import_subscribers_mock.assert_called_once()
+        assert import_subscribers_mock.call_args.kwargs["emails"] == emails
+        assert await subscription_service.load_import_emails(emails_key) is None
+
+    async def test_expired_emails(
+        self,
+        mocker: MockerFixture,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        subscription_tier_organization_free: SubscriptionTier,
+        user: User,
+        session: AsyncSession,
+    ) -> None:
+        import_subscribers_mock = mocker.patch.object(
+            subscription_service,
+            "import_subscribers",
+            spec=SubscriptionService.import_subscribers,
+        )
+
+        # then
+        session.expunge_all()
+
+        await subscription_import_subscribers(
+            job_context,
+            subscription_tier_organization_free.id,
+            uuid.uuid4().hex,
+            user.id,
+            polar_worker_context,
+        )
+
+        import_subscribers_mock.assert_not_called()
+
+
+@pytest.mark.asyncio
+class TestSubscriptionBenefitGrantMany:
+    async def test_not_existing_subscription_benefit(
+        self,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        session: AsyncSession,
+    ) -> None:
+        # then
+        session.expunge_all()
+
+        with pytest.raises(SubscriptionBenefitDoesNotExist):
+            await subscription_benefit_grant_many(
+                job_context, uuid.uuid4(), [uuid.uuid4()], polar_worker_context
+            )
+
+    async def test_existing_subscription_benefit(
+        self,
+        mocker: MockerFixture,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        subscription_benefit_organization: SubscriptionBenefit,
+        session: AsyncSession,
+    ) -> None:
+        grant_benefits_mock = mocker.patch.object(
+            subscription_benefit_grant_service,
+            "grant_benefits",
+            spec=SubscriptionBenefitGrantService.grant_benefits,
+        )
+        grant_ids = [uuid.uuid4()]
+
+        # then
+        session.expunge_all()
+
+        await subscription_benefit_grant_many(
+            job_context,
+            subscription_benefit_organization.id,
+            grant_ids,
+            polar_worker_context,
+        )
+
+        grant_benefits_mock.assert_called_once()
+        assert grant_benefits_mock.call_args[0][2] == grant_ids
+
+    async def test_retry(
+        self,
+        mocker: MockerFixture,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        subscription_benefit_organization: SubscriptionBenefit,
+        session: AsyncSession,
+    ) -> None:
+        grant_benefits_mock = mocker.patch.object(
+            subscription_benefit_grant_service,
+            "grant_benefits",
+            spec=SubscriptionBenefitGrantService.grant_benefits,
+        )
+        grant_benefits_mock.side_effect = SubscriptionBenefitRetriableError(10)
+
+        # then
+        session.expunge_all()
+
+        with pytest.raises(Retry):
+            await subscription_benefit_grant_many(
+                job_context,
+                subscription_benefit_organization.id,
+                [uuid.uuid4()],
+                polar_worker_context,
+            )
+
+    async def test_pacing(
+        self,
+        mocker: MockerFixture,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        subscription_benefit_organization: SubscriptionBenefit,
+        session: AsyncSession,
+    ) -> None:
+        grant_benefits_mock = mocker.patch.object(
+            subscription_benefit_grant_service,
+            "grant_benefits",
+            spec=SubscriptionBenefitGrantService.grant_benefits,
+        )
+        grant_benefits_mock.side_effect = SubscriptionBenefitPacingError(10)
+        enqueue_job_mock = mocker.patch("polar.subscription.tasks.enqueue_job")
+        grant_ids = [uuid.uuid4()]
+
+        # then
+        session.expunge_all()
+
+        # Deferred to a new job, without spending a try
+        await subscription_benefit_grant_many(
+            job_context,
+            subscription_benefit_organization.id,
+            grant_ids,
+            polar_worker_context,
+        )
+
+        enqueue_job_mock.assert_called_once_with(
+            "subscription.subscription_benefit.grant_many",
+            subscription_benefit_id=subscription_benefit_organization.id,
+            subscription_benefit_grant_ids=grant_ids,
+            _defer_by=10,
+        )
+
+
+@pytest.mark.asyncio
+class TestSubscriptionBenefitRevokeMany:
+    async def test_not_existing_subscription_benefit(
+        self,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        session: AsyncSession,
+    ) -> None:
+        # then
+        session.expunge_all()
+
+        with pytest.raises(SubscriptionBenefitDoesNotExist):
+            await subscription_benefit_revoke_many(
+                job_context, uuid.uuid4(), [uuid.uuid4()], polar_worker_context
+            )
+
+    async def test_existing_subscription_benefit(
+        self,
+        mocker: MockerFixture,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        subscription_benefit_organization: SubscriptionBenefit,
+        session: AsyncSession,
+    ) -> None:
+        revoke_benefits_mock = mocker.patch.object(
+            subscription_benefit_grant_service,
+            "revoke_benefits",
+            spec=SubscriptionBenefitGrantService.revoke_benefits,
+        )
+        grant_ids = [uuid.uuid4()]
+
+        # then
+        session.expunge_all()
+
+        await subscription_benefit_revoke_many(
+            job_context,
+            subscription_benefit_organization.id,
+            grant_ids,
+            polar_worker_context,
+        )
+
+        revoke_benefits_mock.assert_called_once()
+        assert revoke_benefits_mock.call_args[0][2] == grant_ids
+
+    async def test_retry(
+        self,
+        mocker: MockerFixture,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        subscription_benefit_organization: SubscriptionBenefit,
+        session: AsyncSession,
+    ) -> None:
+        revoke_benefits_mock = mocker.patch.object(
+            subscription_benefit_grant_service,
+            "revoke_benefits",
+            spec=SubscriptionBenefitGrantService.revoke_benefits,
+        )
+        revoke_benefits_mock.side_effect = SubscriptionBenefitRetriableError(10)
+
+        # then
+        session.expunge_all()
+
+        with pytest.raises(Retry):
+            await subscription_benefit_revoke_many(
+                job_context,
+                subscription_benefit_organization.id,
+                [uuid.uuid4()],
+                polar_worker_context,
+            )
+
+    async def test_pacing(
+        self,
+        mocker: MockerFixture,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        subscription_benefit_organization: SubscriptionBenefit,
+        session: AsyncSession,
+    ) -> None:
+        revoke_benefits_mock = mocker.patch.object(
+            subscription_benefit_grant_service,
+            "revoke_benefits",
+            spec=SubscriptionBenefitGrantService.revoke_benefits,
+        )
+        revoke_benefits_mock.side_effect = SubscriptionBenefitPacingError(10)
+        enqueue_job_mock = mocker.patch("polar.subscription.tasks.enqueue_job")
+        grant_ids = [uuid.uuid4()]
+
+        # then
+        session.expunge_all()
+
+        # Deferred to a new job, without spending a try
+        await subscription_benefit_revoke_many(
+            job_context,
+            subscription_benefit_organization.id,
+            grant_ids,
+            polar_worker_context,
+        )
+
+        enqueue_job_mock.assert_called_once_with(
+            "subscription.subscription_benefit.revoke_many",
+            subscription_benefit_id=subscription_benefit_organization.id,
+            subscription_benefit_grant_ids=grant_ids,
+            _defer_by=10,
+        )
+
+
 @pytest.mark.asyncio
 class TestSubscriptionBenefitUpdate:
     async def test_not_existing_grant(
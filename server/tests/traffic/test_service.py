@@ -1,18 +1,20 @@
 import datetime
 
 import pytest
+from pytest_mock import MockerFixture
 
 from polar.kit.extensions.sqlalchemy import sql
+from polar.kit.pagination import PaginationParams
 from polar.models.article import Article
 from polar.models.organization import Organization
 from polar.models.traffic import Traffic
 from polar.postgres import AsyncSession
-from polar.traffic.schemas import TrafficStatisticsPeriod
+from polar.traffic.schemas import TrafficReferrer, TrafficStatisticsPeriod
 from polar.traffic.service import traffic_service
 
 
 @pytest.mark.asyncio
-async def test_article_add(
+async def test_article_track(
     session: AsyncSession,
     article: Article,
     organization: Organization,
@@ -23,8 +25,7 @@ async def test_article_add(
 
     # 30 views in february
     for i in range(10):
-        await traffic_service.add(
-            session,
+        await traffic_service.track(
             location_href="https://polar.sh/hello",
             referrer=None,
             article_id=article.id,
@@ -32,8 +33,7 @@ async def test_article_add(
         )
 
     for i in range(10):
-        await traffic_service.add(
-            session,
+        await traffic_service.track(
             location_href="https://polar.sh/hello",
             referrer="https://google.com/",
             article_id=article.id,
@@ -41,8 +41,7 @@ async def test_article_add(
         )
 
     for i in range(10):
-        await traffic_service.add(
-            session,
+        await traffic_service.track(
             location_href="https://polar.sh/hello",
             referrer="https://google.com/",
             article_id=article.id,
@@ -50,8 +49,7 @@ async def test_article_add(
         )
 
     # traffic with both article and org id
-    await traffic_service.add(
-        session,
+    await traffic_service.track(
         location_href="https://polar.sh/hello",
         referrer="https://google.com/",
         article_id=article.id,
@@ -61,8 +59,7 @@ async def test_article_add(
 
     # 5 views in november (outside of range)
     for i in range(50):
-        await traffic_service.add(
-            session,
+        await traffic_service.track(
             location_href="https://polar.sh/hello",
             referrer="https://google.com/",
             article_id=article.id,
@@ -71,16 +68,14 @@ async def test_article_add(
 
     # 8 views in december
     for i in range(4):
-        await traffic_service.add(
-            session,
+        await traffic_service.track(
             location_href="https://polar.sh/hello",
             referrer="https://google.com/",
             article_id=article.id,
             date=datetime.date(2023, 12, 1),
         )
     for i in range(4):
-        await traffic_service.add(
-            session,
+        await traffic_service.track(
             location_href="https://polar.sh/hello",
             referrer="https://google.com/",
             article_id=article.id,
@@ -88,14 +83,15 @@ async def test_article_add(
         )
 
     # traffic in other organization (no affect on result)
-    await traffic_service.add(
-        session,
+    await traffic_service.track(
         location_href="https://polar.sh/hello",
         referrer="https://google.com/",
         organization_id=second_organization.id,
         date=datetime.date(2024, 2, 19),
     )
 
+    await traffic_service.flush_views(session)
+
     monthly = await traffic_service.views_statistics(
         session,
         article_ids=[article.id],
@@ -171,7 +167,7 @@ async def test_article_add(
 
 
 @pytest.mark.asyncio
-async def test_organization_add(
+async def test_organization_track(
     session: AsyncSession,
     organization: Organization,
     second_organization: Organization,
@@ -182,8 +178,7 @@ async def test_organization_add(
 
     # 15 views in february
     for i in range(10):
-        await traffic_service.add(
-            session,
+        await traffic_service.track(
             location_href="https://polar.sh/hello",
             referrer=None,
             organization_id=organization.id,
@@ -191,8 +186,7 @@ async def test_organization_add(
         )
 
     for i in range(5):
-        await traffic_service.add(
-            session,
+        await traffic_service.track(
             location_href="https://polar.sh/hello",
             referrer="https://google.com/",
             organization_id=organization.id,
@@ -200,8 +194,7 @@ async def test_organization_add(
         )
 
     # 1 page view that has both article and organization ids
-    await traffic_service.add(
-        session,
+    await traffic_service.track(
         location_href="https://polar.sh/hello",
         referrer="https://google.com/",
         organization_id=organization.id,
@@ -210,14 +203,15 @@ async def test_organization_add(
     )
 
     # traffic in other organization (no affect on result)
-    await traffic_service.add(
-        session,
+    await traffic_service.track(
         location_href="https://polar.sh/hello",
         referrer="https://google.com/",
         organization_id=second_organization.id,
         date=datetime.date(2024, 2, 19),
     )
 
+    await traffic_service.flush_views(session)
+
     monthly = await traffic_service.views_statistics(
         session,
         organization_id=organization.id,
@@ -253,3 +247,217 @@ async def test_organization_add(
     stmt = sql.select(Traffic).order_by(Traffic.date)
     r = await session.execute(stmt)
     assert 4 == len(r.scalars().unique().all())
+
+
+@pytest.mark.asyncio
+async def test_track_flush_views(
+    session: AsyncSession,
+    article: Article,
+    organization: Organization,
+) -> None:
+    # then
+    session.expunge_all()
+
+    await traffic_service.track(
+        location_href="https://polar.sh/hello",
+        referrer=None,
+        article_id=article.id,
+        date=datetime.date(2024, 2, 19),
+    )
+    await traffic_service.flush_views(session)
+
+    for i in range(3):
+        await traffic_service.track(
+            location_href="https://polar.sh/hello",
+            referrer=None,
+            article_id=article.id,
+            date=datetime.date(2024, 2, 19),
+        )
+    await traffic_service.track(
+        location_href="https://polar.sh/hello",
+        referrer="https://google.com/",
+        article_id=article.id,
+        organization_id=organization.id,
+        date=datetime.date(2024, 2, 19),
+    )
+
+    # nothing is written until flushed
+    stmt = sql.select(Traffic).order_by(Traffic.views)
+    r = await session.execute(stmt)
+    assert [1] == [t.views for t in r.scalars().all()]
+
+    await traffic_service.flush_views(session)
+
+    r = await session.execute(stmt.execution_options(populate_existing=True))
+    traffic = r.scalars().all()
+    assert [1, 4] == [t.views for t in traffic]
+    assert traffic[0].referrer == "https://google.com/"
+    assert traffic[0].organization_id == organization.id
+    assert traffic[1].referrer is None
+    assert traffic[1].organization_id is None
+
+    # already flushed deltas are not applied twice
+    await traffic_service.flush_views(session)
+    r = await session.execute(stmt.execution_options(populate_existing=True))
+    assert [1, 4] == [t.views for t in r.scalars().all()]
+
+
+@pytest.mark.asyncio
+async def test_views_statistics_rollups(
+    session: AsyncSession,
+    article: Article,
+) -> None:
+    # then
+    session.expunge_all()
+
+    # monday, wednesday and next monday
+    for date in [
+        datetime.date(2024, 2, 19),
+        datetime.date(2024, 2, 21),
+        datetime.date(2024, 2, 26),
+    ]:
+        await traffic_service.track(
+            location_href="https://polar.sh/hello",
+            article_id=article.id,
+            date=date,
+        )
+
+    await traffic_service.flush_views(session)
+
+    # aligned on the weekly rollups
+    weekly = await traffic_service.views_statistics(
+        session,
+        article_ids=[article.id],
+        start_date=datetime.date(2024, 2, 19),
+        end_date=datetime.date(2024, 3, 1),
+        interval="week",
+        start_of_last_period=datetime.date(2024, 3, 1),
+        group_by_article=True,
+    )
+    assert [
+        TrafficStatisticsPeriod(
+            start_date=datetime.date(2024, 2, 19),
+            end_date=datetime.date(2024, 2, 26),
+            views=2,
+            article_id=article.id,
+        ),
+        TrafficStatisticsPeriod(
+            start_date=datetime.date(2024, 2, 26),
+            end_date=datetime.date(2024, 3, 4),
+            views=1,
+            article_id=article.id,
+        ),
+    ] == weekly
+
+    # not aligned, summed from the daily rollups
+    weekly = await traffic_service.views_statistics(
+        session,
+        article_ids=[article.id],
+        start_date=datetime.date(2024, 2, 20),
+        end_date=datetime.date(2024, 3, 1),
+        interval="week",
+        start_of_last_period=datetime.date(2024, 3, 1),
+        group_by_article=False,
+    )
+    assert [
+        TrafficStatisticsPeriod(
+            start_date=datetime.date(2024, 2, 20),
+            end_date=datetime.date(2024, 2, 27),
+            views=2,
+            article_id=None,
+        ),
+        TrafficStatisticsPeriod(
+            start_date=datetime.date(2024, 2, 27),
+            end_date=datetime.date(2024, 3, 5),
+            views=0,
+            article_id=None,
+        ),
+    ] == weekly
+
+
+@pytest.mark.asyncio
+async def test_referrers(
+    session: AsyncSession,
+    article: Article,
+) -> None:
+    # then
+    session.expunge_all()
+
+    for date, referrer in [
+        (datetime.date(2024, 1, 15), "https://google.com/"),
+        (datetime.date(2024, 1, 31), "https://google.com/"),
+        (datetime.date(2024, 2, 10), "https://twitter.com/"),
+        (datetime.date(2024, 2, 11), "https://twitter.com/"),
+        (datetime.date(2024, 2, 12), "https://twitter.com/"),
+        (datetime.date(2024, 3, 1), "https://google.com/"),
+        (datetime.date(2024, 3, 2), "https://google.com/"),
+        (datetime.date(2024, 3, 3), None),
+    ]:
+        await traffic_service.track(
+            location_href="https://polar.sh/hello",
+            referrer=referrer,
+            article_id=article.id,
+            date=date,
+        )
+
+    await traffic_service.flush_views(session)
+
+    # partial january, full february and partial march
+    results, count = await traffic_service.referrers(
+        session,
+        article_ids=[article.id],
+        start_date=datetime.date(2024, 1, 20),
+        end_date=datetime.date(2024, 3, 1),
+        pagination=PaginationParams(page=1, limit=10),
+    )
+    assert count == 2
+    assert [
+        TrafficReferrer(referrer="https://twitter.com/", views=3),
+        TrafficReferrer(referrer="https://google.com/", views=2),
+    ] == results
+
+    # within a single month
+    results, count = await traffic_service.referrers(
+        session,
+        article_ids=[article.id],
+        start_date=datetime.date(2024, 2, 11),
+        end_date=datetime.date(2024, 2, 20),
+        pagination=PaginationParams(page=1, limit=10),
+    )
+    assert [TrafficReferrer(referrer="https://twitter.com/", views=2)] == results
+
+
+@pytest.mark.asyncio
+async def test_flush_views_batches(
+    mocker: MockerFixture,
+    session: AsyncSession,
+    article: Article,
+) -> None:
+    mocker.patch("polar.traffic.service.FLUSH_BATCH_SIZE", 2)
+
+    # then
+    session.expunge_all()
+
+    for day in range(1, 6):
+        await traffic_service.track(
+            location_href="https://polar.sh/hello",
+            referrer="https://google.com/",
+            article_id=article.id,
+            date=datetime.date(2024, 2, day),
+        )
+    await traffic_service.flush_views(session)
+
+    stmt = sql.select(Traffic)
+    r = await session.execute(stmt)
+    assert 5 == len(r.scalars().all())
+
+    monthly = await traffic_service.views_statistics(
+        session,
+        article_ids=[article.id],
+        start_date=datetime.date(2024, 2, 1),
+        end_date=datetime.date(2024, 2, 29),
+        interval="month",
+        start_of_last_period=datetime.date(2024, 2, 1),
+        group_by_article=False,
+    )
+    assert [5] == [period.views for period in monthly]
@@ -1,3 +1,6 @@
+from collections.abc import AsyncIterator, Iterable
+from typing import TypeVar
+
 import pytest_asyncio
 
 from polar.enums import AccountType
@@ -21,6 +24,13 @@ from tests.fixtures.random_objects import (
     create_subscription_tier,
 )
 
+T = TypeVar("T")
+
+
+async def build_async_iterator(items: Iterable[T]) -> AsyncIterator[T]:
+    for item in items:
+        yield item
+
 
 async def create_transaction(
     session: AsyncSession,
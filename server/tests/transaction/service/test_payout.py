@@ -1,5 +1,6 @@
 import uuid
 from types import SimpleNamespace
+from typing import Any
 from unittest.mock import MagicMock
 
 import pytest
@@ -22,6 +23,7 @@ from polar.transaction.service.payout import (
 from polar.transaction.service.payout import (
     payout_transaction as payout_transaction_service,
 )
+from tests.transaction.conftest import build_async_iterator
 
 
 @pytest.fixture(autouse=True)
@@ -209,6 +211,9 @@ class TestCreatePayout:
             ]
             assert call[1]["transfer_group"] == str(payout.id)
             assert call[1]["metadata"]["payout_transaction_id"] == str(payout.id)
+            assert call[1]["idempotency_key"].startswith(
+                f"payout_transfer_{payout.id}_"
+            )
 
         stripe_service_mock.create_payout.assert_not_called()
 
@@ -243,12 +248,11 @@ class TestCreatePayout:
         stripe_service_mock.transfer.return_value = SimpleNamespace(
             id="STRIPE_TRANSFER_ID",
             balance_transaction="STRIPE_BALANCE_TRANSACTION_ID",
-            destination_payment="STRIPE_DESTINATION_CHARGE_ID",
-        )
-        stripe_service_mock.get_charge.return_value = SimpleNamespace(
-            id="STRIPE_DESTINATION_CHARGE_ID",
-            balance_transaction=SimpleNamespace(
-                amount=900, currency="eur", exchange_rate=0.9
+            destination_payment=SimpleNamespace(
+                id="STRIPE_DESTINATION_CHARGE_ID",
+                balance_transaction=SimpleNamespace(
+                    amount=900, currency="eur", exchange_rate=0.9
+                ),
             ),
         )
         stripe_service_mock.create_payout.return_value = SimpleNamespace(
@@ -280,8 +284,81 @@ class TestCreatePayout:
         assert payout.paid_transactions[0].id == balance_transaction_1.id
         assert payout.paid_transactions[1].id == balance_transaction_2.id
 
+        assert payout.account_amount == -900 * 2
+        for call in stripe_service_mock.transfer.call_args_list:
+            assert call[1]["expand"] == ["destination_payment.balance_transaction"]
+        stripe_service_mock.get_charge.assert_not_called()
         stripe_service_mock.create_payout.assert_not_called()
 
+    async def test_stripe_transfer_error(
+        self, session: AsyncSession, user: User, stripe_service_mock: MagicMock
+    ) -> None:
+        account = Account(
+            status=Account.Status.ACTIVE,
+            account_type=AccountType.stripe,
+            admin_id=user.id,
+            country="US",
+            currency="usd",
+            is_details_submitted=True,
+            is_charges_enabled=True,
+            is_payouts_enabled=True,
+            processor_fees_applicable=True,
+            stripe_id="STRIPE_ACCOUNT_ID",
+        )
+        session.add(account)
+        await session.commit()
+
+        payment_transaction_1 = await create_payment_transaction(
+            session, charge_id="STRIPE_CHARGE_ID_1"
+        )
+        balance_transaction_1 = await create_balance_transaction(
+            session, account=account, payment_transaction_id=payment_transaction_1.id
+        )
+
+        payment_transaction_2 = await create_payment_transaction(
+            session, charge_id="STRIPE_CHARGE_ID_2"
+        )
+        balance_transaction_2 = await create_balance_transaction(
+            session, account=account, payment_transaction_id=payment_transaction_2.id
+        )
+
+        async def transfer_side_effect(
+            destination_stripe_id: str, amount: int, **kwargs: Any
+        ) -> SimpleNamespace:
+            if kwargs["source_transaction"] == "STRIPE_CHARGE_ID_2":
+                raise stripe_lib.error.APIConnectionError("Timeout")
+            return SimpleNamespace(id="STRIPE_TRANSFER_ID_1")
+
+        stripe_service_mock.transfer.side_effect = transfer_side_effect
+
+        # then
+        session.expunge_all()
+
+        # The transfers are resumed later, the payout is created anyway
+        created_payout = await payout_transaction_service.create_payout(
+            session, account=account
+        )
+
+        # The payout and the successful transfer are checkpointed
+        session.expunge_all()
+        payout = await session.get(Transaction, created_payout.id)
+        assert payout is not None
+        assert payout.payout_id is None
+
+        updated_balance_transaction_1 = await session.get(
+            Transaction, balance_transaction_1.id
+        )
+        assert updated_balance_transaction_1 is not None
+        assert updated_balance_transaction_1.transfer_id == "STRIPE_TRANSFER_ID_1"
+        assert updated_balance_transaction_1.payout_transaction_id == payout.id
+
+        updated_balance_transaction_2 = await session.get(
+            Transaction, balance_transaction_2.id
+        )
+        assert updated_balance_transaction_2 is not None
+        assert updated_balance_transaction_2.transfer_id is None
+        assert updated_balance_transaction_2.payout_transaction_id == payout.id
+
     async def test_open_collective(self, session: AsyncSession, user: User) -> None:
         account = Account(
             status=Account.Status.ACTIVE,
@@ -327,6 +404,73 @@ class TestCreatePayout:
         assert len(payout.account_incurred_transactions) == 0
 
 
+@pytest.mark.asyncio
+class TestTriggerStripePayouts:
+    async def test_resume_transfers(
+        self, session: AsyncSession, user: User, stripe_service_mock: MagicMock
+    ) -> None:
+        account = Account(
+            status=Account.Status.ACTIVE,
+            account_type=AccountType.stripe,
+            admin_id=user.id,
+            country="US",
+            currency="usd",
+            is_details_submitted=True,
+            is_charges_enabled=True,
+            is_payouts_enabled=True,
+            processor_fees_applicable=True,
+            stripe_id="STRIPE_ACCOUNT_ID",
+        )
+        session.add(account)
+        await session.commit()
+
+        payment_transaction_1 = await create_payment_transaction(
+            session, charge_id="STRIPE_CHARGE_ID_1"
+        )
+        await create_balance_transaction(
+            session, account=account, payment_transaction_id=payment_transaction_1.id
+        )
+        payment_transaction_2 = await create_payment_transaction(
+            session, charge_id="STRIPE_CHARGE_ID_2"
+        )
+        balance_transaction_2 = await create_balance_transaction(
+            session, account=account, payment_transaction_id=payment_transaction_2.id
+        )
+
+        stripe_service_mock.transfer.side_effect = [
+            SimpleNamespace(id="STRIPE_TRANSFER_ID_1"),
+            stripe_lib.error.APIConnectionError("Timeout"),
+        ]
+
+        session.expunge_all()
+
+        await payout_transaction_service.create_payout(session, account=account)
+        first_transfer_calls = stripe_service_mock.transfer.call_args_list
+
+        stripe_service_mock.transfer.reset_mock()
+        stripe_service_mock.transfer.side_effect = [
+            SimpleNamespace(id="STRIPE_TRANSFER_ID_2")
+        ]
+        stripe_service_mock.retrieve_balance.return_value = ("usd", 0)
+
+        # then
+        session.expunge_all()
+
+        await payout_transaction_service.trigger_stripe_payouts(session)
+
+        transfer_mock: MagicMock = stripe_service_mock.transfer
+        transfer_mock.assert_called_once()
+        assert transfer_mock.call_args == first_transfer_calls[1]
+
+        updated_balance_transaction_2 = await session.get(
+            Transaction, balance_transaction_2.id
+        )
+        assert updated_balance_transaction_2 is not None
+        assert updated_balance_transaction_2.transfer_id == "STRIPE_TRANSFER_ID_2"
+
+        stripe_service_mock.create_payout.assert_not_called()
+
+
 def build_stripe_payout(
     *,
     status: str = "paid",
@@ -431,7 +575,7 @@ class TestCreatePayoutFromStripe:
         await session.commit()
 
         stripe_service_mock.list_balance_transactions.return_value = (
-            balance_transactions
+            build_async_iterator(balance_transactions)
         )
 
         stripe_payout = build_stripe_payout(
@@ -506,7 +650,7 @@ class TestCreatePayoutFromStripe:
         await session.commit()
 
         stripe_service_mock.list_balance_transactions.return_value = (
-            balance_transactions
+            build_async_iterator(balance_transactions)
         )
 
         stripe_payout = build_stripe_payout(
@@ -13,6 +13,7 @@ from polar.postgres import AsyncSession
 from polar.transaction.service.processor_fee import (
     processor_fee_transaction as processor_fee_transaction_service,
 )
+from tests.transaction.conftest import build_async_iterator
 
 
 @pytest.fixture(autouse=True)
@@ -420,7 +421,7 @@ class TestSyncStripeFees:
         ]
 
         stripe_service_mock.list_balance_transactions.return_value = (
-            balance_transactions
+            build_async_iterator(balance_transactions)
         )
 
         fee_transaction_9 = Transaction(
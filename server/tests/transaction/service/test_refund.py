@@ -18,6 +18,7 @@ from polar.transaction.service.refund import (  # type: ignore[attr-defined]
 from polar.transaction.service.refund import (
     refund_transaction as refund_transaction_service,
 )
+from tests.transaction.conftest import build_async_iterator
 
 
 def build_stripe_balance_transaction(
@@ -132,11 +133,9 @@ class TestCreateRefunds:
             balance_transaction=balance_transaction.id,
         )
 
-        stripe_service_mock.list_refunds.return_value = [
-            new_refund,
-            handled_refund,
-            failed_refund,
-        ]
+        stripe_service_mock.list_refunds.return_value = build_async_iterator(
+            [new_refund, handled_refund, failed_refund]
+        )
         stripe_service_mock.get_balance_transaction.return_value = balance_transaction
 
         account = Account(
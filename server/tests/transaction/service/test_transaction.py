@@ -4,6 +4,7 @@ import pytest
 
 from polar.authz.service import Authz
 from polar.exceptions import NotPermitted, ResourceNotFound
+from polar.kit.db.postgres import async_sessionmaker
 from polar.kit.pagination import PaginationParams
 from polar.models import Account, Organization, Transaction, User, UserOrganization
 from polar.models.transaction import TransactionType
@@ -169,6 +170,35 @@ class TestSearch:
             assert result.id in organization_transactions_id
 
 
+@pytest.mark.asyncio
+class TestGetTransactionsCSV:
+    async def test_valid(
+        self,
+        session: AsyncSession,
+        sessionmaker: async_sessionmaker[AsyncSession],
+        user: User,
+        user_organization: UserOrganization,
+        readable_user_transactions: list[Transaction],
+        all_transactions: list[Transaction],
+    ) -> None:
+        # then
+        session.expunge_all()
+
+        rows = [
+            row
+            async for row in transaction_service.get_transactions_csv(
+                sessionmaker, user
+            )
+        ]
+
+        assert rows[0].startswith("Date,Transaction ID,Type,Description,")
+        assert len(rows) == len(readable_user_transactions) + 1
+
+        readable_user_transactions_id = {str(t.id) for t in readable_user_transactions}
+        for row in rows[1:]:
+            assert row.split(",")[1] in readable_user_transactions_id
+
+
 @pytest.mark.asyncio
 class TestGetSummary:
     async def test_account_not_permitted(
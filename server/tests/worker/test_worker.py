@@ -0,0 +1,303 @@
+import asyncio
+import inspect
+import uuid
+from collections.abc import AsyncIterator
+from typing import Any, cast
+from unittest.mock import MagicMock
+
+import pytest
+import pytest_asyncio
+from arq import ArqRedis, Retry
+from pytest_mock import MockerFixture
+
+import polar.tasks  # noqa: F401
+from polar import worker
+from polar.kit.utils import utc_now
+from polar.worker import (
+    JobContext,
+    PendingJob,
+    PolarWorkerContext,
+    TaskLane,
+    WorkerContext,
+    _enqueue_job,
+    _enqueue_jobs,
+    _TaskDedupe,
+    enqueue_job,
+    lifespan,
+    task_hooks,
+)
+
+
+@pytest.mark.asyncio
+async def test_enqueue_jobs() -> None:
+    job_id = f"test.enqueue_jobs:{uuid.uuid4().hex}"
+    async with lifespan() as arq_pool:
+        jobs = await _enqueue_jobs(
+            [
+                PendingJob(
+                    "test.enqueue_jobs",
+                    1,
+                    polar_context=PolarWorkerContext(),
+                    _job_id=job_id,
+                    _defer_by=60,
+                ),
+                # Same ID
+                PendingJob("test.enqueue_jobs", 2, _job_id=job_id),
+            ]
+        )
+
+        try:
+            first_job, duplicate_job = jobs
+            assert duplicate_job is None
+            assert first_job is not None
+            assert first_job.job_id == job_id
+
+            info = await first_job.info()
+            assert info is not None
+            assert info.function == "test.enqueue_jobs"
+            assert info.args == (1,)
+            assert info.kwargs == {"polar_context": PolarWorkerContext()}
+            assert info.score is not None
+            assert info.score - int(info.enqueue_time.timestamp() * 1000) == 60_000
+        finally:
+            await arq_pool.delete(f"arq:job:{job_id}")
+            await arq_pool.zrem(arq_pool.default_queue_name, job_id)
+
+    assert worker.arq_pool is None
+
+
+@pytest.mark.asyncio
+class TestEnqueueJob:
+    async def test_task_lane(self, mock_enqueue_job: MagicMock) -> None:
+        await enqueue_job("subscription.subscription_benefit.grant")
+
+        _, kwargs = mock_enqueue_job.call_args
+        assert kwargs["_queue_name"] == TaskLane.critical.queue_name
+
+    async def test_unregistered_task(self, mock_enqueue_job: MagicMock) -> None:
+        await enqueue_job("test.unregistered")
+
+        _, kwargs = mock_enqueue_job.call_args
+        assert kwargs["_queue_name"] == "arq:queue"
+
+    async def test_lane_override(self, mock_enqueue_job: MagicMock) -> None:
+        await enqueue_job(
+            "subscription.subscription_benefit.grant", _lane=TaskLane.bulk
+        )
+
+        _, kwargs = mock_enqueue_job.call_args
+        assert kwargs["_queue_name"] == TaskLane.bulk.queue_name
+        assert "_lane" not in kwargs
+
+
+DEDUPE_TASK = "test.dedupe"
+
+
+async def dedupe_task(
+    ctx: JobContext,
+    resource_id: uuid.UUID,
+    polar_context: PolarWorkerContext,
+    changed: bool = False,
+    retry: bool = False,
+) -> None:
+    if changed:
+        # Same resource changes while the job is running
+        await _enqueue_job(DEDUPE_TASK, resource_id, _job_id=uuid.uuid4().hex)
+    if retry:
+        raise Retry()
+
+
+@pytest_asyncio.fixture
+async def dedupe_arq_pool(mocker: MockerFixture) -> AsyncIterator[ArqRedis]:
+    mocker.patch.dict(
+        worker._task_dedupes,
+        {
+            DEDUPE_TASK: _TaskDedupe(
+                inspect.signature(dedupe_task), ("resource_id",), True
+            )
+        },
+    )
+    async with lifespan() as arq_pool:
+        queue_name = TaskLane.default.queue_name
+        initial_job_ids = set(await arq_pool.zrange(queue_name, 0, -1))
+        yield arq_pool
+        job_ids = set(await arq_pool.zrange(queue_name, 0, -1)) - initial_job_ids
+        for job_id in job_ids:
+            await arq_pool.zrem(queue_name, job_id)
+            await arq_pool.delete(f"arq:job:{job_id.decode()}")
+        dedupe_keys = await arq_pool.keys(f"worker:dedupe:{DEDUPE_TASK}:*")
+        if dedupe_keys:
+            await arq_pool.delete(*dedupe_keys)
+
+
+async def run_dedupe_job(arq_pool: ArqRedis, **kwargs: Any) -> None:
+    job_context = cast(
+        JobContext,
+        {
+            "redis": arq_pool,
+            "job_id": "fake_job_id",
+            "job_try": 1,
+            "enqueue_time": utc_now(),
+            "score": 0,
+            "lane": TaskLane.default,
+        },
+    )
+    await task_hooks(DEDUPE_TASK, dedupe_task)(job_context, **kwargs)
+
+
+async def get_dedupe_state(arq_pool: ArqRedis, resource_id: uuid.UUID) -> str | None:
+    value = await arq_pool.get(f"worker:dedupe:{DEDUPE_TASK}:{resource_id}")
+    return value.decode().split(":")[0] if value is not None else None
+
+
+async def count_queued_jobs(arq_pool: ArqRedis) -> int:
+    return len(
+        [job for job in await arq_pool.queued_jobs() if job.function == DEDUPE_TASK]
+    )
+
+
+@pytest.mark.asyncio
+class TestWorkerSettings:
+    async def test_lanes_share_pool(self) -> None:
+        async with lifespan() as arq_pool:
+            contexts = [cast(WorkerContext, {"lane": lane}) for lane in TaskLane]
+            await asyncio.gather(
+                *(worker.WorkerSettings.on_startup(ctx) for ctx in contexts)
+            )
+            assert worker.arq_pool is arq_pool
+
+            for ctx in contexts:
+                await worker.WorkerSettings.on_shutdown(ctx)
+            assert worker.arq_pool is arq_pool
+
+    async def test_own_pool(self) -> None:
+        ctx = cast(WorkerContext, {})
+        await worker.WorkerSettings.on_startup(ctx)
+        assert worker.arq_pool is not None
+
+        await worker.WorkerSettings.on_shutdown(ctx)
+        assert worker.arq_pool is None
+
+
+@pytest.mark.asyncio
+class TestDedupe:
+    async def test_enqueue_job(self, dedupe_arq_pool: ArqRedis) -> None:
+        resource_id = uuid.uuid4()
+
+        job = await _enqueue_job(DEDUPE_TASK, resource_id, _job_id=uuid.uuid4().hex)
+        duplicate_job = await _enqueue_job(
+            DEDUPE_TASK, resource_id=resource_id, _job_id=uuid.uuid4().hex
+        )
+        other_job = await _enqueue_job(
+            DEDUPE_TASK, uuid.uuid4(), _job_id=uuid.uuid4().hex
+        )
+
+        assert job is not None
+        assert duplicate_job is None
+        assert other_job is not None
+        assert await get_dedupe_state(dedupe_arq_pool, resource_id) == "queued"
+
+        info = await job.info()
+        assert info is not None
+        assert info.kwargs["dedupe_key"] == (
+            f"worker:dedupe:{DEDUPE_TASK}:{resource_id}"
+        )
+
+    async def test_enqueue_jobs(self, dedupe_arq_pool: ArqRedis) -> None:
+        resource_id = uuid.uuid4()
+
+        jobs = await _enqueue_jobs(
+            [
+                PendingJob(DEDUPE_TASK, resource_id, _job_id=uuid.uuid4().hex),
+                PendingJob(DEDUPE_TASK, resource_id, _job_id=uuid.uuid4().hex),
+                PendingJob(DEDUPE_TASK, uuid.uuid4(), _job_id=uuid.uuid4().hex),
+            ]
+        )
+
+        first_job, duplicate_job, other_job = jobs
+        assert first_job is not None
+        assert duplicate_job is None
+        assert other_job is not None
+
+    async def test_run(self, dedupe_arq_pool: ArqRedis) -> None:
+        resource_id = uuid.uuid4()
+        await _enqueue_job(DEDUPE_TASK, resource_id, _job_id=uuid.uuid4().hex)
+        assert await get_dedupe_state(dedupe_arq_pool, resource_id) == "queued"
+
+        await run_dedupe_job(
+            dedupe_arq_pool,
+            resource_id=resource_id,
+            polar_context=PolarWorkerContext(),
+            dedupe_key=f"worker:dedupe:{DEDUPE_TASK}:{resource_id}",
+        )
+
+        assert await get_dedupe_state(dedupe_arq_pool, resource_id) is None
+        assert await count_queued_jobs(dedupe_arq_pool) == 1
+
+        job = await _enqueue_job(DEDUPE_TASK, resource_id, _job_id=uuid.uuid4().hex)
+        assert job is not None
+
+    async def test_run_changed(self, dedupe_arq_pool: ArqRedis) -> None:
+        resource_id = uuid.uuid4()
+        await _enqueue_job(DEDUPE_TASK, resource_id, _job_id=uuid.uuid4().hex)
+
+        await run_dedupe_job(
+            dedupe_arq_pool,
+            resource_id=resource_id,
+            polar_context=PolarWorkerContext(),
+            changed=True,
+            dedupe_key=f"worker:dedupe:{DEDUPE_TASK}:{resource_id}",
+        )
+
+        # Rerun once, without the trigger of the change
+        assert await get_dedupe_state(dedupe_arq_pool, resource_id) == "queued"
+        assert await count_queued_jobs(dedupe_arq_pool) == 2
+        rerun_job = [
+            job
+            for job in await dedupe_arq_pool.queued_jobs()
+            if job.function == DEDUPE_TASK and job.kwargs.get("changed")
+        ]
+        assert len(rerun_job) == 1
+
+    async def test_run_retry(self, dedupe_arq_pool: ArqRedis) -> None:
+        resource_id = uuid.uuid4()
+        await _enqueue_job(DEDUPE_TASK, resource_id, _job_id=uuid.uuid4().hex)
+
+        with pytest.raises(Retry):
+            await run_dedupe_job(
+                dedupe_arq_pool,
+                resource_id=resource_id,
+                polar_context=PolarWorkerContext(),
+                retry=True,
+                dedupe_key=f"worker:dedupe:{DEDUPE_TASK}:{resource_id}",
+            )
+
+        assert await get_dedupe_state(dedupe_arq_pool, resource_id) == "queued"
+        assert await count_queued_jobs(dedupe_arq_pool) == 1
+
+    async def test_job_gone(
+        self, dedupe_arq_pool: ArqRedis, mocker: MockerFixture
+    ) -> None:
+        resource_id = uuid.uuid4()
+        job = await _enqueue_job(DEDUPE_TASK, resource_id, _job_id=uuid.uuid4().hex)
+        assert job is not None
+
+        # Failed by arq without running the hooks, e.g. after its last try
+        await dedupe_arq_pool.delete(f"arq:job:{job.job_id}")
+
+        # Might be claimed right before being enqueued
+        duplicate_job = await _enqueue_job(
+            DEDUPE_TASK, resource_id, _job_id=uuid.uuid4().hex
+        )
+        assert duplicate_job is None
+
+        mocker.patch.object(worker, "DEDUPE_CLAIM_GRACE_SECONDS", -1)
+        new_job = await _enqueue_job(DEDUPE_TASK, resource_id, _job_id=uuid.uuid4().hex)
+        assert new_job is not None
+        assert await get_dedupe_state(dedupe_arq_pool, resource_id) == "queued"
+
+        # The new job exists: requests are deduplicated again
+        duplicate_job = await _enqueue_job(
+            DEDUPE_TASK, resource_id, _job_id=uuid.uuid4().hex
+        )
+        assert duplicate_job is None